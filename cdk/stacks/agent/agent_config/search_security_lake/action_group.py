@@ -121,6 +121,25 @@ paths:
         '500':
           $ref: '#/components/responses/InternalServerError'
 
+  /entity-profile:
+    get:
+      summary: Entity profile
+      description: Get what is known about one IP address, IAM principal, S3 bucket, Lambda function or hostname across all sources, first and last seen, event counts per source, top peers and actions. Use it first for questions about a single entity, then search the sources for its events.
+      operationId: entity-profile
+      requestBody:
+        required: true
+        content:
+          application/json:
+            schema:
+              $ref: '#/components/schemas/EntityProfileRequest'
+      responses:
+        '200':
+          $ref: '#/components/responses/SuccessfulResponse'
+        '400':
+          $ref: '#/components/responses/BadRequest'
+        '500':
+          $ref: '#/components/responses/InternalServerError'
+
 components:
   schemas:
     QueryRequest:
@@ -135,6 +154,20 @@ components:
         similarity-search:
           type: boolean
           description: Set to false for queries with explicit terms, timestamps, or known event types. Enable (set to true) only when the query is broad, conceptual, or doesn't contain specific identifiers.
+
+    EntityProfileRequest:
+      type: object
+      required:
+        - entity-type
+        - entity-id
+      properties:
+        entity-type:
+          type: string
+          enum: [ip, principal, bucket, function, hostname]
+          description: The type of the entity, principal is an IAM user or role ARN, function a Lambda function ARN.
+        entity-id:
+          type: string
+          description: The IP address, principal ARN, bucket name, function ARN or hostname exactly as given by the user.
     
   responses:
     SuccessfulResponse:
@@ -0,0 +1,211 @@
+import ipaddress
+import math
+import re
+import zlib
+from typing import Dict, List, Optional
+
+
+# Pure Python port of the query side of embedding_processor/ecr_image/indexes/flow_features.py, the
+# Lambda has no NumPy. Query vectors must match the document vectors built at ingest: change both
+# modules together, the constants and the order of the blocks included.
+
+IP_BUCKETS = 16
+IPV4_PREFIXES = [(8, 0.25), (16, 0.5), (24, 0.75), (32, 1.0)]
+IPV6_PREFIXES = [(32, 0.25), (48, 0.5), (64, 0.75), (128, 1.0)]
+FLOW_PORTS = [20, 21, 22, 23, 25, 53, 80, 110, 123, 135, 139, 143, 161, 389, 443, 445, 465, 587, 636, 993, 995,
+              1433, 1521, 2049, 2375, 3306, 3389, 5432, 5900, 6379, 8080, 8443, 9200, 27017]
+PORT_RANGES = [1024, 49152]
+BYTES_BINS = 11
+PACKETS_BINS = 8
+DIRECTIONS = ['inbound', 'outbound', 'lateral']
+ACTIONS = ['allowed', 'denied']
+
+BLOCKS = [
+    ('src_ip', IP_BUCKETS),
+    ('dst_ip', IP_BUCKETS),
+    ('src_port', len(FLOW_PORTS) + len(PORT_RANGES) + 1),
+    ('dst_port', len(FLOW_PORTS) + len(PORT_RANGES) + 1),
+    ('bytes', BYTES_BINS),
+    ('packets', PACKETS_BINS),
+    ('direction', len(DIRECTIONS) + 1),
+    ('action', len(ACTIONS) + 1),
+]
+BLOCK_WEIGHTS = {
+    'src_ip': 1.0,
+    'dst_ip': 1.0,
+    'src_port': 0.5,
+    'dst_port': 1.0,
+    'bytes': 0.5,
+    'packets': 0.5,
+    'direction': 0.5,
+    'action': 1.0,
+}
+
+PORT_NAMES = {
+    'ssh': 22, 'telnet': 23, 'smtp': 25, 'dns': 53, 'http': 80, 'ntp': 123, 'smb': 445, 'https': 443,
+    'ldap': 389, 'mssql': 1433, 'nfs': 2049, 'mysql': 3306, 'rdp': 3389, 'postgres': 5432, 'postgresql': 5432,
+    'vnc': 5900, 'redis': 6379,
+}
+IP_PATTERN = re.compile(r'(?:(from|source|src|to|destination|dst)\s+(?:ip\s+|address\s+|host\s+)?)?\b((?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?)\b', re.IGNORECASE)
+PORT_PATTERN = re.compile(r'\b(?:(source|src|destination|dst)\s+)?ports?\s+(\d{1,5})\b', re.IGNORECASE)
+PORT_NAME_PATTERN = re.compile(r'\b(' + '|'.join(PORT_NAMES) + r')\b', re.IGNORECASE)
+BYTES_PATTERN = re.compile(r'\b(\d+(?:\.\d+)?)\s*(bytes|b|kb|mb|gb)\b', re.IGNORECASE)
+BYTES_UNITS = {'b': 1, 'bytes': 1, 'kb': 1e3, 'mb': 1e6, 'gb': 1e9}
+PACKETS_PATTERN = re.compile(r'\b(\d+)\s*packets?\b', re.IGNORECASE)
+ACTION_WORDS = {
+    'denied': ['denied', 'deny', 'rejected', 'reject', 'blocked', 'block', 'dropped'],
+    'allowed': ['allowed', 'allow', 'accepted', 'accept', 'permitted'],
+}
+DIRECTION_WORDS = {
+    'inbound': ['inbound', 'ingress', 'incoming'],
+    'outbound': ['outbound', 'egress', 'outgoing'],
+    'lateral': ['lateral', 'east-west'],
+}
+
+
+def flow_query_vector(text: str) -> Optional[List[float]]:
+    """
+    Build the feature vector of a VPC flow similarity search.
+
+    Args:
+        text (str): The search criteria, e.g. "denied ssh from 203.0.113.7".
+
+    Returns:
+        Optional[List[float]]: The normalized feature vector, None when the text names no flow field.
+    """
+    flow = parse_flow_query(text)
+    if not flow:
+        return None
+    return flow_feature_vector(flow)
+
+
+def parse_flow_query(text: str) -> Dict:
+    """
+    Extract the flow fields named in a search text: addresses, ports, bytes, packets, action and direction.
+
+    Args:
+        text (str): The search criteria.
+
+    Returns:
+        Dict: A flow document with the fields found.
+    """
+    flow = {}
+    addresses = []
+    for role, address in IP_PATTERN.findall(text):
+        role = role.lower()
+        if role in ['from', 'source', 'src']:
+            flow.setdefault('src_endpoint_ip', address)
+        elif role in ['to', 'destination', 'dst']:
+            flow.setdefault('dst_endpoint_ip', address)
+        else:
+            addresses.append(address)
+    # addresses without a role fill source then destination
+    for field in ['src_endpoint_ip', 'dst_endpoint_ip']:
+        if field not in flow and addresses:
+            flow[field] = addresses.pop(0)
+
+    for role, port in PORT_PATTERN.findall(text):
+        flow.setdefault('src_endpoint_port' if role.lower() in ['source', 'src'] else 'dst_endpoint_port', int(port))
+    for name in PORT_NAME_PATTERN.findall(text):
+        flow.setdefault('dst_endpoint_port', PORT_NAMES[name.lower()])
+
+    for count, unit in BYTES_PATTERN.findall(text):
+        flow.setdefault('traffic_bytes', int(float(count) * BYTES_UNITS[unit.lower()]))
+    for count in PACKETS_PATTERN.findall(text):
+        flow.setdefault('traffic_packets', int(count))
+
+    words = set(re.findall(r'[a-z-]+', text.lower()))
+    for action, action_words in ACTION_WORDS.items():
+        if words & set(action_words):
+            flow.setdefault('action', action)
+    for direction, direction_words in DIRECTION_WORDS.items():
+        if words & set(direction_words):
+            flow.setdefault('direction', direction)
+    return flow
+
+
+def flow_feature_vector(flow: Dict) -> List[float]:
+    """
+    Build the normalized feature vector of one flow, block by block.
+
+    Args:
+        flow (Dict): A flow document, as returned by parse_flow_query.
+
+    Returns:
+        List[float]: The feature vector.
+    """
+    blocks = {name: [0.0] * size for name, size in BLOCKS}
+    ip_features(blocks['src_ip'], flow.get('src_endpoint_ip'))
+    ip_features(blocks['dst_ip'], flow.get('dst_endpoint_ip'))
+    set_column(blocks['src_port'], port_column(flow.get('src_endpoint_port')))
+    set_column(blocks['dst_port'], port_column(flow.get('dst_endpoint_port')))
+    log_bin_features(blocks['bytes'], flow.get('traffic_bytes'))
+    log_bin_features(blocks['packets'], flow.get('traffic_packets'))
+    set_column(blocks['direction'], category(flow.get('direction'), DIRECTIONS))
+    set_column(blocks['action'], category(flow.get('action'), ACTIONS))
+
+    vector = []
+    for name, _ in BLOCKS:
+        norm = math.sqrt(sum(value * value for value in blocks[name]))
+        vector.extend(value / norm * BLOCK_WEIGHTS[name] if norm > 0 else 0.0 for value in blocks[name])
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm if norm > 0 else 0.0 for value in vector]
+
+
+def ip_features(block: List[float], value: Optional[str]) -> None:
+    """
+    Add the signed hashed prefixes of an address or a network to the block.
+    """
+    if not value:
+        return
+    try:
+        network = ipaddress.ip_network(str(value), strict=False)
+    except ValueError:
+        return
+    for prefix, weight in (IPV4_PREFIXES if network.version == 4 else IPV6_PREFIXES):
+        if prefix > network.prefixlen:
+            break
+        hashed = zlib.crc32(str(network.supernet(new_prefix=prefix)).encode('utf-8'))
+        block[hashed % IP_BUCKETS] += weight if (hashed >> 16) & 1 else -weight
+
+
+def port_column(port) -> Optional[int]:
+    """
+    Column of a port: its position in FLOW_PORTS, or its range after them.
+    """
+    try:
+        port = int(port)
+    except (TypeError, ValueError):
+        return None
+    if port in FLOW_PORTS:
+        return FLOW_PORTS.index(port)
+    return len(FLOW_PORTS) + sum(1 for limit in PORT_RANGES if port >= limit)
+
+
+def log_bin_features(block: List[float], value) -> None:
+    """
+    Spread log10(1 + value) over the two nearest bins of the block.
+    """
+    if value in [None, '']:
+        return
+    position = min(max(math.log10(1 + max(float(value), 0)), 0), len(block) - 1)
+    low = math.floor(position)
+    high = min(low + 1, len(block) - 1)
+    fraction = position - low
+    block[low] += 1 - fraction
+    block[high] += fraction
+
+
+def category(value, values: List[str]) -> Optional[int]:
+    """
+    Index of the value in values, len(values) for any other value, None without a value.
+    """
+    if value in [None, '']:
+        return None
+    value = str(value).lower()
+    return values.index(value) if value in values else len(values)
+
+
+def set_column(block: List[float], column: Optional[int]) -> None:
+    if column is not None:
+        block[column] = 1.0
@@ -1,10 +1,13 @@
+import base64
 import boto3
+import hashlib
 import json
 import logging
 import os
+import struct
 from string import Template
-from typing import Dict, List
-from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+from typing import Dict, List, Optional, Tuple
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth, NotFoundError
 import prompts.vpc_flow_logs
 import prompts.cloudtrail_management
 import prompts.response_to_markdown
@@ -12,6 +15,8 @@ import prompts.route_53_logs
 import prompts.security_hub
 import prompts.s3_data_events
 import prompts.lambda_data_events
+import prompts.common
+import flow_features
 
 
 
@@ -21,22 +26,33 @@ log.setLevel(LOG_LEVEL)
 
 
 PARAMETER_NAME = os.environ.get('PARAMETER_NAME', 'SearchSecurityLake-Parameter')
-ssm_client = boto3.client('ssm')
-CONFIG = json.loads(ssm_client.get_parameter(Name=PARAMETER_NAME)['Parameter']['Value'])
-CONFIG['AOSS_ENDPOINT'] = CONFIG['AOSS_ENDPOINT'].replace('https://', '')
+if 'PARAMETER_VALUE' in os.environ:
+    # local runs pass the parameter value directly
+    CONFIG = json.loads(os.environ['PARAMETER_VALUE'])
+else:
+    ssm_client = boto3.client('ssm')
+    CONFIG = json.loads(ssm_client.get_parameter(Name=PARAMETER_NAME)['Parameter']['Value'])
+AOSS_LOCAL = CONFIG['AOSS_ENDPOINT'].startswith('http://')
+CONFIG['AOSS_ENDPOINT'] = CONFIG['AOSS_ENDPOINT'].replace('https://', '').replace('http://', '')
 
 
 bedrock_runtime = boto3.client('bedrock-runtime')
 
 
 service = 'aoss'
-credentials = boto3.Session().get_credentials()
-auth = AWSV4SignerAuth(credentials, CONFIG['AWS_REGION'], service)
+if AOSS_LOCAL:
+    # local emulator (support/aoss_emulator.py), host:port over http without signing
+    aoss_host, aoss_port = CONFIG['AOSS_ENDPOINT'].split(':') if ':' in CONFIG['AOSS_ENDPOINT'] else (CONFIG['AOSS_ENDPOINT'], 80)
+    auth = None
+else:
+    aoss_host, aoss_port = CONFIG['AOSS_ENDPOINT'], 443
+    credentials = boto3.Session().get_credentials()
+    auth = AWSV4SignerAuth(credentials, CONFIG['AWS_REGION'], service)
 aoss_client = OpenSearch(
-    hosts = [{'host': CONFIG['AOSS_ENDPOINT'], 'port': 443}],
+    hosts = [{'host': aoss_host, 'port': int(aoss_port)}],
     http_auth = auth,
-    use_ssl = True,
-    verify_certs = True,
+    use_ssl = not AOSS_LOCAL,
+    verify_certs = not AOSS_LOCAL,
     connection_class = RequestsHttpConnection,
     pool_maxsize = 100,
     timeout=60,
@@ -49,6 +65,7 @@ API_PATH_LAMBDA_DATA_EVENTS = '/lambda-data-events'
 API_PATH_SECURITY_HUB = '/security-hub'
 API_PATH_ROUTE53_LOGS = '/route53-logs'
 API_PATH_VPC_FLOW_LOGS = '/vpc-flow-logs'
+API_PATH_ENTITY_PROFILE = '/entity-profile'
 
 BEDROCK_AGENT_NAME = 'cgdagent-agent'
 BEDROCK_AGENT_ACTION_GROUP = 'search-security-lake'
@@ -59,6 +76,7 @@ BEDROCK_AGENT_API_PATHS = [
     API_PATH_SECURITY_HUB,
     API_PATH_ROUTE53_LOGS,
     API_PATH_VPC_FLOW_LOGS,
+    API_PATH_ENTITY_PROFILE,
 ]
 
 BEDROCK_FOUNDATION_MODEL = 'anthropic.claude-3-sonnet-20240229-v1:0'
@@ -67,6 +85,12 @@ BEDROCK_TEMPERATURE = 0.0
 BEDROCK_TOP_K = 1
 MAX_GENERATION_ATTEMPTS = 3
 
+VECTOR_FIELD = 'embedding_vector'
+RESCORE_VECTOR_FIELD = 'embedding_rescore'
+
+ENTITY_TYPES = ['ip', 'principal', 'bucket', 'function', 'hostname']
+ENTITY_PROFILE_ID_MAX_BYTES = 512
+
 
 SYSTEM_PROMPTS = {
     API_PATH_CLOUDTRAIL: prompts.cloudtrail_management.system,
@@ -127,6 +151,18 @@ def lambda_handler(event, context):
         
         properties = parse_properties(event)
         log.debug(f'PROPERTIES: {properties}')
+        if api_path == API_PATH_ENTITY_PROFILE:
+            if not validate_entity_properties(properties):
+                message = error_invalid_entity_properties()
+                log.error(message)
+                response = response_to_agent(event, message)
+                log.debug(f'RESPONSE TO AGENT: \n{response}')
+                return response
+            log.info(f'RUNNING ENTITY PROFILE LOOKUP.')
+            response = response_to_agent(event, entity_profile(properties))
+            log.debug(f'RESPONSE TO AGENT: \n{response}')
+            return response
+
         if not validate_properties(properties):
             message = error_invalid_properties()
             log.error(message)
@@ -211,28 +247,183 @@ def knn_query(api_path: str, properties: Dict) -> str:
         str: A markdown-formatted string containing the query results.
     """
     user_input = properties['user-input']
+    aoss_index = get_aoss_index(api_path)
+    log.debug(f'AOSS_INDEX: {aoss_index}')
+    aoss_response = None
+    entity_index = CONFIG.get('ENTITY_INDEX_MAP', {}).get(api_path)
+    if entity_index:
+        aoss_response = entity_knn_search(user_input, entity_index['index'], entity_index['field'], aoss_index)
+    if aoss_response is None:
+        aoss_response = vector_search(user_input, aoss_index)
+    log.debug(f'AOSS_RESPONSE: {aoss_response}')
+    markdown_response = generate_markdown_response(user_input, aoss_response, api_path)
+    log.debug(f'MARKDOWN_RESPONSE: {markdown_response}')
+    return markdown_response
+
+
+def vector_search(user_input: str, index: str, size: int=10, k: int=3) -> Dict:
+    """
+    Run a kNN search for the user input on an index, with the vector storage of the index.
+
+    Args:
+        user_input (str): The search criteria to embed.
+        index (str): The AOSS index name.
+        size (int, optional): The number of results to return. Defaults to 10.
+        k (int, optional): The number of nearest neighbors to consider. Defaults to 3.
+
+    Returns:
+        Dict: The AOSS response.
+    """
+    if get_index_vector_storage(index).get('type') == 'binary':
+        return binary_knn_search(user_input, index, size=size, k=k)
+    if get_index_vector_storage(index).get('type') == 'features':
+        # structural flow features, built from the addresses, ports and action of the search without Bedrock
+        vector = flow_features.flow_query_vector(user_input)
+        log.debug(f'FLOW_FEATURES: {flow_features.parse_flow_query(user_input)}')
+        if vector is None:
+            return {'hits': {'total': {'value': 0}, 'max_score': None, 'hits': []}}
+        return aoss_client.search(aoss_query_knn(vector, size=size, k=k), index)
     embedding = create_embedding(user_input)
     log.debug(f'EMBEDDING: Not shown due to size of embedding.')
     #log.debug(f'Embedding:\n{embedding}')
-    aoss_index = get_aoss_index(api_path)
-    log.debug(f'AOSS_INDEX: {aoss_index}')
-    aoss_body = aoss_query_knn(embedding)
+    aoss_body = aoss_query_knn(encode_query_vector(embedding, index), size=size, k=k)
     log.debug(f'AOSS_QUERY: Query not shown due to size of embedding.')
     #log.debug(f'AOSS KNN Query:\n{aoss_body}')
-    aoss_response = aoss_client.search(aoss_body, aoss_index)
-    log.debug(f'AOSS_RESPONSE: {aoss_response}')
-    markdown_response = generate_markdown_response(user_input, aoss_response, api_path)
+    return aoss_client.search(aoss_body, index)
+
+
+def entity_knn_search(user_input: str, entity_index: str, field: str, index: str, size: int=10) -> Optional[Dict]:
+    """
+    Search the entities most similar to the user input, then the events of these entities.
+
+    Events that are not embedded themselves (Route 53 queries are embedded once per hostname)
+    are found through their entity: a kNN search on the entity index, then a terms query on
+    the events index, most similar entity first and latest event first within an entity.
+
+    Args:
+        user_input (str): The search criteria to embed.
+        entity_index (str): The AOSS entity index name.
+        field (str): The field of the events holding the entity id.
+        index (str): The AOSS events index name.
+        size (int, optional): The number of events to return. Defaults to 10.
+
+    Returns:
+        Optional[Dict]: The AOSS events response, None when no entity or event matched.
+    """
+    if not aoss_client.indices.exists(index=entity_index):
+        return None
+    entity_response = vector_search(user_input, entity_index, size=size, k=size)
+    entities = [hit['_source'].get(field) for hit in entity_response['hits']['hits'] if hit['_source'].get(field)]
+    scores = {hit['_source'].get(field): hit['_score'] for hit in entity_response['hits']['hits']}
+    log.debug(f'ENTITIES: {entities}')
+    if not entities:
+        return None
+
+    aoss_body = {
+        'size': size * len(entities),
+        'query': {'terms': {field: entities}},
+        'sort': [{'time': {'order': 'desc'}}],
+        '_source': {'excludes': [VECTOR_FIELD, RESCORE_VECTOR_FIELD]}
+    }
+    aoss_response = aoss_client.search(aoss_body, index)
+    hits = aoss_response['hits']['hits']
+    if not hits:
+        return None
+    # stable sort: the time order is kept within an entity
+    rank = {entity: position for position, entity in enumerate(entities)}
+    hits.sort(key=lambda hit: rank.get(hit['_source'].get(field), len(entities)))
+    for hit in hits:
+        hit['_score'] = scores.get(hit['_source'].get(field))
+    aoss_response['hits']['hits'] = hits[:size]
+    aoss_response['hits']['max_score'] = hits[0]['_score']
+    return aoss_response
+
+
+def entity_profile(properties: Dict) -> str:
+    """
+    Read the profile of an entity with a single get by id.
+
+    Profiles are built at ingest by the embedding processor (indexes/entity_profiles.py),
+    one document per entity with the id <entity type>:<entity id>.
+
+    Args:
+        properties (Dict): A dictionary containing 'entity-type' and 'entity-id'.
+
+    Returns:
+        str: A markdown-formatted string describing the entity.
+    """
+    entity_type = properties['entity-type']
+    entity_id = normalize_entity_id(entity_type, properties['entity-id'])
+    user_input = f'What do we know about the {entity_type} {entity_id}?'
+    index = CONFIG.get('ENTITY_PROFILE_INDEX')
+    if not index:
+        return 'Entity profiles are not enabled, search the sources for the events of this entity.'
+
+    profile_id = entity_profile_id(entity_type, entity_id)
+    log.debug(f'ENTITY_PROFILE_ID: {profile_id}')
+    try:
+        document = aoss_client.get(index=index, id=profile_id)
+    except NotFoundError:
+        document = None
+    log.debug(f'AOSS_RESPONSE: {document}')
+    if not document or not document.get('found'):
+        return f'No profile was found for the {entity_type} {entity_id}, it was not seen by the ingested sources. Search the sources for its events.'
+    profile = document['_source']
+    # each source writes its own first and last time, the profile wide ones are derived here
+    sources = [source for source in (profile.get('sources') or {}).values() if source.get('first_seen')]
+    if sources:
+        profile['first_seen'] = min(int(source['first_seen']) for source in sources)
+        profile['last_seen'] = max(int(source['last_seen']) for source in sources)
+    aoss_response = {'hits': {'hits': [{'_source': profile}]}}
+    markdown_response = generate_markdown_response(user_input, aoss_response, API_PATH_ENTITY_PROFILE)
     log.debug(f'MARKDOWN_RESPONSE: {markdown_response}')
     return markdown_response
 
 
+def normalize_entity_id(entity_type: str, entity_id: str) -> str:
+    """
+    Normalize an entity id as the ingest does: buckets without their ARN prefix,
+    hostnames in lower case without the trailing dot.
+
+    Args:
+        entity_type (str): One of ENTITY_TYPES.
+        entity_id (str): The entity id given by the user.
+
+    Returns:
+        str: The normalized entity id.
+    """
+    entity_id = str(entity_id).strip()
+    if entity_type == 'bucket':
+        entity_id = entity_id.replace('arn:aws:s3:::', '', 1).replace('s3://', '', 1).split('/')[0]
+    elif entity_type == 'hostname':
+        entity_id = entity_id.rstrip('.').lower()
+    return entity_id
+
+
+def entity_profile_id(entity_type: str, entity_id: str) -> str:
+    """
+    Document id of an entity profile, the entity id is hashed when the id exceeds 512 bytes.
+
+    Args:
+        entity_type (str): One of ENTITY_TYPES.
+        entity_id (str): The normalized entity id.
+
+    Returns:
+        str: The profile document id.
+    """
+    profile_id = f'{entity_type}:{entity_id}'
+    if len(profile_id.encode('utf-8')) <= ENTITY_PROFILE_ID_MAX_BYTES:
+        return profile_id
+    return f"{entity_type}:{hashlib.sha256(entity_id.encode('utf-8')).hexdigest()}"
+
+
 def query(api_path: str, properties: Dict) -> str:
     """
     Perform a generative query using the provided properties.
 
     This function attempts to generate and execute a query against the AOSS index,
-    with multiple retries in case of failures. It then generates a markdown response
-    based on the query results.
+    or its rollup index when the model answers from the rollups, with multiple retries
+    in case of failures. It then generates a markdown response based on the query results.
 
     Args:
         api_path (str): The api path is used to map the index.
@@ -242,7 +433,7 @@ def query(api_path: str, properties: Dict) -> str:
         str: A markdown-formatted string containing the query results.
     """
     user_input = properties['user-input']
-    aoss_index = get_aoss_index(api_path)
+    aoss_index = ''
     aoss_body = ''
     aoss_response = ''
     feedback = ''
@@ -253,7 +444,8 @@ def query(api_path: str, properties: Dict) -> str:
         log.debug(f'ATTEMPT: {attempts}/{MAX_GENERATION_ATTEMPTS}')
         try:
             user_prompt = ''.join([feedback, user_input])
-            aoss_body = aoss_query_generative(user_prompt, api_path)
+            aoss_body, rollup = aoss_query_generative(user_prompt, api_path)
+            aoss_index = CONFIG['ROLLUP_INDEX_MAP'][api_path]['index'] if rollup else get_aoss_index(api_path)
             log.debug(f'AOSS_INDEX: {aoss_index}')
             log.debug(f'AOSS_QUERY: {aoss_body}')
             aoss_response = aoss_client.search(aoss_body, aoss_index)
@@ -269,7 +461,8 @@ def query(api_path: str, properties: Dict) -> str:
         results = 'No results were found. If you believe there are results try your request in a different way.'
         markdown_response = generate_markdown_response(user_input, results, api_path)
     else:
-        markdown_response = generate_markdown_response(user_input, aoss_response, api_path)
+        estimated = is_estimate(aoss_body, aoss_response)
+        markdown_response = generate_markdown_response(user_input, aoss_response, api_path, estimated)
     log.debug(f'MARKDOWN_RESPONSE:\n{markdown_response}')
     return markdown_response
 
@@ -288,7 +481,27 @@ def get_aoss_index(api_path: str) -> str:
     return index
 
 
-def generate_markdown_response(user_input: str, aoss_response: Dict, data_source: str) -> str:
+def is_estimate(aoss_body: Dict, aoss_response: Dict) -> bool:
+    """
+    Check if a query answer was computed from sampled documents.
+
+    Sampled documents carry a sample_weight, aggregations extrapolate counts
+    from the estimated_count field.
+
+    Args:
+        aoss_body (Dict): The query sent to Amazon OpenSearch Serverless.
+        aoss_response (Dict): The response from the Amazon OpenSearch Serverless query.
+
+    Returns:
+        bool: True if the answer is an estimate, False otherwise.
+    """
+    if 'estimated_count' in json.dumps(aoss_body) or 'sample_weight' in json.dumps(aoss_body):
+        return True
+    hits = aoss_response.get('hits', {}).get('hits', [])
+    return any('sample_weight' in hit.get('_source', {}) for hit in hits)
+
+
+def generate_markdown_response(user_input: str, aoss_response: Dict, data_source: str, estimated: bool=False) -> str:
     """
     Generate a markdown-formatted response based on the search criteria and AOSS response.
 
@@ -299,6 +512,7 @@ def generate_markdown_response(user_input: str, aoss_response: Dict, data_source
         user_input (str): The original search criteria used for the query.
         aoss_response (Dict): The response from the Amazon OpenSearch Serverless query.
         data_source (str): The data source used for the query.
+        estimated (bool, optional): The response was extrapolated from sampled documents. Defaults to False.
 
     Returns:
         str: A markdown-formatted response summarizing the search results.
@@ -311,7 +525,7 @@ def generate_markdown_response(user_input: str, aoss_response: Dict, data_source
         response = ''.join(hits)
     else:
         response = aoss_response
-    system_prompt = SYSTEM_PROMPTS['response_to_markdown'](data_source)
+    system_prompt = SYSTEM_PROMPTS['response_to_markdown'](data_source, estimated)
     user_prompt = USER_PROMPTS['response_to_markdown'](user_input, response)
 
     body = json.dumps({
@@ -366,34 +580,43 @@ def aoss_query_knn(vector: List[float], size: int=10, k: int=3) -> Dict:
         'size': size,
         'query': {
             'knn': {
-                'embedding_vector': {
+                VECTOR_FIELD: {
                     'vector': vector,
                     'k': k
                 },
             }
         },
         '_source': {
-            'excludes': ['embedding_vector']
+            'excludes': [VECTOR_FIELD, RESCORE_VECTOR_FIELD]
         }
     }
     return query
 
 
-def aoss_query_generative(user_input: str, data_source: str) -> Dict:
+def aoss_query_generative(user_input: str, data_source: str) -> Tuple[Dict, bool]:
     """
     Generate a query for Amazon OpenSearch Serverless using a language model.
 
     This function uses the Bedrock foundation model to generate a query based on
-    the provided search criteria and data source.
+    the provided search criteria and data source. Sources with anomaly scores or threat
+    intel matches get the rules to filter on them. When the data source has a rollup
+    index the model also chooses between the rollups and the events.
 
     Args:
         user_input (str): The search criteria to use for generating the query.
         data_source (str): The data source to use for selecting the appropriate system prompt.
 
     Returns:
-        Dict: A dictionary representing the generated query for AOSS.
+        Tuple[Dict, bool]: The generated query for AOSS, and whether it targets the rollup index.
     """
+    rollup = CONFIG.get('ROLLUP_INDEX_MAP', {}).get(data_source)
     system_prompt = SYSTEM_PROMPTS[data_source]()
+    if data_source in CONFIG.get('ANOMALY_SCORE_PATHS', []):
+        system_prompt = ''.join([system_prompt, prompts.common.ANOMALY_RULES])
+    if data_source in CONFIG.get('IOC_MATCH_PATHS', []):
+        system_prompt = ''.join([system_prompt, prompts.common.IOC_RULES])
+    if rollup:
+        system_prompt = ''.join([system_prompt, prompts.common.rollup_rules(rollup)])
     user_prompt = USER_PROMPTS[data_source](user_input)
     body = json.dumps({
         'anthropic_version': 'bedrock-2023-05-31',
@@ -422,9 +645,9 @@ def aoss_query_generative(user_input: str, data_source: str) -> Dict:
     completion_parts = completion.split('<query>')
     query = json.loads(completion_parts[1])
     query['_source'] = {
-        'excludes': ['embedding_vector']
+        'excludes': [VECTOR_FIELD, RESCORE_VECTOR_FIELD]
     }
-    return query
+    return query, bool(rollup) and '<target>rollup</target>' in completion_parts[0]
 
 
 def create_embedding(text: str) -> List[float]:
@@ -448,12 +671,152 @@ def create_embedding(text: str) -> List[float]:
     return embedding
 
 
+def create_embeddings_by_type(text: str, embedding_types: List[str]) -> Dict:
+    """
+    Create several embedding types for the given text with a single Bedrock call.
+
+    Args:
+        text (str): The input text to create embeddings for.
+        embedding_types (List[str]): The embedding types to return, e.g. ['float', 'binary'].
+
+    Returns:
+        Dict: The embeddings keyed by embedding type.
+    """
+    body = json.dumps({
+        'inputText': text,
+        'dimensions': CONFIG['DIMENSIONS'],
+        'normalize': True,
+        'embeddingTypes': embedding_types
+    })
+    response = bedrock_runtime.invoke_model(body=body, modelId=CONFIG['EMBEDDING_MODEL_ID'])
+    response_body = json.loads(response.get('body').read())
+    return response_body.get('embeddingsByType')
+
+
+def get_index_vector_storage(index: str) -> Dict:
+    """
+    Get the vector storage the embedding processor uses for an index.
+
+    Args:
+        index (str): The AOSS index name.
+
+    Returns:
+        Dict: The vector storage, float storage when the index is not configured.
+    """
+    return CONFIG.get('INDEX_VECTOR_STORAGE', {}).get(index, {'type': 'float'})
+
+
+def encode_query_vector(vector: List[float], index: str) -> List[float]:
+    """
+    Encode a query vector to match the vector storage of an index.
+
+    Byte indices store int8 vectors, the query is quantized with the same range
+    the embedding processor used for the documents.
+
+    Args:
+        vector (List[float]): The embedding vector from the Bedrock embedding model.
+        index (str): The AOSS index name.
+
+    Returns:
+        List[float]: The vector to use in the KNN query.
+    """
+    storage = get_index_vector_storage(index)
+    if storage.get('type') == 'byte':
+        scale = 127 / float(storage.get('range', 0.25))
+        return [max(-128, min(127, round(value * scale))) for value in vector]
+    return vector
+
+
+def binary_knn_search(user_input: str, index: str, size: int=10, k: int=3) -> Dict:
+    """
+    Search a binary vector index and rescore the candidates with float vectors.
+
+    The hamming space search fetches oversample times more candidates than requested,
+    the candidates are ranked again by the cosine similarity between the float query
+    vector and the fp16 copy of each document vector.
+
+    Args:
+        user_input (str): The search criteria to embed.
+        index (str): The AOSS index name.
+        size (int, optional): The number of results to return. Defaults to 10.
+        k (int, optional): The number of nearest neighbors to consider. Defaults to 3.
+
+    Returns:
+        Dict: The AOSS response with the rescored hits.
+    """
+    oversample = int(get_index_vector_storage(index).get('oversample', 5))
+    embeddings = create_embeddings_by_type(user_input, ['float', 'binary'])
+    aoss_body = aoss_query_knn(pack_binary(embeddings['binary']), size=size * oversample, k=k * oversample)
+    aoss_body['_source'] = {'excludes': [VECTOR_FIELD]}
+    aoss_response = aoss_client.search(aoss_body, index)
+
+    query_vector = embeddings['float']
+    hits = aoss_response['hits']['hits']
+    for hit in hits:
+        document_vector = hit['_source'].pop(RESCORE_VECTOR_FIELD, None)
+        hit['_score'] = cosine_similarity(query_vector, decode_fp16(document_vector)) if document_vector else 0.0
+    hits.sort(key=lambda hit: hit['_score'], reverse=True)
+    aoss_response['hits']['hits'] = hits[:size]
+    aoss_response['hits']['max_score'] = hits[0]['_score'] if hits else None
+    log.debug(f'RESCORED: {len(hits)} candidates to {len(aoss_response["hits"]["hits"])} hits')
+    return aoss_response
+
+
+def pack_binary(bits: List[int]) -> List[int]:
+    """
+    Pack a Titan binary embedding, one 0/1 value per dimension, into signed bytes.
+
+    Args:
+        bits (List[int]): The binary embedding.
+
+    Returns:
+        List[int]: 8 bits per value, the format of binary knn_vector fields.
+    """
+    packed = []
+    for start in range(0, len(bits), 8):
+        value = 0
+        for bit in bits[start:start + 8]:
+            value = (value << 1) | (1 if bit else 0)
+        packed.append(value - 256 if value > 127 else value)
+    return packed
+
+
+def decode_fp16(encoded: str) -> List[float]:
+    """
+    Decode a base64 little endian fp16 vector stored by the embedding processor.
+
+    Args:
+        encoded (str): The base64 encoded vector.
+
+    Returns:
+        List[float]: The vector.
+    """
+    data = base64.b64decode(encoded)
+    return list(struct.unpack(f'<{len(data) // 2}e', data))
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    """
+    Compute the cosine similarity of two vectors.
+
+    Args:
+        a (List[float]): The first vector.
+        b (List[float]): The second vector.
+
+    Returns:
+        float: The cosine similarity, 0.0 for empty vectors.
+    """
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = (sum(x * x for x in a) * sum(y * y for y in b)) ** 0.5
+    return dot / norm if norm else 0.0
+
+
 def parse_properties(event: Dict) -> Dict:
     """
     Parse the properties from the event dictionary.
 
-    This function extracts 'user-input' and 'ssimilarity-search'
-    from the event's request body.
+    This function extracts 'user-input' and 'ssimilarity-search', or 'entity-type'
+    and 'entity-id' for entity profiles, from the event's request body.
 
     Args:
         event (Dict): The event dictionary containing the request body.
@@ -474,6 +837,10 @@ def parse_properties(event: Dict) -> Dict:
                 properties['similarity-search'] = True
             else:
                 properties['similarity-search'] = False
+        elif name == 'entity-type':
+            properties['entity-type'] = str(value).lower()
+        elif name == 'entity-id':
+            properties['entity-id'] = value
     return properties
 
 
@@ -520,6 +887,23 @@ def validate_properties(properties: Dict) -> bool:
     return True
 
 
+def validate_entity_properties(properties: Dict) -> bool:
+    """
+    Validate the properties of an entity profile lookup.
+
+    Args:
+        properties (Dict): The properties dictionary to validate.
+
+    Returns:
+        bool: True if the properties are valid, False otherwise.
+    """
+    if properties.get('entity-type') not in ENTITY_TYPES:
+        return False
+    if not properties.get('entity-id'):
+        return False
+    return True
+
+
 def error_invalid_agent() -> str:
     """
     Generate an error message for an invalid agent.
@@ -559,6 +943,28 @@ Boolean flag to indicate if similarity search should be performed or not.
     return message.substitute()
 
 
+def error_invalid_entity_properties() -> str:
+    """
+    Generate an error message for invalid entity profile properties.
+
+    Returns:
+        str: A formatted error message string.
+    """
+    message = Template("""
+# Invalid Properties
+This tool requires two properties:
+1. entity-type
+2. entity-id
+
+## entity-type
+One of $entity_types.
+
+## entity-id
+The IP address, principal ARN, bucket name, function ARN or hostname.
+    """)
+    return message.substitute(entity_types=', '.join(ENTITY_TYPES))
+
+
 def error_catchall(e: Exception) -> str:
     """
     Generate a catch-all error message for unhandled exceptions.
@@ -1,4 +1,6 @@
 from datetime import datetime
+from string import Template
+from typing import Dict
 
 
 
@@ -19,6 +21,69 @@ SYSTEM_PROMPT_RULES = """
 """
 
 
+AGGREGATED_EVENT_RULES = """
+- A document with a count field represents several identical events collapsed at ingest, count holds how many.
+  A document without count is a single event.
+- To count events use a sum aggregation on the count field with "missing": 1 instead of counting documents or using doc_count.
+- first_seen and last_seen hold the time of the first and last collapsed event.
+"""
+
+
+SAMPLED_EVENT_RULES = """
+- A document with a sample_weight field is part of a sample, it stands for sample_weight events.
+- To count events use a sum aggregation on the estimated_count field with "missing": 1 instead of counting documents or summing count.
+- Counts computed from sampled documents are estimates.
+"""
+
+
+ANOMALY_RULES = """
+<anomaly_fields>
+- anomaly_score (float): 0 to 1, how unusual the event is against the baseline of its entity over the previous days
+- anomaly_reasons (keyword): new_entity|new_target|fanout|volume
+</anomaly_fields>
+- For unusual, anomalous or suspicious activity filter on anomaly_score >= 0.5 and sort by anomaly_score descending.
+- To explain why an event is unusual use anomaly_reasons: new_entity (never seen before), new_target (first event of the
+  entity with this target), fanout (many more distinct targets than usual), volume (many more events than usual).
+- Events without anomaly_score had no baseline yet.
+"""
+
+
+IOC_RULES = """
+<ioc_fields>
+- ioc_match (boolean): true when an address, hostname or hash of the event is a threat intel indicator
+- ioc_indicators (keyword): The indicators matched: IP addresses, CIDR networks, domains or hashes
+- ioc_fields (keyword): The fields that matched an indicator, e.g. dst_endpoint_ip
+</ioc_fields>
+- For known-bad, malicious or threat intel questions filter with a term query on ioc_match: true.
+- To find the events of one indicator use a term query on ioc_indicators, networks are written as CIDR (203.0.113.0/24).
+- Events without ioc_match matched no indicator.
+"""
+
+
+ROLLUP_RULES = """
+<rollup_fields>
+- granularity (keyword): hour|day
+- time (date): Start of the hour or day
+- count (long): Exact number of events in the hour or day with these field values
+- first_seen (date): Time of the first event
+- last_seen (date): Time of the last event
+$fields
+</rollup_fields>
+- Counts and top N over the rollup_fields are answered from an index of hourly and daily rollups.
+  It holds every event, also the ones older than the event documents or not sampled.
+- Rollup fields are keyword fields, their names have no .keyword at the end.
+- To answer from the rollups filter on one granularity, day unless the question needs hours, sum the count
+  field and write <target>rollup</target> before the query.
+- Otherwise write <target>events</target> before the query and query the available_fields.
+"""
+
+
+def rollup_rules(rollup: Dict) -> str:
+    fields = [f'- {field} (keyword)' for field in rollup['dimensions']]
+    fields += [f'- {field} (double): Sum of {field[len("sum_"):]} over the events' for field in rollup['sum']]
+    return Template(ROLLUP_RULES).substitute(fields='\n'.join(fields))
+
+
 def get_current_date():
     return datetime.now().strftime('%Y-%m-%d')
 
@@ -1,15 +1,20 @@
 from string import Template
 
 
-def system(data_source: str) -> str:
+def system(data_source: str, estimated: bool=False) -> str:
     prompt_template = Template("""
 Write a concise data driven summary of the response in markdown.
 The <response></response> tags contain OCSF information from a $data_source query
 Do not include the criteria tags, response tags or filler words.
 Do not add opinions or make assumptions.
+$estimate_note
     """)
+    estimate_note = ''
+    if estimated:
+        estimate_note = 'The numbers were extrapolated from sampled events, state clearly that they are estimates.'
     prompt = prompt_template.substitute(
-        data_source=data_source)
+        data_source=data_source,
+        estimate_note=estimate_note)
     return prompt
 
 
@@ -28,16 +28,21 @@ def system() -> str:
 - answers.rdata.keyword (text)
 - answers.type (text)
 - answers.type.keyword (text)
+- count (long): Number of events collapsed into this document
+- first_seen (date): Time of the first collapsed event
+- last_seen (date): Time of the last collapsed event
 </available_fields>
 
 <rules>
 $common_rules
+$aggregated_event_rules
 </rules>
                                
 Build a query in response to the search criteria using the avialable_fields following the rules.
     """)
     prompt = prompt_template.substitute(
-        common_rules=prompts.common.SYSTEM_PROMPT_RULES
+        common_rules=prompts.common.SYSTEM_PROMPT_RULES,
+        aggregated_event_rules=prompts.common.AGGREGATED_EVENT_RULES
     )
     return prompt
 
@@ -44,17 +44,26 @@ def system() -> str:
 - src_endpoint.vpc_uid.keyword (text)
 - traffic.bytes (long)
 - traffic.packets (long)
+- count (long): Number of events collapsed into this document
+- first_seen (date): Time of the first collapsed event
+- last_seen (date): Time of the last collapsed event
+- sample_weight (float): Number of events this sampled document stands for
+- estimated_count (float): Extrapolated number of events, sample_weight multiplied by count
                                
 </available_fields>
 
 <rules>
 $common_rules
+$aggregated_event_rules
+$sampled_event_rules
 </rules>
                                
 Build a query in response to the search criteria using the avialable_fields following the rules.
     """)
     prompt = prompt_template.substitute(
-        common_rules=prompts.common.SYSTEM_PROMPT_RULES
+        common_rules=prompts.common.SYSTEM_PROMPT_RULES,
+        aggregated_event_rules=prompts.common.AGGREGATED_EVENT_RULES,
+        sampled_event_rules=prompts.common.SAMPLED_EVENT_RULES
     )
     return prompt
 
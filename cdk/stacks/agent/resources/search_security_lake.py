@@ -14,9 +14,22 @@ from stacks.agent.constants import SearchSecurityLakeProps
 
 
 class SearchSecurityLake(Construct):
-    def __init__(self, scope: Construct, construct_id: str, aoss_endpoint: str, aoss_collection_id: str, aoss_collection_map: Dict, **kwargs) -> None:
+    def __init__(self, scope: Construct, construct_id: str, aoss_endpoint: str, aoss_collection_id: str, aoss_collection_map: Dict, vector_storage: Dict, route53_hostname_index: str = '', rollups: Dict = None, entity_profile_index: str = '', sketches: Dict = None, ioc_columns: Dict = None, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        rollups = rollups or {}
+        sketches = sketches or {}
+        ioc_columns = ioc_columns or {}
+
+        api_path_data_sources = {
+            '/cloudtrail-mgmt': 'cloudtrail_management',
+            '/s3-data-events': 's3_data_events',
+            '/lambda-data-events': 'lambda_data_events',
+            '/security-hub': 'security_hub',
+            '/route53-logs': 'route53_logs',
+            '/vpc-flow-logs': 'vpc_flow_logs',
+        }
+
         ssm_parameter_values = json.dumps({
             'EMBEDDING_MODEL_ID': 'amazon.titan-embed-text-v2:0',
             'DIMENSIONS': 512, 
@@ -30,7 +43,29 @@ class SearchSecurityLake(Construct):
                 '/security-hub': aoss_collection_map['security_hub'],
                 '/route53-logs':  aoss_collection_map['route53_logs'],
                 '/vpc-flow-logs': aoss_collection_map['vpc_flow_logs'],
-            }
+            },
+            'INDEX_VECTOR_STORAGE': {
+                **{aoss_collection_map[data_source]: storage for data_source, storage in vector_storage.items()},
+                **({route53_hostname_index: vector_storage['route53_logs']} if route53_hostname_index and 'route53_logs' in vector_storage else {})
+            },
+            # entity index searched by kNN before the events of an API path, joined on field
+            'ENTITY_INDEX_MAP': {
+                '/route53-logs': {'index': route53_hostname_index, 'field': 'hostname'}
+            } if route53_hostname_index else {},
+            # rollup index of an API path for counts and top N, fields written by indexes/rollups.py
+            'ROLLUP_INDEX_MAP': {
+                api_path: {
+                    'index': f"{aoss_collection_map[data_source]}_rollup",
+                    'dimensions': ['accountid', 'region'] + [column.replace('.', '_') for column in rollups[data_source].get('dimensions', []) if column not in ['accountid', 'region']],
+                    'sum': [f"sum_{column.replace('.', '_')}" for column in rollups[data_source].get('sum', [])]
+                } for api_path, data_source in api_path_data_sources.items() if data_source in rollups and aoss_collection_map.get(data_source)
+            },
+            # entity profiles of /entity-profile, read by id: <entity type>:<entity id>
+            'ENTITY_PROFILE_INDEX': entity_profile_index,
+            # API paths whose documents carry anomaly_score and anomaly_reasons, indexes/sketches.py
+            'ANOMALY_SCORE_PATHS': [api_path for api_path, data_source in api_path_data_sources.items() if data_source in sketches],
+            # API paths whose documents carry ioc_match, ioc_indicators and ioc_fields, indexes/threat_intel.py
+            'IOC_MATCH_PATHS': [api_path for api_path, data_source in api_path_data_sources.items() if data_source in ioc_columns]
         })
 
         ssm_parameter = aws_ssm.StringParameter(
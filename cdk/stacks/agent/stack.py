@@ -22,7 +22,13 @@ class Agent(Stack):
             'SearchSecurityLakeLambda',
             aoss_endpoint=aoss_collection.attr_collection_endpoint,
             aoss_collection_id=aoss_collection.attr_id,
-            aoss_collection_map=BatchProcessorProps.SL_DATASOURCE_MAP
+            aoss_collection_map=BatchProcessorProps.SL_DATASOURCE_MAP,
+            vector_storage=BatchProcessorProps.VECTOR_STORAGE,
+            route53_hostname_index=BatchProcessorProps.ROUTE53_HOSTNAME_INDEX,
+            rollups=BatchProcessorProps.ROLLUPS,
+            entity_profile_index=BatchProcessorProps.ENTITY_PROFILE_INDEX,
+            sketches=BatchProcessorProps.SKETCHES,
+            ioc_columns=BatchProcessorProps.IOC_COLUMNS if BatchProcessorProps.IOC_FEED_KEYS else {}
         )
 
         agent = BedrockAgent(
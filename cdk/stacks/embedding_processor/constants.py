@@ -44,6 +44,147 @@ class BatchProcessorProps:
         'eks_audit': None,
         'wafv2_logs': None
     }
+    # Optional: collapse repeated events into one document per time bucket and key, with count,
+    # first_seen, last_seen and summed traffic. Off by default, every event is one document.
+    # Enabling it on an existing deployment mixes per-event and collapsed documents in the index
+    # until the older events are purged, the agent counts both (documents without count are one
+    # event). Example:
+    # EVENT_AGGREGATION={
+    #     'vpc_flow_logs': {
+    #         'bucket_minutes': 60,
+    #         'key': ['accountid', 'region', 'src_endpoint_ip', 'dst_endpoint_ip', 'dst_endpoint_port', 'action'],
+    #         'sum': ['traffic_bytes', 'traffic_packets'],
+    #         'sum_json': {'traffic': ['bytes', 'packets']}
+    #     },
+    #     'route53_logs': {
+    #         'bucket_minutes': 60,
+    #         'key': ['accountid', 'region', 'src_endpoint.ip', 'query_hostname', 'query_type', 'rcode']
+    #     }
+    # }
+    EVENT_AGGREGATION={}
+    # Stratified sampling for sources that are too large even when collapsed. Documents get
+    # sample_weight and estimated_count, and the agent reports extrapolated counts as estimates.
+    # Supported for vpc_flow_logs. Rows matching a threat intel indicator are all kept, weight 1,
+    # and are not limited by INDEX_RECORD_LIMIT, only by scan_limit.
+    # Remove the vpc_flow_logs entry from SOURCE_FILTERS to sample every port, example:
+    # 'vpc_flow_logs': {'strata': ['accountid', 'region', 'action'], 'per_stratum': 100, 'scan_limit': 50000}
+    INGEST_SAMPLING={}
+    # Hourly and daily rollups in <index>_rollup, counted from every row read before aggregation
+    # and sampling: count, first_seen, last_seen and the sums per accountid, region and dimensions.
+    # The agent answers counts and top N over these fields from the rollups. Kept until
+    # ROLLUP_PURGE_LT, remove a source to stop its rollups.
+    ROLLUPS={
+        'cloudtrail_management': {'dimensions': ['api_service_name', 'api_operation', 'status']},
+        'security_hub': {'dimensions': ['severity', 'status', 'finding_type']},
+        's3_data_events': {'dimensions': ['api_operation', 'status', 'resources_uid']},
+        'lambda_data_events': {'dimensions': ['api_operation', 'status', 'resource_uid']},
+        'route53_logs': {'dimensions': ['query_hostname', 'query_type', 'rcode']},
+        'vpc_flow_logs': {
+            'dimensions': ['src_endpoint_ip', 'dst_endpoint_port', 'action'],
+            'sum': ['traffic_bytes', 'traffic_packets']
+        }
+    }
+    ROLLUP_PURGE_LT='now-400d/d'
+    # One profile per IP address, IAM principal, S3 bucket, Lambda function and hostname seen by
+    # the ingest: first and last seen, event counts per source, top ENTITY_PROFILE_TOP_N peers and
+    # actions. The agent answers "what do we know about X" with a single get. '' disables the profiles.
+    ENTITY_PROFILE_INDEX='security_lake_entity_profile_index'
+    ENTITY_PROFILE_TOP_N='10'
+    # Per source and day HyperLogLog (distinct targets per entity) and count-min (events per entity
+    # and per entity/target pair) sketches saved under s3://<athena queries bucket>/<SKETCH_PREFIX>/.
+    # Documents get anomaly_score (0 to 1) and anomaly_reasons (new_entity, new_target, fanout,
+    # volume) against the SKETCH_BASELINE_DAYS days before theirs, the agent filters on them for
+    # unusual activity. Remove a source to stop scoring it.
+    SKETCHES={
+        'cloudtrail_management': {'entity': 'user', 'target': 'api_operation'},
+        'route53_logs': {'entity': 'src_endpoint.ip', 'target': 'query_hostname'},
+        'vpc_flow_logs': {'entity': 'src_endpoint_ip', 'target': 'dst_endpoint_ip'}
+    }
+    SKETCH_PREFIX='sketches'
+    SKETCH_BASELINE_DAYS='7'
+    # Threat intel feeds, object keys in the athena queries bucket: text files (.gz allowed) with
+    # one IP address, CIDR network, domain or file hash per line. Documents whose IOC_COLUMNS match
+    # an indicator get ioc_match, ioc_indicators and ioc_fields, the agent filters on ioc_match for
+    # known-bad addresses and domains. No feed disables the matching, example:
+    # IOC_FEED_KEYS=['threat-intel/ips.txt', 'threat-intel/domains.txt.gz']
+    IOC_FEED_KEYS=[]
+    IOC_COLUMNS={
+        'cloudtrail_management': ['src_endpoint.ip'],
+        'route53_logs': ['query_hostname', 'src_endpoint.ip', 'answers.rdata'],
+        'vpc_flow_logs': ['src_endpoint_ip', 'dst_endpoint_ip']
+    }
+    IOC_BLOOM_ERROR_RATE='0.000001'
+    # Vector storage per data source: float (nmslib, float32), fp16 (faiss, ~1/2 the memory),
+    # byte (faiss int8, ~1/4 the memory, 'range' clips components before scaling) or
+    # binary (faiss hamming on Titan binary embeddings, ~1/32 the memory, the agent fetches
+    # 'oversample' times more candidates and rescores them with an fp16 copy of the float vector).
+    # vpc_flow_logs also takes features: a vector built from the addresses, ports, bytes, packets,
+    # direction and action of the flow, without any Bedrock call at ingest or query time. With
+    # features, embedding every flow is free: consider EMBEDDING_POLICY 'always' for vpc_flow_logs.
+    # Compare neighbor precision with ecr_image/benchmark/flow_neighbors.py before switching.
+    # Compare recall with support/vector_storage_benchmark.py before switching, changing
+    # the storage of an existing index requires deleting and rebuilding it.
+    # example: 'vpc_flow_logs': {'type': 'fp16'}
+    VECTOR_STORAGE={}
+    # Pushdown filters compiled into the Athena WHERE clause, same predicate language as
+    # EMBEDDING_POLICY with fields being Security Lake table columns. Sources without an entry
+    # ingest every event.
+    SOURCE_FILTERS={
+        'vpc_flow_logs': {'any': [
+            {'field': 'src_endpoint.port', 'in': [22, 3389]},
+            {'field': 'dst_endpoint.port', 'in': [22, 3389]}
+        ]},
+        'route53_logs': {'field': 'query.hostname', 'not_in': ['ec2messages.us-east-1.amazonaws.com.', 'monitoring.amazonaws.com.']},
+        's3_data_events': {'field': 'http_request.user_agent', 'ne': 'athena.amazonaws.com'}
+    }
+    # Save every _bulk payload under s3://<athena queries bucket>/<prefix>/ to replay the
+    # traffic with ecr_image/benchmark/replay.py, empty disables the capture.
+    BULK_CAPTURE_PREFIX=''
+    # Ingest metrics in CloudWatch Embedded Metric Format, one dimension: DataSource
+    METRICS_NAMESPACE='CGD/EmbeddingProcessor'
+    METRICS_LOG_GROUP_NAME=(f'/{EmbeddingProcessorProps.STACK_NAME}/ingest-metrics').lower()
+    # Profiling of each source's purge and ingest: '' (off), 'cprofile' or 'sampling'. Reports are
+    # written to s3://<athena queries bucket>/<PROFILE_PREFIX>/<run id>/. Override PROFILE_MODE
+    # on a single job submission to profile one run without redeploying.
+    PROFILE_MODE=''
+    PROFILE_PREFIX='profiles'
+    # Per source lease at s3://<athena queries bucket>/<LEASE_PREFIX>/<index>.json, a job skips the
+    # sources another job is still ingesting. Renewed every TTL / 3, '0' disables the lease.
+    LEASE_TTL_SECONDS='900'
+    LEASE_PREFIX='leases'
+    # Documents Bedrock does not embed during the ingest are indexed with embedding_state 'pending'
+    # and embedded later by RUN_MODE=embed_pending jobs. The ingest stops calling Bedrock for a source
+    # after EMBEDDING_DEFER_AFTER_FAILURES failures in a row, documents are marked 'failed' after
+    # EMBEDDING_MAX_ATTEMPTS embed_pending runs.
+    EMBEDDING_DEFER_AFTER_FAILURES='3'
+    EMBEDDING_MAX_ATTEMPTS='5'
+    # Mappings of the indices the ingest creates: 'compact' (numbers as numbers, identifiers as
+    # keyword, the OCSF objects the agent does not query kept in _source only, embedding_vector
+    # excluded from _source) or 'standard'. Submit a job with RUN_MODE=reindex to migrate the
+    # existing indices, each one is copied to <index>_v<n> and served through the alias <index>.
+    MAPPING_PROFILE='compact'
+    # Route 53 queries are embedded once per hostname in ROUTE53_HOSTNAME_INDEX instead of once per
+    # query, the agent searches the hostnames and fetches their queries. A hostname whose query types
+    # or response codes changed is embedded again after ROUTE53_HOSTNAME_REFRESH_DAYS. '' embeds every
+    # route53 document as before.
+    ROUTE53_HOSTNAME_INDEX='security_lake_route53_hostname_index'
+    ROUTE53_HOSTNAME_REFRESH_DAYS='7'
+    EMBEDDING_TEXT_MAX_TOKENS='512'
+    EMBEDDING_TEXT_FIELD_MAX_CHARS='256'
+    # kNN similarity search only adds value for a fraction of events, documents that
+    # are not embedded are still indexed for lexical and aggregation queries.
+    # mode: always | never | when (with a predicate over document fields)
+    EMBEDDING_POLICY={
+        'cloudtrail_management': {'mode': 'when', 'when': {'field': 'status', 'ne': 'Success'}},
+        'security_hub': {'mode': 'always'},
+        's3_data_events': {'mode': 'when', 'when': {'any': [
+            {'field': 'status', 'ne': 'Success'},
+            {'field': 'response_error', 'exists': True}
+        ]}},
+        'lambda_data_events': {'mode': 'always'},
+        'route53_logs': {'mode': 'always'},
+        'vpc_flow_logs': {'mode': 'when', 'when': {'field': 'action', 'eq': 'Denied'}}
+    }
 
 
 class EcrRepoProps:
@@ -63,6 +204,33 @@ class EventBridgeScheduledBatchJobProps:
     EVENT_BRIDGE_SCHEDULE_LAMBDA='rate(15 minutes)'
     EVENT_BRIDGE_SCHEDULE_ROUTE53='rate(15 minutes)'
     EVENT_BRIDGE_SCHEDULE_VPC_FLOW='rate(15 minutes)'
+    EVENT_BRIDGE_SCHEDULE_EMBED_PENDING='rate(1 hour)'
+    # fixed: one job per source on the schedules above
+    # adaptive: the ingest scheduler Lambda sizes, shards or skips the jobs from each source's lag
+    SCHEDULING_MODE='adaptive'
+
+
+class AdaptiveIngestSchedulerProps:
+    LAMBDA_ID='IngestSchedulerLambda'
+    LAMBDA_NAME=(f'{EmbeddingProcessorProps.STACK_NAME}-ingest-scheduler').lower()
+    LAMBDA_DESCRIPTION='Submit embedding processor jobs sized to the lag of each data source.'
+    LAMBDA_IAM_ROLE_ID='IngestSchedulerRole'
+    LAMBDA_IAM_ROLE_NAME=(f'{LAMBDA_NAME}-role').lower()
+    LAMBDA_LAYER_OPENSEARCHPY_ID='IngestSchedulerOpenSearchPy'
+    SCHEDULER_ROLE_ID='IngestSchedulerInvokeRole'
+    SCHEDULE_EXPRESSION='rate(5 minutes)'
+    STATE_KEY='scheduler/state.json'
+    # skip sources whose newest indexed event is less than this old, Security Lake delivers every ~5 minutes
+    MIN_LAG_SECONDS='600'
+    # arrival rate window before the watermark, backlog = rate * lag
+    RATE_WINDOW_SECONDS='3600'
+    # INDEX_RECORD_LIMIT range, larger backlogs are split into up to MAX_JOBS sequential jobs
+    MIN_RECORD_LIMIT='1000'
+    MAX_RECORD_LIMIT='20000'
+    MAX_JOBS='4'
+    # idle sources (watermark unchanged since the last job) are retried with a doubling backoff
+    IDLE_INTERVAL_SECONDS='900'
+    IDLE_MAX_INTERVAL_SECONDS='14400'
 
 
 class LakeFormationProps:
@@ -0,0 +1,135 @@
+import argparse
+import ipaddress
+import json
+import os
+import time
+import numpy as np
+
+from benchmark.generator import generate_rows
+from benchmark.runner import default_environment
+from benchmark.stubs import StubBedrock
+
+# Flow neighbor retrieval with Titan embeddings and with structural feature vectors
+# (VECTOR_STORAGE { "type": "features" }, indexes/flow_features.py), runs from the ecr_image directory:
+#
+#   python -m benchmark.flow_neighbors --rows 2000 --cardinality 200 --bedrock
+#
+# Synthetic VPC flows are vectorized both ways, every flow is a query and its exact cosine neighbors
+# among the other flows are compared with neighbor labels an analyst asks for:
+#
+#   behaviour   same source /24, destination port and action: "other flows like this one"
+#   service     same destination address and port: "who else talks to this service"
+#
+# Reported per vectorizer: precision@k for each label, Bedrock calls and vectorization time. The search
+# is exact, recall of the HNSW index is measured by support/vector_storage_benchmark.py.
+# Without --bedrock the Titan side uses StubBedrock, whose vectors are random: its precision is only a
+# floor, run with --bedrock (Titan v2 in the current AWS region) for the comparison.
+
+NEIGHBOR_LABELS = {
+    'behaviour': lambda doc: (str(ipaddress.ip_network(f"{ doc['src_endpoint_ip'] }/24", strict=False)), doc['dst_endpoint_port'], doc['action']),
+    'service': lambda doc: (doc['dst_endpoint_ip'], doc['dst_endpoint_port']),
+}
+
+# The fields build_vpc_flow_index reads from the Athena columns
+def flow_doc(row):
+    return {
+      "action": row["action"],
+      "disposition": row["disposition"],
+      "activity_name": row["activity_name"],
+      "src_endpoint_ip": row["src_endpoint"]["ip"],
+      "src_endpoint_port": str(row["src_endpoint"]["port"]),
+      "dst_endpoint_ip": row["dst_endpoint"]["ip"],
+      "dst_endpoint_port": str(row["dst_endpoint"]["port"]),
+      "traffic_bytes": row["traffic"]["bytes"],
+      "traffic_packets": row["traffic"]["packets"],
+      "connection_info": row["connection_info"],
+      "type_name": row["type_name"],
+      "severity": row["severity"],
+      "status_code": row["status_code"],
+      "accountid": row["accountid"],
+      "region": row["region"],
+    }
+
+def titan_vectors(docs, bedrock):
+    from container.bedrock_utils import get_embeddings_by_type
+    from indexes.sl_vpc_flow_index import create_embedding_str
+
+    vectors = []
+    for doc in docs:
+      vectors.append(get_embeddings_by_type({ "inputText": create_embedding_str(doc) }, bedrock, ["float"])["float"])
+    return np.array(vectors, dtype=np.float32)
+
+def feature_vectors(docs):
+    from indexes.flow_features import flow_feature_vectors
+
+    return flow_feature_vectors(docs)
+
+# Fraction of the k nearest other flows that share the label of the query flow
+def precision_at_k(vectors, labels, k):
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = vectors @ vectors.T
+    np.fill_diagonal(scores, -np.inf)
+    neighbors = np.argsort(-scores, axis=1)[:, :k]
+    ids = {}
+    labels = np.array([ids.setdefault(label, len(ids)) for label in labels])
+    # queries without any other flow of their label are left out
+    has_peers = np.array([np.count_nonzero(labels == label) > 1 for label in labels])
+    hits = labels[neighbors] == labels[:, None]
+    return round(float(hits[has_peers].mean()), 4) if has_peers.any() else None
+
+def evaluate(name, vectors, docs, seconds, calls, k):
+    result = { 'vectorizer': name, 'dimensions': int(vectors.shape[1]), 'bedrock_calls': calls, 'vectorize_seconds': round(seconds, 3) }
+    for label, key in NEIGHBOR_LABELS.items():
+      result[f'{ label }_precision@{ k }'] = precision_at_k(vectors, [key(doc) for doc in docs], k)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description='VPC flow neighbor retrieval: Titan embeddings vs feature vectors')
+    parser.add_argument('--rows', type=int, default=2000, help='flows generated')
+    parser.add_argument('--cardinality', type=int, default=200, help='distinct addresses')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--bedrock', action='store_true', help='embed with Titan v2 instead of StubBedrock')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    # nothing is sent to the collection, env.py only needs an endpoint
+    os.environ.setdefault('AOSS_ENDPOINT', 'http://localhost:9200')
+    default_environment()
+    from env import BEDROCK_EMBEDDINGS_DIMENSIONS
+
+    docs = [flow_doc(row) for row in generate_rows('vpc_flow_logs', args.rows, args.cardinality, seed = args.seed)]
+
+    if args.bedrock:
+      from container.bedrock_utils import init_bedrock
+      bedrock = init_bedrock()
+    else:
+      bedrock = StubBedrock(0, BEDROCK_EMBEDDINGS_DIMENSIONS)
+    calls = [0]
+    invoke_model = bedrock.invoke_model
+    def counted(*args, **kwargs):
+      calls[0] += 1
+      return invoke_model(*args, **kwargs)
+    bedrock.invoke_model = counted
+
+    tic = time.perf_counter()
+    titan = titan_vectors(docs, bedrock)
+    titan_seconds = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    features = feature_vectors(docs)
+    features_seconds = time.perf_counter() - tic
+
+    results = [
+      evaluate('titan' if args.bedrock else 'titan (stub)', titan, docs, titan_seconds, calls[0], args.k),
+      evaluate('features', features, docs, features_seconds, 0, args.k),
+    ]
+    for result in results:
+      print(json.dumps(result))
+
+    if args.output:
+      with open(args.output, 'w') as file:
+        json.dump({ 'parameters': vars(args), 'results': results }, file, indent=2)
+
+if __name__ == '__main__':
+    main()
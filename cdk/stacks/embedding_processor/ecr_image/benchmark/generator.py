@@ -0,0 +1,255 @@
+import hashlib
+import json
+import os
+import random
+from datetime import datetime, timezone
+
+# Synthetic OCSF 1.x rows for the six Security Lake sources, written as Parquet in the layout the
+# DuckDB backend reads (indexes/duckdb_athena.py). Every column the sl_* queries select is present.
+#
+# cardinality is the number of distinct values of the main entities of a source: principals, IP
+# addresses, hostnames, functions, buckets and findings. Accounts scale with it.
+
+SOURCES = ['cloudtrail_management', 'security_hub', 's3_data_events', 'lambda_data_events', 'route53_logs', 'vpc_flow_logs']
+
+REGIONS = ['us-east-1', 'us-west-2', 'eu-west-1']
+USER_AGENTS = ['aws-cli/2.15.0 Python/3.11.6', 'Boto3/1.34.0 Python/3.11', 'console.amazonaws.com', 'aws-sdk-java/1.12.600', 'Terraform/1.6.5']
+CLOUDTRAIL_OPERATIONS = [
+    ('iam.amazonaws.com', 'CreateAccessKey'), ('iam.amazonaws.com', 'AttachRolePolicy'), ('sts.amazonaws.com', 'AssumeRole'),
+    ('ec2.amazonaws.com', 'DescribeInstances'), ('ec2.amazonaws.com', 'AuthorizeSecurityGroupIngress'),
+    ('signin.amazonaws.com', 'ConsoleLogin'), ('kms.amazonaws.com', 'Decrypt'), ('s3.amazonaws.com', 'PutBucketPolicy'),
+]
+FINDING_TYPES = [
+    ('Software and Configuration Checks/Industry and Regulatory Standards/CIS AWS Foundations Benchmark', 'Ensure MFA is enabled for the root account', 'AwsAccount'),
+    ('Software and Configuration Checks/AWS Security Best Practices', 'S3 general purpose buckets should block public access', 'AwsS3Bucket'),
+    ('TTPs/Initial Access/UnauthorizedAccess:EC2-SSHBruteForce', 'SSH brute force attacks against an EC2 instance', 'AwsEc2Instance'),
+    ('Software and Configuration Checks/Vulnerabilities/CVE', 'Vulnerable package found on an EC2 instance', 'AwsEc2Instance'),
+    ('Effects/Data Exposure', 'Security groups should not allow ingress from 0.0.0.0/0 to port 22', 'AwsEc2SecurityGroup'),
+]
+S3_OPERATIONS = ['GetObject', 'PutObject', 'DeleteObject', 'ListObjects', 'GetBucketAcl']
+DNS_TYPES = ['A', 'AAAA', 'CNAME', 'TXT', 'MX']
+DOMAIN_WORDS = ['api', 'cdn', 'login', 'mail', 'update', 'data', 'portal', 'static', 'telemetry', 'files']
+TLDS = ['com', 'net', 'io', 'org', 'xyz']
+VPC_PORTS = [22, 3389, 443, 80, 53, 3306, 5432, 8080]
+
+# Stable hash of an entity value for ids derived from it, the built-in hash() is salted per process
+def stable_hash(value):
+    return int(hashlib.sha256(value.encode('utf-8')).hexdigest(), 16)
+
+class Entities:
+    # Pools of entity values shared by the rows of a source, sized by cardinality
+    def __init__(self, cardinality, rng):
+        self.rng = rng
+        accounts = max(1, cardinality // 50)
+        self.accounts = [str(100000000000 + rng.randrange(899999999999)) for _ in range(accounts)]
+        self.principals = [f"user-{ index }" if index % 4 else f"role-{ index }" for index in range(cardinality)]
+        self.ips = [f"10.{ rng.randrange(256) }.{ rng.randrange(256) }.{ rng.randrange(1, 255) }" for _ in range(cardinality)]
+        self.public_ips = [f"{ rng.randrange(11, 223) }.{ rng.randrange(256) }.{ rng.randrange(256) }.{ rng.randrange(1, 255) }" for _ in range(cardinality)]
+        self.hostnames = [f"{ rng.choice(DOMAIN_WORDS) }{ index }.{ rng.choice(DOMAIN_WORDS) }.{ rng.choice(TLDS) }." for index in range(cardinality)]
+        self.functions = [f"function-{ index }" for index in range(cardinality)]
+        self.buckets = [f"bucket-{ index }" for index in range(cardinality)]
+        self.instances = [f"i-{ rng.randrange(16 ** 12):012x}" for _ in range(cardinality)]
+
+    def pick(self, values):
+        # skewed towards the first values, a few entities produce most of the events
+        return values[min(int(self.rng.paretovariate(1.2)) - 1, len(values) - 1)]
+
+def generate_rows(data_source, count, cardinality = 100, start_ms = None, end_ms = None, seed = 7):
+    rng = random.Random(seed)
+    entities = Entities(cardinality, rng)
+    end_ms = end_ms or int(datetime.now(timezone.utc).timestamp() * 1000)
+    start_ms = start_ms or end_ms - 60 * 60 * 1000
+    build_row = ROW_BUILDERS[data_source]
+
+    rows = []
+    for index in range(count):
+        time = start_ms + (end_ms - start_ms) * index // max(count, 1)
+        rows.append(build_row(rng, entities, time))
+    return rows
+
+def write_parquet(rows, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(pa.Table.from_pylist(rows), path)
+
+def write_fixtures(data_source, table_name, parquet_path, count, cardinality = 100, start_ms = None, end_ms = None, seed = 7, rows_per_file = 10000):
+    rows = generate_rows(data_source, count, cardinality, start_ms, end_ms, seed)
+    for part, start in enumerate(range(0, len(rows), rows_per_file)):
+        write_parquet(rows[start:start + rows_per_file], os.path.join(parquet_path, table_name, f"part-{ part:05d}.parquet"))
+    return len(rows)
+
+def common_columns(rng, entities, time, class_name, class_uid, category_name, category_uid, activity_name, activity_id, severity_id = 1):
+    account = rng.choice(entities.accounts)
+    region = rng.choice(REGIONS)
+    severities = ['Unknown', 'Informational', 'Low', 'Medium', 'High', 'Critical', 'Fatal']
+    return {
+        "class_name": class_name,
+        "class_uid": class_uid,
+        "category_name": category_name,
+        "category_uid": category_uid,
+        "severity": severities[severity_id],
+        "severity_id": severity_id,
+        "activity_name": activity_name,
+        "activity_id": activity_id,
+        "type_name": f"{ class_name }: { activity_name }",
+        "type_uid": class_uid * 100 + activity_id,
+        "time": time,
+        "time_dt": datetime.fromtimestamp(time / 1000, timezone.utc),
+        "accountid": account,
+        "region": region,
+        "asl_version": "2.0",
+        "cloud": { "provider": "AWS", "region": region, "account": { "uid": account } },
+        "unmapped": { "recipientAccountId": account },
+    }
+
+def observables(*pairs):
+    return [{ "name": name, "type": kind, "value": value } for name, kind, value in pairs if value]
+
+def cloudtrail_row(rng, entities, time):
+    service, operation = rng.choice(CLOUDTRAIL_OPERATIONS)
+    failed = rng.random() < 0.1
+    principal = entities.pick(entities.principals)
+    user_type = "AssumedRole" if principal.startswith("role") else "IAMUser"
+    ip = entities.pick(entities.public_ips)
+    row = common_columns(rng, entities, time, "API Activity", 6003, "Application Activity", 6, "Update" if operation.startswith(("Create", "Attach", "Put", "Authorize")) else "Read", 3 if operation.startswith(("Create", "Attach", "Put", "Authorize")) else 2)
+    row.update({
+        "status": "Failure" if failed else "Success",
+        "is_mfa": rng.random() < 0.3,
+        "api": {
+            "operation": operation,
+            "service": { "name": service },
+            "request": { "uid": f"{ rng.getrandbits(64):016x}", "data": json.dumps({ "userName": principal }) if operation.startswith(("Create", "Attach")) else None },
+            "response": { "error": "AccessDenied" if failed else None, "message": "User is not authorized to perform this operation" if failed else None },
+        },
+        "http_request": { "user_agent": rng.choice(USER_AGENTS) },
+        "actor": {
+            "user": { "uid": f"AIDA{ stable_hash(principal) % 10 ** 12:012d}", "name": principal, "type": user_type, "uid_alt": f"arn:aws:iam::{ row['accountid'] }:{ 'role' if user_type == 'AssumedRole' else 'user' }/{ principal }" },
+            "session": { "issuer": f"arn:aws:iam::{ row['accountid'] }:role/{ principal }" if user_type == "AssumedRole" else None, "mfa": False },
+        },
+        "src_endpoint": { "ip": ip, "domain": None, "uid": None },
+        "dst_endpoint": { "svc_name": service },
+        "session": { "mfa": False, "issuer": None, "created_time": time - 3600 * 1000 },
+        "policy": { "name": None, "uid": None },
+        "observables": observables(("actor.user.name", "User Name", principal), ("src_endpoint.ip", "IP Address", ip)),
+    })
+    return row
+
+def findings_row(rng, entities, time):
+    finding_type, title, resource_type = rng.choice(FINDING_TYPES)
+    finding = entities.pick(entities.instances)
+    severity_id = rng.choice([1, 2, 3, 3, 4, 5])
+    row = common_columns(rng, entities, time, "Security Finding", 2001, "Findings", 2, "Update", 2, severity_id)
+    resource_uid = f"arn:aws:ec2:{ row['region'] }:{ row['accountid'] }:instance/{ finding }" if "Ec2" in resource_type else f"arn:aws:s3:::{ entities.pick(entities.buckets) }"
+    row.update({
+        "status": rng.choice(["New", "New", "Notified", "Resolved", "Suppressed"]),
+        "confidence_score": rng.randrange(1, 100),
+        "finding_info": {
+            "title": title,
+            "desc": f"{ title }. Review the resource configuration and remediate.",
+            "created_time_dt": datetime.fromtimestamp((time - 86400 * 1000) / 1000, timezone.utc),
+            "modified_time_dt": datetime.fromtimestamp(time / 1000, timezone.utc),
+            "types": [finding_type],
+            "uid": f"arn:aws:securityhub:{ row['region'] }:{ row['accountid'] }:finding/{ finding }-{ stable_hash(title) % 10000 }",
+        },
+        "remediation": { "desc": "For information on how to correct this issue, consult the documentation.", "references": ["https://docs.aws.amazon.com/securityhub/latest/userguide/"] },
+        "resources": [{ "type": resource_type, "uid": resource_uid, "region": row["region"], "data": json.dumps({ "Details": { resource_type: { "Id": finding } } }) }],
+        "compliance": { "status": rng.choice(["FAILED", "PASSED", "WARNING"]), "requirements": ["CIS AWS Foundations 1.4"] },
+        "vulnerabilities": [{ "cve": { "uid": f"CVE-2024-{ rng.randrange(1000, 50000) }" } }] if "Vulnerabilities" in finding_type else None,
+        "observables": observables(("resources.uid", "Resource UID", resource_uid)),
+    })
+    return row
+
+def data_event_row(rng, entities, time, service, operation, resources, failed):
+    principal = entities.pick(entities.principals)
+    ip = entities.pick(entities.ips)
+    row = common_columns(rng, entities, time, "API Activity", 6003, "Application Activity", 6, "Read" if operation.startswith(("Get", "List", "Invoke")) else "Update", 2 if operation.startswith(("Get", "List", "Invoke")) else 3)
+    row.update({
+        "status": "Failure" if failed else "Success",
+        "is_mfa": False,
+        "api": {
+            "operation": operation,
+            "service": { "name": service },
+            "request": { "uid": f"{ rng.getrandbits(64):016x}", "data": json.dumps({ "resource": resources[0]["uid"] }) },
+            "response": { "error": "AccessDenied" if failed else None, "message": None },
+        },
+        "http_request": { "user_agent": rng.choice(USER_AGENTS) },
+        "actor": { "user": { "uid": f"AROA{ stable_hash(principal) % 10 ** 12:012d}", "name": principal, "type": "AssumedRole" } },
+        "user": { "uid": principal, "name": principal },
+        "src_endpoint": { "ip": ip, "vpc_uid": f"vpc-{ stable_hash(ip) % 16 ** 8:08x}" },
+        "dst_endpoint": { "svc_name": service },
+        "session": { "mfa": False, "issuer": f"arn:aws:iam::{ row['accountid'] }:role/{ principal }" },
+        "policy": { "name": None, "uid": None },
+        "resources": resources,
+        "observables": observables(("actor.user.name", "User Name", principal), ("src_endpoint.ip", "IP Address", ip)),
+    })
+    return row
+
+def s3_data_row(rng, entities, time):
+    bucket = entities.pick(entities.buckets)
+    operation = rng.choice(S3_OPERATIONS)
+    resources = [
+        { "uid": f"arn:aws:s3:::{ bucket }", "type": "AWS::S3::Bucket" },
+        { "uid": f"arn:aws:s3:::{ bucket }/data/{ rng.randrange(10000) }.json", "type": "AWS::S3::Object" },
+    ]
+    return data_event_row(rng, entities, time, "s3.amazonaws.com", operation, resources, rng.random() < 0.05)
+
+def lambda_data_row(rng, entities, time):
+    function = entities.pick(entities.functions)
+    region = rng.choice(REGIONS)
+    resources = [{ "uid": f"arn:aws:lambda:{ region }:{ entities.accounts[0] }:function:{ function }", "type": "AWS::Lambda::Function" }]
+    return data_event_row(rng, entities, time, "lambda.amazonaws.com", "Invoke", resources, rng.random() < 0.02)
+
+def route53_row(rng, entities, time):
+    hostname = entities.pick(entities.hostnames)
+    ip = entities.pick(entities.ips)
+    nxdomain = rng.random() < 0.08
+    blocked = rng.random() < 0.03
+    row = common_columns(rng, entities, time, "DNS Activity", 4003, "Network Activity", 4, "Query", 1)
+    row.update({
+        "rcode": "NXDomain" if nxdomain else "NoError",
+        "rcode_id": 3 if nxdomain else 0,
+        "disposition": "Blocked" if blocked else "Allowed",
+        "action": "Denied" if blocked else "Allowed",
+        "action_id": 2 if blocked else 1,
+        "query": { "hostname": hostname, "type": rng.choice(DNS_TYPES), "class": "IN", "packet_uid": rng.randrange(65536) },
+        "answers": None if nxdomain else [{ "rdata": entities.pick(entities.public_ips), "type": "A", "class": "IN", "ttl": 300 }],
+        "src_endpoint": { "ip": ip, "port": rng.randrange(1024, 65535), "vpc_uid": f"vpc-{ stable_hash(ip) % 16 ** 8:08x}", "instance_uid": entities.pick(entities.instances) },
+        "dst_endpoint": { "ip": None, "port": 53 },
+        "connection_info": { "protocol_name": "UDP", "direction": "Outbound", "direction_id": 2 },
+        "firewall_rule": { "uid": "rslvr-fw-rule-1" if blocked else None, "name": "block-list" if blocked else None },
+        "observables": observables(("query.hostname", "Hostname", hostname), ("src_endpoint.ip", "IP Address", ip)),
+    })
+    return row
+
+def vpc_flow_row(rng, entities, time):
+    denied = rng.random() < 0.2
+    src_ip = entities.pick(entities.public_ips) if rng.random() < 0.5 else entities.pick(entities.ips)
+    dst_ip = entities.pick(entities.ips)
+    dst_port = rng.choice(VPC_PORTS)
+    packets = rng.randrange(1, 200)
+    row = common_columns(rng, entities, time, "Network Activity", 4001, "Network Activity", 4, "Traffic", 6)
+    row.update({
+        "action": "Denied" if denied else "Allowed",
+        "action_id": 2 if denied else 1,
+        "disposition": "Blocked" if denied else "Allowed",
+        "status_code": "OK",
+        "start_time_dt": datetime.fromtimestamp((time - 60000) / 1000, timezone.utc),
+        "end_time_dt": datetime.fromtimestamp(time / 1000, timezone.utc),
+        "traffic": { "packets": packets, "bytes": packets * rng.randrange(40, 1500) },
+        "src_endpoint": { "ip": src_ip, "port": rng.randrange(1024, 65535), "svc_name": None, "vpc_uid": None, "instance_uid": None },
+        "dst_endpoint": { "ip": dst_ip, "port": dst_port, "svc_name": None, "vpc_uid": f"vpc-{ stable_hash(dst_ip) % 16 ** 8:08x}", "instance_uid": entities.pick(entities.instances) },
+        "connection_info": { "protocol_num": 6, "protocol_name": "TCP", "direction": "Inbound", "direction_id": 1, "tcp_flags": 2 },
+        "observables": observables(("src_endpoint.ip", "IP Address", src_ip), ("dst_endpoint.ip", "IP Address", dst_ip)),
+    })
+    return row
+
+ROW_BUILDERS = {
+    'cloudtrail_management': cloudtrail_row,
+    'security_hub': findings_row,
+    's3_data_events': s3_data_row,
+    'lambda_data_events': lambda_data_row,
+    'route53_logs': route53_row,
+    'vpc_flow_logs': vpc_flow_row,
+}
@@ -0,0 +1,317 @@
+import argparse
+import csv
+import importlib
+import json
+import math
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from benchmark.runner import SOURCE_NAMES, SOURCE_MODULES, default_environment
+from benchmark.stubs import StubBedrock
+
+# Replays recorded ingest traffic against a collection at a multiple of the recorded rate, runs from the
+# ecr_image directory with AOSS_ENDPOINT (or --endpoint) pointing at the target collection:
+#
+#   python -m benchmark.replay --captures s3://bucket/bulk-capture/ --rate 10 --index-suffix _replay --create-indices
+#   python -m benchmark.replay --athena vpc_flow_logs=results/vpc.csv route53_logs=results/r53.csv --rate 2
+#
+# Inputs are _bulk payloads recorded with BULK_CAPTURE_PATH, or Athena result files which are turned into
+# _bulk payloads offline by build_*_index with the stub Bedrock of the benchmark. Captures keep the time
+# they were sent and their request path, payloads built from Athena results are placed at the event time of
+# their first document. Every payload is sent to _bulk, actions sent to <index>/_bulk without _index (the
+# deletes of the purge) get the index of their path.
+# At --rate R every payload is sent R times within its recorded time slot, so the volume grows R times
+# while the duration and the mix of sources stay those of the recording; --speedup compresses the time line.
+# Requests go through post_bulk_payload, the same request bulk_open_search sends.
+# Reported: request latency, documents accepted, rejected (429) and failed per index, a per minute time line
+# and, with --ocu, the IndexingOCU and SearchOCU of the account from CloudWatch over the replay.
+
+def load_captures(path):
+    from indexes.bulk_capture import read_bulk_captures
+
+    return [{ 'time_ms': time_ms, 'path': bulk_path, 'payload': payload } for time_ms, bulk_path, payload in read_bulk_captures(path)]
+
+# Runs build_*_index on Athena result files without AWS: rows are read from the local CSV,
+# embeddings come from StubBedrock and the _bulk payloads are kept instead of being sent
+def convert_athena_results(specs):
+    payloads = []
+    bedrock = StubBedrock()
+    for spec in specs:
+      data_source, _, path = spec.partition('=')
+      module = importlib.import_module(SOURCE_MODULES[data_source][0])
+      build_index = getattr(module, f"build_{ SOURCE_NAMES[data_source] }_index")
+
+      with open(path, newline='', encoding='utf-8') as file:
+        rows = [row for row in csv.DictReader(file)]
+
+      def keep_payload(path, data):
+        payload = '\n'.join([json.dumps(line) for line in data]) + '\n'
+        times = [line['time'] for line in data[1::2] if str(line.get('time', '')).isdigit()]
+        payloads.append({ 'time_ms': int(times[0]) if times else 0, 'path': path, 'payload': payload })
+        return { 'took': 0, 'errors': False, 'items': data[::2] }
+
+      patches = {
+        's3_read_dictionary': lambda bucket, key: rows,
+        'bulk_open_search': keep_payload,
+        'index_exists': lambda index_name: True,
+        'create_index': lambda index_name, knn_index: None,
+        'index_count': lambda index_name: 0,
+      }
+      originals = { name: getattr(module, name) for name in patches }
+      for name, function in patches.items():
+        setattr(module, name, function)
+      try:
+        build_index(bedrock, 'replay', path)
+      finally:
+        for name, function in originals.items():
+          setattr(module, name, function)
+
+    return sorted(payloads, key=lambda payload: payload['time_ms'])
+
+# (line number, action, operation) of every action of a payload: index, create and update are
+# followed by their document, delete has none
+def bulk_actions(lines):
+    line_index = 0
+    while line_index < len(lines):
+      action = json.loads(lines[line_index])
+      operation_type, operation = next(iter(action.items()))
+      yield line_index, action, operation
+      line_index += 1 if operation_type == 'delete' else 2
+
+# Every action with its _index, the index of the request path when it has none, and the suffix appended:
+# the payload is replayed to _bulk
+def rewrite_index_names(payload, suffix, path = '_bulk'):
+    from indexes.bulk_capture import bulk_path_index
+
+    default_index = bulk_path_index(path)
+    lines = payload.rstrip('\n').split('\n')
+    for line_index, action, operation in bulk_actions(lines):
+      index_name = operation.get('_index') or default_index
+      if index_name is None:
+        raise ValueError(f"Bulk action without _index sent to { path }: { lines[line_index] }")
+      operation['_index'] = index_name + suffix
+      lines[line_index] = json.dumps(action)
+    return '\n'.join(lines) + '\n'
+
+def payload_indices(payload):
+    counts = {}
+    lines = payload.rstrip('\n').split('\n')
+    for _, _, operation in bulk_actions(lines):
+      counts[operation['_index']] = counts.get(operation['_index'], 0) + 1
+    return counts
+
+# Send times in seconds from the start, every payload rate times spread over the gap to the next one
+def build_schedule(payloads, rate, speedup):
+    if not payloads:
+      return []
+
+    offsets = [(payload['time_ms'] - payloads[0]['time_ms']) / 1000 / speedup for payload in payloads]
+    gaps = [offsets[index + 1] - offsets[index] for index in range(len(offsets) - 1)]
+    last_gap = statistics.median(gaps) if gaps else 1.0
+
+    schedule = []
+    for index, payload in enumerate(payloads):
+      copies = int(rate * (index + 1)) - int(rate * index)
+      gap = gaps[index] if index < len(gaps) else last_gap
+      for copy in range(copies):
+        schedule.append((offsets[index] + gap * copy / copies, payload))
+    return sorted(schedule, key=lambda entry: entry[0])
+
+class ReplayStats:
+    def __init__(self, bucket_seconds):
+        self.lock = threading.Lock()
+        self.bucket_seconds = bucket_seconds
+        self.latencies = []
+        self.lags = []
+        self.indices = {}
+        self.timeline = {}
+        self.throttled_requests = 0
+        self.failed_requests = 0
+
+    def record(self, elapsed, latency, lag, counts, status_code, body):
+        items = body.get('items', []) if isinstance(body, dict) else []
+        with self.lock:
+          self.latencies.append(latency)
+          self.lags.append(lag)
+          bucket = self.timeline.setdefault(int(elapsed // self.bucket_seconds), { 'requests': 0, 'documents': 0, 'rejected': 0, 'latencies': [] })
+          bucket['requests'] += 1
+          bucket['latencies'].append(latency)
+
+          if status_code == 429:
+            self.throttled_requests += 1
+          elif status_code >= 300:
+            self.failed_requests += 1
+
+          for index_name, count in counts.items():
+            stats = self.indices.setdefault(index_name, { 'sent': 0, 'accepted': 0, 'rejected': 0, 'failed': 0 })
+            stats['sent'] += count
+            bucket['documents'] += count
+            if status_code == 429:
+              stats['rejected'] += count
+              bucket['rejected'] += count
+            elif status_code >= 300 or not items:
+              stats['failed'] += count
+
+          for item in items:
+            result = next(iter(item.values()))
+            stats = self.indices.setdefault(result.get('_index'), { 'sent': 0, 'accepted': 0, 'rejected': 0, 'failed': 0 })
+            if result.get('status', 500) < 300:
+              stats['accepted'] += 1
+            elif result.get('status') == 429:
+              stats['rejected'] += 1
+              bucket['rejected'] += 1
+            else:
+              stats['failed'] += 1
+
+    def report(self):
+        latencies = sorted(self.latencies) or [0]
+        return {
+          'requests': len(self.latencies),
+          'throttled_requests': self.throttled_requests,
+          'failed_requests': self.failed_requests,
+          'latency_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+          'latency_p95_ms': round(percentile(latencies, 95) * 1000, 1),
+          'latency_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+          'max_schedule_lag_seconds': round(max(self.lags or [0]), 2),
+          'indices': self.indices,
+          'timeline': [{
+            'second': bucket * self.bucket_seconds,
+            'requests': values['requests'],
+            'documents_per_second': round(values['documents'] / self.bucket_seconds, 1),
+            'rejection_rate': round(values['rejected'] / values['documents'], 4) if values['documents'] else 0,
+            'latency_p95_ms': round(percentile(sorted(values['latencies']), 95) * 1000, 1),
+          } for bucket, values in sorted(self.timeline.items())],
+        }
+
+def percentile(ordered, value):
+    return ordered[min(len(ordered) - 1, int(math.ceil(len(ordered) * value / 100)) - 1)] if ordered else 0
+
+def replay(schedule, concurrency, bucket_seconds):
+    from indexes.opensearch_utils import post_bulk_payload
+
+    stats = ReplayStats(bucket_seconds)
+
+    def send(scheduled, payload):
+        started = time.perf_counter()
+        try:
+          response = post_bulk_payload('_bulk', payload['payload'])
+          status_code = response.status_code
+          try:
+            body = response.json()
+          except ValueError:
+            body = None
+        except Exception as e:
+          print(f"Replay request failed: { e }")
+          status_code, body = 599, None
+        finished = time.perf_counter()
+        stats.record(started - start, finished - started, started - start - scheduled, payload['counts'], status_code, body)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      for scheduled, payload in schedule:
+        delay = scheduled - (time.perf_counter() - start)
+        if delay > 0:
+          time.sleep(delay) # nosemgrep pacing the replay
+        executor.submit(send, scheduled, payload)
+
+    return stats.report()
+
+def create_indices(index_names, suffix):
+    from indexes.opensearch_utils import create_index, index_exists
+
+    data_sources = { index_name: data_source for data_source, index_name in json.loads(os.environ['SL_DATASOURCE_MAP']).items() if index_name }
+    for index_name in index_names:
+      data_source = data_sources.get(index_name[:len(index_name) - len(suffix)] if suffix else index_name)
+      if data_source in SOURCE_MODULES and not index_exists(index_name):
+        module = importlib.import_module(SOURCE_MODULES[data_source][0])
+        create_index(index_name, getattr(module, f"security_lake_{ SOURCE_NAMES[data_source] }_index_knn"))
+
+# Serverless capacity is reported per account, ClientId is the account id
+def ocu_metrics(started, finished):
+    import boto3
+
+    account_id = boto3.client('sts').get_caller_identity()['Account']
+    cloudwatch = boto3.client('cloudwatch', region_name=os.environ['AWS_REGION'])
+    metrics = {}
+    for metric_name in ['IndexingOCU', 'SearchOCU']:
+      response = cloudwatch.get_metric_statistics(
+        Namespace='AWS/AOSS',
+        MetricName=metric_name,
+        Dimensions=[{ 'Name': 'ClientId', 'Value': account_id }],
+        StartTime=started - timedelta(minutes=5),
+        EndTime=finished + timedelta(minutes=5),
+        Period=60,
+        Statistics=['Maximum'])
+      metrics[metric_name] = [{
+        'time': point['Timestamp'].isoformat(),
+        'ocu': point['Maximum']
+      } for point in sorted(response['Datapoints'], key=lambda point: point['Timestamp'])]
+    return metrics
+
+def print_report(report):
+    print(f"Requests: { report['requests'] } | throttled: { report['throttled_requests'] } | failed: { report['failed_requests'] } | max schedule lag: { report['max_schedule_lag_seconds'] } s")
+    print(f"Latency: p50 { report['latency_p50_ms'] } ms | p95 { report['latency_p95_ms'] } ms | p99 { report['latency_p99_ms'] } ms")
+    for index_name, stats in sorted(report['indices'].items()):
+      rejection_rate = stats['rejected'] / stats['sent'] if stats['sent'] else 0
+      print(f"{ index_name }: sent { stats['sent'] } | accepted { stats['accepted'] } | rejected { stats['rejected'] } ({rejection_rate:0.2%}) | failed { stats['failed'] }")
+    for bucket in report['timeline']:
+      print(f"  +{ bucket['second'] }s: { bucket['documents_per_second'] } docs/s | rejection rate { bucket['rejection_rate'] } | p95 { bucket['latency_p95_ms'] } ms")
+    for metric_name, points in report.get('ocu', {}).items():
+      print(f"{ metric_name }: { ', '.join(str(point['ocu']) for point in points) or 'no data' }")
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded ingest traffic against a collection')
+    parser.add_argument('--captures', default=None, help='directory or s3://bucket/prefix recorded with BULK_CAPTURE_PATH')
+    parser.add_argument('--athena', nargs='*', default=[], help='data_source=path of Athena result CSV files')
+    parser.add_argument('--endpoint', default=None, help='target collection, defaults to AOSS_ENDPOINT')
+    parser.add_argument('--rate', type=float, default=1.0, help='volume multiplier, 2 sends every payload twice')
+    parser.add_argument('--speedup', type=float, default=1.0, help='time line compression, 60 replays an hour in a minute')
+    parser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    parser.add_argument('--index-suffix', default='', help='appended to the index names, keeps the replay out of the live indices')
+    parser.add_argument('--create-indices', action='store_true', help='create missing target indices with the source mappings')
+    parser.add_argument('--bucket-seconds', type=int, default=60, help='time line resolution')
+    parser.add_argument('--ocu', action='store_true', help='read IndexingOCU and SearchOCU from CloudWatch after the replay')
+    parser.add_argument('--output', default=None, help='write the report as JSON')
+    args = parser.parse_args()
+
+    if args.endpoint:
+      os.environ['AOSS_ENDPOINT'] = args.endpoint
+    if 'AOSS_ENDPOINT' not in os.environ:
+      parser.error('set AOSS_ENDPOINT or --endpoint')
+    default_environment()
+
+    payloads = load_captures(args.captures) if args.captures else []
+    payloads += convert_athena_results(args.athena)
+    if not payloads:
+      parser.error('nothing to replay, use --captures or --athena')
+
+    index_names = set()
+    for payload in payloads:
+      payload['payload'] = rewrite_index_names(payload['payload'], args.index_suffix, payload['path'])
+      payload['counts'] = payload_indices(payload['payload'])
+      index_names.update(payload['counts'])
+
+    if args.create_indices:
+      create_indices(sorted(index_names), args.index_suffix)
+
+    schedule = build_schedule(sorted(payloads, key=lambda payload: payload['time_ms']), args.rate, args.speedup)
+    print(f"Replaying { len(payloads) } payloads as { len(schedule) } requests over { schedule[-1][0]:0.1f} seconds to { os.environ['AOSS_ENDPOINT'] }")
+
+    started = datetime.now(timezone.utc)
+    report = replay(schedule, args.concurrency, args.bucket_seconds)
+    finished = datetime.now(timezone.utc)
+
+    if args.ocu:
+      report['ocu'] = ocu_metrics(started, finished)
+
+    print_report(report)
+    if args.output:
+      with open(args.output, 'w') as file:
+        json.dump({ 'parameters': vars(args), 'started': started.isoformat(), 'finished': finished.isoformat(), 'report': report }, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import importlib
+import json
+import os
+import resource
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from benchmark.generator import SOURCES, write_fixtures
+from benchmark.stubs import StubBedrock, start_stub_aoss
+
+# End to end ingest benchmark, runs from the ecr_image directory:
+#
+#   python -m benchmark.runner --sources vpc_flow_logs route53_logs --rows 5000 --cardinality 200 --embedding-latency-ms 20
+#
+# For each source synthetic OCSF rows are written as Parquet, then ingest_security_lake_*_data runs unchanged:
+# the Athena query runs on DuckDB (ATHENA_BACKEND=duckdb), build_*_index reads the result file, embeds with
+# StubBedrock and bulk loads into the AOSS emulator from support/. Nothing is sent to AWS.
+# Reported per source: rows generated and indexed, rows/s, per stage latency and peak memory.
+# Requires duckdb and pyarrow, which are not part of the container image.
+
+SOURCE_MODULES = {
+    'cloudtrail_management': ('indexes.sl_cloud_trail_index', 'ingest_security_lake_cloud_trail_data', 'SL_CLOUDTRAIL'),
+    'security_hub': ('indexes.sl_findings_idx', 'ingest_security_lake_findings_data', 'SL_FINDINGS'),
+    's3_data_events': ('indexes.sl_s3_data_index', 'ingest_security_lake_s3_data_data', 'SL_S3DATA'),
+    'lambda_data_events': ('indexes.sl_lambda_index', 'ingest_security_lake_lambda_data', 'SL_LAMBDA'),
+    'route53_logs': ('indexes.sl_route53_index', 'ingest_security_lake_route53_data', 'SL_ROUTE53'),
+    'vpc_flow_logs': ('indexes.sl_vpc_flow_index', 'ingest_security_lake_vpc_flow_data', 'SL_VPCFLOW'),
+}
+
+DEFAULT_INDEX_NAMES = {
+    'cloudtrail_management': 'security_lake_cloud_trail_index',
+    'security_hub': 'security_lake_findings_index',
+    's3_data_events': 'security_lake_s3_data_index',
+    'lambda_data_events': 'security_lake_lambda_index',
+    'route53_logs': 'security_lake_route53_index',
+    'vpc_flow_logs': 'security_lake_vpc_flow_index',
+}
+
+# Infix of the module level names, e.g. security_lake_vpc_flow_index_name and build_vpc_flow_index
+SOURCE_NAMES = {
+    'cloudtrail_management': 'cloud_trail',
+    'security_hub': 'findings',
+    's3_data_events': 's3_data',
+    'lambda_data_events': 'lambda',
+    'route53_logs': 'route53',
+    'vpc_flow_logs': 'vpc_flow',
+}
+
+# Functions wrapped in every source module, by stage name
+TIMED_STAGES = {
+    'query': 'athena_to_s3',
+    'read': 's3_read_dictionary',
+    'embed': 'get_embeddings_by_type',
+    'bulk': 'bulk_open_search',
+}
+
+def benchmark_environment(work_path, rows, aoss_endpoint):
+    # env.py reads the environment at import. The backend, paths and endpoint are always set,
+    # for the other values those already set by the caller win
+    os.environ.update({
+        'INDEX_RECORD_LIMIT': str(rows),
+        'AOSS_ENDPOINT': aoss_endpoint,
+        'ATHENA_BACKEND': 'duckdb',
+        'DUCKDB_PARQUET_PATH': os.path.join(work_path, 'parquet'),
+        'DUCKDB_RESULTS_PATH': os.path.join(work_path, 'results'),
+    })
+    default_environment()
+
+def default_environment():
+    defaults = {
+        'INDEX_RECORD_LIMIT': '1000',
+        'AWS_REGION': 'us-east-1',
+        'AOSS_PURGE_LT': 'now-5d/d',
+        'AOSS_TIME_ZONE': 'UTC',
+        'AOSS_BULK_CREATE_SIZE': '100',
+        'AOSS_BULK_DELETE_SIZE': '100',
+        'SECURITY_LAKE_ATHENA_BUCKET': 'benchmark',
+        'SECURITY_LAKE_ATHENA_PREFIX': 'results',
+        'ATHENA_QUERY_TIMEOUT': '30',
+        'SL_DATABASE_NAME': 'benchmark',
+        'SL_CLOUDTRAIL': 'amazon_security_lake_table_cloud_trail_mgmt_2_0',
+        'SL_FINDINGS': 'amazon_security_lake_table_sh_findings_2_0',
+        'SL_S3DATA': 'amazon_security_lake_table_s3_data_2_0',
+        'SL_LAMBDA': 'amazon_security_lake_table_lambda_execution_2_0',
+        'SL_ROUTE53': 'amazon_security_lake_table_route53_2_0',
+        'SL_VPCFLOW': 'amazon_security_lake_table_vpc_flow_2_0',
+        'SL_DATASOURCE_MAP': json.dumps(DEFAULT_INDEX_NAMES),
+    }
+    for name, value in defaults.items():
+      os.environ.setdefault(name, value)
+
+# Rows must be newer than the max time ingest starts from, midnight in AOSS_TIME_ZONE for an empty index
+def ingest_window():
+    import dateutil.tz
+
+    now = datetime.now(timezone.utc)
+    midnight = (datetime.now(dateutil.tz.gettz(os.environ['AOSS_TIME_ZONE']))
+      .replace(hour=0, minute=0, second=0, microsecond=0)
+      .astimezone(timezone.utc))
+    end_ms = int(now.timestamp() * 1000) - 1000
+    start_ms = max(int(midnight.timestamp() * 1000) + 1000, end_ms - 60 * 60 * 1000)
+    return start_ms, end_ms
+
+class StageTimer:
+    def __init__(self):
+        self.latencies = {}
+
+    def wrap(self, stage, function):
+        def timed(*args, **kwargs):
+          tic = time.perf_counter()
+          try:
+            return function(*args, **kwargs)
+          finally:
+            self.latencies.setdefault(stage, []).append(time.perf_counter() - tic)
+        return timed
+
+    def report(self):
+        report = {}
+        for stage, latencies in self.latencies.items():
+          ordered = sorted(latencies)
+          report[stage] = {
+            'calls': len(ordered),
+            'total_seconds': round(sum(ordered), 4),
+            'p50_ms': round(statistics.median(ordered) * 1000, 3),
+            'p95_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+          }
+        return report
+
+def run_source(data_source, bedrock, trace_memory):
+    from indexes.opensearch_utils import index_count
+
+    module_name, ingest_name, _ = SOURCE_MODULES[data_source]
+    module = importlib.import_module(module_name)
+    timer = StageTimer()
+
+    originals = {}
+    for stage, function_name in TIMED_STAGES.items():
+      originals[function_name] = getattr(module, function_name)
+      setattr(module, function_name, timer.wrap(stage, originals[function_name]))
+
+    if trace_memory:
+      tracemalloc.start()
+
+    tic = time.perf_counter()
+    try:
+      getattr(module, ingest_name)(bedrock, None)
+    finally:
+      seconds = time.perf_counter() - tic
+      peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+      if trace_memory:
+        tracemalloc.stop()
+      for function_name, function in originals.items():
+        setattr(module, function_name, function)
+
+    stages = timer.report()
+    accounted = sum(stage['total_seconds'] for stage in stages.values())
+    stages['transform'] = { 'calls': 1, 'total_seconds': round(max(seconds - accounted, 0), 4) }
+
+    indexed = index_count(json.loads(os.environ['SL_DATASOURCE_MAP'])[data_source]) or 0
+    return {
+      'data_source': data_source,
+      'rows_indexed': indexed,
+      'seconds': round(seconds, 4),
+      'rows_per_second': round(indexed / seconds, 1) if seconds else None,
+      'stages': stages,
+      'peak_traced_mb': round(peak / 1024 / 1024, 2) if peak is not None else None,
+      'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+    }
+
+def print_result(result):
+    print(f"{ result['data_source'] }: { result['rows_generated'] } rows generated, { result['rows_indexed'] } indexed in { result['seconds'] } seconds ({ result['rows_per_second'] } rows/s)")
+    for stage, values in result['stages'].items():
+      latency = f", p50 { values['p50_ms'] } ms, p95 { values['p95_ms'] } ms" if 'p50_ms' in values else ""
+      print(f"  { stage }: { values['calls'] } calls, { values['total_seconds'] } seconds{ latency }")
+    print(f"  memory: peak traced { result['peak_traced_mb'] } MB, max rss { result['max_rss_mb'] } MB")
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic OCSF ingest benchmark')
+    parser.add_argument('--sources', nargs='+', default=SOURCES, choices=SOURCES)
+    parser.add_argument('--rows', type=int, default=1000, help='rows generated per source')
+    parser.add_argument('--cardinality', type=int, default=100, help='distinct principals, addresses, hostnames, ... per source')
+    parser.add_argument('--embedding-latency-ms', type=float, default=0, help='stub Bedrock latency per embedding call')
+    parser.add_argument('--aoss-endpoint', default=None, help='use a running emulator or domain instead of an in process emulator')
+    parser.add_argument('--trace-memory', action='store_true', help='report the tracemalloc peak, slows down the run')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    emulator = None if args.aoss_endpoint else start_stub_aoss()
+    work_path = tempfile.mkdtemp(prefix='ingest-benchmark-')
+    benchmark_environment(work_path, args.rows, args.aoss_endpoint or emulator.endpoint)
+
+    from env import BEDROCK_EMBEDDINGS_DIMENSIONS, DUCKDB_PARQUET_PATH
+    bedrock = StubBedrock(args.embedding_latency_ms, BEDROCK_EMBEDDINGS_DIMENSIONS)
+    start_ms, end_ms = ingest_window()
+
+    results = []
+    try:
+      for data_source in args.sources:
+        table_name = os.environ[SOURCE_MODULES[data_source][2]]
+        generated = write_fixtures(data_source, table_name, DUCKDB_PARQUET_PATH, args.rows, args.cardinality, start_ms, end_ms, args.seed)
+        result = run_source(data_source, bedrock, args.trace_memory)
+        result['rows_generated'] = generated
+        results.append(result)
+    finally:
+      if emulator is not None:
+        emulator.stop()
+      shutil.rmtree(work_path, ignore_errors=True)
+
+    for result in results:
+      print_result(result)
+
+    if args.output:
+      with open(args.output, 'w') as file:
+        json.dump({ 'parameters': vars(args), 'results': results }, file, indent=2)
+
+if __name__ == '__main__':
+    main()
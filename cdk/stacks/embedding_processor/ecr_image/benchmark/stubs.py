@@ -0,0 +1,53 @@
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import sys
+import time
+
+# Stand-ins for Bedrock and OpenSearch Serverless used by the ingest benchmark.
+#
+# StubBedrock answers invoke_model like Titan v2 with a vector seeded from a hash of the input text,
+# the same text always gets the same embedding, so runs are repeatable and the kNN results are stable.
+# latency_ms sleeps before each answer to model the Bedrock round trip.
+
+class StubBedrock:
+    def __init__(self, latency_ms = 0, dimensions = 512):
+        self.latency_ms = latency_ms
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def invoke_model(self, body, modelId = None, accept = None, contentType = None):
+        request = json.loads(body)
+        self.calls += 1
+        if self.latency_ms:
+          time.sleep(self.latency_ms / 1000)
+
+        vector = hash_embedding(request.get('inputText', ''), request.get('dimensions', self.dimensions))
+        response = {
+          "embedding": vector,
+          "inputTextTokenCount": len(request.get('inputText', '').split()),
+          "embeddingsByType": {}
+        }
+        for embedding_type in request.get('embeddingTypes', ["float"]):
+          response["embeddingsByType"][embedding_type] = vector if embedding_type == "float" else [1 if value > 0 else 0 for value in vector]
+
+        return { 'body': io.BytesIO(json.dumps(response).encode('utf-8')) }
+
+def hash_embedding(text, dimensions):
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'big')
+    rng = random.Random(seed)
+    vector = [rng.gauss(0, 1) for _ in range(dimensions)]
+    norm = math.sqrt(sum(value * value for value in vector)) or 1
+    return [value / norm for value in vector]
+
+# The AOSS emulator lives in support/ at the root of the repository, next to the other local tools
+def start_stub_aoss(port = 0):
+    support_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', '..', 'support'))
+    if support_path not in sys.path:
+      sys.path.append(support_path)
+    from aoss_emulator import AossEmulator
+
+    return AossEmulator(port = port).start()
@@ -1,7 +1,9 @@
 import boto3
 from botocore.exceptions import ClientError
 import json
-from env import  BEDROCK_EMBEDDINGS_MODEL_V2
+import time
+from container.metrics import put_metric
+from env import  BEDROCK_EMBEDDINGS_MODEL_V2, BEDROCK_EMBEDDINGS_DIMENSIONS
 
 def init_bedrock():
     bedrock = boto3.client(
@@ -17,13 +19,47 @@ def get_embedding(body, bedrock):
         accept = '*/*'
         contentType = 'application/json'
 
-        body["dimensions"] = 512
+        body["dimensions"] = BEDROCK_EMBEDDINGS_DIMENSIONS
         body["normalize"] = True
     
+        tic = time.perf_counter()
         response = bedrock.invoke_model(body=json.dumps(body), modelId=modelId, accept=accept, contentType=contentType)
         response_body = json.loads(response.get('body').read())
+        put_embedding_metrics(response, time.perf_counter() - tic)
         embedding = response_body.get('embedding')
         return embedding
     except (ClientError, Exception) as e:
+        if isinstance(e, ClientError) and e.response['Error']['Code'] == 'ThrottlingException':
+            put_metric('EmbeddingThrottles', 1)
         print(f"ERROR: Can't invoke '{ modelId }'. Reason: { e }")
-        raise
\ No newline at end of file
+        raise
+
+# Titan v2 returns several embedding types from a single call, e.g. ["float", "binary"]
+def get_embeddings_by_type(body, bedrock, embedding_types):
+
+    try:
+        modelId = BEDROCK_EMBEDDINGS_MODEL_V2
+        accept = '*/*'
+        contentType = 'application/json'
+
+        body["dimensions"] = BEDROCK_EMBEDDINGS_DIMENSIONS
+        body["normalize"] = True
+        body["embeddingTypes"] = embedding_types
+
+        tic = time.perf_counter()
+        response = bedrock.invoke_model(body=json.dumps(body), modelId=modelId, accept=accept, contentType=contentType)
+        response_body = json.loads(response.get('body').read())
+        put_embedding_metrics(response, time.perf_counter() - tic)
+        return response_body.get('embeddingsByType')
+    except (ClientError, Exception) as e:
+        if isinstance(e, ClientError) and e.response['Error']['Code'] == 'ThrottlingException':
+            put_metric('EmbeddingThrottles', 1)
+        print(f"ERROR: Can't invoke '{ modelId }'. Reason: { e }")
+        raise
+
+# Retries are mostly throttling absorbed by the botocore retry policy
+def put_embedding_metrics(response, seconds):
+    put_metric('EmbeddingLatency', round(seconds * 1000, 1), 'Milliseconds')
+    retries = response.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    if retries:
+        put_metric('EmbeddingRetries', retries)
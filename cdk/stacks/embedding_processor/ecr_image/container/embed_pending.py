@@ -0,0 +1,150 @@
+import importlib
+import time
+from botocore.exceptions import ClientError
+from container.bedrock_utils import get_embeddings_by_type
+from container.lease import acquire_lease, release_lease, LeaseLost
+from container.metrics import set_metrics_source, put_metric, flush_metrics
+from container.indices_ingest import run_index
+from indexes.deferred_embedding import embedding_state_mappings, embedding_version, embedded_fields, pending_query, embed_features, \
+                                       EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD, \
+                                       EMBEDDING_PENDING, EMBEDDING_FAILED
+from indexes.opensearch_utils import index_exists, index_search, bulk_open_search, update_index_mapping
+from indexes.vector_storage import embedding_types, uses_features, VECTOR_FIELD, RESCORE_VECTOR_FIELD
+from env import SL_DATASOURCE_MAP, INDEX_RECORD_LIMIT, EMBEDDING_MAX_ATTEMPTS, EMBED_PENDING_BATCH_SIZE, ROUTE53_HOSTNAME_INDEX
+
+# RUN_MODE=embed_pending: adds the vectors of the documents indexed as pending and re-embeds the stale ones
+# (another embedding_version), see indexes/deferred_embedding.py. Up to INDEX_RECORD_LIMIT documents per
+# source and run, oldest first, written back with partial _bulk updates. Throttled calls are retried
+# after a doubling pause, the run goes as fast as the Bedrock quota allows and stops a source after
+# THROTTLE_MAX_RETRIES throttles in a row. Feature vectors (VECTOR_STORAGE features) need no Bedrock call. Its lease is separate from the one of the ingest: the two
+# touch different documents and run side by side, but two embed_pending jobs never drain the same source.
+
+# Embedding function and field list of each source module
+PENDING_SOURCES = {
+    'cloudtrail_management': ('indexes.sl_cloud_trail_index', 'security_lake_cloud_trail_embedding_fields'),
+    'security_hub': ('indexes.sl_findings_idx', 'security_lake_findings_embedding_fields'),
+    's3_data_events': ('indexes.sl_s3_data_index', 'security_lake_s3_data_embedding_fields'),
+    'lambda_data_events': ('indexes.sl_lambda_index', 'security_lake_lambda_embedding_fields'),
+    'route53_logs': ('indexes.sl_route53_index', 'security_lake_route53_embedding_fields'),
+    'vpc_flow_logs': ('indexes.sl_vpc_flow_index', 'security_lake_vpc_flow_embedding_fields'),
+}
+
+# Entity indices, drained after the index of their source: index name, module, field list
+ENTITY_PENDING_SOURCES = {
+    'route53_logs': (ROUTE53_HOSTNAME_INDEX, 'indexes.route53_hostnames', 'route53_hostname_embedding_fields'),
+}
+
+THROTTLE_ERRORS = ['ThrottlingException', 'ServiceUnavailableException', 'ModelNotReadyException']
+THROTTLE_MAX_PAUSE = 60
+THROTTLE_MAX_RETRIES = 10
+
+def embed_pending_indices(bedrock):
+    for data_source, (module_name, fields_name) in PENDING_SOURCES.items():
+      index_name = SL_DATASOURCE_MAP.get(data_source)
+      if not index_name or not run_index(index_name):
+        continue
+
+      embed_pending_index(data_source, index_name, module_name, fields_name, bedrock)
+      entity_index, entity_module, entity_fields = ENTITY_PENDING_SOURCES.get(data_source, (None, None, None))
+      if entity_index:
+        embed_pending_index(data_source, entity_index, entity_module, entity_fields, bedrock)
+
+def embed_pending_index(data_source, index_name, module_name, fields_name, bedrock):
+    set_metrics_source(data_source)
+    if not acquire_lease(data_source, f"{ index_name }-embed_pending"):
+      return
+    try:
+      tic = time.perf_counter()
+      module = importlib.import_module(module_name)
+      embedded, failed = embed_pending_source(data_source, index_name, module, getattr(module, fields_name), bedrock)
+      print(f"Embed pending { index_name }: embedded={ embedded } | failed={ failed } | { time.perf_counter() - tic:0.4f} seconds")
+    except LeaseLost as e:
+      print(str(e))
+    finally:
+      release_lease(data_source)
+      flush_metrics()
+
+def embed_pending_source(data_source, index_name, module, fields, bedrock):
+    if not index_exists(index_name):
+      return 0, 0
+
+    # indices created before the embedding state have no mapping for it yet
+    update_index_mapping(index_name, embedding_state_mappings())
+
+    version = embedding_version(data_source, fields)
+    query = {
+      "size": EMBED_PENDING_BATCH_SIZE,
+      "query": pending_query(version),
+      # _id breaks the ties of documents with the same time, aggregated and sampled documents share their bucket time
+      "sort": [{ "time": { "order": "asc" } }, { "_id": { "order": "asc" } }],
+      "_source": { "excludes": [VECTOR_FIELD, RESCORE_VECTOR_FIELD] }
+    }
+
+    embedded = 0
+    failed = 0
+    while embedded + failed < INDEX_RECORD_LIMIT:
+      response = index_search(index_name, query)
+      hits = response['hits']['hits'] if response is not None else []
+      if not hits:
+        break
+
+      bulk_body = []
+      if uses_features(data_source):
+        # feature vectors are computed in batch, without Bedrock
+        docs = [hit['_source'] for hit in hits]
+        embed_features(data_source, docs, fields)
+        for hit, doc in zip(hits, docs):
+          bulk_body.append({ "update": { "_index": index_name, "_id": hit['_id'] } })
+          bulk_body.append({ "doc": { field: doc[field] for field in [VECTOR_FIELD, EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD] } })
+        embedded += len(docs)
+      else:
+        for hit in hits:
+          text = module.create_embedding_str(hit['_source'])
+          try:
+            embeddings = embed_with_backoff(data_source, text, bedrock)
+          except ThrottledOut:
+            print(f"{ data_source }: throttled { THROTTLE_MAX_RETRIES } times in a row, stopping")
+            break
+          except Exception as e:
+            print(f"{ data_source }: embedding { hit['_id'] } failed: { e }")
+            attempts = int(hit['_source'].get(EMBEDDING_ATTEMPTS_FIELD) or 0) + 1
+            fields_update = {
+              EMBEDDING_STATE_FIELD: EMBEDDING_FAILED if attempts >= EMBEDDING_MAX_ATTEMPTS else EMBEDDING_PENDING,
+              EMBEDDING_VERSION_FIELD: version,
+              EMBEDDING_ATTEMPTS_FIELD: attempts
+            }
+            failed += 1
+          else:
+            fields_update = embedded_fields(data_source, embeddings, version)
+            embedded += 1
+
+          bulk_body.append({ "update": { "_index": index_name, "_id": hit['_id'] } })
+          bulk_body.append({ "doc": fields_update })
+
+      if bulk_body:
+        bulk_response = bulk_open_search("_bulk", bulk_body)
+        print(f"bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+      if len(bulk_body) < 2 * len(hits):
+        break
+
+      # updated documents can still match until the index refreshes, page forward instead of searching again
+      query['search_after'] = hits[-1]['sort']
+
+    put_metric('EmbeddingDrained', embedded)
+    put_metric('EmbeddingDrainFailures', failed)
+    return embedded, failed
+
+class ThrottledOut(Exception):
+    pass
+
+def embed_with_backoff(data_source, text, bedrock):
+    pause = 1
+    for _ in range(THROTTLE_MAX_RETRIES):
+      try:
+        return get_embeddings_by_type({ "inputText": text }, bedrock, embedding_types(data_source))
+      except ClientError as e:
+        if e.response['Error']['Code'] not in THROTTLE_ERRORS:
+          raise
+        time.sleep(pause) # nosemgrep backoff on Bedrock throttling
+        pause = min(pause * 2, THROTTLE_MAX_PAUSE)
+    raise ThrottledOut()
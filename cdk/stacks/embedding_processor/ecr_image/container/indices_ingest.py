@@ -1,5 +1,12 @@
 import time
-from env import RUN_INDEX_NAME, SL_DATASOURCE_MAP
+from container.lease import acquire_lease, release_lease, LeaseLost
+from container.profiling import profile_stage
+from container.metrics import set_metrics_source, put_metric, get_metric_values, flush_metrics, percentile
+from indexes.opensearch_utils import get_index_max_time
+from indexes.rollups import purge_rollups
+from indexes.entity_profiles import purge_entity_profiles
+from indexes.sketches import purge_sketches
+from env import RUN_INDEX_NAME, SL_DATASOURCE_MAP, ENTITY_PROFILE_INDEX
 
 def run_index(index):
     if not RUN_INDEX_NAME or not RUN_INDEX_NAME.strip():
@@ -9,8 +16,89 @@ def run_index(index):
     else:
       return False
 
+def record_ingest_metrics(data_source, purge_seconds, ingest_seconds):
+    put_metric('PurgeDuration', round(purge_seconds * 1000), 'Milliseconds')
+    put_metric('IngestDuration', round(ingest_seconds * 1000), 'Milliseconds')
+
+    latencies = get_metric_values('EmbeddingLatency')
+    if latencies:
+      print(f"Embedding latency: p50={ percentile(latencies, 50) }ms | p99={ percentile(latencies, 99) }ms | calls={ len(latencies) }")
+
+    # what is not spent waiting on Athena, Bedrock or the bulk requests is spent reading and transforming rows
+    rows = sum(get_metric_values('RowsRead'))
+    waiting_ms = sum(get_metric_values('AthenaQueryDuration')) + sum(get_metric_values('EmbeddingLatency')) + sum(get_metric_values('BulkLatency'))
+    transform_seconds = ingest_seconds - waiting_ms / 1000
+    if rows and transform_seconds > 0:
+      put_metric('TransformRowsPerSecond', round(rows / transform_seconds, 1), 'Count/Second')
+
+    # age of the newest indexed event
+    max_time = get_index_max_time(SL_DATASOURCE_MAP[data_source])
+    if max_time is not None:
+      put_metric('WatermarkLag', round(time.time() - max_time / 1000), 'Seconds')
+
+    flush_metrics()
+
+# Purge and ingest one source, only while holding its lease: a job that overlaps with another one
+# for the same index skips it instead of embedding the same rows again
+def ingest_source(data_source, label, purge, ingest, credentials, bedrock):
+    set_metrics_source(data_source)
+    if not acquire_lease(data_source, SL_DATASOURCE_MAP[data_source]):
+      flush_metrics()
+      return
+
+    try:
+      tic = time.perf_counter()
+      with profile_stage(data_source, "purge"):
+        purge()
+        try:
+          purge_rollups(data_source)
+          purge_sketches(data_source)
+        except Exception as e:
+          # derived data, the ingest of the events goes on
+          print(f"Purge of the rollups and sketches of { data_source } failed: { e }")
+      toc = time.perf_counter()
+      print(f"Purge Security Lake {label} Index: {toc - tic:0.4f} seconds")
+      purge_seconds = toc - tic
+
+      tic = time.perf_counter()
+      with profile_stage(data_source, "ingest"):
+        ingest(bedrock, credentials)
+      toc = time.perf_counter()
+      print(f"Ingest Security Lake {label} Index: {toc - tic:0.4f} seconds")
+      record_ingest_metrics(data_source, purge_seconds, toc - tic)
+    except LeaseLost as e:
+      # another job owns the source now, the next source runs
+      print(str(e))
+      flush_metrics()
+    finally:
+      release_lease(data_source)
+
+# The entity profiles are shared by the sources: purged once per run, under their own lease so that
+# concurrent per source jobs do not purge the same index
+def purge_entity_profile_index():
+    if not ENTITY_PROFILE_INDEX:
+      return
+    set_metrics_source("entity_profiles")
+    if not acquire_lease("entity_profiles", ENTITY_PROFILE_INDEX):
+      flush_metrics()
+      return
+
+    try:
+      tic = time.perf_counter()
+      with profile_stage("entity_profiles", "purge"):
+        purge_entity_profiles()
+      print(f"Purge entity profiles: {time.perf_counter() - tic:0.4f} seconds")
+    except (Exception, LeaseLost) as e:
+      # a derived index, the ingest of the sources goes on
+      print(f"Purge entity profiles failed: { e }")
+    finally:
+      release_lease("entity_profiles")
+      flush_metrics()
+
 def ingest_indices(credentials, bedrock):
 
+  purge_entity_profile_index()
+
   INDEX_INGEST_CLOUD_TRAIL=run_index(SL_DATASOURCE_MAP["cloudtrail_management"])
   INDEX_INGEST_FINDINGS=run_index(SL_DATASOURCE_MAP["security_hub"])
   INDEX_INGEST_S3_DATA=run_index(SL_DATASOURCE_MAP["s3_data_events"])
@@ -21,90 +109,29 @@ def ingest_indices(credentials, bedrock):
   # Build Security Lake Cloud Trail Index
   if INDEX_INGEST_CLOUD_TRAIL:
       from indexes.sl_cloud_trail_index import ingest_security_lake_cloud_trail_data, purge_security_lake_cloud_trail_data
-
-      # Purge Security Lake Cloud Trail Index
-      tic = time.perf_counter()
-      purge_security_lake_cloud_trail_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake Cloud Trail Index: {toc - tic:0.4f} seconds")
-
-      tic = time.perf_counter()
-      ingest_security_lake_cloud_trail_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake Cloud Trail Index: {toc - tic:0.4f} seconds")
+      ingest_source("cloudtrail_management", "Cloud Trail", purge_security_lake_cloud_trail_data, ingest_security_lake_cloud_trail_data, credentials, bedrock)
 
   # Build Security Lake Findings Index
   if INDEX_INGEST_FINDINGS:
       from indexes.sl_findings_idx import ingest_security_lake_findings_data, purge_security_lake_findings_data
-
-      # Purge Security Lake Findings Index
-      tic = time.perf_counter()
-      purge_security_lake_findings_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake Findings Index: {toc - tic:0.4f} seconds")
-
-      tic = time.perf_counter()
-      ingest_security_lake_findings_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake Findings Index: {toc - tic:0.4f} seconds")
+      ingest_source("security_hub", "Findings", purge_security_lake_findings_data, ingest_security_lake_findings_data, credentials, bedrock)
 
   # Build Security Lake Lambda Executions Index
   if INDEX_INGEST_LAMBDA:
       from indexes.sl_lambda_index import ingest_security_lake_lambda_data, purge_security_lake_lambda_data
-
-      # Purge Security Lake Lambda Index
-      tic = time.perf_counter()
-      purge_security_lake_lambda_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake Lambda Index: {toc - tic:0.4f} seconds")
-
-      # Build Security Lake Lambda Index
-      tic = time.perf_counter()
-      ingest_security_lake_lambda_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake Lambda Index: {toc - tic:0.4f} seconds")
+      ingest_source("lambda_data_events", "Lambda", purge_security_lake_lambda_data, ingest_security_lake_lambda_data, credentials, bedrock)
 
   # Build Security Lake Route 53 Index
   if INDEX_INGEST_ROUTE53:
       from indexes.sl_route53_index import ingest_security_lake_route53_data, purge_security_lake_route53_data
-
-      # Purge Security Lake Route 53 Index
-      tic = time.perf_counter()
-      purge_security_lake_route53_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake Route53 Index: {toc - tic:0.4f} seconds")
-
-      tic = time.perf_counter()
-      ingest_security_lake_route53_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake Route53 Index: {toc - tic:0.4f} seconds")
+      ingest_source("route53_logs", "Route53", purge_security_lake_route53_data, ingest_security_lake_route53_data, credentials, bedrock)
 
   # Build Security Lake S3 Data Logs Index
   if INDEX_INGEST_S3_DATA:
       from indexes.sl_s3_data_index import ingest_security_lake_s3_data_data, purge_security_lake_s3_data_data
-
-      # Purge Security Lake S3 Data Index
-      tic = time.perf_counter()
-      purge_security_lake_s3_data_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake S3 Data Index: {toc - tic:0.4f} seconds")
-
-      tic = time.perf_counter()
-      ingest_security_lake_s3_data_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake S3 Data Index: {toc - tic:0.4f} seconds")
+      ingest_source("s3_data_events", "S3 Data", purge_security_lake_s3_data_data, ingest_security_lake_s3_data_data, credentials, bedrock)
 
   # Build Security Lake VPC Flow Logs Index
   if INDEX_INGEST_VPC_FLOW:
       from indexes.sl_vpc_flow_index import ingest_security_lake_vpc_flow_data, purge_security_lake_vpc_flow_data
-
-      # Purge Security Lake Vpc Flow Index
-      tic = time.perf_counter()
-      purge_security_lake_vpc_flow_data()
-      toc = time.perf_counter()
-      print(f"Purge Security Lake Vpc Flow Index: {toc - tic:0.4f} seconds")
-
-      tic = time.perf_counter()
-      ingest_security_lake_vpc_flow_data(bedrock, credentials)
-      toc = time.perf_counter()
-      print(f"Ingest Security Lake Vpc Flow Index: {toc - tic:0.4f} seconds")
+      ingest_source("vpc_flow_logs", "Vpc Flow", purge_security_lake_vpc_flow_data, ingest_security_lake_vpc_flow_data, credentials, bedrock)
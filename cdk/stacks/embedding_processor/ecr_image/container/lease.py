@@ -0,0 +1,155 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import boto3
+from botocore.exceptions import ClientError
+from container.metrics import RUN_ID, put_metric
+from env import LEASE_TTL_SECONDS, LEASE_PREFIX, ATHENA_BACKEND, SECURITY_LAKE_ATHENA_BUCKET
+
+# Per source ingest lease, so that two jobs never purge and ingest the same index at the same time: both
+# would read the same watermark and embed the same rows. A lease is a small JSON object at
+# s3://<Athena bucket>/<LEASE_PREFIX>/<index>.json with its owner and expiry, written with S3 conditional
+# writes: If-None-Match to create it, If-Match on the ETag to take over an expired lease, renew and release.
+# The owner renews the lease every LEASE_TTL_SECONDS / 3 while the source runs, the lease of a job that
+# died expires after LEASE_TTL_SECONDS. A job that does not get the lease skips the source and moves on to
+# the next one. A job whose lease was taken over stops the source at its next write: bulk_open_search and
+# the sketch writes call check_leases. LEASE_TTL_SECONDS=0 disables the lease. With ATHENA_BACKEND=duckdb
+# leases are local files, with a file lock standing in for the conditional writes.
+
+LEASE_OWNER = os.environ.get('AWS_BATCH_JOB_ID', RUN_ID)
+
+held_leases = {}
+
+class LeaseConflict(Exception):
+    pass
+
+# A BaseException so that it passes the per row `except Exception` handlers of the builders and stops the
+# source, ingest_source catches it
+class LeaseLost(BaseException):
+    pass
+
+def acquire_lease(data_source, index_name):
+    if LEASE_TTL_SECONDS <= 0:
+      return True
+
+    store = lease_store()
+    key = f"{ LEASE_PREFIX }/{ index_name }.json"
+    now = time.time()
+
+    try:
+      current, etag = store.get(key)
+      if current is not None and current['expires'] > now and current['owner'] != LEASE_OWNER:
+        print(f"Lease { key } held by { current['owner'] } until { time.ctime(current['expires']) }, skipping { data_source }")
+        put_metric('LeaseSkipped', 1)
+        return False
+
+      etag = store.put(key, lease_record(now), etag)
+    except LeaseConflict:
+      print(f"Lease { key } taken by another job, skipping { data_source }")
+      put_metric('LeaseSkipped', 1)
+      return False
+
+    lease = { 'key': key, 'etag': etag, 'lost': False, 'stop': threading.Event() }
+    lease['thread'] = threading.Thread(target=renew_lease, args=(store, lease), daemon=True)
+    lease['thread'].start()
+    held_leases[data_source] = lease
+    print(f"Lease { key } acquired by { LEASE_OWNER }")
+    return True
+
+def release_lease(data_source):
+    lease = held_leases.pop(data_source, None)
+    if lease is None:
+      return
+
+    lease['stop'].set()
+    lease['thread'].join()
+    if lease['lost']:
+      return
+
+    # expire the lease rather than delete it, the write stays conditional on the ETag
+    try:
+      lease_store().put(lease['key'], { 'owner': LEASE_OWNER, 'expires': 0 }, lease['etag'])
+      print(f"Lease { lease['key'] } released")
+    except Exception as e:
+      print(f"Lease { lease['key'] } not released, expires on its own: { e }")
+
+# Raises LeaseLost once another job took over a lease of this job: the source must not write any more
+def check_leases():
+    for data_source, lease in held_leases.items():
+      if lease['lost']:
+        raise LeaseLost(f"Lease { lease['key'] } lost, stopping { data_source }")
+
+def renew_lease(store, lease):
+    while not lease['stop'].wait(LEASE_TTL_SECONDS / 3):
+      try:
+        lease['etag'] = store.put(lease['key'], lease_record(time.time()), lease['etag'])
+      except LeaseConflict:
+        # another job took over after the lease expired, e.g. renewals failed longer than the TTL
+        print(f"Lease { lease['key'] } lost, another job may be ingesting the same source")
+        put_metric('LeaseLost', 1)
+        lease['lost'] = True
+        return
+      except Exception as e:
+        # transient errors are retried on the next renewal, the lease only expires after the TTL
+        print(f"Lease { lease['key'] } renewal failed: { e }")
+
+def lease_record(now):
+    return { 'owner': LEASE_OWNER, 'acquired': int(now), 'expires': int(now + LEASE_TTL_SECONDS) }
+
+def lease_store():
+    return LocalLeaseStore() if ATHENA_BACKEND == 'duckdb' else S3LeaseStore()
+
+class S3LeaseStore:
+    def __init__(self):
+        self.s3 = boto3.client('s3')
+
+    def get(self, key):
+        try:
+          response = self.s3.get_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key)
+        except ClientError as e:
+          if e.response['Error']['Code'] in ['NoSuchKey', '404']:
+            return None, None
+          raise
+        return json.loads(response['Body'].read()), response['ETag']
+
+    # etag None creates the lease, fails when it exists
+    def put(self, key, record, etag):
+        condition = { 'IfMatch': etag } if etag else { 'IfNoneMatch': '*' }
+        try:
+          response = self.s3.put_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key, Body=json.dumps(record).encode('utf-8'), **condition)
+        except ClientError as e:
+          if e.response['Error']['Code'] in ['PreconditionFailed', 'ConditionalRequestConflict', '412', '409']:
+            raise LeaseConflict(key)
+          raise
+        return response['ETag']
+
+class LocalLeaseStore:
+    def path(self, key):
+        from indexes.duckdb_athena import local_path
+        return local_path(SECURITY_LAKE_ATHENA_BUCKET, key)
+
+    def get(self, key):
+        path = self.path(key)
+        if not os.path.exists(path):
+          return None, None
+        with open(path, 'rb') as file:
+          body = file.read()
+        return json.loads(body), hashlib.sha256(body).hexdigest()
+
+    def put(self, key, record, etag):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        body = json.dumps(record).encode('utf-8')
+
+        with open(f"{ path }.lock", 'w') as lock:
+          fcntl.flock(lock, fcntl.LOCK_EX)
+          _, current = self.get(key)
+          if current != etag:
+            raise LeaseConflict(key)
+          with open(path, 'wb') as file:
+            file.write(body)
+
+        return hashlib.sha256(body).hexdigest()
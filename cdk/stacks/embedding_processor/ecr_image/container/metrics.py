@@ -0,0 +1,106 @@
+import json
+import time
+import uuid
+import boto3
+from env import METRICS_NAMESPACE, METRICS_LOG_GROUP
+
+# Ingest metrics in CloudWatch Embedded Metric Format. Values are buffered per data source and written
+# as EMF JSON lines when the source is done: sent to METRICS_LOG_GROUP with the json/emf header so
+# CloudWatch extracts the metrics, or printed when no log group is set (local runs). Latencies are kept
+# as value arrays, CloudWatch computes the percentiles (p50, p99) from them.
+#
+# Dimension: DataSource. RunId is a property, searchable with Logs Insights but not a dimension.
+
+RUN_ID = uuid.uuid4().hex[:12]
+EMF_MAX_VALUES = 100
+
+metrics_source = None
+metrics_buffer = {}
+log_stream = None
+
+def set_metrics_source(data_source):
+    global metrics_source
+    flush_metrics()
+    metrics_source = data_source
+
+def put_metric(name, value, unit = 'Count'):
+    if value is None:
+      return
+    values = metrics_buffer.setdefault(name, { 'unit': unit, 'values': [] })['values']
+    values.append(value)
+
+def get_metric_values(name):
+    return metrics_buffer.get(name, { 'values': [] })['values']
+
+def flush_metrics():
+    global metrics_buffer
+    if not metrics_buffer:
+      return
+
+    documents = emf_documents(metrics_source or 'all', metrics_buffer)
+    metrics_buffer = {}
+
+    if not METRICS_LOG_GROUP:
+      for document in documents:
+        print(json.dumps(document))
+      return
+
+    try:
+      send_to_log_group(documents)
+      print(f"Metrics sent to { METRICS_LOG_GROUP }: { len(documents) } documents")
+    except Exception as e:
+      print(f"Metrics not sent to { METRICS_LOG_GROUP }: { e }")
+
+# EMF takes at most 100 values per metric and document
+def emf_documents(data_source, buffer):
+    documents = []
+    chunk = 0
+    while True:
+      metrics = {}
+      for name, metric in buffer.items():
+        values = metric['values'][chunk * EMF_MAX_VALUES:(chunk + 1) * EMF_MAX_VALUES]
+        if values:
+          metrics[name] = metric['unit'], values
+      if not metrics:
+        return documents
+
+      document = {
+        "_aws": {
+          "Timestamp": int(time.time() * 1000),
+          "CloudWatchMetrics": [{
+            "Namespace": METRICS_NAMESPACE,
+            "Dimensions": [["DataSource"]],
+            "Metrics": [{ "Name": name, "Unit": unit } for name, (unit, _) in metrics.items()]
+          }]
+        },
+        "DataSource": data_source,
+        "RunId": RUN_ID
+      }
+      for name, (_, values) in metrics.items():
+        document[name] = values if len(values) > 1 else values[0]
+      documents.append(document)
+      chunk += 1
+
+def send_to_log_group(documents):
+    global log_stream
+    logs = boto3.client('logs')
+    logs.meta.events.register('before-call.logs.PutLogEvents', add_emf_header)
+
+    if log_stream is None:
+      log_stream = f"ingest-{ RUN_ID }"
+      logs.create_log_stream(logGroupName=METRICS_LOG_GROUP, logStreamName=log_stream)
+
+    logs.put_log_events(
+      logGroupName=METRICS_LOG_GROUP,
+      logStreamName=log_stream,
+      logEvents=[{ 'timestamp': document['_aws']['Timestamp'], 'message': json.dumps(document) } for document in documents]
+    )
+
+def add_emf_header(params, **kwargs):
+    params['headers']['x-amzn-logs-format'] = 'json/emf'
+
+def percentile(values, value):
+    if not values:
+      return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * value / 100))]
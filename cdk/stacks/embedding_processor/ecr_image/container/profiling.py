@@ -0,0 +1,180 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import boto3
+from contextlib import contextmanager
+from container.metrics import RUN_ID
+from env import PROFILE_MODE, PROFILE_PREFIX, PROFILE_SAMPLE_INTERVAL_MS, PROFILE_TRACEMALLOC_FRAMES, \
+                ATHENA_BACKEND, SECURITY_LAKE_ATHENA_BUCKET
+
+# Profiling of the purge and ingest of each source, switched on with PROFILE_MODE and no image rebuild,
+# e.g. with a container override of the Batch job:
+#
+#   aws batch submit-job ... --container-overrides 'environment=[{name=PROFILE_MODE,value=sampling}]'
+#
+#   cprofile   deterministic, writes <source>-<stage>.pstats and an approximate collapsed stack file
+#   sampling   samples the stack of the main thread every PROFILE_SAMPLE_INTERVAL_MS, low overhead,
+#              writes <source>-<stage>.collapsed
+#
+# Both modes also take a tracemalloc snapshot, written as a top allocations report and a snapshot loadable
+# with tracemalloc.Snapshot.load. PROFILE_TRACEMALLOC_FRAMES is the traceback depth, 0 disables it; every
+# extra frame makes allocations slower, deep tracebacks can slow the ingest several times.
+# Reports go to s3://<Athena bucket>/<PROFILE_PREFIX>/<run id>/, the run id is the one of the ingest metrics.
+# Collapsed stack files are read by flamegraph.pl and speedscope.
+
+PROFILE_CPROFILE = 'cprofile'
+PROFILE_SAMPLING = 'sampling'
+COLLAPSED_MAX_DEPTH = 64
+
+if PROFILE_MODE:
+    print(f"PROFILE_MODE: { PROFILE_MODE } | prefix: { PROFILE_PREFIX }/{ RUN_ID }")
+
+@contextmanager
+def profile_stage(data_source, stage):
+    if PROFILE_MODE not in [PROFILE_CPROFILE, PROFILE_SAMPLING]:
+      yield
+      return
+
+    name = f"{ data_source }-{ stage }"
+    if PROFILE_TRACEMALLOC_FRAMES > 0:
+      tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+
+    profiler = cProfile.Profile() if PROFILE_MODE == PROFILE_CPROFILE else StackSampler(PROFILE_SAMPLE_INTERVAL_MS / 1000)
+    profiler.enable()
+    try:
+      yield
+    finally:
+      profiler.disable()
+      try:
+        # snapshot first, the reports allocate memory too
+        if tracemalloc.is_tracing():
+          snapshot = tracemalloc.take_snapshot()
+          peak = tracemalloc.get_traced_memory()[1]
+          tracemalloc.stop()
+          write_tracemalloc_reports(name, snapshot, peak)
+
+        if PROFILE_MODE == PROFILE_CPROFILE:
+          write_cprofile_reports(name, profiler)
+        else:
+          write_report(f"{ name }.collapsed", collapsed_text(profiler.stacks))
+      except Exception as e:
+        # profiling must never fail the ingest
+        print(f"Profile reports for { name } not written: { e }")
+
+def write_cprofile_reports(name, profiler):
+    with tempfile.NamedTemporaryFile(suffix='.pstats', delete=False) as file:
+      path = file.name
+    profiler.dump_stats(path)
+    with open(path, 'rb') as file:
+      write_report(f"{ name }.pstats", file.read())
+    os.remove(path)
+
+    stats = pstats.Stats(profiler)
+    write_report(f"{ name }.collapsed", collapsed_text(cprofile_stacks(stats)))
+
+    summary = io.StringIO()
+    pstats.Stats(profiler, stream=summary).sort_stats('cumulative').print_stats(40)
+    write_report(f"{ name }.txt", summary.getvalue())
+
+def write_tracemalloc_reports(name, snapshot, peak):
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+    lines = [f"peak traced: { peak / 1024 / 1024:0.2f} MiB"]
+    for statistic in snapshot.statistics('lineno')[:50]:
+      lines.append(str(statistic))
+    write_report(f"{ name }.tracemalloc.txt", '\n'.join(lines) + '\n')
+
+    with tempfile.NamedTemporaryFile(suffix='.snapshot', delete=False) as file:
+      path = file.name
+    snapshot.dump(path)
+    with open(path, 'rb') as file:
+      write_report(f"{ name }.tracemalloc.snapshot", file.read())
+    os.remove(path)
+
+# Stack sampler for the main thread, stacks are kept as root to leaf tuples with their sample count
+class StackSampler:
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = {}
+        self.thread_id = threading.get_ident()
+        self.running = False
+        self.thread = None
+
+    def enable(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.running = False
+        if self.thread is not None:
+          self.thread.join()
+
+    def run(self):
+        while self.running:
+          frame = sys._current_frames().get(self.thread_id)
+          stack = []
+          while frame is not None and len(stack) < COLLAPSED_MAX_DEPTH:
+            stack.append(frame_name(frame.f_code.co_filename, frame.f_code.co_firstlineno, frame.f_code.co_name))
+            frame = frame.f_back
+          if stack:
+            key = tuple(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+          time.sleep(self.interval) # nosemgrep sampling interval
+
+# cProfile only records caller and callee pairs, stacks are rebuilt from the roots by splitting the time
+# of every function between its callees in proportion to the edge times, the same approximation as flameprof
+def cprofile_stacks(stats):
+    callees = {}
+    for function, (_, _, _, _, callers) in stats.stats.items():
+      for caller, edge in callers.items():
+        callees.setdefault(caller, []).append((function, edge[3]))
+
+    stacks = {}
+    def walk(function, allotted, stack):
+      # below a microsecond nothing is drawn, stops the walk on large call graphs
+      if allotted < 0.000001:
+        return
+      _, _, own_time, cumulative_time, _ = stats.stats[function]
+      stack = stack + (frame_name(*function),)
+      share = allotted / cumulative_time if cumulative_time else 0
+      if own_time * share > 0:
+        stacks[stack] = stacks.get(stack, 0) + own_time * share * 1000000
+      if len(stack) >= COLLAPSED_MAX_DEPTH:
+        return
+      for callee, edge_time in callees.get(function, []):
+        if frame_name(*callee) not in stack:
+          walk(callee, edge_time * share, stack)
+
+    for function, (_, _, _, cumulative_time, callers) in stats.stats.items():
+      if not callers:
+        walk(function, cumulative_time, ())
+    return stacks
+
+def frame_name(file_name, line, function_name):
+    return f"{ function_name } ({ os.path.basename(file_name) }:{ line })".replace(';', ':')
+
+def collapsed_text(stacks):
+    lines = [f"{ ';'.join(stack) } { int(round(count)) }" for stack, count in stacks.items() if round(count) > 0]
+    return '\n'.join(sorted(lines)) + '\n'
+
+def write_report(file_name, content):
+    key = f"{ PROFILE_PREFIX }/{ RUN_ID }/{ file_name }"
+    body = content.encode('utf-8') if isinstance(content, str) else content
+
+    if ATHENA_BACKEND == 'duckdb':
+      from indexes.duckdb_athena import local_path
+      path = local_path(SECURITY_LAKE_ATHENA_BUCKET, key)
+      os.makedirs(os.path.dirname(path), exist_ok=True)
+      with open(path, 'wb') as file:
+        file.write(body)
+    else:
+      s3 = boto3.client('s3')
+      s3.put_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key, Body=body)
+
+    print(f"Profile report: { key }")
@@ -0,0 +1,162 @@
+import importlib
+import re
+import time
+from container.lease import acquire_lease, release_lease, LeaseLost
+from container.metrics import set_metrics_source, put_metric, flush_metrics
+from container.indices_ingest import run_index
+from indexes.deferred_embedding import EMBEDDING_STATE_FIELD, EMBEDDING_ATTEMPTS_FIELD, EMBEDDING_EMBEDDED, EMBEDDING_PENDING
+from indexes.opensearch_utils import index_exists, index_search, index_count, bulk_open_search, create_index, \
+                                     delete_open_search, get_index_mapping, get_alias_indices, update_aliases
+from indexes.vector_storage import VECTOR_FIELD, RESCORE_VECTOR_FIELD
+from env import SL_DATASOURCE_MAP, MAPPING_PROFILE, REINDEX_BATCH_SIZE
+
+# RUN_MODE=reindex: migrates each index to the current mappings (MAPPING_PROFILE, vector storage).
+# The documents of <index> are copied to a new <index>_v<n>, then the alias <index> is moved to it, so
+# the ingest, the agent and the scheduler keep using the same name:
+#
+#   <index> is an index   copy to <index>_v1, delete <index>, add the alias <index> -> <index>_v1
+#                         (the index is not searchable between the delete and the alias)
+#   <index> is an alias   copy to <index>_v<n+1>, move the alias in one _aliases call, delete <index>_v<n>
+#
+# The run holds the ingest and the embed_pending leases of the source, no document is written during
+# the copy. The old index is only deleted once every document is copied and searchable in the new one.
+# Vectors that cannot be copied, excluded from _source by the compact profile or stored in another
+# format, are dropped and the documents marked embedding_state pending: embed_pending jobs embed them
+# again while the new index already serves lexical queries.
+
+# Index definition of each source module
+REINDEX_SOURCES = {
+    'cloudtrail_management': ('indexes.sl_cloud_trail_index', 'security_lake_cloud_trail_index_knn'),
+    'security_hub': ('indexes.sl_findings_idx', 'security_lake_findings_index_knn'),
+    's3_data_events': ('indexes.sl_s3_data_index', 'security_lake_s3_data_index_knn'),
+    'lambda_data_events': ('indexes.sl_lambda_index', 'security_lake_lambda_index_knn'),
+    'route53_logs': ('indexes.sl_route53_index', 'security_lake_route53_index_knn'),
+    'vpc_flow_logs': ('indexes.sl_vpc_flow_index', 'security_lake_vpc_flow_index_knn'),
+}
+
+VERSIONED_INDEX = re.compile(r'^(?P<alias>.+)_v(?P<version>\d+)$')
+SEARCHABLE_WAIT_SECONDS = 300
+
+def reindex_indices():
+    print(f"Reindex to the { MAPPING_PROFILE } mapping profile")
+    for data_source, (module_name, knn_name) in REINDEX_SOURCES.items():
+      index_name = SL_DATASOURCE_MAP.get(data_source)
+      if not index_name or not run_index(index_name):
+        continue
+
+      set_metrics_source(data_source)
+      embed_pending_lease = f"{ data_source }-embed_pending"
+      if not acquire_lease(data_source, index_name):
+        continue
+      try:
+        if not acquire_lease(embed_pending_lease, f"{ index_name }-embed_pending"):
+          continue
+        tic = time.perf_counter()
+        module = importlib.import_module(module_name)
+        reindex_source(index_name, getattr(module, knn_name))
+        print(f"Reindex { index_name }: { time.perf_counter() - tic:0.4f} seconds")
+      except (Exception, LeaseLost) as e:
+        print(f"Reindex { index_name } failed: { e }")
+      finally:
+        release_lease(embed_pending_lease)
+        release_lease(data_source)
+        flush_metrics()
+
+def reindex_source(index_name, index_knn):
+    if not index_exists(index_name):
+      print(f"Reindex { index_name }: no index, the ingest creates it with the current mappings")
+      return
+
+    aliased = get_alias_indices(index_name)
+    if aliased and len(aliased) != 1:
+      raise Exception(f"alias { index_name } points to { len(aliased) } indices: { aliased }")
+    source_index = aliased[0] if aliased else index_name
+    match = VERSIONED_INDEX.match(source_index)
+    version = int(match.group('version')) + 1 if aliased and match else 1
+    target_index = f"{ index_name }_v{ version }"
+
+    if index_exists(target_index):
+      # left over by a failed run, never served by the alias
+      delete_open_search(target_index)
+    create_index(target_index, index_knn)
+
+    # vectors are copied as they are when the old and the new mappings store them the same way
+    source_mapping = get_index_mapping(source_index) or {}
+    target_mapping = get_index_mapping(target_index) or {}
+    vector_mapping = lambda mapping: { field: mapping.get('properties', {}).get(field) for field in [VECTOR_FIELD, RESCORE_VECTOR_FIELD] }
+    copy_vectors = vector_mapping(source_mapping) == vector_mapping(target_mapping)
+
+    copied, pending = copy_documents(source_index, target_index, copy_vectors)
+    expected = index_count(source_index)
+    if copied != expected:
+      delete_open_search(target_index)
+      raise Exception(f"copied { copied } of { expected } documents")
+    wait_searchable(target_index, copied)
+
+    if aliased:
+      if not update_aliases([
+        { "remove": { "index": source_index, "alias": index_name } },
+        { "add": { "index": target_index, "alias": index_name } }
+      ]):
+        raise Exception(f"alias { index_name } not moved to { target_index }")
+      delete_open_search(source_index)
+    else:
+      delete_open_search(source_index)
+      if not update_aliases([{ "add": { "index": target_index, "alias": index_name } }]):
+        raise Exception(f"{ index_name } deleted but the alias was not added, the documents are in { target_index }")
+
+    put_metric('ReindexDocuments', copied)
+    put_metric('ReindexPending', pending)
+    print(f"Reindex { index_name }: { source_index } -> { target_index } | documents={ copied } | pending={ pending }")
+
+def copy_documents(source_index, target_index, copy_vectors):
+    query = {
+      "size": REINDEX_BATCH_SIZE,
+      "query": { "match_all": {} },
+      # _id breaks the ties of documents with the same time, aggregated documents share their bucket time
+      "sort": [{ "time": { "order": "asc" } }, { "_id": { "order": "asc" } }]
+    }
+
+    copied = 0
+    pending = 0
+    while True:
+      response = index_search(source_index, query)
+      hits = response['hits']['hits'] if response is not None else []
+      if not hits:
+        break
+
+      bulk_body = []
+      for hit in hits:
+        doc = hit['_source']
+        if not copy_vectors or VECTOR_FIELD not in doc:
+          embedded = VECTOR_FIELD in doc or doc.get(EMBEDDING_STATE_FIELD) == EMBEDDING_EMBEDDED
+          doc.pop(VECTOR_FIELD, None)
+          doc.pop(RESCORE_VECTOR_FIELD, None)
+          if embedded:
+            doc[EMBEDDING_STATE_FIELD] = EMBEDDING_PENDING
+            doc[EMBEDDING_ATTEMPTS_FIELD] = 0
+            pending += 1
+        bulk_body.append({ "create": { "_index": target_index, "_id": hit['_id'] } })
+        bulk_body.append(doc)
+
+      bulk_response = bulk_open_search("_bulk", bulk_body)
+      errors = [item for item in bulk_response.get('items', []) if 'error' in next(iter(item.values()))]
+      if errors or 'items' not in bulk_response:
+        delete_open_search(target_index)
+        raise Exception(f"{ len(errors) } documents not copied, first error: { errors[0] if errors else bulk_response }")
+
+      copied += len(hits)
+      print(f"Reindex { source_index } -> { target_index }: { copied } documents")
+      if len(hits) < REINDEX_BATCH_SIZE:
+        break
+      query['search_after'] = hits[-1]['sort']
+
+    return copied, pending
+
+# Serverless collections make new documents searchable after a few seconds
+def wait_searchable(index_name, expected):
+    deadline = time.time() + SEARCHABLE_WAIT_SECONDS
+    while index_count(index_name) < expected:
+      if time.time() > deadline:
+        raise Exception(f"{ index_name }: { expected } documents not searchable after { SEARCHABLE_WAIT_SECONDS } seconds")
+      time.sleep(5) # nosemgrep waiting for the refresh of the new index
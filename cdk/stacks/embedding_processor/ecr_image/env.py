@@ -2,6 +2,7 @@ import os
 import json
 
 BEDROCK_EMBEDDINGS_MODEL_V2 = 'amazon.titan-embed-text-v2:0'
+BEDROCK_EMBEDDINGS_DIMENSIONS = 512
 
 AWS_REGION = os.environ['AWS_REGION']
 
@@ -18,6 +19,10 @@ AOSS_BULK_DELETE_SIZE = int(os.environ['AOSS_BULK_DELETE_SIZE'])
 SECURITY_LAKE_ATHENA_BUCKET = os.environ["SECURITY_LAKE_ATHENA_BUCKET"]
 SECURITY_LAKE_ATHENA_PREFIX = os.environ["SECURITY_LAKE_ATHENA_PREFIX"]
 ATHENA_QUERY_TIMEOUT = int(os.environ["ATHENA_QUERY_TIMEOUT"])
+ATHENA_BACKEND = os.environ.get("ATHENA_BACKEND", "athena")
+DUCKDB_PARQUET_PATH = os.environ.get("DUCKDB_PARQUET_PATH", "./fixtures/parquet")
+DUCKDB_RESULTS_PATH = os.environ.get("DUCKDB_RESULTS_PATH", "./fixtures/results")
+DUCKDB_RESULTS_FORMAT = os.environ.get("DUCKDB_RESULTS_FORMAT", "csv")
 
 SL_DATABASE_NAME = os.environ["SL_DATABASE_NAME"]
 SL_FINDINGS = os.environ["SL_FINDINGS"]
@@ -28,6 +33,41 @@ SL_CLOUDTRAIL = os.environ["SL_CLOUDTRAIL"]
 SL_LAMBDA = os.environ["SL_LAMBDA"]
 SL_DATASOURCE_MAP = json.loads(os.environ["SL_DATASOURCE_MAP"])
 
+EMBEDDING_POLICY = json.loads(os.environ.get("EMBEDDING_POLICY", "{}"))
+EMBEDDING_TEXT_MAX_TOKENS = int(os.environ.get("EMBEDDING_TEXT_MAX_TOKENS", "512"))
+EMBEDDING_TEXT_FIELD_MAX_CHARS = int(os.environ.get("EMBEDDING_TEXT_FIELD_MAX_CHARS", "256"))
+EVENT_AGGREGATION = json.loads(os.environ.get("EVENT_AGGREGATION", "{}"))
+INGEST_SAMPLING = json.loads(os.environ.get("INGEST_SAMPLING", "{}"))
+SOURCE_FILTERS = json.loads(os.environ.get("SOURCE_FILTERS", "{}"))
+VECTOR_STORAGE = json.loads(os.environ.get("VECTOR_STORAGE", "{}"))
+BULK_CAPTURE_PATH = os.environ.get("BULK_CAPTURE_PATH", "")
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "CGD/EmbeddingProcessor")
+METRICS_LOG_GROUP = os.environ.get("METRICS_LOG_GROUP", "")
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "")
+PROFILE_PREFIX = os.environ.get("PROFILE_PREFIX", "profiles")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get("PROFILE_SAMPLE_INTERVAL_MS", "10"))
+PROFILE_TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1"))
+LEASE_TTL_SECONDS = int(os.environ.get("LEASE_TTL_SECONDS", "900"))
+LEASE_PREFIX = os.environ.get("LEASE_PREFIX", "leases")
+RUN_MODE = os.environ.get("RUN_MODE", "ingest")
+EMBEDDING_DEFER_AFTER_FAILURES = int(os.environ.get("EMBEDDING_DEFER_AFTER_FAILURES", "3"))
+EMBEDDING_MAX_ATTEMPTS = int(os.environ.get("EMBEDDING_MAX_ATTEMPTS", "5"))
+EMBED_PENDING_BATCH_SIZE = int(os.environ.get("EMBED_PENDING_BATCH_SIZE", "100"))
+MAPPING_PROFILE = os.environ.get("MAPPING_PROFILE", "compact")
+REINDEX_BATCH_SIZE = int(os.environ.get("REINDEX_BATCH_SIZE", "500"))
+ROUTE53_HOSTNAME_INDEX = os.environ.get("ROUTE53_HOSTNAME_INDEX", "")
+ROUTE53_HOSTNAME_REFRESH_DAYS = float(os.environ.get("ROUTE53_HOSTNAME_REFRESH_DAYS", "7"))
+ROLLUPS = json.loads(os.environ.get("ROLLUPS", "{}"))
+ROLLUP_PURGE_LT = os.environ.get("ROLLUP_PURGE_LT", "now-400d/d")
+ENTITY_PROFILE_INDEX = os.environ.get("ENTITY_PROFILE_INDEX", "")
+ENTITY_PROFILE_TOP_N = int(os.environ.get("ENTITY_PROFILE_TOP_N", "10"))
+SKETCHES = json.loads(os.environ.get("SKETCHES", "{}"))
+SKETCH_PREFIX = os.environ.get("SKETCH_PREFIX", "sketches")
+SKETCH_BASELINE_DAYS = int(os.environ.get("SKETCH_BASELINE_DAYS", "7"))
+IOC_FEEDS = json.loads(os.environ.get("IOC_FEEDS", "[]"))
+IOC_COLUMNS = json.loads(os.environ.get("IOC_COLUMNS", "{}"))
+IOC_BLOOM_ERROR_RATE = float(os.environ.get("IOC_BLOOM_ERROR_RATE", "0.000001"))
+
 if 'RUN_INDEX_NAME' in os.environ:
     RUN_INDEX_NAME = os.environ['RUN_INDEX_NAME']
     if RUN_INDEX_NAME is not None:
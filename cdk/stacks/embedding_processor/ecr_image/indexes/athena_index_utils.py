@@ -2,6 +2,8 @@ import boto3
 import re
 import time
 import json
+from env import ATHENA_BACKEND
+from container.metrics import put_metric
 
 def athena_query(client, params):
     
@@ -17,6 +19,10 @@ def athena_query(client, params):
     return response
 
 def athena_to_s3(params, credentials, max_execution = 30):
+    if ATHENA_BACKEND == 'duckdb':
+      from indexes.duckdb_athena import duckdb_to_local
+      return duckdb_to_local(params)
+
     if credentials is None:
       client = boto3.client('athena', region_name=params["region"])
     else:
@@ -40,20 +46,33 @@ def athena_to_s3(params, credentials, max_execution = 30):
             state = response['QueryExecution']['Status']['State']
             if state == 'FAILED':
                 print(response['QueryExecution']['Status'])
+                put_metric('AthenaFailures', 1)
                 return False
             elif state == 'SUCCEEDED':
                 toc = time.perf_counter()
                 print(f"Athena query duration: {toc - tic:0.4f} seconds")
+                put_metric('AthenaQueryDuration', round((toc - tic) * 1000), 'Milliseconds')
+
+                statistics = response['QueryExecution'].get('Statistics', {})
+                put_metric('AthenaQueueTime', statistics.get('QueryQueueTimeInMillis'), 'Milliseconds')
+                put_metric('AthenaExecutionTime', statistics.get('EngineExecutionTimeInMillis'), 'Milliseconds')
+                put_metric('AthenaBytesScanned', statistics.get('DataScannedInBytes'), 'Bytes')
 
                 s3_path = response['QueryExecution']['ResultConfiguration']['OutputLocation']
                 filename = re.findall('.*\/(.*)', s3_path)[0]
                 return filename
         time.sleep(1) # nosemgrep waiting for Athena results
     
+    put_metric('AthenaFailures', 1)
     return False
 
 # Deletes all files in your path so use carefully!
 def cleanup_file(bucketname, key):
+    if ATHENA_BACKEND == 'duckdb':
+      from indexes.duckdb_athena import local_cleanup_file
+      local_cleanup_file(bucketname, key)
+      return
+
     s3 = boto3.client('s3')
     s3.delete_object(Bucket=bucketname, Key=key)
 
@@ -0,0 +1,65 @@
+import os
+import time
+import uuid
+import boto3
+from env import BULK_CAPTURE_PATH
+
+# Recording of the _bulk payloads sent by bulk_open_search, enabled with BULK_CAPTURE_PATH which is
+# either a local directory or s3://bucket/prefix. Each payload is saved as it was sent, one file per
+# request named <epoch ms>-<id>.ndjson, or <epoch ms>-<id>-<index>.ndjson when it was sent to
+# <index>/_bulk (the deletes of the purge, whose actions have no _index). benchmark/replay.py replays
+# them against a collection.
+
+def capture_bulk_payload(path, payload):
+    default_index = bulk_path_index(path)
+    file_name = f"{ int(time.time() * 1000) }-{ uuid.uuid4().hex[:8] }{ '-' + default_index if default_index else '' }.ndjson"
+    try:
+      if BULK_CAPTURE_PATH.startswith('s3://'):
+        bucket, prefix = split_s3_path(BULK_CAPTURE_PATH)
+        s3 = boto3.client('s3')
+        s3.put_object(Bucket=bucket, Key=f"{ prefix }{ file_name }", Body=payload.encode('utf-8'))
+      else:
+        os.makedirs(BULK_CAPTURE_PATH, exist_ok=True)
+        with open(os.path.join(BULK_CAPTURE_PATH, file_name), 'w', encoding='utf-8') as file:
+          file.write(payload)
+    except Exception as e:
+      # capture must never fail the ingest
+      print(f"Bulk capture failed: { e }")
+
+# The index of a <index>/_bulk request path, None for _bulk
+def bulk_path_index(path):
+    index_name = path.strip('/')[:-len('_bulk')].strip('/')
+    return index_name or None
+
+def split_s3_path(path):
+    bucket, _, prefix = path[len('s3://'):].partition('/')
+    if prefix and not prefix.endswith('/'):
+      prefix = prefix + '/'
+    return bucket, prefix
+
+# Captured payloads in capture order, as (epoch ms, request path, payload)
+def read_bulk_captures(path):
+    captures = []
+    if path.startswith('s3://'):
+      bucket, prefix = split_s3_path(path)
+      s3 = boto3.client('s3')
+      for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        for item in page.get('Contents', []):
+          name = item['Key'][len(prefix):]
+          if name.endswith('.ndjson') and '/' not in name:
+            body = s3.get_object(Bucket=bucket, Key=item['Key'])['Body'].read().decode('utf-8')
+            captures.append((capture_time(name), capture_path(name), body))
+    else:
+      for name in os.listdir(path):
+        if name.endswith('.ndjson'):
+          with open(os.path.join(path, name), encoding='utf-8') as file:
+            captures.append((capture_time(name), capture_path(name), file.read()))
+
+    return sorted(captures, key=lambda capture: capture[0])
+
+def capture_time(file_name):
+    return int(file_name.split('-')[0])
+
+def capture_path(file_name):
+    parts = file_name[:-len('.ndjson')].split('-', 2)
+    return f"{ parts[2] }/_bulk" if len(parts) > 2 else '_bulk'
@@ -0,0 +1,117 @@
+import hashlib
+import json
+from container.metrics import put_metric
+from indexes.vector_storage import embedding_types, vector_fields, get_vector_storage, uses_features
+from indexes.flow_features import flow_feature_vectors, FLOW_FEATURES_VERSION, FLOW_FEATURE_DIMENSIONS
+from env import BEDROCK_EMBEDDINGS_MODEL_V2, BEDROCK_EMBEDDINGS_DIMENSIONS, EMBEDDING_TEXT_MAX_TOKENS, \
+                EMBEDDING_TEXT_FIELD_MAX_CHARS, EMBEDDING_DEFER_AFTER_FAILURES
+
+# Documents selected by the embedding policy are indexed even when Bedrock throttles or fails, without
+# the vector fields and with embedding_state "pending". The embed_pending run mode
+# (container/embed_pending.py) adds their vectors later at the rate the Bedrock quota allows.
+#
+#   embedding_state     embedded | pending | failed (pending for more than EMBEDDING_MAX_ATTEMPTS runs)
+#   embedding_version   hash of the model, dimensions, vector storage and embedding text template
+#   embedding_attempts  embed_pending runs that failed on the document
+#
+# Documents whose embedding_version differs from the current one are stale, embed_pending re-embeds them
+# too, so a model, dimension or template change reaches indexed documents without a rebuild.
+# After EMBEDDING_DEFER_AFTER_FAILURES consecutive failures the ingest stops calling Bedrock for the
+# source and defers the rest of its rows, a throttled source then ingests at full speed.
+
+EMBEDDING_STATE_FIELD = 'embedding_state'
+EMBEDDING_VERSION_FIELD = 'embedding_version'
+EMBEDDING_ATTEMPTS_FIELD = 'embedding_attempts'
+
+EMBEDDING_EMBEDDED = 'embedded'
+EMBEDDING_PENDING = 'pending'
+EMBEDDING_FAILED = 'failed'
+
+embedding_versions = {}
+consecutive_failures = {}
+
+def embedding_state_mappings():
+    return {
+      EMBEDDING_STATE_FIELD: { "type": "keyword" },
+      EMBEDDING_VERSION_FIELD: { "type": "keyword" },
+      EMBEDDING_ATTEMPTS_FIELD: { "type": "integer" }
+    }
+
+# keyed by data source and fields, the Route 53 hostname entities share the storage of route53_logs
+def embedding_version(data_source, fields):
+    key = (data_source, json.dumps(fields))
+    if key not in embedding_versions and uses_features(data_source):
+      template = {
+        'features': FLOW_FEATURES_VERSION,
+        'dimensions': FLOW_FEATURE_DIMENSIONS,
+        'storage': get_vector_storage(data_source)
+      }
+      embedding_versions[key] = hashlib.sha256(json.dumps(template, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    if key not in embedding_versions:
+      template = {
+        'model': BEDROCK_EMBEDDINGS_MODEL_V2,
+        'dimensions': BEDROCK_EMBEDDINGS_DIMENSIONS,
+        'storage': get_vector_storage(data_source),
+        'fields': fields,
+        'max_tokens': EMBEDDING_TEXT_MAX_TOKENS,
+        'field_max_chars': EMBEDDING_TEXT_FIELD_MAX_CHARS
+      }
+      embedding_versions[key] = hashlib.sha256(json.dumps(template, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    return embedding_versions[key]
+
+# Adds the vector fields to doc, or marks it pending. embed is get_embeddings_by_type, passed by the
+# caller so that the benchmark can time the calls of each source module.
+def embed_document(data_source, doc, fields, text, bedrock, embed):
+    version = embedding_version(data_source, fields)
+
+    if consecutive_failures.get(data_source, 0) >= EMBEDDING_DEFER_AFTER_FAILURES:
+      mark_pending(doc, version)
+      return False
+
+    try:
+      embeddings = embed({"inputText": text}, bedrock, embedding_types(data_source))
+    except Exception:
+      consecutive_failures[data_source] = consecutive_failures.get(data_source, 0) + 1
+      if consecutive_failures[data_source] == EMBEDDING_DEFER_AFTER_FAILURES:
+        print(f"{ data_source }: { EMBEDDING_DEFER_AFTER_FAILURES } embedding failures in a row, deferring the embeddings of this run")
+      mark_pending(doc, version)
+      return False
+
+    consecutive_failures[data_source] = 0
+    doc.update(embedded_fields(data_source, embeddings, version))
+    return True
+
+# Feature vectors (VECTOR_STORAGE features) of a batch of documents, computed here without Bedrock
+def embed_features(data_source, docs, fields):
+    version = embedding_version(data_source, fields)
+    for doc, vector in zip(docs, flow_feature_vectors(docs)):
+      doc.update(embedded_fields(data_source, { "features": vector.tolist() }, version))
+
+def embedded_fields(data_source, embeddings, version):
+    return {
+      **vector_fields(data_source, embeddings),
+      EMBEDDING_STATE_FIELD: EMBEDDING_EMBEDDED,
+      EMBEDDING_VERSION_FIELD: version,
+      EMBEDDING_ATTEMPTS_FIELD: 0
+    }
+
+def mark_pending(doc, version):
+    doc[EMBEDDING_STATE_FIELD] = EMBEDDING_PENDING
+    doc[EMBEDDING_VERSION_FIELD] = version
+    doc[EMBEDDING_ATTEMPTS_FIELD] = 0
+    put_metric('EmbeddingDeferred', 1)
+
+# Pending documents and embedded documents of another version
+def pending_query(version):
+    return {
+      "bool": {
+        "should": [
+          { "term": { EMBEDDING_STATE_FIELD: EMBEDDING_PENDING } },
+          { "bool": {
+            "filter": [{ "term": { EMBEDDING_STATE_FIELD: EMBEDDING_EMBEDDED } }],
+            "must_not": [{ "term": { EMBEDDING_VERSION_FIELD: version } }]
+          } }
+        ],
+        "minimum_should_match": 1
+      }
+    }
@@ -0,0 +1,88 @@
+import csv
+import os
+import time
+import uuid
+from container.metrics import put_metric
+from env import DUCKDB_PARQUET_PATH, DUCKDB_RESULTS_PATH, DUCKDB_RESULTS_FORMAT
+
+# Local stand-in for Athena, selected with ATHENA_BACKEND=duckdb. The ingest queries run on DuckDB over
+# OCSF Parquet fixtures and the results are written under DUCKDB_RESULTS_PATH, which stands in for S3:
+#
+#   DUCKDB_PARQUET_PATH/<table name>/**/*.parquet           one directory per SL_* table, hive partitions allowed
+#   DUCKDB_RESULTS_PATH/<bucket>/<path>/<query id>.csv      read by s3_read_dictionary, removed by cleanup_file
+#
+# The Athena SQL runs unchanged: to_iso8601 is defined as a macro, cast(<row> as json) gives the same JSON
+# objects in DuckDB, and DuckDB lists are 1-based like Athena arrays so resources[1] needs no rewrite.
+# duckdb is not part of the container image, install it where the local backend is used.
+
+TO_ISO8601_MACRO = "CREATE OR REPLACE MACRO to_iso8601(ts) AS strftime(CAST(ts AS TIMESTAMP), '%Y-%m-%dT%H:%M:%S.%g') || 'Z'"
+
+def duckdb_connect():
+    import duckdb
+
+    connection = duckdb.connect()
+    connection.execute("SET TimeZone = 'UTC'")
+    connection.execute(TO_ISO8601_MACRO)
+
+    for table in sorted(os.listdir(DUCKDB_PARQUET_PATH)):
+      table_path = os.path.join(DUCKDB_PARQUET_PATH, table)
+      if os.path.isdir(table_path):
+        parquet_glob = os.path.join(table_path, '**', '*.parquet').replace("'", "''")
+        connection.execute(f"CREATE VIEW \"{ table }\" AS SELECT * FROM read_parquet('{ parquet_glob }', hive_partitioning = true, union_by_name = true)")
+
+    return connection
+
+# Same contract as athena_to_s3: the result file name relative to params['path'], False on failure
+def duckdb_to_local(params):
+    file_name = f"{ uuid.uuid4() }.{ DUCKDB_RESULTS_FORMAT }"
+    output_path = local_path(params['bucket'], f"{ params['path'] }/{ file_name }")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+    tic = time.perf_counter()
+    try:
+      connection = duckdb_connect()
+      copy_options = "FORMAT PARQUET" if DUCKDB_RESULTS_FORMAT == 'parquet' else "FORMAT CSV, HEADER"
+      connection.execute(f"COPY ({ params['query'] }) TO '{ output_path.replace(chr(39), chr(39) * 2) }' ({ copy_options })")
+      connection.close()
+    except Exception as e:
+      print(f"DuckDB query failed: { e }")
+      put_metric('AthenaFailures', 1)
+      return False
+
+    toc = time.perf_counter()
+    print(f"DuckDB query duration: {toc - tic:0.4f} seconds")
+    put_metric('AthenaExecutionTime', round((toc - tic) * 1000), 'Milliseconds')
+    put_metric('AthenaQueryDuration', round((toc - tic) * 1000), 'Milliseconds')
+    return file_name
+
+def local_path(bucket, key):
+    return os.path.join(DUCKDB_RESULTS_PATH, bucket, key)
+
+# Rows are returned as strings, the way csv.DictReader reads Athena results
+def local_read_dictionary(bucket, key):
+    path = local_path(bucket, key)
+
+    if path.endswith('.parquet'):
+      import duckdb
+
+      connection = duckdb.connect()
+      result = connection.execute("SELECT * FROM read_parquet(?)", [path])
+      columns = [column[0] for column in result.description]
+      list = [{ column: to_csv_value(value) for column, value in zip(columns, row) } for row in result.fetchall()]
+      connection.close()
+      return list
+
+    with open(path, newline='', encoding='utf-8') as file:
+      return [row for row in csv.DictReader(file)]
+
+def to_csv_value(value):
+    if value is None:
+      return ''
+    if isinstance(value, bool):
+      return 'true' if value else 'false'
+    return str(value)
+
+def local_cleanup_file(bucket, key):
+    path = local_path(bucket, key)
+    if os.path.exists(path):
+      os.remove(path)
@@ -0,0 +1,38 @@
+from indexes.predicates import validate_predicate, evaluate_predicate
+from env import EMBEDDING_POLICY
+
+# Per data source embedding policy, keyed like SL_DATASOURCE_MAP:
+#   { "mode": "always" }                      embed every document (default)
+#   { "mode": "never" }                       index documents without a vector
+#   { "mode": "when", "when": <predicate> }   embed documents matching the predicate
+# Documents that are not embedded are still indexed for lexical and aggregation queries.
+
+EMBED_ALWAYS = 'always'
+EMBED_NEVER = 'never'
+EMBED_WHEN = 'when'
+
+DEFAULT_EMBEDDING_POLICY = { "mode": EMBED_ALWAYS }
+
+def validate_embedding_policy(data_source, policy):
+    mode = policy.get('mode')
+    if mode not in [EMBED_ALWAYS, EMBED_NEVER, EMBED_WHEN]:
+      raise ValueError(f"EMBEDDING_POLICY { data_source }: invalid mode \"{ mode }\"")
+    if mode == EMBED_WHEN:
+      validate_predicate(policy.get('when'))
+
+for data_source, policy in EMBEDDING_POLICY.items():
+    validate_embedding_policy(data_source, policy)
+    print(f"EMBEDDING_POLICY: { data_source }={ policy }")
+
+def get_embedding_policy(data_source):
+    return EMBEDDING_POLICY.get(data_source) or DEFAULT_EMBEDDING_POLICY
+
+def should_embed(data_source, doc):
+    policy = get_embedding_policy(data_source)
+    mode = policy['mode']
+
+    if mode == EMBED_ALWAYS:
+      return True
+    if mode == EMBED_NEVER:
+      return False
+    return evaluate_predicate(policy['when'], doc)
@@ -0,0 +1,92 @@
+from env import EMBEDDING_TEXT_MAX_TOKENS, EMBEDDING_TEXT_FIELD_MAX_CHARS
+
+# Titan does not expose its tokenizer, ~4 characters per token is close enough for budgeting
+CHARS_PER_TOKEN = 4
+NESTED_LIST_MAX_ITEMS = 5
+EMPTY_STRINGS = ['', 'N/A', 'null', 'None', '-']
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+def build_embedding_text(data, fields, max_tokens = EMBEDDING_TEXT_MAX_TOKENS, field_max_chars = EMBEDDING_TEXT_FIELD_MAX_CHARS):
+    # fields is a list of (label, path) tuples in priority order, e.g. ("Source IP", "src_endpoint.ip").
+    # Fields are rendered one per line until the budget is spent, empty values are skipped and
+    # nested objects are summarized deterministically so the same document always gives the same text.
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    lines = []
+    used = 0
+
+    for label, path in fields:
+      value = render_value(get_path(data, path), field_max_chars)
+      if value is None:
+        continue
+
+      line = f"{ label }: { value }"
+      separator = 1 if lines else 0
+      remaining = max_chars - used - separator
+      if remaining <= len(label) + 2:
+        break
+      if len(line) > remaining:
+        lines.append(truncate(line, remaining))
+        break
+
+      lines.append(line)
+      used += separator + len(line)
+
+    return '\n'.join(lines)
+
+# Dotted path lookup, numeric parts index into lists: "resources.0.uid"
+def get_path(data, path):
+    value = data
+    for part in path.split('.'):
+      if isinstance(value, dict):
+        value = value.get(part)
+      elif isinstance(value, list) and part.isdigit():
+        value = value[int(part)] if int(part) < len(value) else None
+      else:
+        return None
+    return value
+
+def render_value(value, max_chars):
+    if is_empty(value):
+      return None
+    if isinstance(value, (dict, list)):
+      summary = summarize(value)
+      return truncate(summary, max_chars) if summary else None
+    return truncate(' '.join(str(value).split()), max_chars)
+
+# Flatten nested objects into "key=value" pairs with sorted keys, dropping empty values and
+# keeping the first NESTED_LIST_MAX_ITEMS items of every list
+def summarize(value, prefix = ''):
+    parts = []
+    if isinstance(value, dict):
+      for key in sorted(value):
+        if is_empty(value[key]):
+          continue
+        name = f"{ prefix }.{ key }" if prefix else str(key)
+        parts.append(summarize(value[key], name))
+    elif isinstance(value, list):
+      items = [item for item in value if not is_empty(item)]
+      for position, item in enumerate(items[:NESTED_LIST_MAX_ITEMS]):
+        parts.append(summarize(item, f"{ prefix }[{ position }]" if prefix else f"[{ position }]"))
+      if len(items) > NESTED_LIST_MAX_ITEMS:
+        parts.append(f"{ prefix }[+{ len(items) - NESTED_LIST_MAX_ITEMS } more]")
+    else:
+      text = ' '.join(str(value).split())
+      return f"{ prefix }={ text }" if prefix else text
+
+    return ', '.join(part for part in parts if part)
+
+def truncate(text, max_chars):
+    if len(text) <= max_chars:
+      return text
+    return text[:max(max_chars - 3, 0)] + '...'
+
+def is_empty(value):
+    if value is None:
+      return True
+    if isinstance(value, (dict, list)):
+      return len(value) == 0
+    if isinstance(value, str):
+      return value.strip() in EMPTY_STRINGS
+    return False
@@ -0,0 +1,227 @@
+import hashlib
+from container.metrics import put_metric
+from indexes.opensearch_utils import create_index, index_exists, get_documents, bulk_open_search, delete_by_query
+from indexes.event_aggregation import key_value
+from indexes.route53_hostnames import hostname_id
+from env import ENTITY_PROFILE_INDEX, ENTITY_PROFILE_TOP_N, AOSS_PURGE_LT, AOSS_BULK_CREATE_SIZE
+
+# "What do we know about X" without scanning every index: with ENTITY_PROFILE_INDEX set, each ingest
+# batch updates one profile per IP address, IAM principal, S3 bucket, Lambda function and hostname
+# seen in its rows, with document id "<type>:<id>" (ip:203.0.113.7, bucket:my-bucket) so the agent
+# reads a profile with a single get.
+#
+# A profile keeps under sources.<data source> the event count, first and last time, and the top
+# ENTITY_PROFILE_TOP_N peers (the other entities of the same events) and actions (API operation, flow
+# action, query type, finding type) of that source. Each source only writes its own
+# sources.<data source> object: partial updates merge objects, profiles are shared by the sources and
+# their ingests run concurrently under different leases. For the same reason there is no profile wide
+# first_seen or last_seen, a read-modify-write across sources could move them back: the agent and the
+# purge take them from the sources. Top peers and actions are
+# merged with the counts kept in the profile, an entry that drops out of the top N loses its count.
+#
+# Profiles are built from the rows read before sampling and aggregation, like the rollups, with a
+# watermark per source so rows read again are not counted twice. Profiles not seen within
+# AOSS_PURGE_LT are purged.
+
+# (entity type, column) per data source, columns as in EVENT_AGGREGATION, JSON paths included
+ENTITY_COLUMNS = {
+  'cloudtrail_management': [('principal', 'user'), ('ip', 'src_endpoint.ip')],
+  's3_data_events': [('principal', 'actor.user.uid'), ('ip', 'src_endpoint.ip'), ('bucket', 'resources_uid')],
+  'lambda_data_events': [('principal', 'actor.user.uid'), ('ip', 'src_endpoint.ip'), ('function', 'resource_uid')],
+  'route53_logs': [('ip', 'src_endpoint.ip'), ('hostname', 'query_hostname')],
+  'vpc_flow_logs': [('ip', 'src_endpoint_ip'), ('ip', 'dst_endpoint_ip')],
+  # the type of a finding resource is in resources_type, see FINDING_RESOURCE_TYPES
+  'security_hub': [(None, 'resources_uid')]
+}
+
+ENTITY_ACTION_COLUMNS = {
+  'cloudtrail_management': 'api_operation',
+  's3_data_events': 'api_operation',
+  'lambda_data_events': 'api_operation',
+  'route53_logs': 'query_type',
+  'vpc_flow_logs': 'action',
+  'security_hub': 'finding_type'
+}
+
+FINDING_RESOURCE_TYPES = {
+  'AwsS3Bucket': 'bucket',
+  'AwsLambdaFunction': 'function',
+  'AwsIamRole': 'principal',
+  'AwsIamUser': 'principal',
+  'AwsIamAccessKey': 'principal'
+}
+
+# document ids are limited to 512 bytes
+PROFILE_ID_MAX_BYTES = 512
+
+def entity_profiles_enabled(data_source):
+    return bool(ENTITY_PROFILE_INDEX) and data_source in ENTITY_COLUMNS
+
+def entity_profile_index_knn():
+    date = { "type" : "date", "format" : "strict_date_optional_time||epoch_millis" }
+    source = {
+      "properties": {
+        "count": { "type": "long" },
+        "first_seen": date,
+        "last_seen": date,
+        "watermark": date,
+        "peers": {
+          "properties": {
+            "type": { "type": "keyword" },
+            "id": { "type": "keyword" },
+            "count": { "type": "long" }
+          }
+        },
+        "actions": {
+          "properties": {
+            "action": { "type": "keyword" },
+            "count": { "type": "long" }
+          }
+        }
+      }
+    }
+    return {
+      "mappings": {
+        "properties": {
+          "entity_type": { "type": "keyword" },
+          "entity_id": { "type": "keyword" },
+          "sources": { "properties": { data_source: source for data_source in ENTITY_COLUMNS } }
+        }
+      }
+    }
+
+def entity_profile_id(entity_type, entity_id):
+    profile_id = f"{ entity_type }:{ entity_id }"
+    if len(profile_id.encode('utf-8')) <= PROFILE_ID_MAX_BYTES:
+      return profile_id
+    return f"{ entity_type }:{ hashlib.sha256(entity_id.encode('utf-8')).hexdigest() }"
+
+# Normalized id of an entity, None for missing values: buckets without their ARN prefix and
+# hostnames without the trailing dot, as in the other indices
+def entity_value(entity_type, value):
+    if value in [None, '', '-']:
+      return None
+    value = str(value).strip()
+    if entity_type == 'bucket':
+      value = value.replace('arn:aws:s3:::', '', 1).split('/')[0]
+    elif entity_type == 'hostname':
+      value = hostname_id(value)
+    return value or None
+
+def row_entities(data_source, row):
+    entities = []
+    for entity_type, column in ENTITY_COLUMNS[data_source]:
+      if entity_type is None:
+        entity_type = FINDING_RESOURCE_TYPES.get(row.get('resources_type'))
+        if entity_type is None:
+          continue
+      value = entity_value(entity_type, key_value(row, column))
+      if value is not None and (entity_type, value) not in entities:
+        entities.append((entity_type, value))
+    return entities
+
+# Updates the profiles of the entities of a batch of Athena rows, returns the number of profiles written
+def update_entity_profiles(data_source, rows):
+    try:
+      return write_entity_profiles(data_source, rows)
+    except Exception as e:
+      # a derived index must not stop the event ingest: the rows are missing from it, rows read again
+      # later (reindex, rerun of the window) are added once thanks to the watermarks
+      put_metric('EntityProfileErrors', 1)
+      print(f"Entity profiles { data_source } failed: { e }")
+      return 0
+
+def write_entity_profiles(data_source, rows):
+    if not entity_profiles_enabled(data_source) or not rows:
+      return 0
+
+    if not index_exists(ENTITY_PROFILE_INDEX):
+      create_index(ENTITY_PROFILE_INDEX, entity_profile_index_knn())
+
+    action_column = ENTITY_ACTION_COLUMNS.get(data_source)
+    profiles = {}
+    for row in rows:
+      entities = row_entities(data_source, row)
+      action = key_value(row, action_column) if action_column else None
+      for entity_type, entity_id in entities:
+        profile = profiles.setdefault(entity_profile_id(entity_type, entity_id), {
+          "entity_type": entity_type,
+          "entity_id": entity_id,
+          "rows": [],
+          "peers": [],
+          "actions": []
+        })
+        profile["rows"].append(int(row["time"]))
+        profile["peers"].append([(peer_type, peer_id) for peer_type, peer_id in entities if (peer_type, peer_id) != (entity_type, entity_id)])
+        profile["actions"].append(action)
+
+    written = 0
+    profile_ids = list(profiles)
+    for batch_start in range(0, len(profile_ids), AOSS_BULK_CREATE_SIZE):
+      batch_ids = profile_ids[batch_start:batch_start + AOSS_BULK_CREATE_SIZE]
+      indexed = get_documents(ENTITY_PROFILE_INDEX, batch_ids, [f"sources.{ data_source }"])
+
+      bulk_body = []
+      for profile_id in batch_ids:
+        doc = merge_entity_profile(data_source, profiles[profile_id], indexed.get(profile_id))
+        if doc is None:
+          continue
+        bulk_body.append({ "update": { "_index": ENTITY_PROFILE_INDEX, "_id": profile_id } })
+        bulk_body.append({ "doc": doc, "doc_as_upsert": True })
+
+      if bulk_body:
+        bulk_response = bulk_open_search("_bulk", bulk_body)
+        print(f"entity profiles bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+        written += len(bulk_body) // 2
+
+    put_metric('EntityProfiles', written)
+    print(f"Entity profiles { ENTITY_PROFILE_INDEX }: rows={ len(rows) } | profiles={ written }")
+    return written
+
+# The partial update of a profile for the rows newer than the watermark of the source, None when
+# every row was counted
+def merge_entity_profile(data_source, profile, previous):
+    previous = previous or {}
+    source = (previous.get("sources") or {}).get(data_source) or {}
+    watermark = int(source.get("watermark") or 0)
+    new = [position for position, time in enumerate(profile["rows"]) if time > watermark]
+    if not new:
+      return None
+
+    times = [profile["rows"][position] for position in new]
+    peers = {(peer["type"], peer["id"]): int(peer.get("count") or 0) for peer in source.get("peers") or []}
+    for position in new:
+      for peer in profile["peers"][position]:
+        peers[peer] = peers.get(peer, 0) + 1
+    actions = {action["action"]: int(action.get("count") or 0) for action in source.get("actions") or []}
+    for position in new:
+      action = profile["actions"][position]
+      if action not in [None, '']:
+        actions[str(action)] = actions.get(str(action), 0) + 1
+
+    first_seen = min(times + ([int(source["first_seen"])] if source.get("first_seen") else []))
+    last_seen = max(times + ([int(source["last_seen"])] if source.get("last_seen") else []))
+    return {
+      "entity_type": profile["entity_type"],
+      "entity_id": profile["entity_id"],
+      "sources": {
+        data_source: {
+          "count": int(source.get("count") or 0) + len(new),
+          "first_seen": first_seen,
+          "last_seen": last_seen,
+          "watermark": max(times + [watermark]),
+          "peers": [{ "type": peer_type, "id": peer_id, "count": count } for (peer_type, peer_id), count in top(peers)],
+          "actions": [{ "action": action, "count": count } for action, count in top(actions)]
+        }
+      }
+    }
+
+def top(counts):
+    return sorted(counts.items(), key=lambda item: (-item[1], str(item[0])))[:ENTITY_PROFILE_TOP_N]
+
+# Entities no event of any source referenced within AOSS_PURGE_LT
+def purge_entity_profiles():
+    if not ENTITY_PROFILE_INDEX or not index_exists(ENTITY_PROFILE_INDEX):
+      return 0
+    recent = [{ "range": { f"sources.{ data_source }.last_seen": { "gte": AOSS_PURGE_LT } } } for data_source in ENTITY_COLUMNS]
+    return delete_by_query(ENTITY_PROFILE_INDEX, { "query": { "bool": { "must_not": recent } } })
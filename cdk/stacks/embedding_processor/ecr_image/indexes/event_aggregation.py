@@ -0,0 +1,116 @@
+import json
+from env import EVENT_AGGREGATION
+
+# Optional aggregation stage that runs on the Athena rows before documents are built and embedded.
+# Rows are grouped by a time bucket and a configurable key, every group becomes a single row with
+# count, first_seen and last_seen, and the configured numeric columns summed.
+#
+#   EVENT_AGGREGATION = {
+#     "vpc_flow_logs": {
+#       "bucket_minutes": 60,
+#       "key": ["accountid", "region", "src_endpoint_ip", "dst_endpoint_ip", "dst_endpoint_port", "action"],
+#       "sum": ["traffic_bytes", "traffic_packets"],
+#       "sum_json": { "traffic": ["bytes", "packets"] }
+#     }
+#   }
+
+for data_source, config in EVENT_AGGREGATION.items():
+    if int(config.get('bucket_minutes', 0)) <= 0 or not config.get('key'):
+      raise ValueError(f"EVENT_AGGREGATION { data_source }: bucket_minutes and key are required")
+    print(f"EVENT_AGGREGATION: { data_source }={ config }")
+
+def aggregation_enabled(data_source):
+    return data_source in EVENT_AGGREGATION
+
+def aggregate_rows(data_source, rows):
+    if not aggregation_enabled(data_source):
+      return rows
+
+    config = EVENT_AGGREGATION[data_source]
+    bucket_ms = int(config['bucket_minutes']) * 60 * 1000
+    key_columns = config['key']
+    sum_columns = config.get('sum', [])
+    sum_json = config.get('sum_json', {})
+
+    groups = {}
+    for row in rows:
+        time = int(row["time"])
+        group_key = (time // bucket_ms,) + tuple(key_value(row, column) for column in key_columns)
+
+        group = groups.get(group_key)
+        if group is None:
+          # rows arrive ordered by time, the first row of a group is kept as its representative
+          group = dict(row)
+          group["count"] = 0
+          group["first_seen"] = time
+          group["last_seen"] = time
+          for column in sum_columns:
+            group[column] = 0
+          group["_sum_json"] = { column: { field: 0 for field in fields } for column, fields in sum_json.items() }
+          groups[group_key] = group
+
+        group["count"] += 1
+        group["first_seen"] = min(group["first_seen"], time)
+        if time >= group["last_seen"]:
+          # time and time_dt follow the newest event so the index max time stays a valid watermark
+          group["last_seen"] = time
+          group["time"] = row["time"]
+          group["time_dt"] = row.get("time_dt")
+        if row.get("anomaly_score", 0) > group.get("anomaly_score", 0):
+          # the group carries the score of its most anomalous event, see indexes/sketches.py
+          group["anomaly_score"] = row["anomaly_score"]
+          group["anomaly_reasons"] = row["anomaly_reasons"]
+        if row.get("ioc_match"):
+          # and the indicators of all its events, see indexes/threat_intel.py
+          group["ioc_match"] = True
+          for column in ["ioc_indicators", "ioc_fields"]:
+            group[column] = group.get(column, []) + [value for value in row[column] if value not in group.get(column, [])]
+        for column in sum_columns:
+          group[column] += to_int(row.get(column))
+        for column, fields in sum_json.items():
+          values = parse_json(row.get(column))
+          for field in fields:
+            group["_sum_json"][column][field] += to_int(values.get(field))
+
+    aggregated = []
+    for group in groups.values():
+        for column, totals in group.pop("_sum_json").items():
+          values = parse_json(group.get(column))
+          values.update(totals)
+          group[column] = json.dumps(values)
+        aggregated.append(group)
+
+    aggregated.sort(key=lambda group: int(group["time"]))
+    print(f"Aggregated { data_source } rows: { len(rows) } -> { len(aggregated) }")
+    return aggregated
+
+# Key columns are Athena columns, or a dotted path into a json column such as "src_endpoint.ip"
+def key_value(row, column):
+    if column in row or '.' not in column:
+      return row.get(column)
+    json_column, path = column.split('.', 1)
+    value = parse_json(row.get(json_column))
+    for part in path.split('.'):
+      value = value.get(part) if isinstance(value, dict) else None
+    return json.dumps(value, sort_keys=True) if isinstance(value, (dict, list)) else value
+
+def map_aggregate_columns(row, doc):
+    if "count" in row:
+      doc["count"] = row["count"]
+      doc["first_seen"] = row["first_seen"]
+      doc["last_seen"] = row["last_seen"]
+
+def to_int(value):
+    try:
+      return int(float(value)) if value not in (None, '') else 0
+    except (TypeError, ValueError):
+      return 0
+
+def parse_json(value):
+    if isinstance(value, dict):
+      return dict(value)
+    try:
+      parsed = json.loads(value) if value else {}
+    except ValueError:
+      return {}
+    return parsed if isinstance(parsed, dict) else {}
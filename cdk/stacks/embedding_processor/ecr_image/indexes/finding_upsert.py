@@ -0,0 +1,123 @@
+import hashlib
+from indexes.embedding_text import build_embedding_text
+from indexes.deferred_embedding import EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD
+from indexes.vector_storage import VECTOR_FIELD, RESCORE_VECTOR_FIELD
+
+# Security Hub updates a finding many times (workflow status, severity, last observed time), the
+# findings index keeps one document per finding: its _id is the finding_uid and every update of
+# the finding is a partial update (doc_as_upsert) of that document, with
+#
+#   first_seen          time of the first version of the finding that was ingested
+#   update_count        versions ingested after the first one
+#   history             status and severity transitions, [{ time, status, severity }], oldest first,
+#                       the last FINDING_HISTORY_MAX only
+#   finding_text_hash   hash of the embedding text without the fields every update changes
+#
+# The embedding is only computed again when finding_text_hash changes, a new timestamp alone keeps
+# the vector of the document. Versions older than the indexed one are skipped.
+#
+# The document keeps the latest state of the finding: a partial update keeps the fields it does not
+# send and merges objects key by key, so the optional fields a version leaves out are sent as null,
+# and the object fields of an indexed finding are set to null by an update just before the new
+# version in the same bulk request. Between the two, a search can see the finding without them.
+
+FINDING_HISTORY_MAX = 20
+FINDING_TEXT_HASH_FIELD = 'finding_text_hash'
+# embedding text fields that change on every update of a finding
+FINDING_VOLATILE_FIELDS = ['time_dt', 'finding_modified_time']
+# document ids are limited to 512 bytes
+FINDING_ID_MAX_BYTES = 512
+
+# fields a version of a finding can leave out
+FINDING_OPTIONAL_FIELDS = ['anomaly_score', 'anomaly_reasons', 'ioc_match', 'ioc_indicators', 'ioc_fields']
+# object fields, replaced instead of merged
+FINDING_OBJECT_FIELDS = ['resources_data', 'remediation_references', 'cloud', 'compliance', 'observables', 'vulnerabilities', 'unmapped']
+
+# _source of the indexed documents needed to merge a new version
+FINDING_STATE_SOURCE = ['time', 'status', 'severity', 'first_seen', 'update_count', 'history', FINDING_TEXT_HASH_FIELD,
+                        EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD]
+EMBEDDING_RESULT_FIELDS = [VECTOR_FIELD, RESCORE_VECTOR_FIELD, EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD]
+
+def finding_upsert_mappings():
+    return {
+      "first_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
+      "update_count": {
+        "type": "integer"
+      },
+      "history": {
+        "properties": {
+          "time": {
+            "type" : "date",
+            "format" : "strict_date_optional_time||epoch_millis"
+          },
+          "status": {
+            "type": "keyword"
+          },
+          "severity": {
+            "type": "keyword"
+          }
+        }
+      },
+      FINDING_TEXT_HASH_FIELD: {
+        "type": "keyword"
+      }
+    }
+
+def finding_doc_id(finding_uid):
+    if not finding_uid:
+      return None
+    if len(finding_uid.encode('utf-8')) <= FINDING_ID_MAX_BYTES:
+      return finding_uid
+    return hashlib.sha256(finding_uid.encode('utf-8')).hexdigest()
+
+def finding_text_hash(doc, fields):
+    stable_fields = [(label, field) for label, field in fields if field not in FINDING_VOLATILE_FIELDS]
+    return hashlib.sha256(build_embedding_text(doc, stable_fields).encode('utf-8')).hexdigest()[:16]
+
+# Adds first_seen, update_count and history to doc from the indexed version, False when doc is older
+def merge_finding(doc, previous):
+    transition = { "time": doc["time"], "status": doc.get("status"), "severity": doc.get("severity") }
+    if previous is None:
+      doc["first_seen"] = doc["time"]
+      doc["update_count"] = 0
+      doc["history"] = [transition]
+      return True
+
+    if int(previous.get("time") or 0) > doc["time"]:
+      return False
+
+    history = list(previous.get("history") or [])
+    if previous.get("status") != doc.get("status") or previous.get("severity") != doc.get("severity") or not history:
+      history.append(transition)
+    doc["first_seen"] = previous.get("first_seen", previous.get("time"))
+    doc["update_count"] = int(previous.get("update_count") or 0) + 1
+    doc["history"] = history[-FINDING_HISTORY_MAX:]
+    return True
+
+def finding_needs_embedding(doc, previous):
+    if previous is None or previous.get(FINDING_TEXT_HASH_FIELD) != doc[FINDING_TEXT_HASH_FIELD]:
+      return True
+    # same text: an embedded or pending document keeps its state, embed_pending handles stale versions
+    return previous.get(EMBEDDING_STATE_FIELD) is None
+
+# A finding updated twice in one bulk request is sent once, with the embedding of the earlier version
+# when the later one was not embedded again
+def carry_embedding(doc, previous):
+    for field in EMBEDDING_RESULT_FIELDS:
+      if field in previous and field not in doc:
+        doc[field] = previous[field]
+
+# _bulk lines of the upsert of a finding, indexed is True when the finding is already in the index
+def finding_upsert_actions(index_name, doc_id, doc, indexed):
+    for field in FINDING_OPTIONAL_FIELDS:
+      doc.setdefault(field, None)
+    actions = []
+    if indexed:
+      actions.append({ "update": { "_index": index_name, "_id": doc_id } })
+      actions.append({ "doc": { field: None for field in FINDING_OBJECT_FIELDS } })
+    actions.append({ "update": { "_index": index_name, "_id": doc_id } })
+    actions.append({ "doc": doc, "doc_as_upsert": True })
+    return actions
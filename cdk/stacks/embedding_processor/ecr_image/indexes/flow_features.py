@@ -0,0 +1,216 @@
+import ipaddress
+import re
+import zlib
+import numpy as np
+
+# Structural feature vectors for VPC flow similarity, VECTOR_STORAGE { "type": "features" }. A flow is
+# mostly numbers (addresses, ports, bytes, packets, action ids) that Titan embeds poorly, the vector is
+# built from the flow fields instead, without Bedrock, in batch at ingest and for the agent queries:
+#
+#   src_ip, dst_ip       prefixes of the address (/8 /16 /24 /32, /32 /48 /64 /128 for IPv6) hashed into
+#                        IP_BUCKETS signed buckets, longer prefixes weigh more: same host > same subnet
+#   src_port, dst_port   one hot over FLOW_PORTS, or the well known / registered / ephemeral range
+#   bytes, packets       log10 of the count, interpolated between two adjacent bins
+#   direction, action    one hot
+#
+# Each block is normalized and weighted by BLOCK_WEIGHTS, then the vector is normalized: the cosine
+# similarity of two flows is the weighted sum of their block similarities. A block without a value is
+# left at zero, a query that only names a port and an action compares flows on these two blocks.
+# The agent Lambda builds query vectors with a pure Python port of this module
+# (agent/lambda_functions/search_security_lake/flow_features.py), change both and FLOW_FEATURES_VERSION
+# together: the version is part of embedding_version, embed_pending recomputes the indexed vectors.
+
+FLOW_FEATURES_VERSION = 1
+
+IP_BUCKETS = 16
+IPV4_PREFIXES = [(8, 0.25), (16, 0.5), (24, 0.75), (32, 1.0)]
+IPV6_PREFIXES = [(32, 0.25), (48, 0.5), (64, 0.75), (128, 1.0)]
+FLOW_PORTS = [20, 21, 22, 23, 25, 53, 80, 110, 123, 135, 139, 143, 161, 389, 443, 445, 465, 587, 636, 993, 995,
+              1433, 1521, 2049, 2375, 3306, 3389, 5432, 5900, 6379, 8080, 8443, 9200, 27017]
+PORT_RANGES = [1024, 49152]
+BYTES_BINS = 11
+PACKETS_BINS = 8
+DIRECTIONS = ['inbound', 'outbound', 'lateral']
+ACTIONS = ['allowed', 'denied']
+
+BLOCKS = [
+    ('src_ip', IP_BUCKETS),
+    ('dst_ip', IP_BUCKETS),
+    ('src_port', len(FLOW_PORTS) + len(PORT_RANGES) + 1),
+    ('dst_port', len(FLOW_PORTS) + len(PORT_RANGES) + 1),
+    ('bytes', BYTES_BINS),
+    ('packets', PACKETS_BINS),
+    ('direction', len(DIRECTIONS) + 1),
+    ('action', len(ACTIONS) + 1),
+]
+BLOCK_WEIGHTS = {
+    'src_ip': 1.0,
+    'dst_ip': 1.0,
+    'src_port': 0.5,
+    'dst_port': 1.0,
+    'bytes': 0.5,
+    'packets': 0.5,
+    'direction': 0.5,
+    'action': 1.0,
+}
+
+FLOW_FEATURE_DIMENSIONS = sum(size for _, size in BLOCKS)
+
+# (start, end) columns of each block
+def block_offsets():
+    offsets = {}
+    start = 0
+    for name, size in BLOCKS:
+      offsets[name] = (start, start + size)
+      start += size
+    return offsets
+
+BLOCK_OFFSETS = block_offsets()
+
+# Float32 matrix, one normalized row per flow document
+def flow_feature_vectors(docs):
+    vectors = np.zeros((len(docs), FLOW_FEATURE_DIMENSIONS), dtype=np.float32)
+    for row, doc in enumerate(docs):
+      ip_features(vectors[row], 'src_ip', doc.get('src_endpoint_ip'))
+      ip_features(vectors[row], 'dst_ip', doc.get('dst_endpoint_ip'))
+      one_hot(vectors, row, 'direction', category(flow_direction(doc), DIRECTIONS))
+      one_hot(vectors, row, 'action', category(doc.get('action'), ACTIONS))
+
+    port_features(vectors, 'src_port', [doc.get('src_endpoint_port') for doc in docs])
+    port_features(vectors, 'dst_port', [doc.get('dst_endpoint_port') for doc in docs])
+    log_bin_features(vectors, 'bytes', [doc.get('traffic_bytes') for doc in docs], BYTES_BINS)
+    log_bin_features(vectors, 'packets', [doc.get('traffic_packets') for doc in docs], PACKETS_BINS)
+
+    for name, _ in BLOCKS:
+      start, end = BLOCK_OFFSETS[name]
+      block = vectors[:, start:end]
+      norms = np.linalg.norm(block, axis=1, keepdims=True)
+      vectors[:, start:end] = np.divide(block, norms, out=np.zeros_like(block), where=norms > 0) * BLOCK_WEIGHTS[name]
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+# An address or a network, "10.0.1.0/24" only sets the prefixes up to /24
+def ip_features(vector, block, value):
+    if not value:
+      return
+    try:
+      network = ipaddress.ip_network(str(value), strict=False)
+    except ValueError:
+      return
+    start, _ = BLOCK_OFFSETS[block]
+    for prefix, weight in (IPV4_PREFIXES if network.version == 4 else IPV6_PREFIXES):
+      if prefix > network.prefixlen:
+        break
+      key = str(network.supernet(new_prefix=prefix)).encode('utf-8')
+      hashed = zlib.crc32(key)
+      vector[start + hashed % IP_BUCKETS] += weight if (hashed >> 16) & 1 else -weight
+
+def port_features(vectors, block, ports):
+    start, _ = BLOCK_OFFSETS[block]
+    for row, port in enumerate(ports):
+      column = port_column(port)
+      if column is not None:
+        vectors[row, start + column] = 1.0
+
+def port_column(port):
+    try:
+      port = int(port)
+    except (TypeError, ValueError):
+      return None
+    if port in FLOW_PORTS:
+      return FLOW_PORTS.index(port)
+    return len(FLOW_PORTS) + sum(1 for limit in PORT_RANGES if port >= limit)
+
+def log_bin_features(vectors, block, values, bins):
+    start, _ = BLOCK_OFFSETS[block]
+    present = np.array([value not in [None, ''] for value in values])
+    counts = np.array([float(value) if value not in [None, ''] else 0.0 for value in values])
+    positions = np.clip(np.log10(1 + np.maximum(counts, 0)), 0, bins - 1)
+    low = np.floor(positions).astype(int)
+    high = np.minimum(low + 1, bins - 1)
+    fraction = (positions - low).astype(np.float32)
+    rows = np.arange(len(values))[present]
+    vectors[rows, start + low[present]] += 1 - fraction[present]
+    vectors[rows, start + high[present]] += fraction[present]
+
+def one_hot(vectors, row, block, column):
+    if column is not None:
+      vectors[row, BLOCK_OFFSETS[block][0] + column] = 1.0
+
+# Index in values, len(values) for any other value, None without a value
+def category(value, values):
+    if value in [None, '']:
+      return None
+    value = str(value).lower()
+    return values.index(value) if value in values else len(values)
+
+def flow_direction(doc):
+    if doc.get('direction'):
+      return doc['direction']
+    connection_info = doc.get('connection_info')
+    return connection_info.get('direction') if isinstance(connection_info, dict) else None
+
+PORT_NAMES = {
+    'ssh': 22, 'telnet': 23, 'smtp': 25, 'dns': 53, 'http': 80, 'ntp': 123, 'smb': 445, 'https': 443,
+    'ldap': 389, 'mssql': 1433, 'nfs': 2049, 'mysql': 3306, 'rdp': 3389, 'postgres': 5432, 'postgresql': 5432,
+    'vnc': 5900, 'redis': 6379,
+}
+IP_PATTERN = re.compile(r'(?:(from|source|src|to|destination|dst)\s+(?:ip\s+|address\s+|host\s+)?)?\b((?:\d{1,3}\.){3}\d{1,3}(?:/\d{1,2})?)\b', re.IGNORECASE)
+PORT_PATTERN = re.compile(r'\b(?:(source|src|destination|dst)\s+)?ports?\s+(\d{1,5})\b', re.IGNORECASE)
+PORT_NAME_PATTERN = re.compile(r'\b(' + '|'.join(PORT_NAMES) + r')\b', re.IGNORECASE)
+BYTES_PATTERN = re.compile(r'\b(\d+(?:\.\d+)?)\s*(bytes|b|kb|mb|gb)\b', re.IGNORECASE)
+BYTES_UNITS = { 'b': 1, 'bytes': 1, 'kb': 1e3, 'mb': 1e6, 'gb': 1e9 }
+PACKETS_PATTERN = re.compile(r'\b(\d+)\s*packets?\b', re.IGNORECASE)
+ACTION_WORDS = {
+    'denied': ['denied', 'deny', 'rejected', 'reject', 'blocked', 'block', 'dropped'],
+    'allowed': ['allowed', 'allow', 'accepted', 'accept', 'permitted'],
+}
+DIRECTION_WORDS = {
+    'inbound': ['inbound', 'ingress', 'incoming'],
+    'outbound': ['outbound', 'egress', 'outgoing'],
+    'lateral': ['lateral', 'east-west'],
+}
+
+# Flow fields named in a similarity search text, "denied ssh from 203.0.113.7" -> a flow document
+def parse_flow_query(text):
+    flow = {}
+    addresses = []
+    for role, address in IP_PATTERN.findall(text):
+      role = role.lower()
+      if role in ['from', 'source', 'src']:
+        flow.setdefault('src_endpoint_ip', address)
+      elif role in ['to', 'destination', 'dst']:
+        flow.setdefault('dst_endpoint_ip', address)
+      else:
+        addresses.append(address)
+    # addresses without a role fill source then destination
+    for field in ['src_endpoint_ip', 'dst_endpoint_ip']:
+      if field not in flow and addresses:
+        flow[field] = addresses.pop(0)
+
+    for role, port in PORT_PATTERN.findall(text):
+      flow.setdefault('src_endpoint_port' if role.lower() in ['source', 'src'] else 'dst_endpoint_port', int(port))
+    for name in PORT_NAME_PATTERN.findall(text):
+      flow.setdefault('dst_endpoint_port', PORT_NAMES[name.lower()])
+
+    for count, unit in BYTES_PATTERN.findall(text):
+      flow.setdefault('traffic_bytes', int(float(count) * BYTES_UNITS[unit.lower()]))
+    for count in PACKETS_PATTERN.findall(text):
+      flow.setdefault('traffic_packets', int(count))
+
+    words = set(re.findall(r'[a-z-]+', text.lower()))
+    for action, action_words in ACTION_WORDS.items():
+      if words & set(action_words):
+        flow.setdefault('action', action)
+    for direction, direction_words in DIRECTION_WORDS.items():
+      if words & set(direction_words):
+        flow.setdefault('direction', direction)
+    return flow
+
+# None when the text names no flow field
+def flow_query_vector(text):
+    flow = parse_flow_query(text)
+    if not flow:
+      return None
+    return flow_feature_vectors([flow])[0].tolist()
@@ -0,0 +1,114 @@
+import copy
+from indexes.vector_storage import VECTOR_FIELD
+from env import MAPPING_PROFILE
+
+# Mapping profiles of the Security Lake indices, MAPPING_PROFILE:
+#   standard  the mappings as written in the sl_* modules
+#   compact   numeric fields as numbers, identifiers as keyword instead of analyzed text, the OCSF objects
+#             the agent never queries for a source stored in _source only (enabled: false, no field is
+#             indexed for them), and embedding_vector excluded from _source (the HNSW graph keeps it
+#             searchable, the agent never reads it back). embedding_rescore stays in _source, the agent
+#             rescores binary candidates with it. The findings keep their vectors in _source: they are
+#             updated in place (indexes/finding_upsert.py) and an update rebuilds the document from _source.
+#
+# The objects the agent prompts query (src_endpoint.ip.keyword, cloud.region.keyword, the unmapped
+# object of the findings, ...) keep their dynamic mapping: check the available_fields of
+# search_security_lake/prompts before disabling an object. The profile applies when an index is created, container/reindex.py migrates an
+# existing index to the current profile.
+
+MAPPING_STANDARD = 'standard'
+MAPPING_COMPACT = 'compact'
+
+KEYWORD = { "type": "keyword" }
+# numeric columns arrive as strings, an empty one is kept in _source rather than failing the document
+LONG = { "type": "long", "ignore_malformed": True }
+# searched by prefix or token as well as exact value
+TEXT_KEYWORD = { "type": "text", "fields": { "keyword": { "type": "keyword", "ignore_above": 256 } } }
+DISABLED = { "type": "object", "enabled": False }
+
+COMPACT_PROFILES = {
+    'cloudtrail_management': {
+      'fields': {
+        'accountid': KEYWORD,
+        'asl_version': KEYWORD,
+        'user_type': KEYWORD,
+        'user_uid_alt': KEYWORD
+      },
+      'disabled': ['dst_endpoint', 'http_request', 'policy', 'observables', 'unmapped']
+    },
+    'security_hub': {
+      'fields': {
+        'asl_version': KEYWORD,
+        'activity_name': KEYWORD,
+        'finding_uid': KEYWORD,
+        'resources_uid': KEYWORD
+      },
+      # unmapped holds the FindingProviderFields, ProductFields, WorkflowState and Compliance the agent queries
+      'disabled': ['resources_data', 'compliance', 'vulnerabilities'],
+      'source_vectors': True
+    },
+    's3_data_events': {
+      'fields': {
+        'accountid': KEYWORD,
+        'asl_version': KEYWORD,
+        'activity_name': KEYWORD,
+        'api_operation': KEYWORD,
+        'resources_uid': KEYWORD
+      },
+      'disabled': ['dst_endpoint', 'http_request', 'session', 'policy', 'resources', 'user', 'observables', 'unmapped']
+    },
+    'lambda_data_events': {
+      'fields': {
+        'accountid': KEYWORD,
+        'asl_version': KEYWORD,
+        'activity_name': KEYWORD,
+        'api_operation': KEYWORD,
+        'resource_uid': KEYWORD
+      },
+      'disabled': ['dst_endpoint', 'http_request', 'session', 'policy', 'resources', 'user', 'observables', 'unmapped']
+    },
+    'route53_logs': {
+      'fields': {
+        'accountid': KEYWORD,
+        'asl_version': KEYWORD,
+        'activity_name': KEYWORD,
+        'rcode': KEYWORD,
+        'disposition': KEYWORD,
+        'action': KEYWORD,
+        'query_hostname': TEXT_KEYWORD
+      },
+      'disabled': ['dst_endpoint', 'connection_info', 'firewall_rule', 'observables', 'unmapped']
+    },
+    'vpc_flow_logs': {
+      'fields': {
+        'accountid': KEYWORD,
+        'asl_version': KEYWORD,
+        'activity_name': KEYWORD,
+        'dst_endpoint_svc_name': KEYWORD,
+        'traffic_packets': LONG,
+        'traffic_bytes': LONG
+      },
+      'disabled': ['observables', 'unmapped']
+    }
+}
+
+def mapping_profile(data_source, index_knn, profile=None):
+    profile = profile or MAPPING_PROFILE
+    if profile == MAPPING_STANDARD:
+      return index_knn
+    if profile != MAPPING_COMPACT:
+      raise ValueError(f"MAPPING_PROFILE: unknown profile { profile }, expected { MAPPING_STANDARD } or { MAPPING_COMPACT }")
+
+    index_knn = copy.deepcopy(index_knn)
+    compact = COMPACT_PROFILES.get(data_source, { 'fields': {}, 'disabled': [] })
+    properties = index_knn['mappings']['properties']
+    for field, mapping in compact['fields'].items():
+      if field in properties:
+        properties[field] = dict(mapping)
+    for field in compact['disabled']:
+      if field in properties:
+        properties[field] = dict(DISABLED)
+
+    if VECTOR_FIELD in properties and not compact.get('source_vectors'):
+      index_knn['mappings']['_source'] = { "excludes": [VECTOR_FIELD] }
+    return index_knn
@@ -5,8 +5,10 @@ import time
 import requests
 import boto3
 import json
-from env import AWS_REGION, AOSS_PURGE_LT, AOSS_ENDPOINT, AOSS_TIME_ZONE, AOSS_BULK_DELETE_SIZE
+from env import AWS_REGION, AOSS_PURGE_LT, AOSS_ENDPOINT, AOSS_TIME_ZONE, AOSS_BULK_DELETE_SIZE, BULK_CAPTURE_PATH
 from requests_aws4auth import AWS4Auth
+from container.metrics import put_metric
+from container.lease import check_leases
 
 print(f"PurgeTimeConfig: { AOSS_PURGE_LT }")
 
@@ -23,9 +25,38 @@ def display_open_search_indices(run_index):
 def create_index(index_name, knn_index):
     put_open_search(index_name, knn_index )
     
-# DELETE /<index-name>
+# PUT <index-name>/_mapping, adds fields to the mapping of an existing index
+def update_index_mapping(index_name, properties):
+    response = put_open_search(f'{ index_name }/_mapping', { "properties": properties })
+    if response.status_code != 200:
+      print(f"index_name={index_name}, mapping not updated: { response.text }")
+    return response.status_code == 200
+
+# GET <index-name>/_mapping, the mapping of the index behind a name or alias
+def get_index_mapping(index_name):
+    response = get_open_search(f'{ index_name }/_mapping')
+    if response.status_code != 200:
+      return None
+    return next(iter(response.json().values()))['mappings']
+
+# GET _alias/<alias>, the indices an alias points to, None when the name is not an alias
+def get_alias_indices(alias):
+    response = get_open_search(f'_alias/{ alias }')
+    if response.status_code != 200:
+      return None
+    return list(response.json().keys())
+
+# POST _aliases, the actions are applied atomically
+def update_aliases(actions):
+    response = post_open_search('_aliases', { "actions": actions })
+    if response.status_code != 200:
+      print(f"aliases not updated: { response.text }")
+    return response.status_code == 200
+
+# DELETE /<index-name>, an alias (container/reindex.py) deletes the indices behind it
 def delete_index(index_name):
-    delete_open_search(index_name)
+    for name in get_alias_indices(index_name) or [index_name]:
+      delete_open_search(name)
     
 # POST <index-name>/_doc
 def add_index_document(index_name, body):
@@ -100,6 +131,16 @@ def index_search(index_name, query):
     
     return json
 
+# POST <index-name>/_mget, the _source of the documents found, by id
+def get_documents(index_name, ids, source_includes=None):
+    if not ids:
+      return {}
+    docs = [{ "_id": id, "_source": source_includes } if source_includes else { "_id": id } for id in ids]
+    response = post_open_search(f'{ index_name }/_mget', { "docs": docs })
+    if response.status_code != 200:
+      raise Exception(f"index_name={index_name}, _mget failed: { response.status_code } { response.text }")
+    return { doc['_id']: doc.get('_source', {}) for doc in response.json()['docs'] if doc.get('found') }
+
 def list_indices(run_index):
   if run_index:
     path = f'_cat/indices/{run_index}?format=JSON'
@@ -232,11 +273,31 @@ def post_open_search(path, body):
     return response
 
 def bulk_open_search(path, data):
+    # no write once another job took over the lease of the source, see container/lease.py
+    check_leases()
+    payload = '\n'.join([json.dumps(line) for line in data]) + '\n'
+    if BULK_CAPTURE_PATH:
+      from indexes.bulk_capture import capture_bulk_payload
+      capture_bulk_payload(path, payload)
+    tic = time.perf_counter()
+    response = post_bulk_payload(path, payload)
+    put_metric('BulkLatency', round((time.perf_counter() - tic) * 1000), 'Milliseconds')
+    if response.status_code == 429:
+      put_metric('BulkThrottles', 1)
+
+    body = response.json()
+    items = body.get('items', [])
+    put_metric('BulkTook', body.get('took'), 'Milliseconds')
+    put_metric('BulkDocuments', len(items))
+    put_metric('BulkItemErrors', sum(1 for item in items if 'error' in next(iter(item.values()))))
+    return body
+
+# Sends an already serialized ndjson payload, returns the response so the status code (429) can be checked
+def post_bulk_payload(path, payload):
     headers = {"Content-Type": "application/x-ndjson"}
     url = f"{ AOSS_ENDPOINT }/{ path }"
-    payload = '\n'.join([json.dumps(line) for line in data]) + '\n'
     response = requests.post(auth=get_auth(), headers=headers, url=url, data=payload, timeout=60)
-    return response.json()
+    return response
 
 def put_open_search(path, body):
     headers = {"Content-Type": "application/json"}
@@ -245,6 +306,9 @@ def put_open_search(path, body):
     return response
 
 def get_auth():
+    if AOSS_ENDPOINT.startswith('http://'):
+      # local emulator, see support/aoss_emulator.py
+      return None
     service = 'aoss'
     credentials = boto3.Session().get_credentials()
     auth = AWS4Auth(credentials.access_key, credentials.secret_key, 
@@ -0,0 +1,106 @@
+# Predicates are small JSON expressions evaluated against document fields.
+#
+#   { "field": "action", "eq": "Denied" }
+#   { "field": "dst_endpoint_port", "in": [22, 3389] }
+#   { "field": "response_error", "exists": True }
+#   { "any": [ <predicate>, ... ] } | { "all": [ <predicate>, ... ] } | { "not": <predicate> }
+#
+# Field names are dotted paths into the document, e.g. "api.response.error".
+
+COMPARISON_OPERATORS = ['eq', 'ne', 'in', 'not_in', 'gt', 'gte', 'lt', 'lte', 'exists']
+LOGICAL_OPERATORS = ['any', 'all', 'not']
+
+def validate_predicate(predicate):
+    if not isinstance(predicate, dict) or len(predicate) == 0:
+      raise ValueError(f"Invalid predicate: { predicate }")
+
+    logical = [op for op in LOGICAL_OPERATORS if op in predicate]
+    if logical:
+      if len(predicate) != 1:
+        raise ValueError(f"Logical predicate must have a single operator: { predicate }")
+      op = logical[0]
+      if op == 'not':
+        validate_predicate(predicate['not'])
+      else:
+        if not isinstance(predicate[op], list) or len(predicate[op]) == 0:
+          raise ValueError(f"'{ op }' expects a non empty list: { predicate }")
+        for item in predicate[op]:
+          validate_predicate(item)
+      return
+
+    field = predicate.get('field')
+    if not isinstance(field, str) or not field.strip():
+      raise ValueError(f"Predicate is missing 'field': { predicate }")
+
+    operators = [key for key in predicate if key != 'field']
+    if len(operators) != 1 or operators[0] not in COMPARISON_OPERATORS:
+      raise ValueError(f"Predicate must have exactly one of { COMPARISON_OPERATORS }: { predicate }")
+
+    op = operators[0]
+    value = predicate[op]
+    if op in ['in', 'not_in'] and not isinstance(value, list):
+      raise ValueError(f"'{ op }' expects a list: { predicate }")
+    if op == 'exists' and not isinstance(value, bool):
+      raise ValueError(f"'exists' expects true or false: { predicate }")
+
+def get_field(doc, field):
+    value = doc
+    for part in field.split('.'):
+      if not isinstance(value, dict):
+        return None
+      value = value.get(part)
+    return value
+
+def evaluate_predicate(predicate, doc):
+    if 'any' in predicate:
+      return any(evaluate_predicate(item, doc) for item in predicate['any'])
+    if 'all' in predicate:
+      return all(evaluate_predicate(item, doc) for item in predicate['all'])
+    if 'not' in predicate:
+      return not evaluate_predicate(predicate['not'], doc)
+
+    value = get_field(doc, predicate['field'])
+    is_empty = value is None or value == '' or value == []
+
+    if 'exists' in predicate:
+      return predicate['exists'] != is_empty
+    if is_empty:
+      # missing values never match a comparison, but always satisfy a negation
+      return 'ne' in predicate or 'not_in' in predicate
+
+    if 'eq' in predicate:
+      return _equals(value, predicate['eq'])
+    if 'ne' in predicate:
+      return not _equals(value, predicate['ne'])
+    if 'in' in predicate:
+      return any(_equals(value, item) for item in predicate['in'])
+    if 'not_in' in predicate:
+      return not any(_equals(value, item) for item in predicate['not_in'])
+
+    left, right = _to_number(value), _to_number(next(predicate[op] for op in ['gt', 'gte', 'lt', 'lte'] if op in predicate))
+    if left is None or right is None:
+      return False
+    if 'gt' in predicate:
+      return left > right
+    if 'gte' in predicate:
+      return left >= right
+    if 'lt' in predicate:
+      return left < right
+    return left <= right
+
+# Athena CSV results hand every column over as a string, so compare loosely
+def _equals(value, expected):
+    if isinstance(expected, bool) or isinstance(value, bool):
+      return str(value).lower() == str(expected).lower()
+    left, right = _to_number(value), _to_number(expected)
+    if left is not None and right is not None:
+      return left == right
+    return str(value) == str(expected)
+
+def _to_number(value):
+    if isinstance(value, bool):
+      return None
+    try:
+      return float(value)
+    except (TypeError, ValueError):
+      return None
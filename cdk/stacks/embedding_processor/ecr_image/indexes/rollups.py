@@ -0,0 +1,175 @@
+import hashlib
+import json
+from datetime import datetime
+import dateutil.tz
+from container.metrics import put_metric
+from indexes.opensearch_utils import create_index, index_exists, get_documents, bulk_open_search, delete_by_query
+from indexes.event_aggregation import key_value
+from env import ROLLUPS, ROLLUP_PURGE_LT, AOSS_TIME_ZONE, AOSS_BULK_CREATE_SIZE, SL_DATASOURCE_MAP
+
+# Rollup index per data source, <index>_rollup, for counts and top N questions that do not need the
+# events: one document per granularity (hour, day in AOSS_TIME_ZONE), bucket and combination of
+# accountid, region and the configured dimensions, with count, first_seen, last_seen and sum_<column>
+# for the configured numeric columns.
+#
+#   ROLLUPS = {
+#     "vpc_flow_logs": {
+#       "dimensions": ["src_endpoint_ip", "dst_endpoint_port", "action"],
+#       "sum": ["traffic_bytes", "traffic_packets"]
+#     }
+#   }
+#
+# Columns are the Athena columns of the sl_* queries, or a path in one of their JSON columns as for
+# EVENT_AGGREGATION, stored with "_" for ".": src_endpoint.ip of cloudtrail is the src_endpoint_ip
+# field. The rollups are updated from the rows of each batch before sampling and aggregation, so
+# their counts are exact, with partial updates merged in here. Each rollup document keeps the time of the newest row it counts
+# (watermark): rows a later run reads again, after a failed bulk request or a run stopped at
+# INDEX_RECORD_LIMIT, are not counted twice. The ingest lease of the source serializes the updates.
+# Rollups are purged after ROLLUP_PURGE_LT instead of AOSS_PURGE_LT and answer for periods the events
+# are no longer kept.
+
+ROLLUP_GRANULARITIES = ['hour', 'day']
+ROLLUP_KEY_COLUMNS = ['accountid', 'region']
+ROLLUP_WATERMARK_FIELD = 'watermark'
+
+for data_source, config in ROLLUPS.items():
+    if data_source not in SL_DATASOURCE_MAP or not isinstance(config.get('dimensions', []), list):
+      raise ValueError(f"ROLLUPS { data_source }: unknown data source or dimensions is not a list")
+    print(f"ROLLUPS: { data_source }={ config }")
+
+def rollups_enabled(data_source):
+    return data_source in ROLLUPS and bool(SL_DATASOURCE_MAP.get(data_source))
+
+def rollup_index_name(data_source):
+    return f"{ SL_DATASOURCE_MAP[data_source] }_rollup"
+
+def rollup_columns(data_source):
+    return ROLLUP_KEY_COLUMNS + [column for column in ROLLUPS[data_source].get('dimensions', []) if column not in ROLLUP_KEY_COLUMNS]
+
+def rollup_index_knn(data_source):
+    date = { "type" : "date", "format" : "strict_date_optional_time||epoch_millis" }
+    properties = {
+      "granularity": { "type": "keyword" },
+      "time": date,
+      "first_seen": date,
+      "last_seen": date,
+      ROLLUP_WATERMARK_FIELD: date,
+      "count": { "type": "long" }
+    }
+    for column in rollup_columns(data_source):
+      properties[rollup_field(column)] = { "type": "keyword" }
+    for column in ROLLUPS[data_source].get('sum', []):
+      properties[sum_field(column)] = { "type": "double" }
+    return { "mappings": { "properties": properties } }
+
+# Start of the hour or day of time, epoch ms
+def bucket_start(time, granularity):
+    moment = datetime.fromtimestamp(time / 1000, dateutil.tz.gettz(AOSS_TIME_ZONE))
+    if granularity == 'day':
+      moment = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    else:
+      moment = moment.replace(minute=0, second=0, microsecond=0)
+    return int(moment.timestamp() * 1000)
+
+def rollup_field(column):
+    return column.replace('.', '_')
+
+def sum_field(column):
+    return f"sum_{ rollup_field(column) }"
+
+def rollup_value(row, column):
+    value = key_value(row, column)
+    return None if value in [None, ''] else str(value)
+
+def rollup_doc_id(granularity, start, key):
+    return hashlib.sha256(json.dumps([granularity, start, list(key)]).encode('utf-8')).hexdigest()
+
+# Updates the rollups of a source with a batch of Athena rows, returns the number of rollup documents written
+def update_rollups(data_source, rows):
+    try:
+      return write_rollups(data_source, rows)
+    except Exception as e:
+      # a derived index must not stop the event ingest: the rows are missing from it, rows read again
+      # later (reindex, rerun of the window) are added once thanks to the watermarks
+      put_metric('RollupErrors', 1)
+      print(f"Rollups { data_source } failed: { e }")
+      return 0
+
+def write_rollups(data_source, rows):
+    if not rollups_enabled(data_source) or not rows:
+      return 0
+
+    index_name = rollup_index_name(data_source)
+    if not index_exists(index_name):
+      create_index(index_name, rollup_index_knn(data_source))
+
+    columns = rollup_columns(data_source)
+    sum_columns = ROLLUPS[data_source].get('sum', [])
+
+    # rows of each rollup document, merged once its watermark is known
+    buckets = {}
+    for row in rows:
+      time = int(row["time"])
+      key = tuple(rollup_value(row, column) for column in columns)
+      for granularity in ROLLUP_GRANULARITIES:
+        start = bucket_start(time, granularity)
+        bucket = buckets.setdefault(rollup_doc_id(granularity, start, key), { "granularity": granularity, "time": start, "key": key, "rows": [] })
+        bucket["rows"].append(row)
+
+    written = 0
+    bucket_ids = list(buckets)
+    for batch_start in range(0, len(bucket_ids), AOSS_BULK_CREATE_SIZE):
+      batch_ids = bucket_ids[batch_start:batch_start + AOSS_BULK_CREATE_SIZE]
+      indexed = get_documents(index_name, batch_ids, ['count', 'first_seen', 'last_seen', ROLLUP_WATERMARK_FIELD] + [sum_field(column) for column in sum_columns])
+
+      bulk_body = []
+      for doc_id in batch_ids:
+        doc = merge_rollup(buckets[doc_id], indexed.get(doc_id), columns, sum_columns)
+        if doc is None:
+          continue
+        bulk_body.append({ "update": { "_index": index_name, "_id": doc_id } })
+        bulk_body.append({ "doc": doc, "doc_as_upsert": True })
+
+      if bulk_body:
+        bulk_response = bulk_open_search("_bulk", bulk_body)
+        print(f"rollups bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+        written += len(bulk_body) // 2
+
+    put_metric('RollupDocuments', written)
+    print(f"Rollups { index_name }: rows={ len(rows) } | documents={ written }")
+    return written
+
+# The rollup document with the rows newer than its watermark added, None when every row was counted
+def merge_rollup(bucket, previous, columns, sum_columns):
+    previous = previous or {}
+    watermark = int(previous.get(ROLLUP_WATERMARK_FIELD) or 0)
+    rows = [row for row in bucket["rows"] if int(row["time"]) > watermark]
+    if not rows:
+      return None
+
+    times = [int(row["time"]) for row in rows]
+    doc = {
+      "granularity": bucket["granularity"],
+      "time": bucket["time"],
+      "count": int(previous.get("count") or 0) + len(rows),
+      "first_seen": min(times + ([int(previous["first_seen"])] if previous.get("first_seen") else [])),
+      "last_seen": max(times + ([int(previous["last_seen"])] if previous.get("last_seen") else [])),
+      ROLLUP_WATERMARK_FIELD: max(times + [watermark])
+    }
+    for column, value in zip(columns, bucket["key"]):
+      if value is not None:
+        doc[rollup_field(column)] = value
+    for column in sum_columns:
+      doc[sum_field(column)] = float(previous.get(sum_field(column)) or 0) + sum(number(key_value(row, column)) for row in rows)
+    return doc
+
+def number(value):
+    try:
+      return float(value)
+    except (TypeError, ValueError):
+      return 0.0
+
+def purge_rollups(data_source):
+    if not rollups_enabled(data_source) or not index_exists(rollup_index_name(data_source)):
+      return 0
+    return delete_by_query(rollup_index_name(data_source), { "query": { "range": { "time": { "lt": ROLLUP_PURGE_LT } } } })
@@ -0,0 +1,196 @@
+import hashlib
+import time
+from container.bedrock_utils import get_embeddings_by_type
+from indexes.opensearch_utils import create_index, index_exists, get_documents, bulk_open_search, delete_by_query
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings
+from indexes.deferred_embedding import embedding_state_mappings, embed_document, EMBEDDING_STATE_FIELD, \
+                                       EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD, EMBEDDING_EMBEDDED
+from env import ROUTE53_HOSTNAME_INDEX, ROUTE53_HOSTNAME_REFRESH_DAYS, AOSS_PURGE_LT
+
+# Similarity search on Route 53 logs is about the queried domain, not the single query. With
+# ROUTE53_HOSTNAME_INDEX set, the ingest embeds one document per hostname in that index instead of
+# every DNS query: the route53 event documents get no vector and reference their entity through the
+# hostname keyword field. The agent searches the entities and fetches their events with a terms query.
+#
+# An entity keeps query_count, first_seen, last_seen and the query types and response codes seen for
+# the hostname, updated on every ingest. It is embedded when first seen, and embedded again when its
+# text changed (a new query type or response code) and it was embedded more than
+# ROUTE53_HOSTNAME_REFRESH_DAYS ago. Entities use the vector storage of route53_logs, pending ones are
+# drained by embed_pending with the route53 index. Their vectors stay in _source: entities are partial
+# updates and an update rebuilds the document from _source.
+
+ROUTE53_HOSTNAME_DATA_SOURCE = 'route53_logs'
+HOSTNAME_FIELD = 'hostname'
+ENTITY_TEXT_HASH_FIELD = 'entity_text_hash'
+ENTITY_EMBEDDED_TIME_FIELD = 'embedded_time'
+ENTITY_VALUES_MAX = 20
+# document ids are limited to 512 bytes
+ENTITY_ID_MAX_BYTES = 512
+
+# _source of the indexed entities needed to merge new queries
+ENTITY_STATE_SOURCE = ['first_seen', 'last_seen', 'query_count', 'query_types', 'rcodes', ENTITY_TEXT_HASH_FIELD,
+                       ENTITY_EMBEDDED_TIME_FIELD, EMBEDDING_STATE_FIELD, EMBEDDING_VERSION_FIELD, EMBEDDING_ATTEMPTS_FIELD]
+
+route53_hostname_index_knn = {
+  "settings": {
+    "index.knn": True
+  },
+  "mappings": {
+    "properties": {
+      **vector_mappings(ROUTE53_HOSTNAME_DATA_SOURCE),
+      **embedding_state_mappings(),
+      HOSTNAME_FIELD: {
+        "type": "keyword"
+      },
+      "labels": {
+        "type": "keyword"
+      },
+      "first_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
+      "last_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
+      "query_count": {
+        "type": "long"
+      },
+      "query_types": {
+        "type": "keyword"
+      },
+      "rcodes": {
+        "type": "keyword"
+      },
+      ENTITY_TEXT_HASH_FIELD: {
+        "type": "keyword"
+      },
+      ENTITY_EMBEDDED_TIME_FIELD: {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      }
+    }
+  }
+}
+
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+route53_hostname_embedding_fields = [
+    ("Hostname", HOSTNAME_FIELD),
+    ("Domain labels", "labels"),
+    ("Query types", "query_types"),
+    ("Response codes", "rcodes"),
+]
+
+def create_embedding_str(entity):
+    return build_embedding_text(entity, route53_hostname_embedding_fields)
+
+def hostname_entities_enabled():
+    return bool(ROUTE53_HOSTNAME_INDEX)
+
+# Lower case without the trailing dot of the fully qualified name: "Example.com." -> "example.com"
+def hostname_id(query_hostname):
+    if not query_hostname:
+      return None
+    return str(query_hostname).strip().rstrip('.').lower() or None
+
+def entity_doc_id(hostname):
+    if len(hostname.encode('utf-8')) <= ENTITY_ID_MAX_BYTES:
+      return hostname
+    return hashlib.sha256(hostname.encode('utf-8')).hexdigest()
+
+# Upserts the entities of a batch of route53 documents, returns the embedded and pending counts
+def upsert_hostname_entities(docs, bedrock):
+    if not index_exists(ROUTE53_HOSTNAME_INDEX):
+      create_index(ROUTE53_HOSTNAME_INDEX, route53_hostname_index_knn)
+
+    seen = {}
+    for doc in docs:
+      hostname = doc.get(HOSTNAME_FIELD)
+      if not hostname:
+        continue
+      entity = seen.setdefault(hostname, {
+        HOSTNAME_FIELD: hostname,
+        "first_seen": doc["time"],
+        "last_seen": doc["time"],
+        "query_count": 0,
+        "query_types": [],
+        "rcodes": []
+      })
+      entity["first_seen"] = min(entity["first_seen"], int(doc.get("first_seen") or doc["time"]))
+      entity["last_seen"] = max(entity["last_seen"], int(doc.get("last_seen") or doc["time"]))
+      # aggregated documents (EVENT_AGGREGATION) stand for count queries
+      entity["query_count"] += int(doc.get("count") or 1)
+      add_value(entity["query_types"], doc.get("query_type"))
+      add_value(entity["rcodes"], doc.get("rcode"))
+
+    indexed = get_documents(ROUTE53_HOSTNAME_INDEX, { entity_doc_id(hostname) for hostname in seen }, ENTITY_STATE_SOURCE)
+
+    embedded = 0
+    pending = 0
+    bulk_body = []
+    now = int(time.time() * 1000)
+    for hostname, entity in seen.items():
+      doc_id = entity_doc_id(hostname)
+      previous = indexed.get(doc_id)
+      if previous is not None:
+        entity["first_seen"] = min(entity["first_seen"], int(previous.get("first_seen") or entity["first_seen"]))
+        entity["last_seen"] = max(entity["last_seen"], int(previous.get("last_seen") or entity["last_seen"]))
+        entity["query_count"] += int(previous.get("query_count") or 0)
+        for field in ["query_types", "rcodes"]:
+          values = list(previous.get(field) or [])
+          for value in entity[field]:
+            add_value(values, value)
+          entity[field] = values
+
+      entity["labels"] = hostname_labels(hostname)
+      text = create_embedding_str(entity)
+      entity[ENTITY_TEXT_HASH_FIELD] = hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+      if entity_needs_embedding(entity, previous, now):
+        if embed_document(ROUTE53_HOSTNAME_DATA_SOURCE, entity, route53_hostname_embedding_fields, text, bedrock, get_embeddings_by_type):
+          entity[ENTITY_EMBEDDED_TIME_FIELD] = now
+          embedded += 1
+        else:
+          pending += 1
+      elif previous.get(EMBEDDING_STATE_FIELD) == EMBEDDING_EMBEDDED:
+        # the text hash stays the one of the indexed vector until the refresh
+        entity[ENTITY_TEXT_HASH_FIELD] = previous.get(ENTITY_TEXT_HASH_FIELD)
+
+      bulk_body.append({ "update": { "_index": ROUTE53_HOSTNAME_INDEX, "_id": doc_id } })
+      bulk_body.append({ "doc": entity, "doc_as_upsert": True })
+
+    if bulk_body:
+      bulk_response = bulk_open_search("_bulk", bulk_body)
+      print(f"hostname entities bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+    return embedded, pending
+
+def entity_needs_embedding(entity, previous, now):
+    if previous is None or previous.get(EMBEDDING_STATE_FIELD) is None:
+      return True
+    if previous.get(ENTITY_TEXT_HASH_FIELD) == entity[ENTITY_TEXT_HASH_FIELD]:
+      return False
+    # text changed: refreshed rarely, pending entities are left to embed_pending. Entities embedded by
+    # embed_pending have no embedded_time and are refreshed on their first change.
+    embedded_time = int(previous.get(ENTITY_EMBEDDED_TIME_FIELD) or 0)
+    return previous.get(EMBEDDING_STATE_FIELD) == EMBEDDING_EMBEDDED and now - embedded_time >= ROUTE53_HOSTNAME_REFRESH_DAYS * 86400 * 1000
+
+# Labels and their dash separated words, "api-gw.example.com" -> ["api-gw", "api", "gw", "example", "com"]
+def hostname_labels(hostname):
+    labels = []
+    for label in hostname.split('.'):
+      add_value(labels, label)
+      if '-' in label:
+        for word in label.split('-'):
+          add_value(labels, word)
+    return labels
+
+def add_value(values, value):
+    if value not in [None, ''] and value not in values and len(values) < ENTITY_VALUES_MAX:
+      values.append(value)
+
+# Entities no query referenced within AOSS_PURGE_LT
+def purge_hostname_entities():
+    if not index_exists(ROUTE53_HOSTNAME_INDEX):
+      return 0
+    return delete_by_query(ROUTE53_HOSTNAME_INDEX, { "query": { "range": { "last_seen": { "lt": AOSS_PURGE_LT } } } })
@@ -1,8 +1,16 @@
 import boto3
 import csv
 import codecs
+from env import ATHENA_BACKEND
+from container.metrics import put_metric
 
 def s3_read_dictionary(bucket, key):
+  if ATHENA_BACKEND == 'duckdb':
+    from indexes.duckdb_athena import local_read_dictionary
+    list = local_read_dictionary(bucket, key)
+    put_metric('RowsRead', len(list))
+    return list
+
   # get a handle on s3
   s3 = boto3.resource('s3')
 
@@ -21,4 +29,5 @@ def s3_read_dictionary(bucket, key):
       # print(row)
       list.append(row)
   
+  put_metric('RowsRead', len(list))
   return list
\ No newline at end of file
@@ -0,0 +1,114 @@
+import random
+from env import INGEST_SAMPLING, INDEX_RECORD_LIMIT
+
+# Stratified sampling for high volume sources. The Athena query reads up to scan_limit rows, rows are
+# split into strata and a reservoir sample of at most per_stratum rows is kept for every stratum.
+# Each kept row carries sample_weight (rows in stratum / rows kept) and estimated_count
+# (sample_weight * count, count being 1 unless the rows were aggregated) so counts can be extrapolated.
+# Rows matching a threat intel indicator (ioc_match, indexes/threat_intel.py) are all kept, weight 1,
+# even when there are more than max_rows of them: the sample is then the matched rows and one more.
+# The other rows fit in max_rows minus the matched rows: with more strata than that the smallest
+# strata are merged into one, so every row read is represented and the watermark can pass them all.
+# Only the sources whose builder samples its rows (SAMPLED_SOURCES) can be configured.
+#
+#   INGEST_SAMPLING = {
+#     "vpc_flow_logs": { "strata": ["accountid", "region", "action"], "per_stratum": 100, "scan_limit": 50000 }
+#   }
+
+SAMPLED_SOURCES = ['vpc_flow_logs']
+
+for data_source, config in INGEST_SAMPLING.items():
+    if data_source not in SAMPLED_SOURCES:
+      raise ValueError(f"INGEST_SAMPLING { data_source }: sampling is supported for { SAMPLED_SOURCES } only")
+    if not config.get('strata') or int(config.get('per_stratum', 0)) <= 0:
+      raise ValueError(f"INGEST_SAMPLING { data_source }: strata and per_stratum are required")
+    print(f"INGEST_SAMPLING: { data_source }={ config }")
+
+# key of the strata merged when there are more than rows to keep
+MERGED_STRATUM = ('__merged__',)
+
+def sampling_enabled(data_source):
+    return data_source in INGEST_SAMPLING
+
+def sampling_scan_limit(data_source, default = INDEX_RECORD_LIMIT):
+    if not sampling_enabled(data_source):
+      return default
+    return int(INGEST_SAMPLING[data_source].get('scan_limit', default))
+
+def stratified_sample(data_source, rows, max_rows = INDEX_RECORD_LIMIT):
+    if not sampling_enabled(data_source) or len(rows) == 0:
+      return rows
+
+    config = INGEST_SAMPLING[data_source]
+    strata_columns = config['strata']
+    rng = random.Random(config.get('seed'))
+
+    matched = [row for row in rows if row.get("ioc_match")]
+    rows = [row for row in rows if not row.get("ioc_match")]
+
+    strata = {}
+    for row in rows:
+        strata.setdefault(tuple(row.get(column) for column in strata_columns), []).append(row)
+
+    strata_len = len(strata)
+    strata = merge_strata(strata, max(max_rows - len(matched), 1))
+    allocation = allocate(strata, int(config['per_stratum']), max(max_rows - len(matched), 1))
+
+    newest = rows[-1] if rows else None
+    newest_key = tuple(newest.get(column) for column in strata_columns) if rows else None
+    if newest_key not in strata:
+      newest_key = MERGED_STRATUM
+
+    sampled = []
+    for row in matched:
+        row = dict(row)
+        row["sample_weight"] = 1.0
+        row["estimated_count"] = float(row.get("count", 1))
+        sampled.append(row)
+    for key, stratum in strata.items():
+        reservoir = reservoir_sample(stratum, allocation[key], rng)
+        if key == newest_key and newest not in reservoir:
+          # the newest row always stays in the sample, the index max time is the next run's watermark
+          reservoir[rng.randrange(len(reservoir))] = newest
+
+        weight = len(stratum) / len(reservoir)
+        for row in reservoir:
+            row = dict(row)
+            row["sample_weight"] = weight
+            row["estimated_count"] = weight * int(row.get("count", 1))
+            sampled.append(row)
+
+    sampled.sort(key=lambda row: int(row["time"]))
+    print(f"Sampled { data_source } rows: { len(rows) + len(matched) } -> { len(sampled) } | strata: { strata_len } -> { len(strata) } | ioc_match: { len(matched) }")
+    return sampled
+
+# Keeps the max_strata - 1 largest strata and merges the others, their rows share one weight
+def merge_strata(strata, max_strata):
+    if len(strata) <= max_strata:
+      return strata
+    keys = sorted(strata, key=lambda key: len(strata[key]), reverse=True)
+    merged = { key: strata[key] for key in keys[:max_strata - 1] }
+    merged[MERGED_STRATUM] = [row for key in keys[max_strata - 1:] for row in strata[key]]
+    return merged
+
+# Every stratum keeps min(size, cap) rows, the cap is lowered until the total fits max_rows,
+# at most one row per stratum once strata are merged to max_rows
+def allocate(strata, per_stratum, max_rows):
+    cap = per_stratum
+    while cap > 1 and sum(min(len(stratum), cap) for stratum in strata.values()) > max_rows:
+        cap -= max(1, cap // 10)
+    return { key: min(len(stratum), max(cap, 1)) for key, stratum in strata.items() }
+
+# Algorithm R
+def reservoir_sample(rows, size, rng):
+    reservoir = rows[:size]
+    for position in range(size, len(rows)):
+        slot = rng.randint(0, position)
+        if slot < size:
+          reservoir[slot] = rows[position]
+    return reservoir
+
+def map_sample_columns(row, doc):
+    if "sample_weight" in row:
+      doc["sample_weight"] = row["sample_weight"]
+      doc["estimated_count"] = row["estimated_count"]
@@ -0,0 +1,325 @@
+import hashlib
+import io
+import math
+import os
+from datetime import datetime, timedelta
+import boto3
+import dateutil.tz
+import numpy as np
+from botocore.exceptions import ClientError
+from container.metrics import put_metric
+from container.lease import check_leases
+from indexes.event_aggregation import key_value
+from env import SKETCHES, SKETCH_PREFIX, SKETCH_BASELINE_DAYS, ATHENA_BACKEND, SECURITY_LAKE_ATHENA_BUCKET, AOSS_TIME_ZONE, SL_DATASOURCE_MAP
+
+# Anomaly score at ingest against per entity baselines kept in compact sketches, so that "unusual
+# activity" is a filter on anomaly_score instead of cardinality aggregations at query time.
+#
+#   SKETCHES = {
+#     "vpc_flow_logs": { "entity": "src_endpoint_ip", "target": "dst_endpoint_ip" },
+#     "cloudtrail_management": { "entity": "user", "target": "api_operation" }
+#   }
+#
+# Per source and day (AOSS_TIME_ZONE), a HyperLogLog of the distinct targets of each entity
+# (destinations per source IP, APIs per principal) and a count-min sketch of the events per entity and
+# per (entity, target) pair, saved as s3://<Athena bucket>/<SKETCH_PREFIX>/<index>/<day>.npz between
+# runs. Every row is scored against the SKETCH_BASELINE_DAYS days before its own:
+#
+#   new_entity   the entity has no event in the baseline                              ANOMALY_NEW_ENTITY
+#   new_target   the entity is known but never had an event with this target          ANOMALY_NEW_TARGET
+#   fanout       distinct targets of the entity on the day / its daily baseline mean  1 - 1 / ratio
+#   volume       events of the entity on the day / its daily baseline mean            1 - 1 / ratio
+#
+# anomaly_score is the highest of these, from 0 to 1, anomaly_reasons lists the reasons scoring at
+# least ANOMALY_REASON_MIN. Rows without any baseline day are not scored. The count-min sketch only
+# overestimates, a pair it counts 0 times was never seen. Counts of the current day grow during the
+# day, fanout and volume are conservative early in the day. Rows are counted once: each day keeps the
+# time of its newest counted row (watermark), like the rollups. The ingest lease of the source
+# serializes the updates, days older than the baseline are deleted with the purge.
+
+HLL_PRECISION = 8
+HLL_REGISTERS = 1 << HLL_PRECISION
+CMS_DEPTH = 4
+CMS_WIDTH = 1 << 15
+ANOMALY_NEW_ENTITY = 0.5
+ANOMALY_NEW_TARGET = 0.6
+ANOMALY_REASON_MIN = 0.5
+
+for data_source, config in SKETCHES.items():
+    if data_source not in SL_DATASOURCE_MAP or not config.get('entity') or not config.get('target'):
+      raise ValueError(f"SKETCHES { data_source }: unknown data source, entity and target are required")
+    print(f"SKETCHES: { data_source }={ config }")
+
+# day sketches loaded by this run, by (data source, day)
+loaded_sketches = {}
+
+class DaySketch:
+    def __init__(self, entities = None, registers = None, counts = None, watermark = 0):
+        self.entities = { entity: position for position, entity in enumerate(entities or []) }
+        # one row of HyperLogLog registers per entity
+        self.registers = list(registers) if registers is not None else []
+        self.counts = counts if counts is not None else np.zeros((CMS_DEPTH, CMS_WIDTH), dtype=np.int32)
+        self.watermark = watermark
+        self.dirty = False
+
+    def add(self, entity, target):
+        position = self.entities.get(entity)
+        if position is None:
+          position = self.entities[entity] = len(self.entities)
+          self.registers.append(np.zeros(HLL_REGISTERS, dtype=np.uint8))
+        if target is not None:
+          hashed = hash64(target)
+          register = hashed & (HLL_REGISTERS - 1)
+          rank = (64 - HLL_PRECISION) - (hashed >> HLL_PRECISION).bit_length() + 1
+          self.registers[position][register] = max(self.registers[position][register], rank)
+          cms_add(self.counts, pair_key(entity, target))
+        cms_add(self.counts, entity_key(entity))
+        self.dirty = True
+
+    def distinct(self, entity):
+        position = self.entities.get(entity)
+        return hll_estimate(self.registers[position]) if position is not None else 0.0
+
+    def events(self, entity):
+        return cms_count(self.counts, entity_key(entity))
+
+    def pair_events(self, entity, target):
+        return cms_count(self.counts, pair_key(entity, target))
+
+    def to_bytes(self):
+        buffer = io.BytesIO()
+        entities = sorted(self.entities, key=self.entities.get)
+        registers = np.stack(self.registers) if self.registers else np.zeros((0, HLL_REGISTERS), dtype=np.uint8)
+        np.savez_compressed(buffer, entities=np.array(entities, dtype=str), registers=registers,
+                            counts=self.counts, watermark=np.array([self.watermark], dtype=np.int64))
+        return buffer.getvalue()
+
+    @staticmethod
+    def from_bytes(body):
+        data = np.load(io.BytesIO(body), allow_pickle=False)
+        return DaySketch(list(data['entities']), data['registers'], data['counts'], int(data['watermark'][0]))
+
+def hash64(value):
+    return int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'little')
+
+def entity_key(entity):
+    return f"e\x1f{ entity }"
+
+def pair_key(entity, target):
+    return f"p\x1f{ entity }\x1f{ target }"
+
+# Columns of a key in the count-min rows, double hashing of one 64 bit hash
+def cms_columns(key):
+    hashed = hash64(key)
+    low, high = hashed & 0xffffffff, (hashed >> 32) | 1
+    return [(low + row * high) % CMS_WIDTH for row in range(CMS_DEPTH)]
+
+def cms_add(counts, key):
+    counts[np.arange(CMS_DEPTH), cms_columns(key)] += 1
+
+def cms_count(counts, key):
+    return int(counts[np.arange(CMS_DEPTH), cms_columns(key)].min())
+
+def hll_estimate(registers):
+    alpha = 0.7213 / (1 + 1.079 / HLL_REGISTERS)
+    estimate = alpha * HLL_REGISTERS ** 2 / np.sum(np.power(2.0, -registers.astype(np.float64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * HLL_REGISTERS and zeros:
+      # small range correction: linear counting
+      return HLL_REGISTERS * math.log(HLL_REGISTERS / zeros)
+    return float(estimate)
+
+def sketches_enabled(data_source):
+    return data_source in SKETCHES and bool(SL_DATASOURCE_MAP.get(data_source))
+
+def row_day(time):
+    return datetime.fromtimestamp(int(time) / 1000, dateutil.tz.gettz(AOSS_TIME_ZONE)).strftime('%Y-%m-%d')
+
+def baseline_days(day):
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return [(start - timedelta(days=offset)).strftime('%Y-%m-%d') for offset in range(1, SKETCH_BASELINE_DAYS + 1)]
+
+def sketch_key(data_source, day):
+    return f"{ SKETCH_PREFIX }/{ SL_DATASOURCE_MAP[data_source] }/{ day }.npz"
+
+# The sketch of a day, None for a baseline day without any sketch
+def day_sketch(data_source, day, create = False):
+    if (data_source, day) not in loaded_sketches:
+      body = sketch_store().get(sketch_key(data_source, day))
+      loaded_sketches[(data_source, day)] = DaySketch.from_bytes(body) if body is not None else None
+    if loaded_sketches[(data_source, day)] is None and create:
+      loaded_sketches[(data_source, day)] = DaySketch()
+    return loaded_sketches[(data_source, day)]
+
+# Updates the day sketches of a source with a batch of Athena rows and sets anomaly_score and
+# anomaly_reasons on the rows that have a baseline, returns the rows
+def score_anomalies(data_source, rows):
+    try:
+      return update_sketches(data_source, rows)
+    except Exception as e:
+      # the events are indexed without anomaly_score, rows already added to a day sketch are saved with
+      # the next save of that day and counted once thanks to its watermark
+      put_metric('SketchErrors', 1)
+      print(f"Sketches { data_source } failed: { e }")
+      return rows
+
+def update_sketches(data_source, rows):
+    if not sketches_enabled(data_source) or not rows:
+      return rows
+
+    entity_column = SKETCHES[data_source]['entity']
+    target_column = SKETCHES[data_source]['target']
+
+    days = {}
+    for row in rows:
+      days.setdefault(row_day(row["time"]), []).append(row)
+
+    for day, day_rows in days.items():
+      sketch = day_sketch(data_source, day, create=True)
+      watermark = sketch.watermark
+      for row in day_rows:
+        if int(row["time"]) > watermark:
+          entity = sketch_value(key_value(row, entity_column))
+          if entity is not None:
+            sketch.add(entity, sketch_value(key_value(row, target_column)))
+          sketch.watermark = max(sketch.watermark, int(row["time"]))
+
+    scored = 0
+    anomalous = 0
+    for day, day_rows in days.items():
+      sketch = day_sketch(data_source, day)
+      baseline = [baseline_sketch for baseline_sketch in (day_sketch(data_source, baseline_day) for baseline_day in baseline_days(day)) if baseline_sketch is not None]
+      if not baseline:
+        continue
+      entity_scores = {}
+      for row in day_rows:
+        entity = sketch_value(key_value(row, entity_column))
+        if entity is None:
+          continue
+        if entity not in entity_scores:
+          entity_scores[entity] = entity_anomalies(sketch, baseline, entity)
+        score, reasons = target_anomalies(baseline, entity, sketch_value(key_value(row, target_column)), entity_scores[entity])
+        row["anomaly_score"] = score
+        row["anomaly_reasons"] = reasons
+        scored += 1
+        anomalous += 1 if reasons else 0
+
+    for day in days:
+      save_sketch(data_source, day)
+
+    put_metric('AnomalousRows', anomalous)
+    print(f"Sketches { data_source }: rows={ len(rows) } | days={ len(days) } | scored={ scored } | anomalous={ anomalous }")
+    return rows
+
+# Scores of an entity for the day: new_entity, or fanout and volume against the baseline daily means
+def entity_anomalies(sketch, baseline, entity):
+    baseline_events = sum(baseline_sketch.events(entity) for baseline_sketch in baseline)
+    if baseline_events == 0:
+      return { "new_entity": ANOMALY_NEW_ENTITY }
+    distinct_mean = sum(baseline_sketch.distinct(entity) for baseline_sketch in baseline) / len(baseline)
+    events_mean = baseline_events / len(baseline)
+    return {
+      "fanout": ratio_score(sketch.distinct(entity), distinct_mean),
+      "volume": ratio_score(sketch.events(entity), events_mean)
+    }
+
+def target_anomalies(baseline, entity, target, entity_scores):
+    scores = dict(entity_scores)
+    if "new_entity" not in scores and target is not None and sum(baseline_sketch.pair_events(entity, target) for baseline_sketch in baseline) == 0:
+      scores["new_target"] = ANOMALY_NEW_TARGET
+    reasons = sorted(reason for reason, score in scores.items() if score >= ANOMALY_REASON_MIN)
+    return round(max(scores.values()), 3), reasons
+
+def ratio_score(value, mean):
+    ratio = value / max(mean, 1.0)
+    return 1 - 1 / ratio if ratio > 1 else 0.0
+
+def sketch_value(value):
+    return None if value in [None, '', '-'] else str(value)
+
+def save_sketch(data_source, day):
+    sketch = loaded_sketches.get((data_source, day))
+    if sketch is None or not sketch.dirty:
+      return
+    check_leases()
+    sketch_store().put(sketch_key(data_source, day), sketch.to_bytes())
+    sketch.dirty = False
+
+def map_anomaly_columns(row, doc):
+    if "anomaly_score" in row:
+      doc["anomaly_score"] = row["anomaly_score"]
+      doc["anomaly_reasons"] = row["anomaly_reasons"]
+
+def anomaly_mappings():
+    return {
+      "anomaly_score": {
+        "type": "float"
+      },
+      "anomaly_reasons": {
+        "type": "keyword"
+      }
+    }
+
+# Days older than the baseline of today are no longer read
+def purge_sketches(data_source):
+    if not sketches_enabled(data_source):
+      return 0
+    oldest = baseline_days(row_day(datetime.now().timestamp() * 1000))[-1]
+    store = sketch_store()
+    prefix = f"{ SKETCH_PREFIX }/{ SL_DATASOURCE_MAP[data_source] }/"
+    deleted = 0
+    for key in store.list(prefix):
+      if key[len(prefix):].replace('.npz', '') < oldest:
+        store.delete(key)
+        deleted += 1
+    return deleted
+
+def sketch_store():
+    return LocalSketchStore() if ATHENA_BACKEND == 'duckdb' else S3SketchStore()
+
+class S3SketchStore:
+    def __init__(self):
+        self.s3 = boto3.client('s3')
+
+    def get(self, key):
+        try:
+          return self.s3.get_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key)['Body'].read()
+        except ClientError as e:
+          if e.response['Error']['Code'] in ['NoSuchKey', '404']:
+            return None
+          raise
+
+    def put(self, key, body):
+        self.s3.put_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key, Body=body)
+
+    def list(self, prefix):
+        keys = []
+        for page in self.s3.get_paginator('list_objects_v2').paginate(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Prefix=prefix):
+          keys.extend(item['Key'] for item in page.get('Contents', []))
+        return keys
+
+    def delete(self, key):
+        self.s3.delete_object(Bucket=SECURITY_LAKE_ATHENA_BUCKET, Key=key)
+
+class LocalSketchStore:
+    def path(self, key):
+        from indexes.duckdb_athena import local_path
+        return local_path(SECURITY_LAKE_ATHENA_BUCKET, key)
+
+    def get(self, key):
+        if not os.path.exists(self.path(key)):
+          return None
+        with open(self.path(key), 'rb') as file:
+          return file.read()
+
+    def put(self, key, body):
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        with open(self.path(key), 'wb') as file:
+          file.write(body)
+
+    def list(self, prefix):
+        directory = self.path(prefix)
+        return [f"{ prefix }{ name }" for name in os.listdir(directory)] if os.path.isdir(directory) else []
+
+    def delete(self, key):
+        os.remove(self.path(key))
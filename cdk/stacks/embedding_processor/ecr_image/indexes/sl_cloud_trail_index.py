@@ -1,9 +1,19 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
                                      index_search, index_purge, bulk_open_search
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector
+from indexes.deferred_embedding import embedding_state_mappings, embed_document
+from indexes.mapping_profiles import mapping_profile
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
 from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_CLOUDTRAIL, SL_DATASOURCE_MAP
@@ -44,22 +54,18 @@ security_lake_cloud_trail_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_CLOUDTRAIL }"
 
-security_lake_cloud_trail_index_name = SL_DATASOURCE_MAP["cloudtrail_management"]
-security_lake_cloud_trail_index_knn = {
+security_lake_cloud_trail_data_source = "cloudtrail_management"
+security_lake_cloud_trail_index_name = SL_DATASOURCE_MAP[security_lake_cloud_trail_data_source]
+security_lake_cloud_trail_index_knn = mapping_profile(security_lake_cloud_trail_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_cloud_trail_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -163,7 +169,7 @@ security_lake_cloud_trail_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_cloud_trail_index():
   delete_index(security_lake_cloud_trail_index_name)
@@ -183,7 +189,17 @@ def build_cloud_trail_index(bedrock, s3_bucket = None, s3_key = None, delete_idx
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"Cloud Trail Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_cloud_trail_data_source, list)
+    update_entity_profiles(security_lake_cloud_trail_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_cloud_trail_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_cloud_trail_data_source, list)
+
     error_cnt = 0
+    pending_cnt = 0
+    embedded_cnt = 0
     bulk_body = []
 
     for index, row in enumerate(list):
@@ -229,6 +245,9 @@ def build_cloud_trail_index(bedrock, s3_bucket = None, s3_key = None, delete_idx
             doc["region"] = row["region"]
             doc["asl_version"] = row["asl_version"]
 
+            map_anomaly_columns(row, doc)
+            map_ioc_columns(row, doc)
+
             map_dict_column(row, doc, "api")
             api_data = doc["api"]["request"]["data"]
             doc["api"]["request"]["data"] = json.loads(api_data) if api_data and api_data.strip() else None
@@ -243,10 +262,12 @@ def build_cloud_trail_index(bedrock, s3_bucket = None, s3_key = None, delete_idx
             map_dict_column(row, doc, "observables")
             map_dict_column(row, doc, "unmapped")
 
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
+            if should_embed(security_lake_cloud_trail_data_source, doc):
+                # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                if embed_document(security_lake_cloud_trail_data_source, doc, security_lake_cloud_trail_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                    embedded_cnt += 1
+                else:
+                    pending_cnt += 1
 
             bulk_body.append({ "create": { "_index": security_lake_cloud_trail_index_name } })
             bulk_body.append(doc)
@@ -268,13 +289,14 @@ def build_cloud_trail_index(bedrock, s3_bucket = None, s3_key = None, delete_idx
             print(f"{error_cnt} | Exception: { str(e) }")
 
     count = index_count(security_lake_cloud_trail_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) }")
     
 def search_cloud_trail_index(bedrock, input_text, size=1):
     
     try:
         bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_cloud_trail_data_source))
+        search_vector = query_vector(security_lake_cloud_trail_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -353,11 +375,7 @@ def ingest_security_lake_cloud_trail_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_cloud_trail_index_name, True)
 
-    query = security_lake_cloud_trail_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time }"
-
+    query = f"{ security_lake_cloud_trail_query_2_0 }{ where_clause(security_lake_cloud_trail_data_source, max_time) }"
     query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
 
     print (f"Query: { query }")
@@ -399,52 +417,31 @@ def convert_enddate_to_seconds(ts):
 def purge_security_lake_cloud_trail_data():
   index_purge(security_lake_cloud_trail_index_name)
 
-def create_embedding_str(data):
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_cloud_trail_embedding_fields = [
+    ("API Operation", "api_operation"),
+    ("API Service", "api_service_name"),
+    ("Status", "status"),
+    ("Response Error", "api.response.error"),
+    ("Response Error Message", "api.response.message"),
+    ("User", "user"),
+    ("User Type", "user_type"),
+    ("User Name", "user_uid_alt"),
+    ("Source IP Address", "src_endpoint.ip"),
+    ("Event Type", "type_name"),
+    ("Severity", "severity"),
+    ("MFA", "is_mfa"),
+    ("HTTP User Agent", "http_user_agent"),
+    ("Account ID", "accountid"),
+    ("Cloud Region", "cloud.region"),
+    ("Event Time", "time_dt"),
+    ("Session Issuer", "actor.session.issuer"),
+    ("Invoked By", "actor.invoked_by"),
+    ("API Request", "api.request.data"),
+    ("Class Name", "class_name"),
+    ("Category Name", "category_name"),
+    ("Cloud Provider", "cloud.provider"),
+]
 
-    event_data = f"""
-    Event Details:
-    - Class Name: {data.get("class_name", "N/A")}
-    - Category Name: {data.get("category_name", "N/A")}
-    - Event Type: {data['type_name']}
-    - Severity: {data['severity']}
-    - Event Time: {datetime.fromtimestamp(int(data['time']) / 1000).strftime('%Y-%m-%d %H:%M:%S.%f')}
-    - Status: {data['status']}
-
-    API Operation Details:
-    - API Operation: {data['api_operation']}
-    - API Service: {data['api_service_name']}
-
-    Source Endpoint Details:
-    - IP Address: {data['src_endpoint']['ip']}
-
-    Other Details:
-    - HTTP User Agent: {data['http_user_agent']}
-    - Cloud Provider: {data['cloud']['provider']}
-    - Cloud Region: {data['cloud']['region']}
-    """
-
-    # - API Request:
-    # - Database Name: {data['api']['request']['data']['databaseName']}
-    # - Table Name: {data['api']['request']['data']['name']}
-    # - User Name: {data['actor']['user']['uid_alt']}
-    # - Account UID: {data['actor']['user']['account']['uid']}
-    # - Session Created: {datetime.strptime(data['actor']['session']['created_time_dt'], '%Y-%m-%d %H:%M:%S.%f')}
-    # - Session MFA: {data['actor']['session']['is_mfa']}
-    # - Session Issuer: {data['actor']['session']['issuer']}
-    # Actor Details:
-    # - User: {data['actor']['user']['type']}
-    # - User UID: {data['actor']['user']['uid']}
-
-    # event_data = json.dumps(doc["class_name"] + ' ' + \
-    #                         doc["category_name"] + ' ' + \
-    #                         doc["severity"] + ' ' + \
-    #                         doc["type_name"] + ' ' + \
-    #                         doc["timestr"] + ' ' + \
-    #                         doc["status"] + ' ' + \
-    #                         doc["api_operation"] + ' ' + \
-    #                         doc["api_service_name"] + ' ' + \
-    #                         doc["user"] + ' ' + \
-    #                         doc["user_type"] + ' ' + \
-    #                         doc["user_uid_alt"])
-
-    return event_data
+def create_embedding_str(data):
+    return build_embedding_text(data, security_lake_cloud_trail_embedding_fields)
@@ -1,12 +1,25 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
-                                     index_search, index_purge, bulk_open_search
+                                     index_search, index_purge, bulk_open_search, \
+                                     get_documents, update_index_mapping
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector
+from indexes.deferred_embedding import embedding_state_mappings, embed_document
+from indexes.mapping_profiles import mapping_profile
+from indexes.finding_upsert import finding_upsert_mappings, finding_doc_id, finding_text_hash, merge_finding, \
+                                   finding_needs_embedding, carry_embedding, finding_upsert_actions, FINDING_STATE_SOURCE, FINDING_TEXT_HASH_FIELD
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
-from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_FINDINGS, SL_DATASOURCE_MAP
+from env import AWS_REGION, INDEX_RECORD_LIMIT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_FINDINGS, SL_DATASOURCE_MAP
 
 security_lake_findings_query_2_0 = f"select \
  activity_id, \
@@ -41,22 +54,19 @@ security_lake_findings_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_FINDINGS }"
 
-security_lake_findings_index_name = SL_DATASOURCE_MAP["security_hub"]
-security_lake_findings_index_knn = {
+security_lake_findings_data_source = "security_hub"
+security_lake_findings_index_name = SL_DATASOURCE_MAP[security_lake_findings_data_source]
+security_lake_findings_index_knn = mapping_profile(security_lake_findings_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_findings_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
+      **finding_upsert_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -153,7 +163,7 @@ security_lake_findings_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_findings_index():
   delete_index(security_lake_findings_index_name)
@@ -169,116 +179,165 @@ def build_findings_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
 
     if create_idx:
       create_index(security_lake_findings_index_name, security_lake_findings_index_knn)
+    else:
+      # indices created before the upsert by finding_uid have no mapping for its fields yet
+      update_index_mapping(security_lake_findings_index_name, finding_upsert_mappings())
 
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"Findings Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_findings_data_source, list)
+    update_entity_profiles(security_lake_findings_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_findings_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_findings_data_source, list)
+
     error_cnt = 0
-    bulk_body = []
-
-    for index, row in enumerate(list):
-        remediation_desc: str
-        resources_data: str
-
-        class_name = row["class_name"]
-        category_name = row["category_name"]
-        severity = row["severity"]
-        type_name = row["type_name"]
-        time = int(row["time"])
-        finding_title = row["finding_title"]
-        finding_desc = row["finding_desc"]
-        finding_created_time = row["finding_created_time"]
-        finding_modified_time = row["finding_modified_time"]
-        finding_type = row["finding_type"]
-        remediation_desc = row["remediation_desc"]
-        resources_type = row["resources_type"]
-        resources_uid = row["resources_uid"]
-        resources_region = row["resources_region"]
-        resources_data = row["resources_data"]
-        activity_id = row["activity_id"]
-        activity_name = row["activity_name"]
-        class_uid = row["class_uid"]
-        category_uid = row["category_uid"]
-        time_dt = row["time_dt"]
-        status = row["status"]
-        finding_uid = row["finding_uid"]
-        remediation_references = row["remediation_references"]
-        asl_version = row["asl_version"]
-        cloud = row["cloud"]
-        confidence_score = row["confidence_score"]
-        compliance = row["compliance"]
-        observables = row["observables"]
-        vulnerabilities = row["vulnerabilities"]
-        unmapped = row["unmapped"]
-
-        timestr = datetime.fromtimestamp(int(time)/1000).strftime('%Y-%m-%d %H:%M:%S.%f')
+    pending_cnt = 0
+    embedded_cnt = 0
+    updated_cnt = 0
+    skipped_cnt = 0
+
+    # one upsert per finding and bulk request, findings are merged with the version indexed before,
+    # see indexes/finding_upsert.py
+    for batch_start in range(0, len(list), AOSS_BULK_CREATE_SIZE):
+      batch = list[batch_start:batch_start + AOSS_BULK_CREATE_SIZE]
+      try:
+        indexed = get_documents(security_lake_findings_index_name, { finding_doc_id(row["finding_uid"]) for row in batch } - { None }, FINDING_STATE_SOURCE)
+      except Exception as e:
+        # later batches would move the index max time, the watermark, past these findings: stop here,
+        # the next run reads them again
+        error_cnt += len(list) - batch_start
+        print(f"{error_cnt} | Exception: { str(e) } | stopping at { batch_start } of { len(list) } rows")
+        break
+      upserts = {}
+      creates = []
+
+      for row in batch:
+          remediation_desc: str
+          resources_data: str
+
+          class_name = row["class_name"]
+          category_name = row["category_name"]
+          severity = row["severity"]
+          type_name = row["type_name"]
+          time = int(row["time"])
+          finding_title = row["finding_title"]
+          finding_desc = row["finding_desc"]
+          finding_created_time = row["finding_created_time"]
+          finding_modified_time = row["finding_modified_time"]
+          finding_type = row["finding_type"]
+          remediation_desc = row["remediation_desc"]
+          resources_type = row["resources_type"]
+          resources_uid = row["resources_uid"]
+          resources_region = row["resources_region"]
+          resources_data = row["resources_data"]
+          activity_id = row["activity_id"]
+          activity_name = row["activity_name"]
+          class_uid = row["class_uid"]
+          category_uid = row["category_uid"]
+          time_dt = row["time_dt"]
+          status = row["status"]
+          finding_uid = row["finding_uid"]
+          remediation_references = row["remediation_references"]
+          asl_version = row["asl_version"]
+          cloud = row["cloud"]
+          confidence_score = row["confidence_score"]
+          compliance = row["compliance"]
+          observables = row["observables"]
+          vulnerabilities = row["vulnerabilities"]
+          unmapped = row["unmapped"]
+
+          timestr = datetime.fromtimestamp(int(time)/1000).strftime('%Y-%m-%d %H:%M:%S.%f')
         
-        try:
-            doc = {}
-            doc["class_name"] = class_name
-            doc["category_name"] = category_name
-            doc["severity"] = severity
-            doc["type_name"] = type_name
-            doc["time"] = time
-            doc["finding_title"] = finding_title
-            doc["finding_desc"] = finding_desc
-            doc["finding_created_time"] = finding_created_time
-            doc["finding_modified_time"] = finding_modified_time
-            doc["finding_type"] = finding_type
-            doc["remediation_desc"] = remediation_desc
-            doc["resources_type"] = resources_type
-            doc["resources_uid"] = resources_uid
-            doc["resources_region"] = resources_region
-            doc["activity_id"] = activity_id
-            doc["activity_name"] = activity_name
-            doc["class_uid"] = class_uid
-            doc["category_uid"] = category_uid
-            doc["time_dt"] = time_dt
-            doc["status"] = status
-            doc["finding_uid"] = finding_uid
-            doc["asl_version"] = asl_version
-            doc["confidence_score"] = confidence_score
-
-            map_dict_column(row, doc, "resources_data")
-            map_dict_column(row, doc, "remediation_references")
-            map_dict_column(row, doc, "cloud")
-            map_dict_column(row, doc, "compliance")
-            map_dict_column(row, doc, "observables")
-            map_dict_column(row, doc, "vulnerabilities")
-            map_dict_column(row, doc, "unmapped")
-
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
-
-            bulk_body.append({ "create": { "_index": security_lake_findings_index_name } })
-            bulk_body.append(doc)
-
-            bulk_len = len(bulk_body)/2
-            if (bulk_len % AOSS_BULK_CREATE_SIZE == 0) or (index == len(list) - 1):
-                bulk_response = bulk_open_search("_bulk", bulk_body)
-                print(f"bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
-                bulk_body = []
-
-            processed_len = index + 1
-            if (processed_len % INDEX_REPORT_COUNT == 0) or index == len(list) - 1:
-                print(f"processed: { processed_len }")
-            if index >= INDEX_RECORD_LIMIT:
-                break
-
-        except Exception as e:
-            error_cnt += 1
-            print(f"{error_cnt} | Exception: { str(e) }")
+          try:
+              doc = {}
+              doc["class_name"] = class_name
+              doc["category_name"] = category_name
+              doc["severity"] = severity
+              doc["type_name"] = type_name
+              doc["time"] = time
+              doc["finding_title"] = finding_title
+              doc["finding_desc"] = finding_desc
+              doc["finding_created_time"] = finding_created_time
+              doc["finding_modified_time"] = finding_modified_time
+              doc["finding_type"] = finding_type
+              doc["remediation_desc"] = remediation_desc
+              doc["resources_type"] = resources_type
+              doc["resources_uid"] = resources_uid
+              doc["resources_region"] = resources_region
+              doc["activity_id"] = activity_id
+              doc["activity_name"] = activity_name
+              doc["class_uid"] = class_uid
+              doc["category_uid"] = category_uid
+              doc["time_dt"] = time_dt
+              doc["status"] = status
+              doc["finding_uid"] = finding_uid
+              doc["asl_version"] = asl_version
+              doc["confidence_score"] = confidence_score
+
+              map_anomaly_columns(row, doc)
+              map_ioc_columns(row, doc)
+
+              map_dict_column(row, doc, "resources_data")
+              map_dict_column(row, doc, "remediation_references")
+              map_dict_column(row, doc, "cloud")
+              map_dict_column(row, doc, "compliance")
+              map_dict_column(row, doc, "observables")
+              map_dict_column(row, doc, "vulnerabilities")
+              map_dict_column(row, doc, "unmapped")
+
+              doc_id = finding_doc_id(finding_uid)
+              previous = upserts.get(doc_id, indexed.get(doc_id)) if doc_id else None
+              if doc_id and not merge_finding(doc, previous):
+                  # an older version than the indexed one
+                  skipped_cnt += 1
+                  continue
+              doc[FINDING_TEXT_HASH_FIELD] = finding_text_hash(doc, security_lake_findings_embedding_fields)
+
+              if should_embed(security_lake_findings_data_source, doc) and finding_needs_embedding(doc, previous):
+                  # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                  if embed_document(security_lake_findings_data_source, doc, security_lake_findings_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                      embedded_cnt += 1
+                  else:
+                      pending_cnt += 1
+
+              if doc_id is None:
+                  creates.append(doc)
+                  continue
+              if previous is not None:
+                  carry_embedding(doc, previous)
+                  updated_cnt += 1
+              upserts[doc_id] = doc
+
+          except Exception as e:
+              error_cnt += 1
+              print(f"{error_cnt} | Exception: { str(e) }")
+
+      bulk_body = []
+      for doc_id, doc in upserts.items():
+        bulk_body.extend(finding_upsert_actions(security_lake_findings_index_name, doc_id, doc, doc_id in indexed))
+      for doc in creates:
+        bulk_body.append({ "create": { "_index": security_lake_findings_index_name } })
+        bulk_body.append(doc)
+      if bulk_body:
+        bulk_response = bulk_open_search("_bulk", bulk_body)
+        print(f"bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+
+      processed_len = batch_start + len(batch)
+      print(f"processed: { processed_len }")
 
     count = index_count(security_lake_findings_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) } | Updated count: { str(updated_cnt) } | Skipped count: { str(skipped_cnt) }")
     
 def search_findings_index(bedrock, input_text, size=1):
     
     try:
         bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_findings_data_source))
+        search_vector = query_vector(security_lake_findings_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -342,11 +401,7 @@ def ingest_security_lake_findings_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_findings_index_name, True)
 
-    query = security_lake_findings_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time }"
-
+    query = f"{ security_lake_findings_query_2_0 }{ where_clause(security_lake_findings_data_source, max_time) }"
     query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
     print (f"Query: { query }")
 
@@ -380,80 +435,33 @@ def ingest_security_lake_findings_data(bedrock, credentials):
 def purge_security_lake_findings_data():
   index_purge(security_lake_findings_index_name)
 
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_findings_embedding_fields = [
+    ("Finding Title", "finding_title"),
+    ("Finding Description", "finding_desc"),
+    ("Severity", "severity"),
+    ("Finding Type", "finding_type"),
+    ("Status", "status"),
+    ("Resources Type", "resources_type"),
+    ("Resources UID", "resources_uid"),
+    ("Remediation Description", "remediation_desc"),
+    ("Resources Region", "resources_region"),
+    ("AWS Account UID", "cloud.account.uid"),
+    ("Activity Name", "activity_name"),
+    ("Type Name", "type_name"),
+    ("Confidence Score", "confidence_score"),
+    ("Finding Created Time", "finding_created_time"),
+    ("Finding Modified Time", "finding_modified_time"),
+    ("Time (as datetime)", "time_dt"),
+    ("Observable", "observables.0"),
+    ("Resources Data", "resources_data"),
+    ("Compliance", "compliance"),
+    ("Vulnerabilities", "vulnerabilities"),
+    ("Class Name", "class_name"),
+    ("Category Name", "category_name"),
+    ("Cloud Provider", "cloud.provider"),
+    ("Finding UID", "finding_uid"),
+]
+
 def create_embedding_str(json):
-   
-    event_data = f"""
-        Class Name: {str(json.get('class_name', 'N/A'))}
-        Category Name: {str(json.get('category_name', 'N/A'))}
-        Severity: {str(json.get('severity', 'N/A'))}
-        Type Name: {str(json.get('type_name', 'N/A'))}
-        Time: {str(json.get('time', 'N/A'))}
-        Finding Title: {str(json.get('finding_title', 'N/A'))}
-        Finding Description: {str(json.get('finding_desc', 'N/A'))}
-        Finding Created Time: {str(json.get('finding_created_time', 'N/A'))}
-        Finding Modified Time: {str(json.get('finding_modified_time', 'N/A'))}
-        Finding Type: {str(json.get('finding_type', 'N/A'))}
-        Remediation Description: {str(json.get('remediation_desc', 'N/A'))}
-        Resources Type: {str(json.get('resources_type', 'N/A'))}
-        Resources UID: {str(json.get('resources_uid', 'N/A'))}
-        Resources Region: {str(json.get('resources_region', 'N/A'))}
-        Activity ID: {str(json.get('activity_id', 'N/A'))}
-        Activity Name: {str(json.get('activity_name', 'N/A'))}
-        Class UID: {str(json.get('class_uid', 'N/A'))}
-        Category UID: {str(json.get('category_uid', 'N/A'))}
-        Time (as datetime): {str(json.get('time_dt', 'N/A'))}
-        Status: {str(json.get('status', 'N/A'))}
-        Finding UID: {str(json.get('finding_uid', 'N/A'))}
-        ASL Version: {str(json.get('asl_version', 'N/A'))}
-        Confidence Score: {str(json.get('confidence_score', 'N/A'))}
-        AWS Account UID: {str(json['cloud']['account'].get('uid', 'N/A'))}
-        AWS Region: {str(json.get('resources_region', 'N/A'))}
-        Cloud Provider: {str(json['cloud'].get('provider', 'N/A'))}
-        Observable: {str(json.get('observables', [{}])[0])}
-        """
-
-        # Remediation References: {', '.join(str(item) for item in json.get('remediation_references', ['N/A']))}
-        # FMS Admin Account ID: {str(json['resources_data'].get('Other', {}).get('fmsAdminAccountId', 'N/A'))}
-        # Duplicate Security Group IDs: {', '.join(str(item) for item in json['resources_data'].get('Other', {}).get(
-        #     'duplicateSecurityGroupIds', ['N/A']))}
-        # FMS Policy Name: {str(json['resources_data'].get('Other', {}).get('fmsPolicyName', 'N/A'))}
-        # VPC ID: {str(json['resources_data'].get('Other', {}).get('vpcId', 'N/A'))}
-        # FMS Policy ARN: {str(json['resources_data'].get('Other', {}).get('fmsPolicyArn', 'N/A'))}
-        # AWS Account Name: {str(json.get('unmapped', {}).get('AwsAccountName', 'N/A'))}
-        # Finding Provider Fields.Confidence: {str(json.get('unmapped', {}).get(
-        #     'FindingProviderFields.Confidence', 'N/A'))}
-        # Finding Provider Fields.Severity.Label: {str(json.get('unmapped', {}).get(
-        #     'FindingProviderFields.Severity.Label', 'N/A'))}
-        # Finding Provider Fields.Severity.Normalized: {str(json.get('unmapped', {}).get(
-        #     'FindingProviderFields.Severity.Normalized', 'N/A'))}
-        # Finding Provider Fields.Severity.Product: {str(json.get('unmapped', {}).get(
-        #     'FindingProviderFields.Severity.Product', 'N/A'))}
-        # Finding Provider Fields.Types[]: {', '.join(str(item) for item in json.get('unmapped', {}).get(
-        #     'FindingProviderFields.Types[]', ['N/A']))}
-        # Product Fields.aws/securityhub/CompanyName: {str(json.get('unmapped', {}).get(
-        #     'ProductFields.aws/securityhub/CompanyName', 'N/A'))}
-        # Product Fields.aws/securityhub/FindingId: {str(json.get('unmapped', {}).get(
-        #     'ProductFields.aws/securityhub/FindingId', 'N/A'))}
-        # Product Fields.aws/securityhub/ProductName: {str(json.get('unmapped', {}).get(
-        #     'ProductFields.aws/securityhub/ProductName', 'N/A'))}
-        # Record State: {str(json.get('unmapped', {}).get('RecordState', 'N/A'))}
-        # Severity.Normalized: {str(json.get('unmapped', {}).get('Severity.Normalized', 'N/A'))}
-        # Severity.Product: {str(json.get('unmapped', {}).get('Severity.Product', 'N/A'))}
-        # Workflow State: {str(json.get('unmapped', {}).get('WorkflowState', 'N/A'))}
-
-        # event_data = json.dumps(doc["class_name"] + ' ' + \
-        #                         doc["category_name"] + ' ' + \
-        #                         doc["severity"] + ' ' + \
-        #                         doc["type_name"] + ' ' + \
-        #                         doc["timestr"] + ' ' + \
-        #                         doc["finding_title"] + ' ' + \
-        #                         doc["finding_desc"] + ' ' + \
-        #                         str(doc["finding_created_time"]) + ' ' + \
-        #                         str(doc["finding_modified_time"]) + ' ' + \
-        #                         doc["finding_type"] + ' ' + \
-        #                         doc["remediation_desc"] + ' ' + \
-        #                         doc["resources_type"] + ' ' + \
-        #                         doc["resources_uid"] + ' ' + \
-        #                         doc["resources_region"])
-
-    return event_data
\ No newline at end of file
+    return build_embedding_text(json, security_lake_findings_embedding_fields)
@@ -1,9 +1,19 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
                                      index_search, index_purge, bulk_open_search
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector
+from indexes.deferred_embedding import embedding_state_mappings, embed_document
+from indexes.mapping_profiles import mapping_profile
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
 from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_LAMBDA, SL_DATASOURCE_MAP
@@ -46,22 +56,18 @@ security_lake_lambda_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_LAMBDA }"
 
-security_lake_lambda_index_name = SL_DATASOURCE_MAP["lambda_data_events"]
-security_lake_lambda_index_knn = {
+security_lake_lambda_data_source = "lambda_data_events"
+security_lake_lambda_index_name = SL_DATASOURCE_MAP[security_lake_lambda_data_source]
+security_lake_lambda_index_knn = mapping_profile(security_lake_lambda_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_lambda_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -168,7 +174,7 @@ security_lake_lambda_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_lambda_index():
     delete_index(security_lake_lambda_index_name)
@@ -187,7 +193,17 @@ def build_lambda_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = Fa
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"Lambda Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_lambda_data_source, list)
+    update_entity_profiles(security_lake_lambda_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_lambda_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_lambda_data_source, list)
+
     error_cnt = 0
+    pending_cnt = 0
+    embedded_cnt = 0
     bulk_body = []
 
     for index, row in enumerate(list):
@@ -232,6 +248,9 @@ def build_lambda_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = Fa
             doc["region"] = row["region"]
             doc["asl_version"] = row["asl_version"]
 
+            map_anomaly_columns(row, doc)
+            map_ioc_columns(row, doc)
+
             map_dict_column(row, doc, "cloud")
             map_dict_column(row, doc, "api")
             api_data = doc["api"]["request"]["data"]
@@ -248,10 +267,12 @@ def build_lambda_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = Fa
             map_dict_column(row, doc, "observables")
             map_dict_column(row, doc, "unmapped")
 
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
+            if should_embed(security_lake_lambda_data_source, doc):
+                # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                if embed_document(security_lake_lambda_data_source, doc, security_lake_lambda_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                    embedded_cnt += 1
+                else:
+                    pending_cnt += 1
 
             bulk_body.append({ "create": { "_index": security_lake_lambda_index_name } })
             bulk_body.append(doc)
@@ -273,13 +294,14 @@ def build_lambda_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = Fa
             print(f"{error_cnt} | Exception: { str(e) }")
 
     count = index_count(security_lake_lambda_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) }")
     
 def search_lambda_index(bedrock, input_text, size=1):
     
     try:
         bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_lambda_data_source))
+        search_vector = query_vector(security_lake_lambda_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -337,11 +359,7 @@ def ingest_security_lake_lambda_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_lambda_index_name, True)
 
-    query = security_lake_lambda_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time }"
-
+    query = f"{ security_lake_lambda_query_2_0 }{ where_clause(security_lake_lambda_data_source, max_time) }"
     query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
     print (f"Query: { query }")
 
@@ -375,81 +393,34 @@ def ingest_security_lake_lambda_data(bedrock, credentials):
 def purge_security_lake_lambda_data():
   index_purge(security_lake_lambda_index_name)
 
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_lambda_embedding_fields = [
+    ("api_operation", "api_operation"),
+    ("resource_uid", "resource_uid"),
+    ("status", "status"),
+    ("api_response_error", "api.response.error"),
+    ("actor_user_type", "actor.user.type"),
+    ("actor_user_uid", "actor.user.uid"),
+    ("actor_invoked_by", "actor.invoked_by"),
+    ("src_endpoint_ip", "src_endpoint.ip"),
+    ("src_endpoint_domain", "src_endpoint.domain"),
+    ("resource_type", "resource_type"),
+    ("resource_owner_account", "resources.0.owner.account.uid"),
+    ("api_service_name", "api_service_name"),
+    ("http_user_agent", "http_user_agent"),
+    ("severity", "severity"),
+    ("type_name", "type_name"),
+    ("activity_name", "activity_name"),
+    ("is_mfa", "is_mfa"),
+    ("accountid", "accountid"),
+    ("region", "region"),
+    ("time_dt", "time_dt"),
+    ("api_request_data", "api.request.data"),
+    ("actor_session", "actor.session"),
+    ("function_version", "unmapped.additionalEventData.functionVersion"),
+    ("class_name", "class_name"),
+    ("category_name", "category_name"),
+]
+
 def create_embedding_str(json):
-   
-    event_data = f"""The event details are:
-        class_name: {json['class_name']}
-        category_name: {json['category_name']}
-        severity: {json['severity']}
-        type_name: {json['type_name']}
-        time: {json['time']}
-        status: {json['status']}
-        api_operation: {json['api_operation']}
-        api_service_name: {json['api_service_name']}
-        http_user_agent: {json['http_user_agent']}
-        resource_uid: {json['resource_uid']}
-        resource_type: {json['resource_type']}
-        time_dt: {json['time_dt']}
-        class_uid: {json['class_uid']}
-        category_uid: {json['category_uid']}
-        severity_id: {json['severity_id']}
-        activity_name: {json['activity_name']}
-        activity_id: {json['activity_id']}
-        type_uid: {json['type_uid']}
-        is_mfa: {json['is_mfa']}
-        accountid: {json['accountid']}
-        region: {json['region']}
-        asl_version: {json['asl_version']}
-        cloud_region: {json['cloud']['region']}
-        cloud_provider: {json['cloud']['provider']}
-        api_response: {json['api']['response']}
-        api_operation: {json['api']['operation']}
-        api_version: {json['api']['version']}
-        api_service_name: {json['api']['service']['name']}
-        api_request_data: {json['api']['request']['data']}
-        api_request_uid: {json['api']['request']['uid']}
-        actor_user_type: {json['actor']['user']['type']}
-        actor_user_name: {json['actor']['user']['name']}
-        actor_user_uid_alt: {json['actor']['user']['uid_alt']}
-        actor_user_uid: {json['actor']['user']['uid']}
-        actor_user_account: {json['actor']['user']['account']}
-        actor_user_credential_uid: {json['actor']['user']['credential_uid']}
-        actor_session: {json['actor']['session']}
-        actor_invoked_by: {json['actor']['invoked_by']}
-        actor_idp: {json['actor']['idp']}
-        http_user_agent: {json['http_request']['user_agent']}
-        src_endpoint_uid: {json['src_endpoint']['uid']}
-        src_endpoint_ip: {json['src_endpoint']['ip']}
-        src_endpoint_domain: {json['src_endpoint']['domain']}
-        session: {json['session']}
-        policy: {json['policy']}
-        resource_uid: {json['resources'][0]['uid']}
-        resource_owner_account: {json['resources'][0]['owner']['account']['uid']}
-        resource_type: {json['resources'][0]['type']}
-        user: {json['user']}
-        observable_name_resources_uid: {json['observables'][0]['name']}
-        observable_value_resources_uid: {json['observables'][0]['value']}
-        observable_type_resources_uid: {json['observables'][0]['type']}
-        observable_type_id_resources_uid: {json['observables'][0]['type_id']}
-        observable_name_src_endpoint_domain: {json['observables'][1]['name']}
-        observable_value_src_endpoint_domain: {json['observables'][1]['value']}
-        observable_type_src_endpoint_domain: {json['observables'][1]['type']}
-        observable_type_id_src_endpoint_domain: {json['observables'][1]['type_id']}
-        additional_event_data_function_version: {json['unmapped']['additionalEventData.functionVersion']}
-        additional_event_data_management_event: {json['unmapped']['managementEvent']}
-        additional_event_data_read_only: {json['unmapped']['readOnly']}
-        additional_event_data_recipient_account_id: {json['unmapped']['recipientAccountId']}."""
-
-        # event_data = json.dumps(doc["class_name"] + ' ' + \
-        #                         doc["category_name"] + ' ' + \
-        #                         doc["severity"] + ' ' + \
-        #                         doc["type_name"] + ' ' + \
-        #                         doc["timestr"] + ' ' + \
-        #                         doc["status"] + ' ' + \
-        #                         doc["api_operation"] + ' ' + \
-        #                         doc["api_service_name"] + ' ' + \
-        #                         doc["http_user_agent"] + ' ' + \
-        #                         doc["resource_uid"] + ' ' + \
-        #                         doc["resource_type"])
-            
-    return event_data
+    return build_embedding_text(json, security_lake_lambda_embedding_fields)
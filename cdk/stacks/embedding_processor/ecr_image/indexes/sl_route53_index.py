@@ -1,9 +1,21 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
-                                     index_search, index_purge, bulk_open_search
+                                     index_search, index_purge, bulk_open_search, update_index_mapping
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector
+from indexes.deferred_embedding import embedding_state_mappings, embed_document
+from indexes.mapping_profiles import mapping_profile
+from indexes.route53_hostnames import hostname_entities_enabled, hostname_id, upsert_hostname_entities, purge_hostname_entities
+from indexes.event_aggregation import aggregate_rows, map_aggregate_columns
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
 from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_ROUTE53, SL_DATASOURCE_MAP
@@ -42,22 +54,18 @@ security_lake_route53_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_ROUTE53 }"
 
-security_lake_route53_index_name = SL_DATASOURCE_MAP["route53_logs"]
-security_lake_route53_index_knn = {
+security_lake_route53_data_source = "route53_logs"
+security_lake_route53_index_name = SL_DATASOURCE_MAP[security_lake_route53_data_source]
+security_lake_route53_index_knn = mapping_profile(security_lake_route53_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_route53_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -74,9 +82,23 @@ security_lake_route53_index_knn = {
         "type" : "date",
         "format" : "strict_date_optional_time||epoch_millis"
       },
+      "count": {
+        "type": "long"
+      },
+      "first_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
+      "last_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
       "query_hostname": {
         "type": "text"
       },
+      "hostname": {
+        "type": "keyword"
+      },
       "query_type": {
         "type": "keyword"
       },
@@ -155,7 +177,7 @@ security_lake_route53_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_route53_index():
     delete_index(security_lake_route53_index_name)
@@ -171,11 +193,26 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
 
     if create_idx:
       create_index(security_lake_route53_index_name, security_lake_route53_index_knn)
+    else:
+      # indices created before the hostname entities have no mapping for the hostname reference yet
+      update_index_mapping(security_lake_route53_index_name, { "hostname": { "type": "keyword" } })
 
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"Route53 Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_route53_data_source, list)
+    update_entity_profiles(security_lake_route53_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_route53_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_route53_data_source, list)
+
+    list = aggregate_rows(security_lake_route53_data_source, list)
+
     error_cnt = 0
+    pending_cnt = 0
+    embedded_cnt = 0
     bulk_body = []
 
     for index, row in enumerate(list):
@@ -197,6 +234,7 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             doc["type_name"] = type_name
             doc["time"] = time
             doc["query_hostname"] = query_hostname
+            doc["hostname"] = hostname_id(query_hostname)
             doc["query_type"] = query_type
 
             doc["class_uid"] = row["class_uid"]
@@ -215,6 +253,10 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             doc["time_dt"] = row["time_dt"]
             doc["asl_version"] = row["asl_version"]
 
+            map_aggregate_columns(row, doc)
+            map_anomaly_columns(row, doc)
+            map_ioc_columns(row, doc)
+
             map_dict_column(row, doc, "cloud")
             map_dict_column(row, doc, "src_endpoint")
             map_dict_column(row, doc, "dst_endpoint")
@@ -225,10 +267,13 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             map_dict_column(row, doc, "observables")
             map_dict_column(row, doc, "unmapped")
 
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
+            # with hostname entities the events are not embedded, see indexes/route53_hostnames.py
+            if not hostname_entities_enabled() and should_embed(security_lake_route53_data_source, doc):
+                # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                if embed_document(security_lake_route53_data_source, doc, security_lake_route53_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                    embedded_cnt += 1
+                else:
+                    pending_cnt += 1
 
             bulk_body.append({ "create": { "_index": security_lake_route53_index_name } })
             bulk_body.append(doc)
@@ -237,7 +282,17 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             if (bulk_len % AOSS_BULK_CREATE_SIZE == 0) or (index == len(list) - 1):
                 bulk_response = bulk_open_search("_bulk", bulk_body)
                 print(f"bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
+                # the events are created, a failed entity upsert must not send them again with the next flush
+                bulk_docs = bulk_body[1::2]
                 bulk_body = []
+                if hostname_entities_enabled():
+                    try:
+                        entities_embedded, entities_pending = upsert_hostname_entities(bulk_docs, bedrock)
+                        embedded_cnt += entities_embedded
+                        pending_cnt += entities_pending
+                    except Exception as e:
+                        error_cnt += 1
+                        print(f"{error_cnt} | Hostname entities exception: { str(e) }")
 
             processed_len = index + 1
             if (processed_len % INDEX_REPORT_COUNT == 0) or index == len(list) - 1:
@@ -250,13 +305,14 @@ def build_route53_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             print(f"{error_cnt} | Exception: { str(e) }")
 
     count = index_count(security_lake_route53_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) }")
     
 def search_route53_index(bedrock, input_text, size=1):
     
     try:
         bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_route53_data_source))
+        search_vector = query_vector(security_lake_route53_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -309,11 +365,7 @@ def ingest_security_lake_route53_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_route53_index_name, True)
 
-    query = security_lake_route53_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time } AND query.hostname NOT IN ('ec2messages.us-east-1.amazonaws.com.','monitoring.amazonaws.com.')"
-
+    query = f"{ security_lake_route53_query_2_0 }{ where_clause(security_lake_route53_data_source, max_time) }"
     query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
     print (f"Query: { query }")
 
@@ -346,88 +398,33 @@ def ingest_security_lake_route53_data(bedrock, credentials):
 
 def purge_security_lake_route53_data():
   index_purge(security_lake_route53_index_name)
-
+  if hostname_entities_enabled():
+    purge_hostname_entities()
+
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_route53_embedding_fields = [
+    ("query_hostname", "query_hostname"),
+    ("query_type", "query_type"),
+    ("rcode", "rcode"),
+    ("disposition", "disposition"),
+    ("action", "action"),
+    ("answers", "answers"),
+    ("firewall_rule", "firewall_rule"),
+    ("src_endpoint_ip", "src_endpoint.ip"),
+    ("src_endpoint_instance_uid", "src_endpoint.instance_uid"),
+    ("src_endpoint_vpc_uid", "src_endpoint.vpc_uid"),
+    ("query_class", "query.class"),
+    ("protocol_name", "connection_info.protocol_name"),
+    ("direction", "connection_info.direction"),
+    ("severity", "severity"),
+    ("activity_name", "activity_name"),
+    ("accountid", "accountid"),
+    ("region", "region"),
+    ("time_dt", "time_dt"),
+    ("class_name", "class_name"),
+    ("category_name", "category_name"),
+    ("type_name", "type_name"),
+]
 
 def create_embedding_str(data):
-   
-    event_data = f"""
-        class_name: {data.get("class_name", "N/A")}
-        category_name: {data.get("category_name", "N/A")}
-        severity: {data.get("severity", "N/A")}
-        type_name: {data.get("type_name", "N/A")}
-        time: {data.get("time", "N/A")}
-        query_hostname: {data.get("query_hostname", "N/A")}
-        query_type: {data.get("query_type", "N/A")}
-        class_uid: {data.get("class_uid", "N/A")}
-        category_uid: {data.get("category_uid", "N/A")}
-        severity_id: {data.get("severity_id", "N/A")}
-        activity_name: {data.get("activity_name", "N/A")}
-        activity_id: {data.get("activity_id", "N/A")}
-        type_uid: {data.get("type_uid", "N/A")}
-        rcode: {data.get("rcode", "N/A")}
-        rcode_id: {data.get("rcode_id", "N/A")}
-        disposition: {data.get("disposition", "N/A")}
-        action: {data.get("action", "N/A")}
-        action_id: {data.get("action_id", "N/A")}
-        accountid: {data.get("accountid", "N/A")}
-        region: {data.get("region", "N/A")}
-        time_dt: {data.get("time_dt", "N/A")}
-        asl_version: {data.get("asl_version", "N/A")}
-        cloud_account_uid: {data["cloud"].get("account", {}).get("uid", "N/A")}
-        cloud_region: {data["cloud"].get("region", "N/A")}
-        cloud_provider: {data["cloud"].get("provider", "N/A")}
-        src_endpoint_vpc_uid: {data["src_endpoint"].get("vpc_uid", "N/A")}
-        src_endpoint_ip: {data["src_endpoint"].get("ip", "N/A")}
-        src_endpoint_port: {data["src_endpoint"].get("port", "N/A")}
-        src_endpoint_instance_uid: {data["src_endpoint"].get("instance_uid", "N/A")}
-        query_hostname: {data["query"].get("hostname", "N/A")}
-        query_type: {data["query"].get("type", "N/A")}
-        query_class: {data["query"].get("class", "N/A")}
-        protocol_name: {data["connection_info"].get("protocol_name", "N/A")}
-        direction: {data["connection_info"].get("direction", "N/A")}
-        direction_id: {data["connection_info"].get("direction_id", "N/A")}
-        """
-
-        # event_data = json.dumps(doc["class_name"] + ' ' + \
-        #                         doc["category_name"] + ' ' + \
-        #                         doc["severity"] + ' ' + \
-        #                         doc["type_name"] + ' ' + \
-        #                         doc["timestr"] + ' ' + \
-        #                         doc["query_hostname"] + ' ' + \
-        #                         doc["query_type"])
-
-    return event_data
-
-        # answer_type_1: {data["answers"][0].get("type", "N/A")}
-        # answer_rdata_1: {data["answers"][0].get("rdata", "N/A")}
-        # answer_class_1: {data["answers"][0].get("class", "N/A")}
-        # answer_type_2: {data["answers"][1].get("type", "N/A")}
-        # answer_rdata_2: {data["answers"][1].get("rdata", "N/A")}
-        # answer_class_2: {data["answers"][1].get("class", "N/A")}
-        # answer_type_3: {data["answers"][2].get("type", "N/A")}
-        # answer_rdata_3: {data["answers"][2].get("rdata", "N/A")}
-        # answer_class_3: {data["answers"][2].get("class", "N/A")}
-        # observable_name_1: {data["observables"][0].get("name", "N/A")}
-        # observable_value_1: {data["observables"][0].get("value", "N/A")}
-        # observable_type_1: {data["observables"][0].get("type", "N/A")}
-        # observable_type_id_1: {data["observables"][0].get("type_id", "N/A")}
-        # observable_name_2: {data["observables"][1].get("name", "N/A")}
-        # observable_value_2: {data["observables"][1].get("value", "N/A")}
-        # observable_type_2: {data["observables"][1].get("type", "N/A")}
-        # observable_type_id_2: {data["observables"][1].get("type_id", "N/A")}
-        # observable_name_3: {data["observables"][2].get("name", "N/A")}
-        # observable_value_3: {data["observables"][2].get("value", "N/A")}
-        # observable_type_3: {data["observables"][2].get("type", "N/A")}
-        # observable_type_id_3: {data["observables"][2].get("type_id", "N/A")}
-        # observable_name_4: {data["observables"][3].get("name", "N/A")}
-        # observable_value_4: {data["observables"][3].get("value", "N/A")}
-        # observable_type_4: {data["observables"][3].get("type", "N/A")}
-        # observable_type_id_4: {data["observables"][3].get("type_id", "N/A")}
-        # observable_name_5: {data["observables"][4].get("name", "N/A")}
-        # observable_value_5: {data["observables"][4].get("value", "N/A")}
-        # observable_type_5: {data["observables"][4].get("type", "N/A")}
-        # observable_type_id_5: {data["observables"][4].get("type_id", "N/A")}
-        # observable_name_6: {data["observables"][5].get("name", "N/A")}
-        # observable_value_6: {data["observables"][5].get("value", "N/A")}
-        # observable_type_6: {data["observables"][5].get("type", "N/A")}
-        # observable_type_id_6: {data["observables"][5].get("type_id", "N/A")}
+    return build_embedding_text(data, security_lake_route53_embedding_fields)
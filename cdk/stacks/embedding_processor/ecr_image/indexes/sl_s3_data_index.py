@@ -1,9 +1,19 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
                                      index_search, index_purge, bulk_open_search
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector
+from indexes.deferred_embedding import embedding_state_mappings, embed_document
+from indexes.mapping_profiles import mapping_profile
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
 from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_S3DATA, SL_DATASOURCE_MAP
@@ -47,22 +57,18 @@ security_lake_s3_data_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_S3DATA }"
 
-security_lake_s3_data_index_name = SL_DATASOURCE_MAP["s3_data_events"]
-security_lake_s3_data_index_knn = {
+security_lake_s3_data_data_source = "s3_data_events"
+security_lake_s3_data_index_name = SL_DATASOURCE_MAP[security_lake_s3_data_data_source]
+security_lake_s3_data_index_knn = mapping_profile(security_lake_s3_data_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_s3_data_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -172,7 +178,7 @@ security_lake_s3_data_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_s3_data_index():
     delete_index(security_lake_s3_data_index_name)
@@ -192,7 +198,17 @@ def build_s3_data_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"S3 Data Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_s3_data_data_source, list)
+    update_entity_profiles(security_lake_s3_data_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_s3_data_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_s3_data_data_source, list)
+
     error_cnt = 0
+    pending_cnt = 0
+    embedded_cnt = 0
     bulk_body = []
 
     for index, row in enumerate(list):
@@ -242,6 +258,9 @@ def build_s3_data_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             doc["region"] = row["region"]
             doc["asl_version"] = row["asl_version"]
 
+            map_anomaly_columns(row, doc)
+            map_ioc_columns(row, doc)
+
             map_dict_column(row, doc, "cloud")
             map_dict_column(row, doc, "api")
             api_data = doc["api"]["request"]["data"]
@@ -258,10 +277,12 @@ def build_s3_data_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             map_dict_column(row, doc, "observables")
             map_dict_column(row, doc, "unmapped")
 
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
+            if should_embed(security_lake_s3_data_data_source, doc):
+                # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                if embed_document(security_lake_s3_data_data_source, doc, security_lake_s3_data_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                    embedded_cnt += 1
+                else:
+                    pending_cnt += 1
 
             bulk_body.append({ "create": { "_index": security_lake_s3_data_index_name } })
             bulk_body.append(doc)
@@ -283,13 +304,14 @@ def build_s3_data_index(bedrock, s3_bucket = None, s3_key = None, delete_idx = F
             print(f"{error_cnt} | Exception: { str(e) }")
 
     count = index_count(security_lake_s3_data_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) }")
     
 def search_s3_data_index(bedrock, input_text, size=1):
     
     try:
         bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_s3_data_data_source))
+        search_vector = query_vector(security_lake_s3_data_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -347,12 +369,7 @@ def ingest_security_lake_s3_data_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_s3_data_index_name, True)
 
-    query = security_lake_s3_data_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time } and \
-        http_request.user_agent != 'athena.amazonaws.com'"
-
+    query = f"{ security_lake_s3_data_query_2_0 }{ where_clause(security_lake_s3_data_data_source, max_time) }"
     query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
     print (f"Query: { query }")
 
@@ -386,50 +403,32 @@ def ingest_security_lake_s3_data_data(bedrock, credentials):
 def purge_security_lake_s3_data_data():
   index_purge(security_lake_s3_data_index_name)
 
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_s3_data_embedding_fields = [
+    ("API Operation", "api_operation"),
+    ("Status", "status"),
+    ("Response Error", "response_error"),
+    ("Bucket Name", "api.request.data.bucketName"),
+    ("Object Key", "api.request.data.key"),
+    ("Resource UID", "resources_uid"),
+    ("Resource Type", "resource_type"),
+    ("Actor User Type", "actor.user.type"),
+    ("Actor User UID", "actor.user.uid"),
+    ("Actor Invoked By", "actor.invoked_by"),
+    ("Source Endpoint IP", "src_endpoint.ip"),
+    ("Source Endpoint Domain", "src_endpoint.domain"),
+    ("HTTP User Agent", "http_user_agent"),
+    ("Bucket Owner Account UID", "resources.1.owner.account.uid"),
+    ("API Service Name", "api_service_name"),
+    ("Severity", "severity"),
+    ("Type Name", "type_name"),
+    ("Account ID", "accountid"),
+    ("Region", "region"),
+    ("Time DateTime", "time_dt"),
+    ("Class Name", "class_name"),
+    ("Category Name", "category_name"),
+    ("Cloud Provider", "cloud.provider"),
+]
+
 def create_embedding_str(json_data):
-   
-    event_data = f"""Class Name: {json_data.get('class_name', 'N/A')},
-        Category Name: {json_data.get('category_name', 'N/A')},
-        Severity: {json_data.get('severity', 'N/A')},
-        Type Name: {json_data.get('type_name', 'N/A')},
-        Time: {json_data.get('time', 'N/A')},
-        Status: {json_data.get('status', 'N/A')},
-        API Service Name: {json_data.get('api_service_name', 'N/A')},
-        API Operation: {json_data.get('api_operation', 'N/A')},
-        Response Error: {json_data.get('response_error', 'N/A')},
-        Resource UID: {json_data.get('resources_uid', 'N/A')},
-        Resource Type: {json_data.get('resource_type', 'N/A')},
-        Time DateTime: {json_data.get('time_dt', 'N/A')},
-        Account ID: {json_data.get('accountid', 'N/A')},
-        Region: {json_data.get('region', 'N/A')},
-        Cloud Provider: {json_data['cloud'].get('provider', 'N/A') if 'cloud' in json_data else 'N/A'},
-        API Operation: {json_data['api'].get('operation', 'N/A') if 'api' in json_data else 'N/A'},
-        API Service Name: {json_data['api']['service'].get('name', 'N/A') if 'api' in json_data and 'service' in json_data['api'] else 'N/A'},
-        Bucket Name: {json_data['api']['request']['data'].get('bucketName', 'N/A') if 'api' in json_data and 'request' in json_data['api'] and 'data' in json_data['api']['request'] else 'N/A'},
-        Object Key: {json_data['api']['request']['data'].get('key', 'N/A') if 'api' in json_data and 'request' in json_data['api'] and 'data' in json_data['api']['request'] else 'N/A'},
-        Actor User Type: {json_data['actor']['user'].get('type', 'N/A') if 'actor' in json_data and 'user' in json_data['actor'] else 'N/A'},
-        Actor Invoked By: {json_data['actor'].get('invoked_by', 'N/A') if 'actor' in json_data else 'N/A'},
-        Source Endpoint Domain: {json_data['src_endpoint'].get('domain', 'N/A') if 'src_endpoint' in json_data else 'N/A'},
-        Resource UID: {json_data['resources'][0].get('uid', 'N/A') if 'resources' in json_data and len(json_data['resources']) > 0 else 'N/A'},
-        Resource Type: {json_data['resources'][0].get('type', 'N/A') if 'resources' in json_data and len(json_data['resources']) > 0 else 'N/A'},
-        Bucket Owner Account UID: {json_data['resources'][1]['owner']['account'].get('uid', 'N/A') if 'resources' in json_data and len(json_data['resources']) > 1 and 'owner' in json_data['resources'][1] and 'account' in json_data['resources'][1]['owner'] else 'N/A'},
-        Bucket Resource UID: {json_data['resources'][1].get('uid', 'N/A') if 'resources' in json_data and len(json_data['resources']) > 1 else 'N/A'},
-        Bucket Resource Type: {json_data['resources'][1].get('type', 'N/A') if 'resources' in json_data and len(json_data['resources']) > 1 else 'N/A'}"""
-
-        # event_data = json.dumps(doc["class_name"] + ' ' + \
-        #                         doc["category_name"] + ' ' + \
-        #                         doc["severity"] + ' ' + \
-        #                         doc["type_name"] + ' ' + \
-        #                         doc["timestr"] + ' ' + \
-        #                         doc["status"] + ' ' + \
-        #                         doc["api_service_name"] + ' ' + \
-        #                         doc["api_operation"] + ' ' + \
-        #                         doc["response_error"] + ' ' + \
-        #                         doc["http_user_agent"] + ' ' + \
-        #                         doc["resources_uid"])
-
-    return event_data
-
-    # API Response Error: {json_data['api']['response'].get('error', 'N/A') if 'api' in json_data and 'response' in json_data['api'] else 'N/A'},
-    # Actor User UID Alt: {json_data['actor']['user'].get('uid_alt', 'N/A') if 'actor' in json_data and 'user' in json_data['actor'] else 'N/A'},
-    # Actor User Account UID: {json_data['actor']['user']['account'].get('uid', 'N/A') if 'actor' in json_data and 'user' in json_data['actor'] and 'account' in json_data['actor']['user'] else 'N/A'},
+    return build_embedding_text(json_data, security_lake_s3_data_embedding_fields)
@@ -1,12 +1,25 @@
 import json
 from datetime import datetime
-from container.bedrock_utils import get_embedding
+from container.bedrock_utils import get_embeddings_by_type
 from indexes.opensearch_utils import create_index, delete_index, \
                                      get_index_max_time, index_exists, index_count, \
                                      index_search, index_purge, bulk_open_search
+from indexes.embedding_policy import should_embed
+from indexes.embedding_text import build_embedding_text
+from indexes.vector_storage import vector_mappings, embedding_types, query_vector, uses_features
+from indexes.deferred_embedding import embedding_state_mappings, embed_document, embed_features
+from indexes.flow_features import flow_query_vector
+from indexes.mapping_profiles import mapping_profile
+from indexes.event_aggregation import aggregate_rows, map_aggregate_columns
+from indexes.sampling import stratified_sample, sampling_scan_limit, map_sample_columns
+from indexes.source_filters import where_clause
+from indexes.rollups import update_rollups
+from indexes.entity_profiles import update_entity_profiles
+from indexes.sketches import score_anomalies, map_anomaly_columns, anomaly_mappings
+from indexes.threat_intel import match_iocs, map_ioc_columns, ioc_mappings
 from indexes.athena_index_utils import athena_to_s3, cleanup_file, map_dict_column
 from indexes.s3_reader import s3_read_dictionary
-from env import AWS_REGION, INDEX_RECORD_LIMIT, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_VPCFLOW, SL_DATASOURCE_MAP
+from env import AWS_REGION, INDEX_REPORT_COUNT, AOSS_BULK_CREATE_SIZE, ATHENA_QUERY_TIMEOUT, SL_VPCFLOW, SL_DATASOURCE_MAP
 
 security_lake_vpc_flow_query_2_0 = f"select \
  class_name, \
@@ -47,22 +60,18 @@ security_lake_vpc_flow_query_2_0 = f"select \
  cast (unmapped as json) as unmapped \
 from { SL_VPCFLOW }"
 
-security_lake_vpc_flow_index_name = SL_DATASOURCE_MAP["vpc_flow_logs"]
-security_lake_vpc_flow_index_knn = {
+security_lake_vpc_flow_data_source = "vpc_flow_logs"
+security_lake_vpc_flow_index_name = SL_DATASOURCE_MAP[security_lake_vpc_flow_data_source]
+security_lake_vpc_flow_index_knn = mapping_profile(security_lake_vpc_flow_data_source, {
   "settings": {
     "index.knn": True
   },
   "mappings": {
     "properties": {
-      "embedding_vector": {
-        "type": "knn_vector",
-        "dimension": 512,
-        "method": {
-          "name": "hnsw",
-          "space_type": "cosinesimil",
-          "engine": "nmslib"
-        }
-      },
+      **vector_mappings(security_lake_vpc_flow_data_source),
+      **embedding_state_mappings(),
+      **anomaly_mappings(),
+      **ioc_mappings(),
       "class_name": {
         "type": "keyword"
       },
@@ -79,6 +88,23 @@ security_lake_vpc_flow_index_knn = {
         "type" : "date",
         "format" : "strict_date_optional_time||epoch_millis"
       },
+      "count": {
+        "type": "long"
+      },
+      "sample_weight": {
+        "type": "float"
+      },
+      "estimated_count": {
+        "type": "float"
+      },
+      "first_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
+      "last_seen": {
+        "type" : "date",
+        "format" : "strict_date_optional_time||epoch_millis"
+      },
       "traffic_packets": {
         "type": "text"
       },
@@ -177,7 +203,7 @@ security_lake_vpc_flow_index_knn = {
       }
     }
   }
-}
+})
 
 def delete_vpc_flow_index():
     delete_index(security_lake_vpc_flow_index_name)
@@ -197,8 +223,24 @@ def build_vpc_flow_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
     list = s3_read_dictionary(s3_bucket, s3_key)
     print(f"VPC Flow Athena rows found: { len(list) }")
 
+    # exact counts from every row read, see indexes/rollups.py and indexes/entity_profiles.py
+    update_rollups(security_lake_vpc_flow_data_source, list)
+    update_entity_profiles(security_lake_vpc_flow_data_source, list)
+    # anomaly_score against the sketched baselines, see indexes/sketches.py
+    list = score_anomalies(security_lake_vpc_flow_data_source, list)
+    # ioc_match against the threat intel feeds, see indexes/threat_intel.py
+    list = match_iocs(security_lake_vpc_flow_data_source, list)
+
+    list = aggregate_rows(security_lake_vpc_flow_data_source, list)
+    list = stratified_sample(security_lake_vpc_flow_data_source, list)
+
     error_cnt = 0
+    pending_cnt = 0
+    embedded_cnt = 0
     bulk_body = []
+    # with feature vectors the documents to embed are vectorized together before each bulk request
+    features = uses_features(security_lake_vpc_flow_data_source)
+    feature_docs = []
 
     for index, row in enumerate(list):
         traffic_packets: int
@@ -217,8 +259,8 @@ def build_vpc_flow_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
         severity = row["severity"]
         type_name = row["type_name"]
         time = int(row["time"])
-        traffic_packets = row["traffic_packets"] if not row["traffic_packets"] else 0
-        traffic_bytes = row["traffic_bytes"] if not row["traffic_bytes"] else 0
+        traffic_packets = int(row["traffic_packets"]) if row["traffic_packets"] else 0
+        traffic_bytes = int(row["traffic_bytes"]) if row["traffic_bytes"] else 0
         activity_name = row["activity_name"]
         src_endpoint_ip = row["src_endpoint_ip"]
         src_endpoint_port = row["src_endpoint_port"]
@@ -264,6 +306,11 @@ def build_vpc_flow_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
             doc["region"] = row["region"]
             doc["asl_version"] = row["asl_version"]
 
+            map_aggregate_columns(row, doc)
+            map_sample_columns(row, doc)
+            map_anomaly_columns(row, doc)
+            map_ioc_columns(row, doc)
+
             map_dict_column(row, doc, "cloud")
             map_dict_column(row, doc, "src_endpoint")
             map_dict_column(row, doc, "dst_endpoint")
@@ -272,16 +319,24 @@ def build_vpc_flow_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
             map_dict_column(row, doc, "observables")
             map_dict_column(row, doc, "unmapped")
 
-            input_text = create_embedding_str(doc)
-            bedrockBody = {"inputText": input_text}
-            embedding_vector = get_embedding(bedrockBody, bedrock)
-            doc["embedding_vector"] = embedding_vector
+            if should_embed(security_lake_vpc_flow_data_source, doc) and features:
+                feature_docs.append(doc)
+            elif should_embed(security_lake_vpc_flow_data_source, doc):
+                # documents Bedrock did not embed are indexed as pending, see indexes/deferred_embedding.py
+                if embed_document(security_lake_vpc_flow_data_source, doc, security_lake_vpc_flow_embedding_fields, create_embedding_str(doc), bedrock, get_embeddings_by_type):
+                    embedded_cnt += 1
+                else:
+                    pending_cnt += 1
 
             bulk_body.append({ "create": { "_index": security_lake_vpc_flow_index_name } })
             bulk_body.append(doc)
 
             bulk_len = len(bulk_body)/2
             if (bulk_len % AOSS_BULK_CREATE_SIZE == 0) or (index == len(list) - 1):
+                if feature_docs:
+                    embed_features(security_lake_vpc_flow_data_source, feature_docs, security_lake_vpc_flow_embedding_fields)
+                    embedded_cnt += len(feature_docs)
+                    feature_docs = []
                 bulk_response = bulk_open_search("_bulk", bulk_body)
                 print(f"bulk_response: time={bulk_response.get('took', 'N/A')}ms | items={len(bulk_response.get('items', []))} | errors={bulk_response.get('errors', 'N/A')}")
                 bulk_body = []
@@ -289,21 +344,25 @@ def build_vpc_flow_index(bedrock, s3_bucket = None, s3_key = None, delete_idx =
             processed_len = index + 1
             if (processed_len % INDEX_REPORT_COUNT == 0) or index == len(list) - 1:
                 print(f"processed: { processed_len }")
-            if index >= INDEX_RECORD_LIMIT:
-                break
+            # no INDEX_RECORD_LIMIT break: the rows are bounded by the Athena LIMIT and the sample, a row
+            # dropped here would be behind the watermark of the sampled rows after it
 
         except Exception as e:
             error_cnt += 1
             print(f"{ error_cnt } | Exception: { str(e) }")
 
     count = index_count(security_lake_vpc_flow_index_name)
-    print(f"Index count: { str(count) } | Error count: { str(error_cnt)}")
+    print(f"Index count: { str(count) } | Error count: { str(error_cnt)} | Embedded count: { str(embedded_cnt) } | Pending count: { str(pending_cnt) }")
     
 def search_vpc_flow_index(bedrock, input_text, size=1):
     
     try:
-        bedrockBody = {"inputText": input_text}
-        search_vector = get_embedding(bedrockBody, bedrock)
+        if uses_features(security_lake_vpc_flow_data_source):
+            search_vector = flow_query_vector(input_text)
+        else:
+            bedrockBody = {"inputText": input_text}
+            embeddings = get_embeddings_by_type(bedrockBody, bedrock, embedding_types(security_lake_vpc_flow_data_source))
+            search_vector = query_vector(security_lake_vpc_flow_data_source, embeddings)
     except Exception as e:
         print(e)
     
@@ -388,12 +447,8 @@ def ingest_security_lake_vpc_flow_data(bedrock, credentials):
 
     max_time = get_index_max_time(security_lake_vpc_flow_index_name, True)
 
-    query = security_lake_vpc_flow_query_2_0
-    if max_time is not None:
-      # print (f"query max_time = {max_time} ")
-      query = f"{ query } WHERE time > { max_time } and ( src_endpoint.port in (22,3389) or dst_endpoint.port in (22,3389))"
-
-    query = f"{ query } ORDER BY time asc LIMIT { INDEX_RECORD_LIMIT }"
+    query = f"{ security_lake_vpc_flow_query_2_0 }{ where_clause(security_lake_vpc_flow_data_source, max_time) }"
+    query = f"{ query } ORDER BY time asc LIMIT { sampling_scan_limit(security_lake_vpc_flow_data_source) }"
     print (f"Query: { query }")
 
     from env import SECURITY_LAKE_ATHENA_BUCKET, SECURITY_LAKE_ATHENA_PREFIX, SL_DATABASE_NAME
@@ -427,57 +482,35 @@ def ingest_security_lake_vpc_flow_data(bedrock, credentials):
 def purge_security_lake_vpc_flow_data():
   index_purge(security_lake_vpc_flow_index_name)
 
+# Embedding text fields in priority order, rendered under the EMBEDDING_TEXT_MAX_TOKENS budget
+security_lake_vpc_flow_embedding_fields = [
+    ("Action", "action"),
+    ("Disposition", "disposition"),
+    ("Activity Name", "activity_name"),
+    ("Source IP", "src_endpoint_ip"),
+    ("Source Port", "src_endpoint_port"),
+    ("Destination IP", "dst_endpoint_ip"),
+    ("Destination Port", "dst_endpoint_port"),
+    ("Connection Info", "connection_info"),
+    ("Traffic Bytes", "traffic_bytes"),
+    ("Traffic Packets", "traffic_packets"),
+    ("Source Service", "src_endpoint_svc_name"),
+    ("Destination Service", "dst_endpoint_svc_name"),
+    ("Type Name", "type_name"),
+    ("Severity", "severity"),
+    ("Status Code", "status_code"),
+    ("Account ID", "accountid"),
+    ("Region", "region"),
+    ("Time", "time_dt"),
+    ("Start Time", "start_time_dt"),
+    ("End Time", "end_time_dt"),
+    ("Source Endpoint", "src_endpoint"),
+    ("Destination Endpoint", "dst_endpoint"),
+    ("Class Name", "class_name"),
+    ("Category Name", "category_name"),
+    ("Observables", "observables"),
+    ("Unmapped", "unmapped"),
+]
+
 def create_embedding_str(data):
-   
-    event_data = f"""Class Name: {data['class_name']}
-        Category Name: {data['category_name']}
-        Severity: {data['severity']}
-        Type Name: {data['type_name']}
-        Time: {data['time_dt']}
-        Traffic Packets: {data['traffic_packets']}
-        Traffic Bytes: {data['traffic_bytes']}
-        Activity Name: {data['activity_name']}
-        Source IP: {data['src_endpoint_ip']}
-        Source Port: {data['src_endpoint_port']}
-        Source Service: {data['src_endpoint_svc_name']}
-        Destination IP: {data['dst_endpoint_ip']}
-        Destination Port: {data['dst_endpoint_port']}
-        Destination Service: {data['dst_endpoint_svc_name']}
-        Disposition: {data['disposition']}
-        Start Time: {data['start_time_dt']}
-        End Time: {data['end_time_dt']}
-        Class UID: {data['class_uid']}
-        Category UID: {data['category_uid']}
-        Severity ID: {data['severity_id']}
-        Type UID: {data['type_uid']}
-        Action: {data['action']}
-        Action ID: {data['action_id']}
-        Status Code: {data['status_code']}
-        Account ID: {data['accountid']}
-        Region: {data['region']}
-        ASL Version: {data['asl_version']}
-        Cloud: {data['cloud']}
-        Source Endpoint: {data['src_endpoint']}
-        Destination Endpoint: {data['dst_endpoint']}
-        Connection Info: {data['connection_info']}
-        Traffic Info: {data['traffic']}
-        Observables: {data['observables']}
-        Unmapped: {data['unmapped']}"""
-
-        # event_data = json.dumps(doc["class_name"] + ' ' + \
-        #                         doc["category_name"] + ' ' + \
-        #                         doc["severity"] + ' ' + \
-        #                         doc["type_name"] + ' ' + \
-        #                         doc["timestr"] + ' ' + \
-        #                         str(doc["traffic_packets"]) + ' ' + \
-        #                         str(doc["traffic_bytes"]) + ' ' + \
-        #                         doc["activity_name"]  + ' ' + \
-        #                         str(doc["src_endpoint_ip"])  + ' ' + \
-        #                         str(doc["src_endpoint_port"])  + ' ' + \
-        #                         str(doc["src_endpoint_svc_name"])  + ' ' + \
-        #                         str(doc["dst_endpoint_ip"])  + ' ' + \
-        #                         str(doc["dst_endpoint_port"])  + ' ' + \
-        #                         str(doc["dst_endpoint_svc_name"])  + ' ' + \
-        #                         str(doc["disposition"]))
-
-    return event_data
\ No newline at end of file
+    return build_embedding_text(data, security_lake_vpc_flow_embedding_fields)
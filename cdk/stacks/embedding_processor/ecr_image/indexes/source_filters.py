@@ -0,0 +1,132 @@
+import re
+from indexes.predicates import validate_predicate
+from env import SOURCE_FILTERS
+
+# Per data source pushdown filters, keyed like SL_DATASOURCE_MAP. Filters use the predicate language
+# from indexes/predicates.py, fields are column paths in the Security Lake table, e.g. "src_endpoint.port".
+# A filter is compiled into the Athena WHERE clause, and into a pyarrow expression for readers
+# that scan the Security Lake Parquet files directly.
+#
+#   SOURCE_FILTERS = {
+#     "vpc_flow_logs": { "any": [
+#       { "field": "src_endpoint.port", "in": [22, 3389] },
+#       { "field": "dst_endpoint.port", "in": [22, 3389] }
+#     ]}
+#   }
+
+COLUMN_PATH = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$')
+SQL_OPERATORS = { 'eq': '=', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=' }
+
+def validate_source_filter(data_source, predicate):
+    validate_predicate(predicate)
+    for field in predicate_fields(predicate):
+      if not COLUMN_PATH.match(field):
+        raise ValueError(f"SOURCE_FILTERS { data_source }: invalid column \"{ field }\"")
+
+def predicate_fields(predicate):
+    if 'any' in predicate or 'all' in predicate:
+      return [field for item in predicate.get('any', predicate.get('all')) for field in predicate_fields(item)]
+    if 'not' in predicate:
+      return predicate_fields(predicate['not'])
+    return [predicate['field']]
+
+def get_source_filter(data_source):
+    return SOURCE_FILTERS.get(data_source)
+
+# WHERE clause for an incremental ingest: the watermark and the source filter
+def where_clause(data_source, max_time):
+    clauses = []
+    if max_time is not None:
+      clauses.append(f"time > { max_time }")
+    predicate = get_source_filter(data_source)
+    if predicate is not None:
+      clauses.append(to_athena_sql(predicate))
+    return f" WHERE { ' AND '.join(clauses) }" if clauses else ""
+
+# Missing values satisfy ne and not_in, the same as evaluate_predicate
+def to_athena_sql(predicate):
+    if 'any' in predicate:
+      return '(' + ' OR '.join(to_athena_sql(item) for item in predicate['any']) + ')'
+    if 'all' in predicate:
+      return '(' + ' AND '.join(to_athena_sql(item) for item in predicate['all']) + ')'
+    if 'not' in predicate:
+      return f"NOT { to_athena_sql(predicate['not']) }"
+
+    field = predicate['field']
+    if 'exists' in predicate:
+      return f"{ field } IS NOT NULL" if predicate['exists'] else f"{ field } IS NULL"
+    if 'ne' in predicate:
+      return f"({ field } IS NULL OR { field } <> { sql_literal(predicate['ne']) })"
+    if 'in' in predicate:
+      return f"{ field } IN ({ ', '.join(sql_literal(value) for value in predicate['in']) })"
+    if 'not_in' in predicate:
+      return f"({ field } IS NULL OR { field } NOT IN ({ ', '.join(sql_literal(value) for value in predicate['not_in']) }))"
+
+    op = next(op for op in SQL_OPERATORS if op in predicate)
+    return f"{ field } { SQL_OPERATORS[op] } { sql_literal(predicate[op]) }"
+
+def sql_literal(value):
+    if isinstance(value, bool):
+      return 'TRUE' if value else 'FALSE'
+    if isinstance(value, (int, float)):
+      return repr(value)
+    if value is None:
+      return 'NULL'
+    return "'" + str(value).replace("'", "''") + "'"
+
+for data_source, predicate in SOURCE_FILTERS.items():
+    validate_source_filter(data_source, predicate)
+    print(f"SOURCE_FILTERS: { data_source }={ to_athena_sql(predicate) }")
+
+# pyarrow is only needed by readers that scan Parquet directly, the Athena path does not import it
+def to_parquet_filter(predicate):
+    import pyarrow.compute as pc
+
+    if 'any' in predicate:
+      expression = to_parquet_filter(predicate['any'][0])
+      for item in predicate['any'][1:]:
+        expression = expression | to_parquet_filter(item)
+      return expression
+    if 'all' in predicate:
+      expression = to_parquet_filter(predicate['all'][0])
+      for item in predicate['all'][1:]:
+        expression = expression & to_parquet_filter(item)
+      return expression
+    if 'not' in predicate:
+      return ~to_parquet_filter(predicate['not'])
+
+    column = pc.field(*predicate['field'].split('.'))
+    if 'exists' in predicate:
+      return column.is_valid() if predicate['exists'] else column.is_null()
+    if 'eq' in predicate:
+      return column == predicate['eq']
+    if 'ne' in predicate:
+      return column.is_null() | (column != predicate['ne'])
+    if 'in' in predicate:
+      return column.isin(predicate['in'])
+    if 'not_in' in predicate:
+      return column.is_null() | ~column.isin(predicate['not_in'])
+    if 'gt' in predicate:
+      return column > predicate['gt']
+    if 'gte' in predicate:
+      return column >= predicate['gte']
+    if 'lt' in predicate:
+      return column < predicate['lt']
+    return column <= predicate['lte']
+
+# pyarrow counterpart of where_clause
+def parquet_filter(data_source, max_time):
+    import pyarrow.compute as pc
+
+    expressions = []
+    if max_time is not None:
+      expressions.append(pc.field('time') > int(max_time))
+    predicate = get_source_filter(data_source)
+    if predicate is not None:
+      expressions.append(to_parquet_filter(predicate))
+    if not expressions:
+      return None
+    expression = expressions[0]
+    for item in expressions[1:]:
+      expression = expression & item
+    return expression
@@ -0,0 +1,263 @@
+import gzip
+import hashlib
+import ipaddress
+import json
+import math
+import re
+import boto3
+from container.metrics import put_metric
+from env import IOC_FEEDS, IOC_COLUMNS, IOC_BLOOM_ERROR_RATE, SL_DATASOURCE_MAP
+
+# Threat intel matching at ingest: rows whose addresses, hostnames or hashes are known indicators get
+# ioc_match (true), ioc_indicators (the indicators matched) and ioc_fields (the columns that matched),
+# so "any traffic to known-bad IPs" is a term filter on ioc_match.
+#
+#   IOC_FEEDS = ["s3://<bucket>/threat-intel/ips.txt", "/data/domains.txt.gz"]
+#   IOC_COLUMNS = {
+#     "vpc_flow_logs": ["src_endpoint_ip", "dst_endpoint_ip"],
+#     "route53_logs": ["query_hostname", "src_endpoint.ip", "answers.rdata"]
+#   }
+#
+# Feeds are text files, gzip when the name ends with .gz, with one indicator per line: the first
+# comma or whitespace separated field, lines starting with # are comments. An indicator is an IP
+# address, a CIDR network, an MD5, SHA-1 or SHA-256 hash or a domain, defanged dots ([.]) allowed.
+# Columns are the Athena columns of the sl_* queries or a path in one of their JSON columns, lists
+# included (answers.rdata is the rdata of every answer).
+#
+# The feeds are loaded once per run and kept in memory for millions of indicators:
+#
+#   addresses, hashes, domains   one Bloom filter, ~29 bits per indicator at the default error rate
+#   CIDR networks                one hash set of network prefixes per prefix length, a longest prefix
+#                                match probes at most 33 (IPv4) or 129 (IPv6) sets, in practice the
+#                                few prefix lengths the feeds use
+#
+# A domain indicator matches its subdomains: every suffix of a hostname is probed in the Bloom filter,
+# one probe per label. The Bloom filter has false positives at IOC_BLOOM_ERROR_RATE and no false
+# negatives. Values are matched once per batch. Sampling keeps every matching row, aggregated
+# groups keep the indicators of all their rows.
+
+HASH_PATTERN = re.compile(r'^(?:[0-9a-f]{32}|[0-9a-f]{40}|[0-9a-f]{64})$')
+DOMAIN_PATTERN = re.compile(r'^(?:[a-z0-9_](?:[a-z0-9_-]{0,61}[a-z0-9])?\.)+[a-z0-9-]{2,63}$')
+
+for data_source, columns in IOC_COLUMNS.items():
+    if data_source not in SL_DATASOURCE_MAP or not isinstance(columns, list):
+      raise ValueError(f"IOC_COLUMNS { data_source }: unknown data source or columns is not a list")
+    print(f"IOC_COLUMNS: { data_source }={ columns }")
+
+# indicators of the feeds, loaded by the first batch matched
+loaded_indicators = None
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    # Positions of a key, double hashing of one 128 bit hash, generated so a miss stops at its first unset bit
+    def positions(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        low, high = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((low + number * high) % self.size for number in range(self.hashes))
+
+    def add(self, key):
+        for position in self.positions(key):
+          self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+class CidrTable:
+    def __init__(self):
+        # network prefixes by IP version and prefix length
+        self.networks = { 4: {}, 6: {} }
+        self.lengths = { 4: [], 6: [] }
+
+    def add(self, network):
+        shift = network.max_prefixlen - network.prefixlen
+        if network.prefixlen not in self.networks[network.version]:
+          self.networks[network.version][network.prefixlen] = set()
+          self.lengths[network.version] = sorted(self.networks[network.version], reverse=True)
+        self.networks[network.version][network.prefixlen].add(int(network.network_address) >> shift)
+
+    def __len__(self):
+        return sum(len(prefixes) for networks in self.networks.values() for prefixes in networks.values())
+
+    # Longest network containing the address, None when none does
+    def match(self, address):
+        value = int(address)
+        for prefixlen in self.lengths[address.version]:
+          shift = address.max_prefixlen - prefixlen
+          if value >> shift in self.networks[address.version][prefixlen]:
+            return f"{ ipaddress.ip_address(value >> shift << shift) }/{ prefixlen }"
+        return None
+
+class Indicators:
+    def __init__(self, exact, networks):
+        self.exact = exact
+        self.networks = networks
+
+    # The indicator a column value matches, None when it matches none
+    def match(self, value):
+        value = value.strip().lower()
+        try:
+          address = ipaddress.ip_address(value)
+        except ValueError:
+          address = None
+        if address is not None:
+          if f"ip:{ address }" in self.exact:
+            return str(address)
+          return self.networks.match(address)
+        if HASH_PATTERN.match(value):
+          return value if f"hash:{ value }" in self.exact else None
+        labels = value.rstrip('.').split('.')
+        for start in range(len(labels) - 1):
+          suffix = '.'.join(labels[start:])
+          if f"domain:{ suffix }" in self.exact:
+            return suffix
+        return None
+
+def ioc_matching_enabled(data_source):
+    return bool(IOC_FEEDS) and data_source in IOC_COLUMNS
+
+# (type, indicator) of a feed entry, None for entries that are not an indicator
+def parse_indicator(value):
+    value = value.strip().lower().replace('[.]', '.')
+    try:
+      network = ipaddress.ip_network(value, strict=False)
+      if network.prefixlen == network.max_prefixlen:
+        return 'ip', str(network.network_address)
+      return 'cidr', network
+    except ValueError:
+      pass
+    if HASH_PATTERN.match(value):
+      return 'hash', value
+    value = value.rstrip('.')
+    if value.startswith('*.'):
+      value = value[2:]
+    if DOMAIN_PATTERN.match(value):
+      return 'domain', value
+    return None
+
+def feed_lines(location):
+    if location.startswith('s3://'):
+      bucket, key = location[len('s3://'):].split('/', 1)
+      stream = boto3.client('s3').get_object(Bucket=bucket, Key=key)['Body']
+    else:
+      stream = open(location, 'rb')
+    try:
+      lines = gzip.GzipFile(fileobj=stream) if location.endswith('.gz') else stream
+      # the S3 body streams its lines with iter_lines, files and gzip iterate theirs
+      for line in (lines.iter_lines() if hasattr(lines, 'iter_lines') else lines):
+        yield line.decode('utf-8', errors='replace')
+    finally:
+      stream.close()
+
+def threat_indicators():
+    global loaded_indicators
+    if loaded_indicators is not None:
+      return loaded_indicators
+
+    exact = []
+    networks = CidrTable()
+    skipped = 0
+    for location in IOC_FEEDS:
+      for line in feed_lines(location):
+        line = line.strip()
+        if not line or line.startswith('#'):
+          continue
+        indicator = parse_indicator(re.split(r'[,\s]', line, 1)[0])
+        if indicator is None:
+          skipped += 1
+        elif indicator[0] == 'cidr':
+          networks.add(indicator[1])
+        else:
+          exact.append(f"{ indicator[0] }:{ indicator[1] }")
+
+    bloom = BloomFilter(len(exact), IOC_BLOOM_ERROR_RATE)
+    for key in exact:
+      bloom.add(key)
+    loaded_indicators = Indicators(bloom, networks)
+    print(f"Threat intel: feeds={ len(IOC_FEEDS) } | indicators={ len(exact) } | networks={ len(networks) } | skipped={ skipped } | bloom={ len(bloom.bits) } bytes, { bloom.hashes } hashes")
+    return loaded_indicators
+
+# Values of a column, a path in a JSON column goes through lists
+def column_values(row, column):
+    if column in row or '.' not in column:
+      values = [row.get(column)]
+    else:
+      json_column, path = column.split('.', 1)
+      values = [json_value(row.get(json_column))]
+      for part in path.split('.'):
+        values = [item.get(part) for value in values for item in (value if isinstance(value, list) else [value]) if isinstance(item, dict)]
+    values = [item for value in values for item in (value if isinstance(value, list) else [value])]
+    return [str(value) for value in values if value not in [None, '', '-'] and not isinstance(value, dict)]
+
+def json_value(value):
+    if isinstance(value, (dict, list)) or value is None:
+      return value
+    try:
+      return json.loads(value)
+    except (TypeError, ValueError):
+      return None
+
+# Sets ioc_match, ioc_indicators and ioc_fields on the rows matching an indicator, returns the rows
+def match_iocs(data_source, rows):
+    try:
+      return match_rows(data_source, rows)
+    except Exception as e:
+      # a feed that cannot be read must not stop the event ingest, the rows are indexed without ioc_match
+      put_metric('IocErrors', 1)
+      print(f"Threat intel { data_source } failed: { e }")
+      return rows
+
+def match_rows(data_source, rows):
+    if not ioc_matching_enabled(data_source) or not rows:
+      return rows
+
+    indicators = threat_indicators()
+    columns = IOC_COLUMNS[data_source]
+    # indicator of each value of the batch, addresses and hostnames repeat
+    matches = {}
+    matched = 0
+    for row in rows:
+      row_indicators = []
+      row_fields = []
+      for column in columns:
+        for value in column_values(row, column):
+          if value not in matches:
+            matches[value] = indicators.match(value)
+          if matches[value] is None:
+            continue
+          if matches[value] not in row_indicators:
+            row_indicators.append(matches[value])
+          if column.replace('.', '_') not in row_fields:
+            row_fields.append(column.replace('.', '_'))
+      if row_indicators:
+        row["ioc_match"] = True
+        row["ioc_indicators"] = row_indicators
+        row["ioc_fields"] = row_fields
+        matched += 1
+
+    put_metric('IocMatches', matched)
+    print(f"Threat intel { data_source }: rows={ len(rows) } | values={ len(matches) } | matched={ matched }")
+    return rows
+
+def map_ioc_columns(row, doc):
+    if row.get("ioc_match"):
+      doc["ioc_match"] = True
+      doc["ioc_indicators"] = row["ioc_indicators"]
+      doc["ioc_fields"] = row["ioc_fields"]
+
+def ioc_mappings():
+    return {
+      "ioc_match": {
+        "type": "boolean"
+      },
+      "ioc_indicators": {
+        "type": "keyword"
+      },
+      "ioc_fields": {
+        "type": "keyword"
+      }
+    }
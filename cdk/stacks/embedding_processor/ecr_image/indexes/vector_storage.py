@@ -0,0 +1,171 @@
+import base64
+import struct
+from indexes.flow_features import FLOW_FEATURE_DIMENSIONS
+from env import VECTOR_STORAGE, BEDROCK_EMBEDDINGS_DIMENSIONS
+
+# Per data source vector storage, keyed like SL_DATASOURCE_MAP:
+#   { "type": "float" }                   nmslib hnsw, float32 vectors (default)
+#   { "type": "fp16" }                    faiss hnsw with fp16 scalar quantization, ~1/2 the vector memory
+#   { "type": "byte", "range": 0.25 }     faiss hnsw on int8 vectors, ~1/4 the vector memory
+#   { "type": "binary", "oversample": 5 } faiss hnsw on packed Titan binary vectors, ~1/32 the vector memory
+#   { "type": "features" }                nmslib hnsw on structural feature vectors computed without Bedrock,
+#                                         vpc_flow_logs only, see indexes/flow_features.py
+#
+# Titan returns normalized vectors, so the faiss variants use innerproduct which ranks like cosinesimil.
+# Byte vectors are quantized here, components are clipped to [-range, range] and scaled to [-127, 127].
+# Binary indices search in hamming space, the agent fetches oversample times more candidates and rescores
+# them with the fp16 copy of the float vector kept in embedding_rescore, a binary field that is not indexed.
+# Changing the storage of an existing index requires deleting and rebuilding the index.
+
+VECTOR_FLOAT = 'float'
+VECTOR_FP16 = 'fp16'
+VECTOR_BYTE = 'byte'
+VECTOR_BINARY = 'binary'
+VECTOR_FEATURES = 'features'
+
+VECTOR_FIELD = 'embedding_vector'
+RESCORE_VECTOR_FIELD = 'embedding_rescore'
+
+DEFAULT_VECTOR_STORAGE = { "type": VECTOR_FLOAT }
+DEFAULT_BYTE_RANGE = 0.25
+DEFAULT_BINARY_OVERSAMPLE = 5
+# data sources with a feature vectorizer
+FEATURE_SOURCES = ['vpc_flow_logs']
+
+def validate_vector_storage(data_source, storage):
+    storage_type = storage.get('type')
+    if storage_type not in [VECTOR_FLOAT, VECTOR_FP16, VECTOR_BYTE, VECTOR_BINARY, VECTOR_FEATURES]:
+      raise ValueError(f"VECTOR_STORAGE { data_source }: invalid type \"{ storage_type }\"")
+    if storage_type == VECTOR_FEATURES and data_source not in FEATURE_SOURCES:
+      raise ValueError(f"VECTOR_STORAGE { data_source }: features are only available for { FEATURE_SOURCES }")
+    if storage_type == VECTOR_BYTE and float(storage.get('range', DEFAULT_BYTE_RANGE)) <= 0:
+      raise ValueError(f"VECTOR_STORAGE { data_source }: range must be positive")
+    if storage_type == VECTOR_BINARY and int(storage.get('oversample', DEFAULT_BINARY_OVERSAMPLE)) < 1:
+      raise ValueError(f"VECTOR_STORAGE { data_source }: oversample must be at least 1")
+
+for data_source, storage in VECTOR_STORAGE.items():
+    validate_vector_storage(data_source, storage)
+    print(f"VECTOR_STORAGE: { data_source }={ storage }")
+
+def get_vector_storage(data_source):
+    return VECTOR_STORAGE.get(data_source) or DEFAULT_VECTOR_STORAGE
+
+def uses_features(data_source):
+    return get_vector_storage(data_source)['type'] == VECTOR_FEATURES
+
+# Mapping properties of the vector fields, merged into the index mapping
+def vector_mappings(data_source):
+    mappings = { VECTOR_FIELD: knn_vector_mapping(data_source) }
+    if get_vector_storage(data_source)['type'] == VECTOR_BINARY:
+      mappings[RESCORE_VECTOR_FIELD] = { "type": "binary" }
+    return mappings
+
+def knn_vector_mapping(data_source):
+    storage = get_vector_storage(data_source)
+
+    if storage['type'] == VECTOR_BINARY:
+      return {
+        "type": "knn_vector",
+        "dimension": BEDROCK_EMBEDDINGS_DIMENSIONS,
+        "data_type": "binary",
+        "method": {
+          "name": "hnsw",
+          "space_type": "hamming",
+          "engine": "faiss"
+        }
+      }
+
+    if storage['type'] == VECTOR_FEATURES:
+      return {
+        "type": "knn_vector",
+        "dimension": FLOW_FEATURE_DIMENSIONS,
+        "method": {
+          "name": "hnsw",
+          "space_type": "cosinesimil",
+          "engine": "nmslib"
+        }
+      }
+
+    if storage['type'] == VECTOR_FP16:
+      return {
+        "type": "knn_vector",
+        "dimension": BEDROCK_EMBEDDINGS_DIMENSIONS,
+        "method": {
+          "name": "hnsw",
+          "space_type": "innerproduct",
+          "engine": "faiss",
+          "parameters": {
+            "encoder": {
+              "name": "sq",
+              "parameters": { "type": "fp16" }
+            }
+          }
+        }
+      }
+
+    if storage['type'] == VECTOR_BYTE:
+      return {
+        "type": "knn_vector",
+        "dimension": BEDROCK_EMBEDDINGS_DIMENSIONS,
+        "data_type": "byte",
+        "method": {
+          "name": "hnsw",
+          "space_type": "innerproduct",
+          "engine": "faiss"
+        }
+      }
+
+    return {
+      "type": "knn_vector",
+      "dimension": BEDROCK_EMBEDDINGS_DIMENSIONS,
+      "method": {
+        "name": "hnsw",
+        "space_type": "cosinesimil",
+        "engine": "nmslib"
+      }
+    }
+
+def embedding_types(data_source):
+    if get_vector_storage(data_source)['type'] == VECTOR_BINARY:
+      return ["float", "binary"]
+    return ["float"]
+
+# Document fields for the embeddings returned by get_embeddings_by_type, or { "features": vector }
+def vector_fields(data_source, embeddings):
+    if uses_features(data_source):
+      return { VECTOR_FIELD: embeddings["features"] }
+    if get_vector_storage(data_source)['type'] == VECTOR_BINARY:
+      return {
+        VECTOR_FIELD: pack_binary(embeddings["binary"]),
+        RESCORE_VECTOR_FIELD: encode_fp16(embeddings["float"])
+      }
+    return { VECTOR_FIELD: encode_vector(data_source, embeddings["float"]) }
+
+# Documents and queries must be encoded the same way, see encode_query_vector in the agent Lambda
+def query_vector(data_source, embeddings):
+    if get_vector_storage(data_source)['type'] == VECTOR_BINARY:
+      return pack_binary(embeddings["binary"])
+    return encode_vector(data_source, embeddings["float"])
+
+def encode_vector(data_source, vector):
+    storage = get_vector_storage(data_source)
+    if storage['type'] == VECTOR_BYTE:
+      return quantize_byte(vector, float(storage.get('range', DEFAULT_BYTE_RANGE)))
+    return vector
+
+def quantize_byte(vector, value_range = DEFAULT_BYTE_RANGE):
+    scale = 127 / value_range
+    return [max(-128, min(127, round(value * scale))) for value in vector]
+
+# Titan returns one 0/1 value per dimension, binary knn_vector fields take 8 bits per signed byte
+def pack_binary(bits):
+    packed = []
+    for start in range(0, len(bits), 8):
+      value = 0
+      for bit in bits[start:start + 8]:
+        value = (value << 1) | (1 if bit else 0)
+      packed.append(value - 256 if value > 127 else value)
+    return packed
+
+def encode_fp16(vector):
+    return base64.b64encode(struct.pack(f"<{ len(vector) }e", *vector)).decode('ascii')
@@ -3,7 +3,7 @@ from container.indices_ingest import ingest_indices
 # from container.indices_search_test import test_search_indices
 from container.bedrock_utils import init_bedrock
 from indexes.opensearch_utils import display_open_search_indices
-from env import RUN_INDEX_NAME
+from env import RUN_INDEX_NAME, RUN_MODE
 
 def get_credentials():
     sts = boto3.client("sts")
@@ -27,7 +27,14 @@ def main():
 
   bedrock = init_bedrock()
 
-  ingest_indices(credentials, bedrock)
+  if RUN_MODE == 'embed_pending':
+    from container.embed_pending import embed_pending_indices
+    embed_pending_indices(bedrock)
+  elif RUN_MODE == 'reindex':
+    from container.reindex import reindex_indices
+    reindex_indices()
+  else:
+    ingest_indices(credentials, bedrock)
 
   display_open_search_indices(RUN_INDEX_NAME)
 
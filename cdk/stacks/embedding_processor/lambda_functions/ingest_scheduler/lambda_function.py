@@ -0,0 +1,276 @@
+import boto3
+import json
+import logging
+import math
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+from opensearchpy import OpenSearch, RequestsHttpConnection, AWSV4SignerAuth
+
+
+# Adaptive scheduling of the embedding processor jobs. Invoked every few minutes by one EventBridge
+# schedule, for each data source it reads the committed watermark (max time of the index, never older
+# than midnight, the same as the ingest) and the arrival rate over the window before the watermark,
+# estimates the backlog as rate * lag, and decides to:
+#
+#   skip     a job of the source is still queued or running, the lag is under MIN_LAG_SECONDS,
+#            or the source is idle and its backoff has not elapsed
+#   submit   one job, or a sequential array job of up to MAX_JOBS children when the backlog is larger
+#            than MAX_RECORD_LIMIT, with INDEX_RECORD_LIMIT sized to the backlog
+#
+# Sources with documents indexed without their embedding (embedding_state pending) also get an
+# embed_pending job, unless one is already queued or running. The pending hostname entities
+# (ROUTE53_HOSTNAME_INDEX) count for route53_logs, its embed_pending job drains both indices.
+#
+# Children of an array job run one after the other: every job reads the watermark when it starts, so
+# concurrent jobs of one source would ingest the same rows.
+# A source is idle when its watermark did not move since the last submission, the idle backoff doubles
+# on every idle submission up to IDLE_MAX_INTERVAL_SECONDS, then resets as soon as the watermark moves.
+# The per source state is kept in s3://STATE_BUCKET/STATE_KEY.
+
+LOG_LEVEL = logging.INFO
+log = logging.getLogger()
+log.setLevel(LOG_LEVEL)
+
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+AOSS_ENDPOINT = os.environ['AOSS_ENDPOINT']
+AOSS_TIME_ZONE = os.environ.get('AOSS_TIME_ZONE', 'UTC')
+SL_DATASOURCE_MAP = json.loads(os.environ['SL_DATASOURCE_MAP'])
+JOB_QUEUE = os.environ['JOB_QUEUE']
+JOB_DEFINITION = os.environ['JOB_DEFINITION']
+JOB_NAME = os.environ['JOB_NAME']
+STATE_BUCKET = os.environ['STATE_BUCKET']
+STATE_KEY = os.environ.get('STATE_KEY', 'scheduler/state.json')
+MIN_LAG_SECONDS = int(os.environ.get('MIN_LAG_SECONDS', '600'))
+RATE_WINDOW_SECONDS = int(os.environ.get('RATE_WINDOW_SECONDS', '3600'))
+MIN_RECORD_LIMIT = int(os.environ.get('MIN_RECORD_LIMIT', '1000'))
+MAX_RECORD_LIMIT = int(os.environ.get('MAX_RECORD_LIMIT', '20000'))
+MAX_JOBS = int(os.environ.get('MAX_JOBS', '4'))
+IDLE_INTERVAL_SECONDS = int(os.environ.get('IDLE_INTERVAL_SECONDS', '900'))
+IDLE_MAX_INTERVAL_SECONDS = int(os.environ.get('IDLE_MAX_INTERVAL_SECONDS', '14400'))
+DRY_RUN = os.environ.get('DRY_RUN', '') == 'true'
+# entity index drained by the embed_pending jobs of route53_logs, empty when not deployed
+ROUTE53_HOSTNAME_INDEX = os.environ.get('ROUTE53_HOSTNAME_INDEX', '')
+
+ACTIVE_JOB_STATUS = ['SUBMITTED', 'PENDING', 'RUNNABLE', 'STARTING', 'RUNNING']
+
+# Job name suffix per data source, as for the fixed schedules
+JOB_NAME_SUFFIX = {
+    'cloudtrail_management': 'CloudTrail',
+    'security_hub': 'Findings',
+    's3_data_events': 'S3Data',
+    'lambda_data_events': 'Lambda',
+    'route53_logs': 'Route53',
+    'vpc_flow_logs': 'VpcFlow',
+}
+
+
+AOSS_LOCAL = AOSS_ENDPOINT.startswith('http://')
+endpoint = AOSS_ENDPOINT.replace('https://', '').replace('http://', '')
+if AOSS_LOCAL:
+    # local emulator (support/aoss_emulator.py), host:port over http without signing
+    aoss_host, aoss_port = endpoint.split(':') if ':' in endpoint else (endpoint, 80)
+    auth = None
+else:
+    aoss_host, aoss_port = endpoint, 443
+    auth = AWSV4SignerAuth(boto3.Session().get_credentials(), AWS_REGION, 'aoss')
+aoss_client = OpenSearch(
+    hosts = [{'host': aoss_host, 'port': int(aoss_port)}],
+    http_auth = auth,
+    use_ssl = not AOSS_LOCAL,
+    verify_certs = not AOSS_LOCAL,
+    connection_class = RequestsHttpConnection,
+    timeout=30,
+    max_retries=3
+)
+
+batch_client = boto3.client('batch')
+s3_client = boto3.client('s3')
+
+
+def lambda_handler(event, context):
+    now = time.time()
+    state = read_state()
+    decisions = []
+
+    for data_source, index_name in SL_DATASOURCE_MAP.items():
+        if index_name is None or data_source not in JOB_NAME_SUFFIX:
+            continue
+        try:
+            decision = schedule_source(data_source, index_name, state.setdefault(data_source, {}), now)
+        except Exception as e:
+            log.error(f'{data_source}: not scheduled: {e}')
+            decision = {'data_source': data_source, 'action': 'error', 'reason': str(e)}
+        log.info(json.dumps(decision))
+        decisions.append(decision)
+
+        try:
+            decision = schedule_embed_pending(data_source, index_name)
+        except Exception as e:
+            log.error(f'{data_source}: embed_pending not scheduled: {e}')
+            decision = {'data_source': data_source, 'run_mode': 'embed_pending', 'action': 'error', 'reason': str(e)}
+        log.info(json.dumps(decision))
+        decisions.append(decision)
+
+    if not DRY_RUN:
+        write_state(state)
+
+    return {'decisions': decisions}
+
+
+def schedule_source(data_source: str, index_name: str, source_state: Dict, now: float) -> Dict:
+    job_name = f'{JOB_NAME}-{JOB_NAME_SUFFIX[data_source]}'
+    decision = {'data_source': data_source, 'job_name': job_name}
+
+    if has_active_job(job_name):
+        return {**decision, 'action': 'skip', 'reason': 'job queued or running'}
+
+    watermark = get_watermark(index_name, now)
+    lag = max(now - watermark / 1000, 0)
+    rate = get_arrival_rate(index_name, watermark)
+    backlog = math.ceil(rate * lag) if rate is not None else None
+    decision.update({'watermark': watermark, 'lag_seconds': round(lag), 'rows_per_second': rate, 'backlog': backlog})
+
+    if lag < MIN_LAG_SECONDS:
+        source_state['idle_submissions'] = 0
+        return {**decision, 'action': 'skip', 'reason': 'caught up'}
+
+    # the watermark did not move since the last submission: nothing new arrived, back off
+    idle = source_state.get('watermark') == watermark and 'submitted' in source_state
+    idle_submissions = source_state.get('idle_submissions', 0) if idle else 0
+    if idle:
+        backoff = min(IDLE_INTERVAL_SECONDS * 2 ** idle_submissions, IDLE_MAX_INTERVAL_SECONDS)
+        if now - source_state['submitted'] < backoff:
+            return {**decision, 'action': 'skip', 'reason': f'idle, next check in {round(backoff - (now - source_state["submitted"]))} seconds'}
+
+    record_limit, jobs = plan_jobs(backlog)
+    decision.update({'action': 'submit', 'record_limit': record_limit, 'jobs': jobs})
+    if not DRY_RUN:
+        decision['job_id'] = submit_job(job_name, index_name, record_limit, jobs)
+
+    source_state.update({
+        'watermark': watermark,
+        'submitted': now,
+        'idle_submissions': idle_submissions + 1 if idle else 0
+    })
+    return decision
+
+
+def schedule_embed_pending(data_source: str, index_name: str) -> Dict:
+    job_name = f'{JOB_NAME}-{JOB_NAME_SUFFIX[data_source]}-EmbedPending'
+    decision = {'data_source': data_source, 'run_mode': 'embed_pending', 'job_name': job_name}
+
+    pending = count_pending(index_name)
+    if data_source == 'route53_logs' and ROUTE53_HOSTNAME_INDEX:
+        pending += count_pending(ROUTE53_HOSTNAME_INDEX)
+    decision['pending'] = pending
+    if not pending:
+        return {**decision, 'action': 'skip', 'reason': 'nothing pending'}
+    if has_active_job(job_name):
+        return {**decision, 'action': 'skip', 'reason': 'job queued or running'}
+
+    decision['action'] = 'submit'
+    if not DRY_RUN:
+        decision['job_id'] = batch_client.submit_job(
+            jobName=job_name,
+            jobQueue=JOB_QUEUE,
+            jobDefinition=JOB_DEFINITION,
+            containerOverrides={'environment': [
+                {'name': 'RUN_INDEX_NAME', 'value': index_name},
+                {'name': 'RUN_MODE', 'value': 'embed_pending'}
+            ]}
+        )['jobId']
+    return decision
+
+
+def count_pending(index_name: str) -> int:
+    if not aoss_client.indices.exists(index=index_name):
+        return 0
+    response = aoss_client.count(index=index_name, body={'query': {'term': {'embedding_state': 'pending'}}})
+    return response['count']
+
+
+def plan_jobs(backlog: Optional[int]) -> tuple:
+    # without a rate (empty or new index) the backlog is unknown, one job at the largest limit
+    if backlog is None:
+        return MAX_RECORD_LIMIT, 1
+
+    record_limit = min(max(backlog, MIN_RECORD_LIMIT), MAX_RECORD_LIMIT)
+    jobs = min(max(math.ceil(backlog / record_limit), 1), MAX_JOBS)
+    return record_limit, jobs
+
+
+def has_active_job(job_name: str) -> bool:
+    response = batch_client.list_jobs(
+        jobQueue=JOB_QUEUE,
+        filters=[{'name': 'JOB_NAME', 'values': [job_name]}]
+    )
+    return any(job['status'] in ACTIVE_JOB_STATUS for job in response.get('jobSummaryList', []))
+
+
+def submit_job(job_name: str, index_name: str, record_limit: int, jobs: int) -> str:
+    request = {
+        'jobName': job_name,
+        'jobQueue': JOB_QUEUE,
+        'jobDefinition': JOB_DEFINITION,
+        'containerOverrides': {'environment': [
+            {'name': 'RUN_INDEX_NAME', 'value': index_name},
+            {'name': 'INDEX_RECORD_LIMIT', 'value': str(record_limit)}
+        ]}
+    }
+    if jobs > 1:
+        # children run one after the other, each from the watermark left by the previous one
+        request['arrayProperties'] = {'size': jobs}
+        request['dependsOn'] = [{'type': 'SEQUENTIAL'}]
+
+    return batch_client.submit_job(**request)['jobId']
+
+
+# Max indexed time in epoch ms, midnight in AOSS_TIME_ZONE when the index is empty or older
+def get_watermark(index_name: str, now: float) -> int:
+    midnight = datetime.fromtimestamp(now, ZoneInfo(AOSS_TIME_ZONE)).replace(hour=0, minute=0, second=0, microsecond=0)
+    midnight = int(midnight.timestamp() * 1000)
+
+    if not aoss_client.indices.exists(index=index_name):
+        return midnight
+
+    response = aoss_client.search(index=index_name, body={
+        'size': 0,
+        'aggs': {'max_time': {'max': {'field': 'time'}}}
+    })
+    max_time = response['aggregations']['max_time']['value']
+    return int(max_time) if max_time is not None and max_time > midnight else midnight
+
+
+# Rows per second of event time over the RATE_WINDOW_SECONDS before the watermark. Aggregated
+# documents (EVENT_AGGREGATION) stand for their count of rows.
+def get_arrival_rate(index_name: str, watermark: int) -> Optional[float]:
+    if not aoss_client.indices.exists(index=index_name):
+        return None
+
+    response = aoss_client.search(index=index_name, body={
+        'size': 0,
+        'track_total_hits': True,
+        'query': {'range': {'time': {'gt': watermark - RATE_WINDOW_SECONDS * 1000, 'lte': watermark}}},
+        'aggs': {'rows': {'sum': {'field': 'count'}}}
+    })
+    documents = response['hits']['total']['value']
+    if documents == 0:
+        return None
+
+    rows = max(response['aggregations']['rows']['value'] or 0, documents)
+    return round(rows / RATE_WINDOW_SECONDS, 3)
+
+
+def read_state() -> Dict:
+    try:
+        body = s3_client.get_object(Bucket=STATE_BUCKET, Key=STATE_KEY)['Body'].read()
+        return json.loads(body)
+    except s3_client.exceptions.NoSuchKey:
+        return {}
+
+
+def write_state(state: Dict):
+    s3_client.put_object(Bucket=STATE_BUCKET, Key=STATE_KEY, Body=json.dumps(state).encode('utf-8'))
@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+from constructs import Construct
+from aws_cdk import Stack
+from aws_cdk import Duration
+from aws_cdk import aws_batch as batch
+from aws_cdk import aws_iam as iam
+from aws_cdk import aws_lambda
+from aws_cdk import aws_s3 as s3
+from aws_cdk import aws_scheduler as scheduler
+import json
+from stacks.embedding_processor.constants import AdaptiveIngestSchedulerProps, BatchProcessorProps, EventBridgeScheduledBatchJobProps
+
+class AdaptiveIngestScheduler(Construct):
+
+    def __init__(self, scope: Construct, construct_id: str,
+        job_definition: batch.EcsJobDefinition,
+        job_queue: batch.JobQueue,
+        collection_endpoint: str,
+        collection_id: str,
+        bucket: s3.Bucket,
+        **kwargs) -> None:
+        super().__init__(scope, construct_id, **kwargs)
+
+        lambda_iam_role = iam.Role(
+            self,
+            AdaptiveIngestSchedulerProps.LAMBDA_IAM_ROLE_ID,
+            role_name=AdaptiveIngestSchedulerProps.LAMBDA_IAM_ROLE_NAME,
+            assumed_by=iam.ServicePrincipal("lambda.amazonaws.com"),
+            description="A role for the ingest scheduler",
+            managed_policies=[iam.ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole")],
+            inline_policies={
+                "schedulerAccessPolicy": iam.PolicyDocument(statements=[
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=["batch:SubmitJob"],
+                        resources=[job_definition.job_definition_arn, job_queue.job_queue_arn]
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=["batch:ListJobs"],
+                        resources=["*"]
+                    ),
+                    iam.PolicyStatement(
+                        effect=iam.Effect.ALLOW,
+                        actions=["aoss:APIAccessAll"],
+                        resources=[f"arn:aws:aoss:{Stack.of(self).region}:{Stack.of(self).account}:collection/{collection_id}"]
+                    )
+                ])
+            }
+        )
+        bucket.grant_read_write(lambda_iam_role, AdaptiveIngestSchedulerProps.STATE_KEY)
+
+        lambda_layer_opensearchpy = aws_lambda.LayerVersion(
+            self,
+            id=AdaptiveIngestSchedulerProps.LAMBDA_LAYER_OPENSEARCHPY_ID,
+            code=aws_lambda.Code.from_asset('stacks/agent/lambda_layers/opensearch_py/layer.zip'),
+            compatible_runtimes=[
+                aws_lambda.Runtime.PYTHON_3_12,
+            ],
+            description='opensearch-py 2.6.0'
+        )
+
+        scheduler_lambda = aws_lambda.Function(
+            self,
+            id=AdaptiveIngestSchedulerProps.LAMBDA_ID,
+            function_name=AdaptiveIngestSchedulerProps.LAMBDA_NAME,
+            description=AdaptiveIngestSchedulerProps.LAMBDA_DESCRIPTION,
+            code=aws_lambda.Code.from_asset('stacks/embedding_processor/lambda_functions/ingest_scheduler/'),
+            runtime=aws_lambda.Runtime.PYTHON_3_12,
+            architecture=aws_lambda.Architecture.ARM_64,
+            handler='lambda_function.lambda_handler',
+            timeout=Duration.seconds(60),
+            memory_size=256,
+            role=lambda_iam_role,
+            layers=[
+                lambda_layer_opensearchpy
+            ],
+            environment={
+                "AOSS_ENDPOINT": collection_endpoint,
+                "AOSS_TIME_ZONE": BatchProcessorProps.AOSS_TIME_ZONE,
+                "SL_DATASOURCE_MAP": json.dumps(BatchProcessorProps.SL_DATASOURCE_MAP),
+                "ROUTE53_HOSTNAME_INDEX": BatchProcessorProps.ROUTE53_HOSTNAME_INDEX,
+                "JOB_QUEUE": job_queue.job_queue_arn,
+                "JOB_DEFINITION": job_definition.job_definition_arn,
+                "JOB_NAME": EventBridgeScheduledBatchJobProps.BATCH_JOB_NAME,
+                "STATE_BUCKET": bucket.bucket_name,
+                "STATE_KEY": AdaptiveIngestSchedulerProps.STATE_KEY,
+                "MIN_LAG_SECONDS": AdaptiveIngestSchedulerProps.MIN_LAG_SECONDS,
+                "RATE_WINDOW_SECONDS": AdaptiveIngestSchedulerProps.RATE_WINDOW_SECONDS,
+                "MIN_RECORD_LIMIT": AdaptiveIngestSchedulerProps.MIN_RECORD_LIMIT,
+                "MAX_RECORD_LIMIT": AdaptiveIngestSchedulerProps.MAX_RECORD_LIMIT,
+                "MAX_JOBS": AdaptiveIngestSchedulerProps.MAX_JOBS,
+                "IDLE_INTERVAL_SECONDS": AdaptiveIngestSchedulerProps.IDLE_INTERVAL_SECONDS,
+                "IDLE_MAX_INTERVAL_SECONDS": AdaptiveIngestSchedulerProps.IDLE_MAX_INTERVAL_SECONDS
+            }
+        )
+
+        invoke_role = iam.Role(
+            self,
+            AdaptiveIngestSchedulerProps.SCHEDULER_ROLE_ID,
+            assumed_by=iam.ServicePrincipal("scheduler.amazonaws.com"),
+            description="A role for the ingest scheduler schedule"
+        )
+        scheduler_lambda.grant_invoke(invoke_role)
+
+        # a single schedule, the Lambda decides which jobs run
+        self.event_rule = scheduler.CfnSchedule(self, "eventRuleIngestScheduler",
+            flexible_time_window=scheduler.CfnSchedule.FlexibleTimeWindowProperty(
+                mode="OFF",
+            ),
+            schedule_expression=AdaptiveIngestSchedulerProps.SCHEDULE_EXPRESSION,
+            name=f"{EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_SCHEDULER_NAME}-adaptive",
+            state=EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_RUN_STATE,
+            target=scheduler.CfnSchedule.TargetProperty(
+                arn=scheduler_lambda.function_arn,
+                role_arn=invoke_role.role_arn
+            )
+        )
+
+        self.function = scheduler_lambda
+
+        return
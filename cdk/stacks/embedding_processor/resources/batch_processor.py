@@ -7,6 +7,8 @@ from aws_cdk import aws_batch as batch
 from aws_cdk import aws_ec2 as ec2
 from aws_cdk import aws_ecs as ecs
 from aws_cdk import aws_iam as iam
+from aws_cdk import aws_logs as logs
+from aws_cdk import RemovalPolicy
 from aws_cdk import aws_ecr_assets as ecr_asset
 from aws_cdk import aws_opensearchserverless as ops
 import json
@@ -34,6 +36,15 @@ class BatchProcessor(Construct):
             vpc=vpc
         )
 
+        metrics_log_group = logs.LogGroup(
+            self,
+            id='IngestMetrics',
+            log_group_name=BatchProcessorProps.METRICS_LOG_GROUP_NAME,
+            retention=logs.RetentionDays.ONE_MONTH,
+            removal_policy=RemovalPolicy.DESTROY
+        )
+        metrics_log_group.grant_write(batch_job_role)
+
         # Create a Batch Job Definition
         batch_job_definition = batch.EcsJobDefinition(
             self, 
@@ -65,7 +76,36 @@ class BatchProcessor(Construct):
                     "SL_VPCFLOW": BatchProcessorProps.SL_VPCFLOW,
                     "SL_CLOUDTRAIL": BatchProcessorProps.SL_CLOUDTRAIL,
                     "SL_LAMBDA": BatchProcessorProps.SL_LAMBDA,
-                    "SL_DATASOURCE_MAP": json.dumps(BatchProcessorProps.SL_DATASOURCE_MAP)
+                    "SL_DATASOURCE_MAP": json.dumps(BatchProcessorProps.SL_DATASOURCE_MAP),
+                    "EMBEDDING_POLICY": json.dumps(BatchProcessorProps.EMBEDDING_POLICY),
+                    "EMBEDDING_DEFER_AFTER_FAILURES": BatchProcessorProps.EMBEDDING_DEFER_AFTER_FAILURES,
+                    "EMBEDDING_MAX_ATTEMPTS": BatchProcessorProps.EMBEDDING_MAX_ATTEMPTS,
+                    "MAPPING_PROFILE": BatchProcessorProps.MAPPING_PROFILE,
+                    "ROUTE53_HOSTNAME_INDEX": BatchProcessorProps.ROUTE53_HOSTNAME_INDEX,
+                    "ROUTE53_HOSTNAME_REFRESH_DAYS": BatchProcessorProps.ROUTE53_HOSTNAME_REFRESH_DAYS,
+                    "EMBEDDING_TEXT_MAX_TOKENS": BatchProcessorProps.EMBEDDING_TEXT_MAX_TOKENS,
+                    "EMBEDDING_TEXT_FIELD_MAX_CHARS": BatchProcessorProps.EMBEDDING_TEXT_FIELD_MAX_CHARS,
+                    "EVENT_AGGREGATION": json.dumps(BatchProcessorProps.EVENT_AGGREGATION),
+                    "INGEST_SAMPLING": json.dumps(BatchProcessorProps.INGEST_SAMPLING),
+                    "ROLLUPS": json.dumps(BatchProcessorProps.ROLLUPS),
+                    "ROLLUP_PURGE_LT": BatchProcessorProps.ROLLUP_PURGE_LT,
+                    "ENTITY_PROFILE_INDEX": BatchProcessorProps.ENTITY_PROFILE_INDEX,
+                    "ENTITY_PROFILE_TOP_N": BatchProcessorProps.ENTITY_PROFILE_TOP_N,
+                    "SKETCHES": json.dumps(BatchProcessorProps.SKETCHES),
+                    "SKETCH_PREFIX": BatchProcessorProps.SKETCH_PREFIX,
+                    "SKETCH_BASELINE_DAYS": BatchProcessorProps.SKETCH_BASELINE_DAYS,
+                    "IOC_FEEDS": json.dumps([f"s3://{ bucket_name }/{ key }" for key in BatchProcessorProps.IOC_FEED_KEYS]),
+                    "IOC_COLUMNS": json.dumps(BatchProcessorProps.IOC_COLUMNS),
+                    "IOC_BLOOM_ERROR_RATE": BatchProcessorProps.IOC_BLOOM_ERROR_RATE,
+                    "SOURCE_FILTERS": json.dumps(BatchProcessorProps.SOURCE_FILTERS),
+                    "VECTOR_STORAGE": json.dumps(BatchProcessorProps.VECTOR_STORAGE),
+                    "BULK_CAPTURE_PATH": f"s3://{ bucket_name }/{ BatchProcessorProps.BULK_CAPTURE_PREFIX }" if BatchProcessorProps.BULK_CAPTURE_PREFIX else "",
+                    "METRICS_NAMESPACE": BatchProcessorProps.METRICS_NAMESPACE,
+                    "METRICS_LOG_GROUP": metrics_log_group.log_group_name,
+                    "PROFILE_MODE": BatchProcessorProps.PROFILE_MODE,
+                    "PROFILE_PREFIX": BatchProcessorProps.PROFILE_PREFIX,
+                    "LEASE_TTL_SECONDS": BatchProcessorProps.LEASE_TTL_SECONDS,
+                    "LEASE_PREFIX": BatchProcessorProps.LEASE_PREFIX
                 }
             )
         )
@@ -145,5 +145,25 @@ class EventBridgeScheduledBatchJob(Construct):
                 })
             )
         )
+
+        # adds the embeddings Bedrock did not return during the ingest, for every index
+        self.event_rule = scheduler.CfnSchedule(self, "eventRuleEmbedPending",
+            flexible_time_window=scheduler.CfnSchedule.FlexibleTimeWindowProperty(
+                mode="OFF",
+            ),
+            schedule_expression=EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_SCHEDULE_EMBED_PENDING,
+            name=f"{EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_SCHEDULER_NAME}-embed_pending",
+            state=EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_RUN_STATE,
+            target=scheduler.CfnSchedule.TargetProperty(
+                arn=EventBridgeScheduledBatchJobProps.EVENT_BRIDGE_BATCH_SUBMIT_JOB_ARN,
+                role_arn=iam_role.role_arn,
+                input=json.dumps({
+                    "JobDefinition": job_definition.job_definition_arn,
+                    "JobQueue": job_queue.job_queue_arn,
+                    "JobName": f"{EventBridgeScheduledBatchJobProps.BATCH_JOB_NAME}-EmbedPending",
+                    "ContainerOverrides": { "Environment": [ { "Name": "RUN_MODE", "Value": "embed_pending" } ] }
+                })
+            )
+        )
     
         return
@@ -11,10 +11,12 @@ from stacks.embedding_processor.resources.s3_bucket import S3Bucket
 from stacks.embedding_processor.resources.ecr_repo import EcrRepo
 from stacks.embedding_processor.resources.batch_processor import BatchProcessor
 from stacks.embedding_processor.resources.event_bridge_scheduled_job import EventBridgeScheduledBatchJob
+from stacks.embedding_processor.resources.adaptive_ingest_scheduler import AdaptiveIngestScheduler
 from stacks.embedding_processor.resources.lake_formation_settings import LakeFormationSettings
 from stacks.embedding_processor.resources.lake_formation import LakeFormationTablePermissions
 from stacks.agent.constants import SearchSecurityLakeProps
-from stacks.embedding_processor.constants import AOSS_READ_ONLY_ROLE_ARN, BatchProcessorProps
+from stacks.embedding_processor.constants import AOSS_READ_ONLY_ROLE_ARN, BatchProcessorProps, \
+                                                 EventBridgeScheduledBatchJobProps, AdaptiveIngestSchedulerProps
 
 class EmbeddingProcessor(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -32,6 +34,9 @@ class EmbeddingProcessor(Stack):
         read_only_aoss_data_access_policy_roles = []
         if AOSS_READ_ONLY_ROLE_ARN:
             read_only_aoss_data_access_policy_roles = [AOSS_READ_ONLY_ROLE_ARN]
+        if EventBridgeScheduledBatchJobProps.SCHEDULING_MODE == 'adaptive':
+            # the ingest scheduler reads the watermark of each index
+            read_only_aoss_data_access_policy_roles.append(f'arn:aws:iam::{Stack.of(self).account}:role/{AdaptiveIngestSchedulerProps.LAMBDA_IAM_ROLE_NAME}')
 
         # < EMBEDDING PROCESSOR >
         vpc_infrastructure = VpcInfrastructure(self, "Network")        
@@ -50,10 +55,19 @@ class EmbeddingProcessor(Stack):
             batch_job_role=processor_iam_role.role,
         )
 
-        event_bridge_scheduled_job = EventBridgeScheduledBatchJob(self, 
-            "eventBridgeScheduledJob",
-            batch_processor.batch_job_definition,
-            batch_processor.batch_job_queue)
+        if EventBridgeScheduledBatchJobProps.SCHEDULING_MODE == 'adaptive':
+            adaptive_ingest_scheduler = AdaptiveIngestScheduler(self,
+                "adaptiveIngestScheduler",
+                job_definition=batch_processor.batch_job_definition,
+                job_queue=batch_processor.batch_job_queue,
+                collection_endpoint=opensearch_serverless.collection.attr_collection_endpoint,
+                collection_id=opensearch_serverless.collection.attr_id,
+                bucket=bucket.s3_bucket)
+        else:
+            event_bridge_scheduled_job = EventBridgeScheduledBatchJob(self, 
+                "eventBridgeScheduledJob",
+                batch_processor.batch_job_definition,
+                batch_processor.batch_job_queue)
 
 
         # Lake Formation Settings Construct
@@ -6,6 +6,7 @@ from aws_cdk import Aws
 from aws_cdk import aws_cloudwatch
 from aws_cdk import Duration
 from stacks.agent.constants import SearchSecurityLakeProps
+from stacks.embedding_processor.constants import BatchProcessorProps
 from stacks.observability.constants import DashboardProps
 
 
@@ -205,6 +206,49 @@ class Dashboard(Construct):
             ]
         )
 
+        # ingest metrics emitted by the embedding processor, one line per data source
+        ingest_athena_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Athena Queue / Execution Time",
+            left=self.ingest_metrics("AthenaQueueTime", "Average"),
+            right=self.ingest_metrics("AthenaExecutionTime", "Average")
+        )
+
+        ingest_rows_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Bytes Scanned / Rows Read",
+            left=self.ingest_metrics("AthenaBytesScanned", "Sum"),
+            right=self.ingest_metrics("RowsRead", "Sum")
+        )
+
+        ingest_transform_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Transform Rows/s / Watermark Lag",
+            left=self.ingest_metrics("TransformRowsPerSecond", "Average"),
+            right=self.ingest_metrics("WatermarkLag", "Maximum")
+        )
+
+        ingest_embedding_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Embedding Latency p50 / p99",
+            left=self.ingest_metrics("EmbeddingLatency", "p50"),
+            right=self.ingest_metrics("EmbeddingLatency", "p99")
+        )
+
+        ingest_throttles_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Embedding Throttles / Retries",
+            left=self.ingest_metrics("EmbeddingThrottles", "Sum"),
+            right=self.ingest_metrics("EmbeddingRetries", "Sum")
+        )
+
+        ingest_bulk_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Bulk Took p99 / Item Errors",
+            left=self.ingest_metrics("BulkTook", "p99"),
+            right=self.ingest_metrics("BulkItemErrors", "Sum")
+        )
+
+        ingest_duration_widget = aws_cloudwatch.GraphWidget(
+            title="Ingest Purge / Ingest Duration",
+            left=self.ingest_metrics("PurgeDuration", "Maximum"),
+            right=self.ingest_metrics("IngestDuration", "Maximum")
+        )
+
         dashboard.add_widgets(
             batch_utilization_widget,
             lambda_invocations_widget,
@@ -213,7 +257,27 @@ class Dashboard(Construct):
             aoss_utilization_widget,
             lambda_errors_widget,
             embedding_errors_widget,
-            claude_3_errors_widget
+            claude_3_errors_widget,
+            ingest_athena_widget,
+            ingest_rows_widget,
+            ingest_transform_widget,
+            ingest_embedding_widget,
+            ingest_throttles_widget,
+            ingest_bulk_widget,
+            ingest_duration_widget
         )
 
         return
+
+    def ingest_metrics(self, metric_name: str, statistic: str):
+        return [
+            aws_cloudwatch.Metric(
+                namespace=BatchProcessorProps.METRICS_NAMESPACE,
+                metric_name=metric_name,
+                dimensions_map={"DataSource": data_source},
+                statistic=statistic,
+                label=data_source,
+                period=Duration.minutes(15)
+            )
+            for data_source, index_name in BatchProcessorProps.SL_DATASOURCE_MAP.items() if index_name
+        ]
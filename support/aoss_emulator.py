@@ -0,0 +1,1040 @@
+import argparse
+import fnmatch
+import json
+import re
+import threading
+import time
+import uuid
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+
+
+# In memory stand-in for the subset of Amazon OpenSearch Serverless the project uses:
+# index create, delete and HEAD, _bulk, _doc, _mget, _count, _search, _cat/indices, _mapping and aliases
+# (_aliases, _alias), the mapping _source excludes apply to the returned documents.
+# Queries: match_all, match, match_phrase, multi_match, query_string, term, terms, range,
+# exists, bool and knn (brute force with NumPy), sorted searches page with search_after.
+# Aggregations: terms, date_histogram, max, min, sum, avg, value_count and cardinality.
+#
+# Point the project at it with AOSS_ENDPOINT=http://localhost:9200, requests are not signed
+# for http endpoints. Start it in process with AossEmulator().start() or from the command line.
+
+DEFAULT_PORT = 9200
+DEFAULT_SEARCH_SIZE = 10
+DEFAULT_TERMS_SIZE = 10
+
+TIME_UNITS_MS = {
+    's': 1000,
+    'm': 60 * 1000,
+    'h': 60 * 60 * 1000,
+    'd': 24 * 60 * 60 * 1000,
+    'w': 7 * 24 * 60 * 60 * 1000,
+}
+CALENDAR_INTERVALS = {
+    'minute': '1m', '1m': '1m',
+    'hour': '1h', '1h': '1h',
+    'day': '1d', '1d': '1d',
+    'week': '1w', '1w': '1w',
+    'month': 'month', '1M': 'month',
+    'quarter': 'quarter', '1q': 'quarter',
+    'year': 'year', '1y': 'year',
+}
+DATE_MATH = re.compile(r'^now(?P<offsets>([+-]\d+[yMwdhHms])*)(/(?P<round>[yMwdhHms]))?$')
+DATE_OFFSET = re.compile(r'([+-])(\d+)([yMwdhHms])')
+
+
+
+class EmulatorError(Exception):
+    def __init__(self, status: int, error_type: str, reason: str):
+        super().__init__(reason)
+        self.status = status
+        self.body = {'error': {'type': error_type, 'reason': reason}, 'status': status}
+
+
+
+def get_path(source: Dict, field: str) -> List[Any]:
+    """
+    Values of a dotted field path, lists are flattened. A .keyword suffix reads the text field.
+    """
+    if field.endswith('.keyword'):
+        field = field[:-len('.keyword')]
+    values = [source]
+    for part in field.split('.'):
+        next_values = []
+        for value in values:
+            if isinstance(value, list):
+                value = [item.get(part) for item in value if isinstance(item, dict)]
+                next_values.extend(value)
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    flattened = []
+    for value in values:
+        if isinstance(value, list):
+            flattened.extend(value)
+        elif value is not None:
+            flattened.append(value)
+    return flattened
+
+
+def to_epoch_ms(value: Any) -> Optional[float]:
+    """
+    Epoch milliseconds of a number, an ISO 8601 string or date math such as now-5d/d.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    match = DATE_MATH.match(text)
+    if match:
+        return date_math(match)
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        parsed = datetime.fromisoformat(text.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp() * 1000
+
+
+def date_math(match: re.Match) -> float:
+    """
+    Resolve now[+-N unit]...[/unit] in UTC.
+    """
+    moment = datetime.now(timezone.utc)
+    for sign, amount, unit in DATE_OFFSET.findall(match.group('offsets') or ''):
+        amount = int(amount) * (1 if sign == '+' else -1)
+        if unit == 'y':
+            moment = moment.replace(year=moment.year + amount)
+        elif unit == 'M':
+            month = moment.month - 1 + amount
+            moment = moment.replace(year=moment.year + month // 12, month=month % 12 + 1, day=1)
+        else:
+            moment = moment + timedelta(milliseconds=amount * TIME_UNITS_MS[unit.lower()])
+    if match.group('round'):
+        moment = floor_datetime(moment, match.group('round'))
+    return moment.timestamp() * 1000
+
+
+def floor_datetime(moment: datetime, unit: str) -> datetime:
+    """
+    Round a datetime down to a date math unit.
+    """
+    if unit == 'y':
+        return moment.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'M':
+        return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'w':
+        moment = moment - timedelta(days=moment.weekday())
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit == 'd':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if unit in ['h', 'H']:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    if unit == 'm':
+        return moment.replace(second=0, microsecond=0)
+    return moment.replace(microsecond=0)
+
+
+def to_number(value: Any) -> Optional[float]:
+    """
+    Numeric value of a field, dates are converted to epoch milliseconds.
+    """
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return to_epoch_ms(value)
+
+
+def values_equal(value: Any, expected: Any) -> bool:
+    """
+    Term equality, numbers and numeric strings compare as numbers, booleans as text.
+    """
+    if isinstance(value, bool) or isinstance(expected, bool):
+        return str(value).lower() == str(expected).lower()
+    if isinstance(value, (int, float)) or isinstance(expected, (int, float)):
+        left, right = to_number(value), to_number(expected)
+        return left is not None and left == right
+    return str(value) == str(expected)
+
+
+def tokenize(value: Any) -> List[str]:
+    return re.findall(r'\w+', str(value).lower())
+
+
+def filter_source(source: Dict, source_filter: Any) -> Optional[Dict]:
+    """
+    Apply a _source parameter: a boolean, a list of includes or an includes/excludes object.
+    """
+    if source_filter is None or source_filter is True:
+        return source
+    if source_filter is False:
+        return None
+    if isinstance(source_filter, str):
+        source_filter = [source_filter]
+    if isinstance(source_filter, list):
+        includes, excludes = source_filter, []
+    else:
+        includes = source_filter.get('includes', source_filter.get('include', []))
+        excludes = source_filter.get('excludes', source_filter.get('exclude', []))
+        includes = [includes] if isinstance(includes, str) else includes
+        excludes = [excludes] if isinstance(excludes, str) else excludes
+
+    def walk(value: Dict, prefix: str, included: bool) -> Dict:
+        filtered = {}
+        for key, item in value.items():
+            path = f'{prefix}.{key}' if prefix else key
+            if any(fnmatch.fnmatchcase(path, pattern) for pattern in excludes):
+                continue
+            if included or not includes or any(fnmatch.fnmatchcase(path, pattern) for pattern in includes):
+                filtered[key] = walk(item, path, True) if isinstance(item, dict) else item
+            elif isinstance(item, dict) and any(pattern.startswith(f'{path}.') for pattern in includes):
+                nested = walk(item, path, False)
+                if nested:
+                    filtered[key] = nested
+        return filtered
+
+    return walk(source, '', False)
+
+
+def knn_score(space_type: str, query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """
+    OpenSearch kNN scores for a space type.
+    """
+    if space_type == 'hamming':
+        bits = np.unpackbits(vectors.astype(np.int8).view(np.uint8), axis=1)
+        query_bits = np.unpackbits(query.astype(np.int8).view(np.uint8))
+        return 1 / (1 + np.count_nonzero(bits != query_bits, axis=1))
+    if space_type == 'l2':
+        return 1 / (1 + np.sum((vectors - query) ** 2, axis=1))
+    if space_type == 'innerproduct':
+        products = vectors @ query
+        return np.where(products >= 0, products + 1, 1 / (1 - products))
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query)
+    cosine = np.divide(vectors @ query, norms, out=np.zeros(len(vectors)), where=norms > 0)
+    return 1 / (2 - cosine)
+
+
+
+class EmulatorIndex:
+    """
+    Documents and mapping of a single index.
+    """
+    def __init__(self, name: str, body: Dict):
+        self.name = name
+        self.settings = body.get('settings', {})
+        self.mappings = body.get('mappings', {'properties': {}})
+        self.documents: Dict[str, Dict] = {}
+
+    def field_mapping(self, field: str) -> Dict:
+        properties = self.mappings.get('properties', {})
+        mapping = {}
+        for part in field.split('.'):
+            mapping = properties.get(part, {})
+            properties = mapping.get('properties', {})
+        return mapping
+
+    def stored_source(self, doc_id: str) -> Dict:
+        """
+        The document as returned, without the fields the mapping excludes from _source.
+        """
+        return filter_source(self.documents[doc_id], self.mappings.get('_source'))
+
+    def size_in_bytes(self) -> int:
+        return sum(len(json.dumps(source)) for source in self.documents.values())
+
+
+class QueryEngine:
+    """
+    Evaluates the query DSL against an index, clauses return a score for every matching document id.
+    """
+    def __init__(self, index: EmulatorIndex):
+        self.index = index
+
+    def evaluate(self, query: Optional[Dict]) -> Dict[str, float]:
+        if not query:
+            return {doc_id: 1.0 for doc_id in self.index.documents}
+        if len(query) != 1:
+            raise EmulatorError(400, 'parsing_exception', f'query must have a single clause: {query}')
+        clause, body = next(iter(query.items()))
+        handler = getattr(self, f'query_{clause}', None)
+        if handler is None:
+            raise EmulatorError(400, 'parsing_exception', f'unsupported query [{clause}]')
+        return handler(body)
+
+    def matching(self, predicate) -> Dict[str, float]:
+        return {doc_id: 1.0 for doc_id, source in self.index.documents.items() if predicate(source)}
+
+    def query_match_all(self, body: Dict) -> Dict[str, float]:
+        return {doc_id: 1.0 for doc_id in self.index.documents}
+
+    def query_term(self, body: Dict) -> Dict[str, float]:
+        field, value = next(iter(body.items()))
+        value = value.get('value') if isinstance(value, dict) else value
+        return self.matching(lambda source: any(values_equal(item, value) for item in get_path(source, field)))
+
+    def query_terms(self, body: Dict) -> Dict[str, float]:
+        field, values = next((key, value) for key, value in body.items() if key != 'boost')
+        return self.matching(lambda source: any(values_equal(item, value) for item in get_path(source, field) for value in values))
+
+    def query_exists(self, body: Dict) -> Dict[str, float]:
+        return self.matching(lambda source: len(get_path(source, body['field'])) > 0)
+
+    def query_range(self, body: Dict) -> Dict[str, float]:
+        field, bounds = next(iter(body.items()))
+        checks = []
+        for op, compare in [('gt', lambda a, b: a > b), ('gte', lambda a, b: a >= b), ('lt', lambda a, b: a < b), ('lte', lambda a, b: a <= b)]:
+            if op in bounds:
+                bound = to_number(bounds[op])
+                if bound is None:
+                    raise EmulatorError(400, 'parsing_exception', f'failed to parse range bound [{bounds[op]}]')
+                checks.append((compare, bound))
+
+        def in_range(source: Dict) -> bool:
+            for value in get_path(source, field):
+                number = to_number(value)
+                if number is not None and all(compare(number, bound) for compare, bound in checks):
+                    return True
+            return False
+
+        return self.matching(in_range)
+
+    def text_score(self, source: Dict, fields: List[str], text: Any, phrase: bool=False, prefix: bool=False) -> float:
+        query_tokens = tokenize(text)
+        if not query_tokens:
+            return 0.0
+        if phrase or prefix:
+            pattern = r'\b' + r'\s+'.join(re.escape(token) for token in query_tokens) + (r'\w*' if prefix else r'\b')
+        score = 0.0
+        for field in fields:
+            values = list(flatten_values(source)) if field in ['*', '_all'] else get_path(source, field)
+            for value in values:
+                tokens = tokenize(value)
+                if phrase or prefix:
+                    score += len(query_tokens) if re.search(pattern, ' '.join(tokens)) else 0
+                else:
+                    score += sum(1 for token in query_tokens if token in tokens)
+        return score
+
+    def text_query(self, fields: List[str], text: Any, phrase: bool=False, prefix: bool=False) -> Dict[str, float]:
+        scores = {}
+        for doc_id, source in self.index.documents.items():
+            score = self.text_score(source, fields, text, phrase, prefix)
+            if score > 0:
+                scores[doc_id] = score
+        return scores
+
+    def query_match(self, body: Dict) -> Dict[str, float]:
+        field, value = next(iter(body.items()))
+        value = value.get('query') if isinstance(value, dict) else value
+        return self.text_query([field], value)
+
+    def query_match_phrase(self, body: Dict) -> Dict[str, float]:
+        field, value = next(iter(body.items()))
+        value = value.get('query') if isinstance(value, dict) else value
+        return self.text_query([field], value, phrase=True)
+
+    def query_match_phrase_prefix(self, body: Dict) -> Dict[str, float]:
+        field, value = next(iter(body.items()))
+        value = value.get('query') if isinstance(value, dict) else value
+        return self.text_query([field], value, prefix=True)
+
+    def query_multi_match(self, body: Dict) -> Dict[str, float]:
+        fields = body.get('fields', ['*'])
+        match_type = body.get('type', 'best_fields')
+        return self.text_query(fields, body['query'], phrase=match_type == 'phrase', prefix=match_type == 'phrase_prefix')
+
+    def query_query_string(self, body: Dict) -> Dict[str, float]:
+        text = re.sub(r'[~*?"()]|\b(AND|OR|NOT)\b', ' ', str(body['query']))
+        fields = body.get('fields', [body['default_field']] if 'default_field' in body else ['*'])
+        return self.text_query(fields, text)
+
+    def query_bool(self, body: Dict) -> Dict[str, float]:
+        def clauses(name: str) -> List[Dict]:
+            value = body.get(name, [])
+            return value if isinstance(value, list) else [value]
+
+        candidates = set(self.index.documents)
+        scores = {doc_id: 0.0 for doc_id in candidates}
+        for clause in clauses('must'):
+            matched = self.evaluate(clause)
+            candidates &= set(matched)
+            for doc_id in candidates:
+                scores[doc_id] += matched[doc_id]
+        for clause in clauses('filter'):
+            candidates &= set(self.evaluate(clause))
+        for clause in clauses('must_not'):
+            candidates -= set(self.evaluate(clause))
+
+        should = clauses('should')
+        minimum_should_match = int(body.get('minimum_should_match', 0 if clauses('must') or clauses('filter') else 1 if should else 0))
+        should_counts = {doc_id: 0 for doc_id in candidates}
+        for clause in should:
+            matched = self.evaluate(clause)
+            for doc_id in candidates & set(matched):
+                should_counts[doc_id] += 1
+                scores[doc_id] += matched[doc_id]
+        candidates = {doc_id for doc_id in candidates if should_counts[doc_id] >= minimum_should_match}
+
+        return {doc_id: scores[doc_id] or 1.0 for doc_id in candidates}
+
+    def query_knn(self, body: Dict) -> Dict[str, float]:
+        field, parameters = next(iter(body.items()))
+        k = int(parameters.get('k', DEFAULT_SEARCH_SIZE))
+        candidates = self.evaluate(parameters['filter']) if parameters.get('filter') else self.index.documents
+
+        doc_ids = [doc_id for doc_id in candidates if isinstance(self.index.documents[doc_id].get(field), list)]
+        if not doc_ids:
+            return {}
+        space_type = self.index.field_mapping(field).get('method', {}).get('space_type', 'l2')
+        vectors = np.array([self.index.documents[doc_id][field] for doc_id in doc_ids], dtype=np.float64)
+        scores = knn_score(space_type, np.array(parameters['vector'], dtype=np.float64), vectors)
+        top = np.argsort(-scores, kind='stable')[:k]
+        return {doc_ids[position]: float(scores[position]) for position in top}
+
+
+def flatten_values(value: Any):
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from flatten_values(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from flatten_values(item)
+    elif value is not None:
+        yield value
+
+
+
+class Aggregator:
+    """
+    Computes the aggregations block of a search over the matching documents.
+    """
+    def __init__(self, index: EmulatorIndex):
+        self.index = index
+
+    def aggregate(self, aggregations: Dict, sources: List[Dict]) -> Dict:
+        results = {}
+        for name, body in aggregations.items():
+            sub_aggregations = body.get('aggs', body.get('aggregations', {}))
+            aggregation_type = next(key for key in body if key not in ['aggs', 'aggregations', 'meta'])
+            handler = getattr(self, f'agg_{aggregation_type}', None)
+            if handler is None:
+                raise EmulatorError(400, 'parsing_exception', f'unsupported aggregation [{aggregation_type}]')
+            results[name] = handler(body[aggregation_type], sources, sub_aggregations)
+        return results
+
+    def numbers(self, field: str, sources: List[Dict]) -> List[float]:
+        return [number for source in sources for number in (to_number(value) for value in get_path(source, field)) if number is not None]
+
+    def is_date(self, field: str) -> bool:
+        return self.index.field_mapping(field).get('type') == 'date'
+
+    def metric(self, value: Optional[float], field: str) -> Dict:
+        result = {'value': value}
+        if value is not None and self.is_date(field):
+            result['value_as_string'] = datetime.fromtimestamp(value / 1000, timezone.utc).isoformat().replace('+00:00', 'Z')
+        return result
+
+    def agg_max(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        numbers = self.numbers(body['field'], sources)
+        return self.metric(max(numbers) if numbers else None, body['field'])
+
+    def agg_min(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        numbers = self.numbers(body['field'], sources)
+        return self.metric(min(numbers) if numbers else None, body['field'])
+
+    def agg_sum(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        return {'value': float(sum(self.numbers(body['field'], sources)))}
+
+    def agg_avg(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        numbers = self.numbers(body['field'], sources)
+        return {'value': sum(numbers) / len(numbers) if numbers else None}
+
+    def agg_value_count(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        return {'value': sum(len(get_path(source, body['field'])) for source in sources)}
+
+    def agg_cardinality(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        return {'value': len({json.dumps(value, sort_keys=True) for source in sources for value in get_path(source, body['field'])})}
+
+    def bucket(self, key: Any, members: List[Dict], sub_aggregations: Dict) -> Dict:
+        bucket = {'key': key, 'doc_count': len(members)}
+        bucket.update(self.aggregate(sub_aggregations, members))
+        return bucket
+
+    def agg_terms(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        groups: Dict[str, Tuple[Any, List[Dict]]] = {}
+        for source in sources:
+            seen = set()
+            for value in get_path(source, body['field']):
+                if isinstance(value, (dict, list)):
+                    continue
+                group_key = json.dumps(value)
+                if group_key in seen:
+                    continue
+                seen.add(group_key)
+                groups.setdefault(group_key, (value, []))[1].append(source)
+
+        min_doc_count = int(body.get('min_doc_count', 1))
+        ordered = sorted(groups.values(), key=lambda group: (-len(group[1]), str(group[0])))
+        order = body.get('order')
+        if isinstance(order, dict) and '_key' in order:
+            ordered = sorted(groups.values(), key=lambda group: group[0], reverse=order['_key'] == 'desc')
+        elif isinstance(order, dict) and order.get('_count') == 'asc':
+            ordered = sorted(groups.values(), key=lambda group: (len(group[1]), str(group[0])))
+        ordered = [group for group in ordered if len(group[1]) >= min_doc_count]
+
+        size = int(body.get('size', DEFAULT_TERMS_SIZE))
+        buckets = [self.bucket(key, members, sub_aggregations) for key, members in ordered[:size]]
+        return {
+            'doc_count_error_upper_bound': 0,
+            'sum_other_doc_count': sum(len(members) for _, members in ordered[size:]),
+            'buckets': buckets
+        }
+
+    def agg_date_histogram(self, body: Dict, sources: List[Dict], sub_aggregations: Dict) -> Dict:
+        interval = body.get('calendar_interval') or body.get('fixed_interval') or body.get('interval', '1d')
+        interval = CALENDAR_INTERVALS.get(interval, interval)
+        groups: Dict[float, List[Dict]] = {}
+        for source in sources:
+            for value in get_path(source, body['field']):
+                epoch_ms = to_epoch_ms(value)
+                if epoch_ms is not None:
+                    groups.setdefault(self.histogram_key(epoch_ms, interval), []).append(source)
+                    break
+
+        keys = sorted(groups)
+        if keys and int(body.get('min_doc_count', 0)) == 0:
+            key = keys[0]
+            filled = []
+            while key <= keys[-1]:
+                filled.append(key)
+                key = self.next_histogram_key(key, interval)
+            keys = filled
+
+        buckets = []
+        for key in keys:
+            bucket = self.bucket(int(key), groups.get(key, []), sub_aggregations)
+            bucket['key_as_string'] = datetime.fromtimestamp(key / 1000, timezone.utc).isoformat().replace('+00:00', 'Z')
+            buckets.append(bucket)
+        return {'buckets': buckets}
+
+    def histogram_key(self, epoch_ms: float, interval: str) -> float:
+        moment = datetime.fromtimestamp(epoch_ms / 1000, timezone.utc)
+        if interval == 'month':
+            return floor_datetime(moment, 'M').timestamp() * 1000
+        if interval == 'quarter':
+            return moment.replace(month=(moment.month - 1) // 3 * 3 + 1, day=1, hour=0, minute=0, second=0, microsecond=0).timestamp() * 1000
+        if interval == 'year':
+            return floor_datetime(moment, 'y').timestamp() * 1000
+        if interval == '1w':
+            return floor_datetime(moment, 'w').timestamp() * 1000
+        interval_ms = self.interval_ms(interval)
+        return epoch_ms // interval_ms * interval_ms
+
+    def next_histogram_key(self, key: float, interval: str) -> float:
+        moment = datetime.fromtimestamp(key / 1000, timezone.utc)
+        if interval in ['month', 'quarter', 'year']:
+            months = {'month': 1, 'quarter': 3, 'year': 12}[interval]
+            month = moment.month - 1 + months
+            return moment.replace(year=moment.year + month // 12, month=month % 12 + 1).timestamp() * 1000
+        if interval == '1w':
+            return key + TIME_UNITS_MS['w']
+        return key + self.interval_ms(interval)
+
+    def interval_ms(self, interval: str) -> int:
+        match = re.match(r'^(\d+)([smhdw])$', interval)
+        if not match:
+            raise EmulatorError(400, 'parsing_exception', f'unsupported interval [{interval}]')
+        return int(match.group(1)) * TIME_UNITS_MS[match.group(2)]
+
+
+
+class AossEmulator:
+    """
+    The emulator state and HTTP server. Use start() and stop() to run it in process.
+    """
+    def __init__(self, host: str='localhost', port: int=DEFAULT_PORT):
+        self.host = host
+        self.port = port
+        self.indices: Dict[str, EmulatorIndex] = {}
+        self.aliases: Dict[str, str] = {}
+        self.lock = threading.RLock()
+        self.server = None
+        self.thread = None
+
+    @property
+    def endpoint(self) -> str:
+        return f'http://{self.host}:{self.port}'
+
+    def start(self) -> 'AossEmulator':
+        emulator = self
+
+        class Handler(EmulatorRequestHandler):
+            pass
+        Handler.emulator = emulator
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def resolve(self, name: str) -> str:
+        """
+        The index an alias points to, other names unchanged.
+        """
+        return self.aliases.get(name, name)
+
+    def exists(self, name: str) -> bool:
+        return self.resolve(name) in self.indices
+
+    def get_index(self, name: str) -> EmulatorIndex:
+        name = self.resolve(name)
+        if name not in self.indices:
+            raise EmulatorError(404, 'index_not_found_exception', f'no such index [{name}]')
+        return self.indices[name]
+
+    def create_index(self, name: str, body: Dict) -> Dict:
+        with self.lock:
+            if name in self.indices or name in self.aliases:
+                raise EmulatorError(400, 'resource_already_exists_exception', f'index [{name}] already exists')
+            self.indices[name] = EmulatorIndex(name, body or {})
+        return {'acknowledged': True, 'shards_acknowledged': True, 'index': name}
+
+    def put_mapping(self, name: str, body: Dict) -> Dict:
+        with self.lock:
+            index = self.get_index(name)
+            properties = index.mappings.setdefault('properties', {})
+            for field, mapping in (body or {}).get('properties', {}).items():
+                if field in properties and properties[field].get('type') != mapping.get('type'):
+                    raise EmulatorError(400, 'illegal_argument_exception', f'mapper [{field}] cannot be changed from type [{properties[field].get("type")}] to [{mapping.get("type")}]')
+                properties[field] = mapping
+        return {'acknowledged': True}
+
+    def delete_index(self, name: str) -> Dict:
+        with self.lock:
+            if name in self.aliases:
+                raise EmulatorError(400, 'illegal_argument_exception', f'The provided expression [{name}] matches an alias, specify the corresponding concrete indices instead.')
+            self.get_index(name)
+            del self.indices[name]
+            self.aliases = {alias: index for alias, index in self.aliases.items() if index != name}
+        return {'acknowledged': True}
+
+    def update_aliases(self, body: Dict) -> Dict:
+        """
+        POST _aliases, the add and remove actions are applied atomically. An alias points to one index.
+        """
+        with self.lock:
+            aliases = dict(self.aliases)
+            for action in body.get('actions', []):
+                op_type, options = next(iter(action.items()))
+                index, alias = options.get('index'), options.get('alias')
+                if index not in self.indices:
+                    raise EmulatorError(404, 'index_not_found_exception', f'no such index [{index}]')
+                if op_type == 'add':
+                    if alias in self.indices:
+                        raise EmulatorError(400, 'invalid_alias_name_exception', f'an index exists with the same name as the alias [{alias}]')
+                    aliases[alias] = index
+                elif op_type == 'remove':
+                    if aliases.get(alias) != index:
+                        raise EmulatorError(404, 'aliases_not_found_exception', f'aliases [{alias}] missing')
+                    del aliases[alias]
+                else:
+                    raise EmulatorError(400, 'illegal_argument_exception', f'unsupported alias action [{op_type}]')
+            self.aliases = aliases
+        return {'acknowledged': True}
+
+    def get_aliases(self, name: Optional[str], alias: Optional[str]) -> Tuple[int, Dict]:
+        """
+        GET _alias/<alias> and GET <index>/_alias, keyed by index.
+        """
+        with self.lock:
+            if name is not None:
+                index = self.get_index(name).name
+                return 200, {index: {'aliases': {a: {} for a, i in self.aliases.items() if i == index}}}
+            if alias not in self.aliases:
+                return 404, {'error': f'alias [{alias}] missing', 'status': 404}
+            return 200, {self.aliases[alias]: {'aliases': {alias: {}}}}
+
+    def index_document(self, name: str, source: Dict, doc_id: Optional[str]=None, op_type: str='index') -> Tuple[int, Dict]:
+        with self.lock:
+            name = self.resolve(name)
+            if name not in self.indices:
+                # dynamic index creation, like OpenSearch
+                self.indices[name] = EmulatorIndex(name, {})
+            index = self.indices[name]
+            doc_id = doc_id or uuid.uuid4().hex
+            exists = doc_id in index.documents
+            if op_type == 'create' and exists:
+                return 409, {'_index': name, '_id': doc_id, 'status': 409,
+                             'error': {'type': 'version_conflict_engine_exception', 'reason': f'[{doc_id}]: document already exists'}}
+            index.documents[doc_id] = source
+        status = 200 if exists else 201
+        return status, {'_index': name, '_id': doc_id, 'result': 'updated' if exists else 'created', 'status': status}
+
+    def update_document(self, name: str, doc_id: str, body: Dict) -> Tuple[int, Dict]:
+        with self.lock:
+            name = self.resolve(name)
+            index = self.indices.get(name)
+            if index is None or doc_id not in index.documents:
+                if 'doc' in body and body.get('doc_as_upsert'):
+                    return self.index_document(name, body['doc'], doc_id)
+                if 'upsert' in body:
+                    return self.index_document(name, body['upsert'], doc_id)
+                return 404, {'_index': name, '_id': doc_id, 'status': 404,
+                             'error': {'type': 'document_missing_exception', 'reason': f'[{doc_id}]: document missing'}}
+            merge(index.documents[doc_id], body.get('doc', {}))
+        return 200, {'_index': name, '_id': doc_id, 'result': 'updated', 'status': 200}
+
+    def delete_document(self, name: str, doc_id: str) -> Tuple[int, Dict]:
+        with self.lock:
+            name = self.resolve(name)
+            index = self.indices.get(name)
+            if index is None or doc_id not in index.documents:
+                return 404, {'_index': name, '_id': doc_id, 'result': 'not_found', 'status': 404}
+            del index.documents[doc_id]
+        return 200, {'_index': name, '_id': doc_id, 'result': 'deleted', 'status': 200}
+
+    def bulk(self, default_index: Optional[str], lines: List[Dict]) -> Dict:
+        tic = time.perf_counter()
+        items = []
+        position = 0
+        while position < len(lines):
+            action = lines[position]
+            op_type, metadata = next(iter(action.items()))
+            name = metadata.get('_index', default_index)
+            doc_id = metadata.get('_id')
+            if op_type == 'delete':
+                status, result = self.delete_document(name, doc_id)
+                position += 1
+            elif op_type in ['index', 'create']:
+                status, result = self.index_document(name, lines[position + 1], doc_id, op_type)
+                position += 2
+            elif op_type == 'update':
+                status, result = self.update_document(name, doc_id, lines[position + 1])
+                position += 2
+            else:
+                raise EmulatorError(400, 'illegal_argument_exception', f'unsupported bulk action [{op_type}]')
+            items.append({op_type: result})
+        errors = any('error' in next(iter(item.values())) for item in items)
+        return {'took': int((time.perf_counter() - tic) * 1000), 'errors': errors, 'items': items}
+
+    def count(self, name: str, body: Optional[Dict]) -> Dict:
+        with self.lock:
+            index = self.get_index(name)
+            matched = QueryEngine(index).evaluate((body or {}).get('query'))
+        return {'count': len(matched), '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0}}
+
+    def search(self, name: str, body: Optional[Dict]) -> Dict:
+        tic = time.perf_counter()
+        body = body or {}
+        with self.lock:
+            index = self.get_index(name)
+            matched = QueryEngine(index).evaluate(body.get('query'))
+            doc_ids = sort_documents(index, matched, body.get('sort'))
+            specs = sort_specs(body['sort']) if body.get('sort') else []
+            if body.get('search_after') is not None:
+                if not specs:
+                    raise EmulatorError(400, 'illegal_argument_exception', 'search_after requires a sort')
+                doc_ids = [doc_id for doc_id in doc_ids
+                           if is_after([sort_value(index, matched, doc_id, field) for field, _ in specs], body['search_after'], specs)]
+            sources = [index.documents[doc_id] for doc_id in matched]
+            aggregations = body.get('aggs', body.get('aggregations'))
+            start = int(body.get('from', 0))
+            size = int(body.get('size', DEFAULT_SEARCH_SIZE))
+
+            hits = []
+            for doc_id in doc_ids[start:start + size]:
+                hit = {'_index': index.name, '_id': doc_id, '_score': matched[doc_id]}
+                source = filter_source(index.stored_source(doc_id), body.get('_source'))
+                if source is not None:
+                    hit['_source'] = json.loads(json.dumps(source))
+                if specs:
+                    hit['sort'] = [sort_value(index, matched, doc_id, field) for field, _ in specs]
+                hits.append(hit)
+
+            response = {
+                'took': 0,
+                'timed_out': False,
+                '_shards': {'total': 1, 'successful': 1, 'skipped': 0, 'failed': 0},
+                'hits': {
+                    'total': {'value': len(matched), 'relation': 'eq'},
+                    'max_score': max(matched.values()) if matched else None,
+                    'hits': hits
+                }
+            }
+            if aggregations:
+                response['aggregations'] = Aggregator(index).aggregate(aggregations, sources)
+        response['took'] = int((time.perf_counter() - tic) * 1000)
+        return response
+
+    def get_document(self, name: str, doc_id: str) -> Tuple[int, Dict]:
+        with self.lock:
+            index = self.get_index(name)
+            if doc_id not in index.documents:
+                return 404, {'_index': index.name, '_id': doc_id, 'found': False}
+            return 200, {'_index': index.name, '_id': doc_id, 'found': True, '_source': index.stored_source(doc_id)}
+
+    def multi_get(self, name: str, body: Dict) -> Dict:
+        """
+        POST <index>/_mget with {"ids": [...]} or {"docs": [{"_id": ..., "_source": ...}]}.
+        """
+        requests = body.get('docs') or [{'_id': doc_id} for doc_id in body.get('ids', [])]
+        docs = []
+        with self.lock:
+            index = self.get_index(name)
+            for request in requests:
+                doc_id = request['_id']
+                if doc_id not in index.documents:
+                    docs.append({'_index': index.name, '_id': doc_id, 'found': False})
+                    continue
+                doc = {'_index': index.name, '_id': doc_id, 'found': True}
+                source = filter_source(index.stored_source(doc_id), request.get('_source'))
+                if source is not None:
+                    doc['_source'] = json.loads(json.dumps(source))
+                docs.append(doc)
+        return {'docs': docs}
+
+    def cat_indices(self, pattern: Optional[str]) -> List[Dict]:
+        with self.lock:
+            return [
+                {
+                    'health': 'green',
+                    'status': 'open',
+                    'index': name,
+                    'docs.count': str(len(index.documents)),
+                    'store.size': f'{round(index.size_in_bytes() / 1024, 1)}kb'
+                }
+                for name, index in sorted(self.indices.items())
+                if pattern is None or fnmatch.fnmatchcase(name, pattern) or self.resolve(pattern) == name
+            ]
+
+
+def merge(target: Dict, changes: Dict) -> None:
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def sort_specs(sort: Any) -> List[Tuple[str, str]]:
+    """
+    The sort parameter as (field, order) pairs.
+    """
+    specs = []
+    for item in (sort if isinstance(sort, list) else [sort]):
+        if isinstance(item, str):
+            specs.append((item, 'desc' if item == '_score' else 'asc'))
+        else:
+            field, options = next(iter(item.items()))
+            specs.append((field, options.get('order', 'asc') if isinstance(options, dict) else options))
+    return specs
+
+
+def sort_value(index: EmulatorIndex, matched: Dict[str, float], doc_id: str, field: str) -> Any:
+    """
+    Value of a sort field as returned in the hit sort array, None when missing.
+    """
+    if field == '_score':
+        return matched[doc_id]
+    if field == '_id':
+        return doc_id
+    values = get_path(index.documents[doc_id], field)
+    if not values:
+        return None
+    number = to_number(values[0])
+    if number is None:
+        return str(values[0])
+    return int(number) if number.is_integer() else number
+
+
+def sort_documents(index: EmulatorIndex, matched: Dict[str, float], sort: Any) -> List[str]:
+    """
+    Order matching ids by the sort parameter, by descending score when there is none.
+    """
+    doc_ids = list(matched)
+    if not sort:
+        return sorted(doc_ids, key=lambda doc_id: -matched[doc_id])
+    # stable sorts applied from the last key to the first
+    for field, order in reversed(sort_specs(sort)):
+        reverse = order == 'desc'
+        if field == '_score':
+            doc_ids.sort(key=lambda doc_id: matched[doc_id], reverse=reverse)
+            continue
+
+        def sort_key(doc_id: str):
+            value = sort_value(index, matched, doc_id, field)
+            return (0, 0, value) if isinstance(value, str) else (0, value, '')
+
+        present = [doc_id for doc_id in doc_ids if sort_value(index, matched, doc_id, field) is not None]
+        missing = [doc_id for doc_id in doc_ids if sort_value(index, matched, doc_id, field) is None]
+        # missing values sort last in both directions
+        doc_ids = sorted(present, key=sort_key, reverse=reverse) + missing
+    return doc_ids
+
+
+def is_after(values: List[Any], after: List[Any], specs: List[Tuple[str, str]]) -> bool:
+    """
+    Whether sort values come after the search_after values, missing values sort last.
+    """
+    for value, bound, (_, order) in zip(values, after, specs):
+        if value == bound:
+            continue
+        if value is None:
+            return True
+        if bound is None:
+            return False
+        if isinstance(value, str) or isinstance(bound, str):
+            value, bound = str(value), str(bound)
+        return value > bound if order == 'asc' else value < bound
+    return False
+
+
+
+class EmulatorRequestHandler(BaseHTTPRequestHandler):
+    emulator: AossEmulator = None
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def read_json(self) -> Optional[Dict]:
+        body = self.read_body()
+        return json.loads(body) if body.strip() else None
+
+    def send_json(self, status: int, body: Any, head: bool=False) -> None:
+        payload = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if not head:
+            self.wfile.write(payload)
+
+    def handle_request(self, method: str) -> None:
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.split('/') if part]
+        params = parse_qs(url.query)
+        try:
+            status, body = self.route(method, parts, params)
+        except EmulatorError as e:
+            status, body = e.status, e.body
+        except (ValueError, KeyError, TypeError, StopIteration) as e:
+            status, body = 400, {'error': {'type': 'parsing_exception', 'reason': str(e)}, 'status': 400}
+        self.send_json(status, body, head=method == 'HEAD')
+
+    def route(self, method: str, parts: List[str], params: Dict) -> Tuple[int, Any]:
+        emulator = self.emulator
+        if not parts:
+            return 200, {'version': {'distribution': 'opensearch', 'number': '2.x-emulator'}}
+
+        if parts[0] == '_cat' and len(parts) >= 2 and parts[1] == 'indices':
+            return 200, emulator.cat_indices(parts[2] if len(parts) > 2 else None)
+        if parts[0] == '_bulk':
+            return 200, emulator.bulk(None, parse_ndjson(self.read_body()))
+        if parts[0] == '_aliases':
+            return 200, emulator.update_aliases(self.read_json())
+        if parts[0] == '_alias' and len(parts) > 1:
+            return emulator.get_aliases(None, parts[1])
+
+        name = parts[0]
+        if len(parts) == 1:
+            if method == 'HEAD':
+                return (200 if emulator.exists(name) else 404), {}
+            if method == 'PUT':
+                return 200, emulator.create_index(name, self.read_json())
+            if method == 'DELETE':
+                return 200, emulator.delete_index(name)
+            if method == 'GET':
+                index = emulator.get_index(name)
+                return 200, {index.name: {'settings': index.settings, 'mappings': index.mappings}}
+
+        endpoint = parts[1] if len(parts) > 1 else None
+        if endpoint == '_bulk':
+            return 200, emulator.bulk(name, parse_ndjson(self.read_body()))
+        if endpoint == '_mget':
+            return 200, emulator.multi_get(name, self.read_json())
+        if endpoint == '_count':
+            return 200, emulator.count(name, self.read_json())
+        if endpoint == '_search':
+            return 200, emulator.search(name, self.read_json())
+        if endpoint == '_mapping':
+            if method in ['PUT', 'POST']:
+                return 200, emulator.put_mapping(name, self.read_json())
+            index = emulator.get_index(name)
+            return 200, {index.name: {'mappings': index.mappings}}
+        if endpoint == '_alias':
+            return emulator.get_aliases(name, None)
+        if endpoint in ['_doc', '_create']:
+            doc_id = parts[2] if len(parts) > 2 else None
+            if method == 'GET':
+                return emulator.get_document(name, doc_id)
+            if method == 'DELETE':
+                return emulator.delete_document(name, doc_id)
+            return emulator.index_document(name, self.read_json(), doc_id, 'create' if endpoint == '_create' else 'index')
+        if endpoint == '_update' and len(parts) > 2:
+            return emulator.update_document(name, parts[2], self.read_json())
+
+        raise EmulatorError(400, 'illegal_argument_exception', f'unsupported request [{method} /{"/".join(parts)}]')
+
+    def do_GET(self) -> None:
+        self.handle_request('GET')
+
+    def do_POST(self) -> None:
+        self.handle_request('POST')
+
+    def do_PUT(self) -> None:
+        self.handle_request('PUT')
+
+    def do_DELETE(self) -> None:
+        self.handle_request('DELETE')
+
+    def do_HEAD(self) -> None:
+        self.handle_request('HEAD')
+
+
+def parse_ndjson(body: bytes) -> List[Dict]:
+    return [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Local Amazon OpenSearch Serverless emulator.')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    emulator = AossEmulator(args.host, args.port).start()
+    print(f'AOSS emulator listening on {emulator.endpoint}')
+    try:
+        emulator.thread.join()
+    except KeyboardInterrupt:
+        emulator.stop()
+
+
+
+if __name__ == '__main__':
+    main()
@@ -24,6 +24,8 @@ class AossHelper():
     host: str
     region: str = 'us-east-1'
     session: boto3.Session = None
+    port: int = 443
+    use_ssl: bool = True
 
     def __post_init__(self):
         if self.session is None:
@@ -32,13 +34,16 @@ class AossHelper():
     
     def _client(self) -> OpenSearch:
         service = 'aoss'
-        credentials = self.session.get_credentials()
-        auth = AWSV4SignerAuth(credentials, self.region, service)
+        auth = None
+        if self.use_ssl:
+            # requests to the local emulator (support/aoss_emulator.py) are not signed
+            credentials = self.session.get_credentials()
+            auth = AWSV4SignerAuth(credentials, self.region, service)
         client = OpenSearch(
-            hosts = [{'host': self.host, 'port': 443}],
+            hosts = [{'host': self.host, 'port': self.port}],
             http_auth = auth,
-            use_ssl = True,
-            verify_certs = True,
+            use_ssl = self.use_ssl,
+            verify_certs = self.use_ssl,
             connection_class = RequestsHttpConnection,
             pool_maxsize = 100,
             timeout=60,
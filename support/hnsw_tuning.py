@@ -0,0 +1,180 @@
+import itertools
+import json
+import os
+import tempfile
+import time
+import boto3
+import hnswlib
+import numpy as np
+from typing import Dict, List
+
+
+
+# Values used by the embedding processor mappings and aoss_query_knn in the agent Lambda
+CURRENT_CONFIGURATION = {'dimension': 512, 'm': 16, 'ef_construction': 100, 'ef_search': 100, 'k': 3}
+
+PARAMETER_GRID = {
+    'm': [8, 16, 32],
+    'ef_construction': [100, 256, 512],
+    'ef_search': [50, 100, 256],
+}
+K_VALUES = [3, 10]
+BEDROCK_EMBEDDING_MODEL = 'amazon.titan-embed-text-v2:0'
+
+
+
+def embed_texts(texts: List[str], dimensions: int, path: str, region: str='us-east-1') -> np.ndarray:
+    """
+    Embed a list of texts with Titan v2 and save the vectors, used to compare dimensions.
+
+    :param:
+    texts:List[str] - embedding texts, e.g. one document per line of a recorded dump.
+    dimensions:int - 256, 512 or 1024.
+    path:str - .npy file the vectors are written to.
+    """
+    client = boto3.Session().client('bedrock-runtime', region_name=region)
+    vectors = []
+    for text in texts:
+        body = json.dumps({'inputText': text, 'dimensions': dimensions, 'normalize': True})
+        response = client.invoke_model(body=body, modelId=BEDROCK_EMBEDDING_MODEL)
+        vectors.append(json.loads(response.get('body').read())['embedding'])
+    vectors = np.array(vectors, dtype=np.float32)
+    np.save(path, vectors)
+    return vectors
+
+
+def split_queries(vectors: np.ndarray, query_count: int, seed: int=7) -> Dict:
+    """
+    Hold out query_count random vectors as queries, the rest is indexed.
+    """
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    return {'base': vectors[order[query_count:]], 'queries': vectors[order[:query_count]]}
+
+
+def exact_neighbors(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Exact cosine neighbors, used as ground truth.
+    """
+    base = base / np.linalg.norm(base, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ base.T), axis=1)[:, :k]
+
+
+def build_index(base: np.ndarray, m: int, ef_construction: int) -> Dict:
+    """
+    Build a cosine HNSW index and measure the build time and serialized size.
+    """
+    tic = time.perf_counter()
+    index = hnswlib.Index(space='cosine', dim=base.shape[1])
+    index.init_index(max_elements=len(base), M=m, ef_construction=ef_construction, random_seed=7)
+    index.add_items(base, np.arange(len(base)))
+    build_seconds = time.perf_counter() - tic
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'index.bin')
+        index.save_index(path)
+        index_bytes = os.path.getsize(path)
+
+    return {'index': index, 'build_seconds': build_seconds, 'index_bytes': index_bytes}
+
+
+def search(index: hnswlib.Index, queries: np.ndarray, k: int, ef_search: int) -> Dict:
+    """
+    Run the queries one at a time, the way the agent Lambda does, and record the latencies.
+    """
+    index.set_ef(max(ef_search, k))
+    neighbors = []
+    latencies = []
+    for query in queries:
+        tic = time.perf_counter()
+        labels, _ = index.knn_query(query, k=k)
+        latencies.append((time.perf_counter() - tic) * 1000)
+        neighbors.append(labels[0].tolist())
+    return {'neighbors': neighbors, 'latencies': np.array(latencies)}
+
+
+def recall_at_k(truth: np.ndarray, neighbors: List[List[int]], k: int) -> float:
+    """
+    Average fraction of the exact top k found by the approximate search.
+    """
+    found = [len(set(truth[row][:k]) & set(neighbors[row][:k])) for row in range(len(truth))]
+    return sum(found) / (k * len(truth))
+
+
+def estimate_aoss_memory(n: int, dimension: int, m: int) -> int:
+    """
+    HNSW memory estimate for float32 vectors: 1.1 * (4 * dimension + 8 * m) * n bytes
+    """
+    return int(1.1 * (4 * dimension + 8 * m) * n)
+
+
+def tune(vectors_by_dimension: Dict[int, np.ndarray], query_count: int=200, grid: Dict=PARAMETER_GRID, k_values: List[int]=K_VALUES) -> List[Dict]:
+    """
+    Evaluate every combination of the parameter grid for every dimension.
+
+    :param:
+    vectors_by_dimension:Dict[int, np.ndarray] - vectors of the same documents embedded at each dimension.
+    query_count:int - number of held out query vectors.
+    grid:Dict - lists of m, ef_construction and ef_search values.
+    k_values:List[int] - k values recall and latency are reported for.
+    """
+    results = []
+    for dimension, vectors in vectors_by_dimension.items():
+        split = split_queries(vectors, query_count)
+        truth = exact_neighbors(split['base'], split['queries'], max(k_values))
+
+        for m, ef_construction in itertools.product(grid['m'], grid['ef_construction']):
+            built = build_index(split['base'], m, ef_construction)
+            for ef_search, k in itertools.product(grid['ef_search'], k_values):
+                run = search(built['index'], split['queries'], k, ef_search)
+                results.append({
+                    'dimension': dimension,
+                    'm': m,
+                    'ef_construction': ef_construction,
+                    'ef_search': ef_search,
+                    'k': k,
+                    'recall': round(recall_at_k(truth, run['neighbors'], k), 4),
+                    'p50_ms': round(float(np.percentile(run['latencies'], 50)), 3),
+                    'p95_ms': round(float(np.percentile(run['latencies'], 95)), 3),
+                    'p99_ms': round(float(np.percentile(run['latencies'], 99)), 3),
+                    'build_seconds': round(built['build_seconds'], 2),
+                    'index_mb': round(built['index_bytes'] / 1024 / 1024, 2),
+                    'aoss_memory_mb': round(estimate_aoss_memory(len(split['base']), dimension, m) / 1024 / 1024, 2),
+                })
+    return results
+
+
+def print_results(results: List[Dict]) -> None:
+    """
+    Print the results as a table, the current production configuration is marked with *.
+    """
+    columns = list(results[0].keys())
+    print(' | '.join(columns))
+    for result in results:
+        current = all(result.get(key) == value for key, value in CURRENT_CONFIGURATION.items())
+        print(' | '.join(str(result[column]) for column in columns) + (' *' if current else ''))
+
+
+
+def main() -> None:
+
+
+    # vectors recorded with vector_storage_benchmark.record_embeddings, or embedded at
+    # several dimensions with embed_texts from the same documents
+    vectors_by_dimension = {
+        512: np.load('embeddings.npy'),
+        # 256: np.load('embeddings_256.npy'),
+        # 1024: np.load('embeddings_1024.npy'),
+    }
+
+    results = tune(vectors_by_dimension)
+    print_results(results)
+
+    with open('hnsw_tuning_results.json', 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import json
+import time
+import numpy as np
+from typing import Dict, List
+import aoss_tools
+
+
+
+# Mirrors cdk/stacks/embedding_processor/ecr_image/indexes/vector_storage.py
+STORAGE_TYPES = {
+    'float': {'type': 'float'},
+    'fp16': {'type': 'fp16'},
+    'byte': {'type': 'byte', 'range': 0.25},
+}
+BENCHMARK_INDEX_PREFIX = 'vector_storage_benchmark'
+VECTOR_FIELD = 'embedding_vector'
+
+
+
+def record_embeddings(aoss: aoss_tools.AossHelper, index: str, path: str, n: int=10000) -> np.ndarray:
+    """
+    Save the embedding vectors of the newest documents of an index.
+
+    :param:
+    aoss:AossHelper - client for the collection.
+    index:str - index to read the vectors from, it must use float storage and the standard
+    mapping profile (the compact profile excludes the vectors from _source).
+    path:str - .npy file the vectors are written to.
+    n:int - number of documents to read, 10000 at most.
+    """
+    body = {
+        'size': n,
+        'sort': [{'time': {'order': 'desc'}}],
+        'query': {'exists': {'field': VECTOR_FIELD}},
+        '_source': [VECTOR_FIELD]
+    }
+    response = aoss.client.search(index=index, body=body)
+    vectors = np.array([hit['_source'][VECTOR_FIELD] for hit in response['hits']['hits']], dtype=np.float32)
+    np.save(path, vectors)
+    print(f'Recorded {len(vectors)} vectors from {index} to {path}')
+    return vectors
+
+
+def knn_vector_mapping(storage: Dict, dimension: int) -> Dict:
+    """
+    Build the knn_vector mapping for a storage type.
+    """
+    if storage['type'] == 'fp16':
+        return {
+            'type': 'knn_vector',
+            'dimension': dimension,
+            'method': {
+                'name': 'hnsw',
+                'space_type': 'innerproduct',
+                'engine': 'faiss',
+                'parameters': {'encoder': {'name': 'sq', 'parameters': {'type': 'fp16'}}}
+            }
+        }
+    if storage['type'] == 'byte':
+        return {
+            'type': 'knn_vector',
+            'dimension': dimension,
+            'data_type': 'byte',
+            'method': {'name': 'hnsw', 'space_type': 'innerproduct', 'engine': 'faiss'}
+        }
+    return {
+        'type': 'knn_vector',
+        'dimension': dimension,
+        'method': {'name': 'hnsw', 'space_type': 'cosinesimil', 'engine': 'nmslib'}
+    }
+
+
+def encode_vector(storage: Dict, vector: np.ndarray) -> List:
+    """
+    Encode a vector the way the embedding processor and the agent Lambda do.
+    """
+    if storage['type'] == 'byte':
+        scale = 127 / storage['range']
+        return np.clip(np.rint(vector * scale), -128, 127).astype(int).tolist()
+    return vector.tolist()
+
+
+def estimate_memory(storage: Dict, n: int, dimension: int, m: int=16) -> int:
+    """
+    Estimate the HNSW graph memory in bytes: 1.1 * (bytes per vector + 8 * m) * n
+    """
+    bytes_per_value = {'float': 4, 'fp16': 2, 'byte': 1}[storage['type']]
+    return int(1.1 * (bytes_per_value * dimension + 8 * m) * n)
+
+
+def exact_neighbors(base: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """
+    Exact cosine neighbors on float32 vectors, used as ground truth.
+    """
+    base = base / np.linalg.norm(base, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    scores = queries @ base.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def load_index(aoss: aoss_tools.AossHelper, index: str, storage: Dict, base: np.ndarray, batch_size: int=500, timeout: int=300) -> None:
+    """
+    Create a benchmark index and bulk load the base vectors, the document id is the row number.
+    """
+    if aoss.client.indices.exists(index=index):
+        aoss.client.indices.delete(index=index)
+    body = {
+        'settings': {'index.knn': True},
+        'mappings': {'properties': {VECTOR_FIELD: knn_vector_mapping(storage, base.shape[1])}}
+    }
+    aoss.client.indices.create(index=index, body=body)
+
+    for start in range(0, len(base), batch_size):
+        bulk_body = []
+        for row in range(start, min(start + batch_size, len(base))):
+            bulk_body.append({'index': {'_index': index, '_id': str(row)}})
+            bulk_body.append({VECTOR_FIELD: encode_vector(storage, base[row])})
+        aoss.client.bulk(body=bulk_body)
+
+    # vector search collections make documents searchable asynchronously
+    deadline = time.time() + timeout
+    while aoss.client.count(index=index)['count'] < len(base) and time.time() < deadline:
+        time.sleep(5)
+
+
+def run_queries(aoss: aoss_tools.AossHelper, index: str, storage: Dict, queries: np.ndarray, k: int) -> Dict:
+    """
+    Run the held out queries and collect neighbors and client side latency.
+    """
+    neighbors = []
+    latencies = []
+    for query in queries:
+        body = {
+            'size': k,
+            'query': {'knn': {VECTOR_FIELD: {'vector': encode_vector(storage, query), 'k': k}}},
+            '_source': False
+        }
+        tic = time.perf_counter()
+        response = aoss.client.search(index=index, body=body)
+        latencies.append((time.perf_counter() - tic) * 1000)
+        neighbors.append([int(hit['_id']) for hit in response['hits']['hits']])
+    return {'neighbors': neighbors, 'latencies': latencies}
+
+
+def recall_at_k(truth: np.ndarray, neighbors: List[List[int]], k: int) -> float:
+    """
+    Average fraction of the exact top k found by the approximate search.
+    """
+    found = [len(set(truth[row][:k]) & set(neighbors[row][:k])) for row in range(len(truth))]
+    return sum(found) / (k * len(truth))
+
+
+def benchmark(aoss: aoss_tools.AossHelper, vectors: np.ndarray, storage_types: List[str], k: int=10, query_count: int=100) -> List[Dict]:
+    """
+    Compare the storage types on recorded vectors, the last query_count vectors are held out as queries.
+    """
+    base, queries = vectors[:-query_count], vectors[-query_count:]
+    truth = exact_neighbors(base, queries, k)
+
+    results = []
+    for name in storage_types:
+        storage = STORAGE_TYPES[name]
+        index = f'{BENCHMARK_INDEX_PREFIX}_{name}'
+        load_index(aoss, index, storage, base)
+        run = run_queries(aoss, index, storage, queries, k)
+        latencies = np.array(run['latencies'])
+        results.append({
+            'storage': name,
+            f'recall@{k}': round(recall_at_k(truth, run['neighbors'], k), 4),
+            'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+            'p95_ms': round(float(np.percentile(latencies, 95)), 2),
+            'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+            'memory_mb': round(estimate_memory(storage, len(base), base.shape[1]) / 1024 / 1024, 2),
+        })
+        aoss.client.indices.delete(index=index)
+    return results
+
+
+
+def main() -> None:
+
+
+    # set your AOSS host and region
+    host = ''
+    region = 'us-east-1'
+
+    aoss = aoss_tools.AossHelper(
+        host=host,
+        region=region
+    )
+
+    # record once from a float index, then rerun the benchmark on the saved file
+    path = 'embeddings.npy'
+    vectors = record_embeddings(aoss, 'security_lake_vpc_flow_index', path)
+    # vectors = np.load(path)
+
+    results = benchmark(aoss, vectors, ['float', 'fp16', 'byte'])
+    print(json.dumps(results, indent=2))
+
+
+
+if __name__ == '__main__':
+    main()